@@ -0,0 +1,302 @@
+# coding=utf-8
+"""
+Compares the GCODE analysis as formerly done by ``octoprint.util.gcodeInterpreter.gcode._load``, looking up each
+parameter with a separate ``getCodeInt``/``getCodeFloat`` call, with :class:`octoprint.util.gcodeInterpreter.GcodeAnalyzer`
+which tokenizes each line once. The tokenizer deliberately reads some lines differently (see
+:class:`~octoprint.util.gcodeInterpreter.GcodeAnalyzer`), so the former analysis is checked on the lines rewritten into
+the form it understands, see :func:`canonical_lines`. Both have to arrive at the same print time and filament usage,
+the benchmark fails otherwise, making it a regression check over the given files as well. If NumPy is installed,
+:class:`octoprint.util.gcodeInterpreter.NumpyGcodeAnalyzer` is included.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_analysis.py [--rounds N] [gcode ...]
+
+Without any GCODE files given, ``tests/filemanager/_files/bp_case.gcode`` and a generated file of typical moves are
+used.
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import collections
+import math
+import os
+import time
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+MAX_EXTRUDERS = 10
+
+
+def generated_lines(count=200000):
+	lines = ["G21\n", "G90\n", "M82\n", "G28\n", "G92 E0\n"]
+	for i in range(count):
+		if i % 500 == 0:
+			lines.append("G1 Z%.2f F1200\n" % (0.2 + i / 500 * 0.2))
+		if i % 50 == 0:
+			lines.append("G1 E%.5f F2400\n" % (i * 0.00071 - 1.0))
+			lines.append("G0 X%.3f Y%.3f F9000\n" % (i * 0.013 % 200, i * 0.029 % 200))
+		lines.append("G1 X%.3f Y%.3f E%.5f F1800\n" % (i * 0.013 % 200, i * 0.029 % 200, i * 0.00071))
+	return lines
+
+
+def read_lines(path):
+	with open(path) as f:
+		return f.readlines()
+
+
+def canonical_lines(lines):
+	"""
+	Rewrites ``lines`` the way the tokenizer reads them: parameters separated by spaces, without line number and
+	checksum, and of parameters given several times only the last one.
+	"""
+	from octoprint.util.gcodeInterpreter import _parameterPattern
+
+	result = []
+	for line in lines:
+		if ";" in line:
+			line = line[0:line.find(";")]
+
+		params = collections.OrderedDict()
+		for letter, value in _parameterPattern.findall(line):
+			if letter != "N":
+				params[letter] = value
+		result.append(" ".join(letter + value for letter, value in params.items()) + "\n")
+	return result
+
+
+def analyse_legacy(lines, printer_profile):
+	from octoprint.util.gcodeInterpreter import getCodeInt, getCodeFloat
+
+	pos = [0.0, 0.0, 0.0]
+	posOffset = [0.0, 0.0, 0.0]
+	currentE = [0.0]
+	totalExtrusion = [0.0]
+	maxExtrusion = [0.0]
+	currentExtruder = 0
+	totalMoveTimeMinute = 0.0
+	absoluteE = True
+	scale = 1.0
+	posAbs = True
+	feedRateXY = min(printer_profile["axes"]["x"]["speed"], printer_profile["axes"]["y"]["speed"])
+	offsets = printer_profile["extruder"]["offsets"]
+	progressCallback = lambda percentage: None
+	abort = False
+
+	filePos = 0
+	for line in lines:
+		# per line bookkeeping of the former implementation
+		if abort:
+			raise RuntimeError()
+		filePos += 1
+		if isinstance(lines, (file)):
+			percentage = None
+		elif isinstance(lines, (list)):
+			percentage = float(filePos) / float(len(lines))
+		else:
+			percentage = None
+		if progressCallback is not None and (filePos % 1000 == 0) and percentage is not None:
+			progressCallback(percentage)
+
+		if ';' in line:
+			line = line[0:line.find(';')]
+
+		G = getCodeInt(line, 'G')
+		M = getCodeInt(line, 'M')
+		T = getCodeInt(line, 'T')
+
+		if G is not None:
+			if G == 0 or G == 1:
+				x = getCodeFloat(line, 'X')
+				y = getCodeFloat(line, 'Y')
+				z = getCodeFloat(line, 'Z')
+				e = getCodeFloat(line, 'E')
+				f = getCodeFloat(line, 'F')
+				oldPos = pos
+				pos = pos[:]
+				if posAbs:
+					if x is not None:
+						pos[0] = x * scale + posOffset[0]
+					if y is not None:
+						pos[1] = y * scale + posOffset[1]
+					if z is not None:
+						pos[2] = z * scale + posOffset[2]
+				else:
+					if x is not None:
+						pos[0] += x * scale
+					if y is not None:
+						pos[1] += y * scale
+					if z is not None:
+						pos[2] += z * scale
+				if f is not None:
+					feedRateXY = f
+
+				moveType = 'move'
+				if e is not None:
+					if absoluteE:
+						e -= currentE[currentExtruder]
+					if e > 0.0:
+						moveType = 'extrude'
+					if e < 0.0:
+						moveType = 'retract'
+					totalExtrusion[currentExtruder] += e
+					currentE[currentExtruder] += e
+					if totalExtrusion[currentExtruder] > maxExtrusion[currentExtruder]:
+						maxExtrusion[currentExtruder] = totalExtrusion[currentExtruder]
+				else:
+					e = 0.0
+
+				if x is not None or y is not None or z is not None:
+					diffX = oldPos[0] - pos[0]
+					diffY = oldPos[1] - pos[1]
+					totalMoveTimeMinute += math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
+				elif moveType == "extrude":
+					diffX = oldPos[0] - pos[0]
+					diffY = oldPos[1] - pos[1]
+					time1 = math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
+					time2 = abs(e / feedRateXY)
+					totalMoveTimeMinute += max(time1, time2)
+				elif moveType == "retract":
+					totalMoveTimeMinute += abs(e / feedRateXY)
+			elif G == 4:
+				S = getCodeFloat(line, 'S')
+				if S is not None:
+					totalMoveTimeMinute += S / 60.0
+				P = getCodeFloat(line, 'P')
+				if P is not None:
+					totalMoveTimeMinute += P / 60.0 / 1000.0
+			elif G == 20:
+				scale = 25.4
+			elif G == 21:
+				scale = 1.0
+			elif G == 28:
+				x = getCodeFloat(line, 'X')
+				y = getCodeFloat(line, 'Y')
+				z = getCodeFloat(line, 'Z')
+				center = [0.0,0.0,0.0]
+				if x is None and y is None and z is None:
+					pos = center
+				else:
+					pos = pos[:]
+					if x is not None:
+						pos[0] = center[0]
+					if y is not None:
+						pos[1] = center[1]
+					if z is not None:
+						pos[2] = center[2]
+			elif G == 90:
+				posAbs = True
+			elif G == 91:
+				posAbs = False
+			elif G == 92:
+				x = getCodeFloat(line, 'X')
+				y = getCodeFloat(line, 'Y')
+				z = getCodeFloat(line, 'Z')
+				e = getCodeFloat(line, 'E')
+				if e is not None:
+					currentE[currentExtruder] = e
+				if x is not None:
+					posOffset[0] = pos[0] - x
+				if y is not None:
+					posOffset[1] = pos[1] - y
+				if z is not None:
+					posOffset[2] = pos[2] - z
+
+		elif M is not None:
+			if M == 82:
+				absoluteE = True
+			elif M == 83:
+				absoluteE = False
+
+		elif T is not None and T <= MAX_EXTRUDERS:
+			posOffset[0] -= offsets[currentExtruder][0] if currentExtruder < len(offsets) else 0
+			posOffset[1] -= offsets[currentExtruder][1] if currentExtruder < len(offsets) else 0
+
+			currentExtruder = T
+
+			posOffset[0] += offsets[currentExtruder][0] if currentExtruder < len(offsets) else 0
+			posOffset[1] += offsets[currentExtruder][1] if currentExtruder < len(offsets) else 0
+
+			for l in (currentE, maxExtrusion, totalExtrusion):
+				if len(l) <= currentExtruder:
+					l.extend([0.0] * (currentExtruder + 1 - len(l)))
+
+	return totalMoveTimeMinute, maxExtrusion
+
+
+def analyse(lines, printer_profile, analyzer_class=None):
+	from octoprint.util.gcodeInterpreter import GcodeAnalyzer
+
+	if analyzer_class is None:
+		analyzer_class = GcodeAnalyzer
+
+	analyzer = analyzer_class(printer_profile, maxExtruders=MAX_EXTRUDERS, estimator="simple")
+	for i in range(0, len(lines), analyzer.chunkSize):
+		analyzer.feed(lines[i:i+analyzer.chunkSize])
+	return analyzer.totalMoveTimeMinute, analyzer.maxExtrusion
+
+
+def analyse_numpy(lines, printer_profile):
+	from octoprint.util.gcodeInterpreter import NumpyGcodeAnalyzer
+	return analyse(lines, printer_profile, analyzer_class=NumpyGcodeAnalyzer)
+
+
+def same_results(expected, actual):
+	return abs(expected[0] - actual[0]) < 1e-6 and len(expected[1]) == len(actual[1]) \
+	       and all(abs(a - b) < 1e-6 for a, b in zip(expected[1], actual[1]))
+
+
+def best_of(rounds, func, *args):
+	best = None
+	for _ in range(rounds):
+		start = time.time()
+		func(*args)
+		duration = time.time() - start
+		if best is None or duration < best:
+			best = duration
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks the GCODE analysis")
+	parser.add_argument("--rounds", type=int, default=3)
+	parser.add_argument("files", nargs="*")
+	args = parser.parse_args()
+
+	from octoprint.printer.profile import PrinterProfileManager
+	profile = PrinterProfileManager.default
+
+	files = args.files
+	if not files:
+		files = [os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "tests", "filemanager", "_files", "bp_case.gcode")]
+	sources = [(os.path.basename(path), read_lines(path)) for path in files]
+	if not args.files:
+		sources.append(("generated", generated_lines()))
+
+	for name, lines in sources:
+		expected = analyse_legacy(canonical_lines(lines), profile)
+		actual = analyse(lines, profile)
+		assert expected == actual, "results differ for %s: %r != %r" % (name, expected, actual)
+
+		candidates = [("legacy", analyse_legacy), ("GcodeAnalyzer", analyse)]
+		if numpy is not None:
+			# the vectorized backend sums up in a different order, allow for rounding differences
+			assert same_results(expected, analyse_numpy(lines, profile)), "results of the NumPy backend differ for %s" % name
+			candidates.append(("NumpyGcodeAnalyzer", analyse_numpy))
+
+		print("%s, %d lines, %.2f min, %r mm" % (name, len(lines), actual[0], actual[1]))
+		for label, func in candidates:
+			print("  %-26s %10.0f lines/sec" % (label, len(lines) / best_of(args.rounds, func, lines, profile)))
+
+
+if __name__ == "__main__":
+	main()
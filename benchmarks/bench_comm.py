@@ -0,0 +1,184 @@
+# coding=utf-8
+"""
+Replays a recorded print through :class:`octoprint.util.comm.MachineCom` and reports the throughput of the
+communication layer: lines sent per second, the latency between receiving an ``ok`` and sending the next line, and
+the CPU time spent per sent line.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_comm.py [--rounds N] [--realtime] [--lines N] [recording gcode]
+
+A recording is made by enabling ``serial.record`` in ``config.yaml``, it's then found in the ``logs`` folder. It has
+to be replayed with the same GCODE file that was printed while recording. Without a recording given, a generated
+file is printed on the virtual printer to record a session first, which is then replayed.
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import glob
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+def generate_gcode(path, lines):
+	with open(path, "wb") as f:
+		f.write("G28\nG90\nM82\n")
+		for i in range(lines):
+			f.write("G1 X%.3f Y%.3f E%.5f F6000 ; move %d\n" % (100 + (i % 40) * 0.1, 100 + (i % 30) * 0.1, i * 0.0005, i))
+		f.write("M105\n")
+
+
+class PrintCallback(object):
+	def __init__(self):
+		from octoprint.util.comm import MachineComPrintCallback
+		self._callback = MachineComPrintCallback()
+		self.done = threading.Event()
+
+	def mcPrintjobDone(self):
+		self.done.set()
+
+	def __getattr__(self, item):
+		return getattr(self._callback, item)
+
+
+def run_print(gcode, callback, starting=None, **kwargs):
+	"""
+	Connects, prints ``gcode`` and disconnects again. ``starting`` is called right before the print is started.
+	Returns the duration of the print and the CPU time spent meanwhile.
+	"""
+	from octoprint.util.comm import MachineCom
+
+	machineCom = MachineCom(callbackObject=callback, **kwargs)
+	try:
+		deadline = time.time() + 30
+		while not machineCom.isOperational():
+			if time.time() > deadline or machineCom.isClosedOrError():
+				raise RuntimeError("Could not connect: %s" % machineCom.getStateString())
+			time.sleep(0.01)
+
+		machineCom.selectFile(gcode, False)
+		if starting is not None:
+			starting()
+
+		cpu_start = sum(os.times()[:2])
+		start = time.time()
+		machineCom.startPrint()
+		if not callback.done.wait(600):
+			raise RuntimeError("Print didn't finish: %s" % machineCom.getStateString())
+		return time.time() - start, sum(os.times()[:2]) - cpu_start
+	finally:
+		machineCom.close()
+		machineCom.thread.join(10)
+
+
+def record(gcode):
+	from octoprint.settings import settings
+
+	s = settings()
+	s.setBoolean(["serial", "record"], True)
+	s.setBoolean(["devel", "virtualPrinter", "enabled"], True)
+	try:
+		run_print(gcode, PrintCallback(), port="VIRTUAL", baudrate=115200)
+	finally:
+		s.setBoolean(["serial", "record"], False)
+
+	return sorted(glob.glob(os.path.join(s.getBaseFolder("logs"), "serial-*.rec")))[-1]
+
+
+def replay(events, gcode, realtime):
+	from octoprint.util.recording import ReplaySerial
+
+	class MeasuringReplaySerial(ReplaySerial):
+		def __init__(self, *args, **kwargs):
+			ReplaySerial.__init__(self, *args, **kwargs)
+			self.latencies = []
+			self.lines = 0
+			self._ok_at = None
+
+		def readline(self):
+			line = ReplaySerial.readline(self)
+			if line.startswith("ok") and self._ok_at is None:
+				self._ok_at = time.time()
+			return line
+
+		def write(self, data):
+			if self._ok_at is not None:
+				self.latencies.append(time.time() - self._ok_at)
+				self._ok_at = None
+			self.lines += 1
+			ReplaySerial.write(self, data)
+
+	transport = MeasuringReplaySerial(events, realtime=realtime)
+
+	def starting():
+		# only measure the print itself
+		transport.lines = 0
+		del transport.latencies[:]
+
+	duration, cpu = run_print(gcode, PrintCallback(), starting=starting, port="REPLAY", baudrate=115200, transport=transport)
+	return duration, transport.lines, cpu, transport.latencies, transport.getStats()
+
+
+def percentile(values, p):
+	if not values:
+		return float("nan")
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks the communication layer by replaying a recorded print")
+	parser.add_argument("--rounds", type=int, default=5)
+	parser.add_argument("--realtime", action="store_true", help="replay at the recorded timing")
+	parser.add_argument("--lines", type=int, default=2000, help="lines of the generated file when recording")
+	parser.add_argument("recording", nargs="?")
+	parser.add_argument("gcode", nargs="?")
+	args = parser.parse_args()
+
+	logging.getLogger().addHandler(logging.NullHandler())
+
+	basedir = tempfile.mkdtemp()
+	try:
+		from octoprint.settings import settings
+		s = settings(init=True, basedir=basedir)
+		s.set(["devel", "virtualPrinter", "throttle"], 0)
+
+		import octoprint.plugin
+		octoprint.plugin.plugin_manager(init=True)
+
+		from octoprint.util.recording import loadRecording
+
+		recording, gcode = args.recording, args.gcode
+		if recording is None:
+			gcode = os.path.join(basedir, "bench.gcode")
+			generate_gcode(gcode, args.lines)
+			print("Recording a print of %d lines on the virtual printer..." % args.lines)
+			recording = record(gcode)
+		elif gcode is None:
+			parser.error("the GCODE file printed while recording is needed for replaying")
+
+		events = loadRecording(recording)
+
+		results = [replay(events, gcode, args.realtime) for _ in range(args.rounds)]
+		duration, lines, cpu, latencies, stats = min(results, key=lambda x: x[0])
+
+		print("%s, %d events, best of %d" % (os.path.basename(recording), len(events), args.rounds))
+		print("  %-22s %10.0f lines/sec" % ("throughput", lines / duration))
+		print("  %-22s %10.3f / %.3f / %.3f ms" % ("ok latency p50/p90/p99", percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000, percentile(latencies, 99) * 1000))
+		print("  %-22s %10.1f us/line" % ("cpu", cpu / lines * 1000000 if lines else float("nan")))
+		print("  %-22s %10d mismatches, %d stalls" % ("divergence", stats["mismatches"], stats["stalls"]))
+	finally:
+		shutil.rmtree(basedir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+	main()
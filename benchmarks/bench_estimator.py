@@ -0,0 +1,176 @@
+# coding=utf-8
+"""
+Compares the print time estimation assuming every move happens at its feedrate (``simple``) with the one simulating
+the acceleration of the printer's firmware (``planner``, see :class:`octoprint.util.planner.TrapezoidalPlanner`).
+
+Accuracy is measured against the print times recorded in the print history of the files in an uploads folder: each
+file with successful prints on record is analysed with the printer profile it was printed with and the estimates are
+compared with the average recorded print time. Throughput is measured on the given GCODE files, extrapolated to a
+100 MB file.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_estimator.py [--rounds N] [--uploads FOLDER] [--profiles FOLDER] [gcode ...]
+
+``--uploads`` is OctoPrint's ``uploads`` folder, ``--profiles`` its ``printerProfiles`` folder (the default printer
+profile is used if not given). Without any GCODE files given, ``tests/filemanager/_files/bp_case.gcode`` is used for
+the throughput.
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import copy
+import itertools
+import os
+import time
+
+import yaml
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+MAX_EXTRUDERS = 10
+ESTIMATORS = ("simple", "planner")
+
+
+def analyzer_classes():
+	from octoprint.util.gcodeInterpreter import GcodeAnalyzer, NumpyGcodeAnalyzer
+
+	classes = [("python", GcodeAnalyzer)]
+	if numpy is not None:
+		classes.append(("numpy", NumpyGcodeAnalyzer))
+	return classes
+
+
+def estimate(path, printer_profile, estimator, analyzer_class):
+	"""
+	Estimated print time of the file at ``path``, in seconds.
+	"""
+	analyzer = analyzer_class(printer_profile, maxExtruders=MAX_EXTRUDERS, estimator=estimator)
+	with open(path, "rb") as f:
+		while True:
+			chunk = list(itertools.islice(f, analyzer.chunkSize))
+			if not chunk:
+				break
+			analyzer.feed(chunk)
+	return analyzer.totalMoveTimeMinute * 60
+
+
+def load_profile(profiles, identifier):
+	from octoprint.printer.profile import PrinterProfileManager
+	from octoprint.util import dict_merge
+
+	profile = copy.deepcopy(PrinterProfileManager.default)
+	path = os.path.join(profiles, "%s.profile" % identifier) if profiles and identifier else None
+	if path and os.path.isfile(path):
+		with open(path) as f:
+			profile = dict_merge(profile, yaml.safe_load(f))
+	return profile
+
+
+def recorded_prints(uploads):
+	"""
+	Yields path, printer profile id and average recorded print time of all files in ``uploads`` with successful
+	prints on record.
+	"""
+	for folder, _, files in os.walk(uploads):
+		if not ".metadata.yaml" in files:
+			continue
+
+		with open(os.path.join(folder, ".metadata.yaml")) as f:
+			metadata = yaml.safe_load(f) or dict()
+
+		for name, data in metadata.items():
+			path = os.path.join(folder, name)
+			if not isinstance(data, dict) or not os.path.isfile(path):
+				continue
+
+			print_times = dict()
+			for entry in data.get("history", []):
+				if entry.get("success") and entry.get("printTime"):
+					print_times.setdefault(entry.get("printerProfile"), []).append(entry["printTime"])
+
+			for profile, times in print_times.items():
+				yield path, profile, sum(times) / len(times)
+
+
+def accuracy(uploads, profiles):
+	analyzer_class = analyzer_classes()[-1][1]
+
+	errors = dict((estimator, []) for estimator in ESTIMATORS)
+	for path, profile_id, actual in recorded_prints(uploads):
+		profile = load_profile(profiles, profile_id)
+
+		line = "%s (%s): actual %.0fs" % (os.path.relpath(path, uploads), profile_id, actual)
+		for estimator in ESTIMATORS:
+			estimated = estimate(path, profile, estimator, analyzer_class)
+			error = (estimated - actual) / actual
+			errors[estimator].append(abs(error))
+			line += ", %s %.0fs (%+.1f%%)" % (estimator, estimated, error * 100)
+		print(line)
+
+	if not errors[ESTIMATORS[0]]:
+		print("No successful prints on record in %s" % uploads)
+		return
+
+	print("Mean absolute error over %d files:" % len(errors[ESTIMATORS[0]]))
+	for estimator in ESTIMATORS:
+		print("  %-10s %6.1f%%" % (estimator, sum(errors[estimator]) / len(errors[estimator]) * 100))
+
+
+def best_of(rounds, func, *args):
+	best = None
+	for _ in range(rounds):
+		start = time.time()
+		func(*args)
+		duration = time.time() - start
+		if best is None or duration < best:
+			best = duration
+	return best
+
+
+def throughput(files, rounds):
+	from octoprint.printer.profile import PrinterProfileManager
+	profile = PrinterProfileManager.default
+
+	for path in files:
+		size = os.path.getsize(path)
+		print("%s, %.1f MB" % (os.path.basename(path), size / 1024.0 / 1024.0))
+		for backend, analyzer_class in analyzer_classes():
+			for estimator in ESTIMATORS:
+				duration = best_of(rounds, estimate, path, profile, estimator, analyzer_class)
+				print("  %-6s %-8s %8.2f MB/sec, %6.1fs for 100 MB, estimated %.0fs" % (backend, estimator,
+				                                                                         size / duration / 1024.0 / 1024.0,
+				                                                                         100.0 * 1024 * 1024 / size * duration,
+				                                                                         estimate(path, profile, estimator, analyzer_class)))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks the print time estimation")
+	parser.add_argument("--rounds", type=int, default=3)
+	parser.add_argument("--uploads", default=None)
+	parser.add_argument("--profiles", default=None)
+	parser.add_argument("files", nargs="*")
+	args = parser.parse_args()
+
+	if args.uploads:
+		accuracy(args.uploads, args.profiles)
+	else:
+		print("No uploads folder given, skipping accuracy against recorded print times")
+
+	files = args.files
+	if not files:
+		files = [os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "tests", "filemanager", "_files", "bp_case.gcode")]
+	throughput(files, args.rounds)
+
+
+if __name__ == "__main__":
+	main()
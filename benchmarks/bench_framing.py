@@ -0,0 +1,99 @@
+# coding=utf-8
+"""
+Compares framing lines for sending (line number, checksum and newline) as formerly done by
+:meth:`octoprint.util.comm.MachineCom._doSendWithChecksum` with :class:`octoprint.util.comm.LineFramer`, both with
+the checksum calculated on the fly and calculated ahead of time as done while reading the file to print.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_framing.py [--rounds N] [gcode ...]
+
+Without any GCODE files given, a generated file of typical moves is used.
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import time
+
+
+def generated_lines(count=50000):
+	return ["G1 X%.3f Y%.3f E%.5f F1800" % (i * 0.013 % 200, i * 0.029 % 200, i * 0.00071) for i in range(count)]
+
+
+def read_lines(path):
+	from octoprint.util.comm import PrintingGcodeFileInformation
+
+	lines = []
+	with open(path) as f:
+		for line in f:
+			parsed = PrintingGcodeFileInformation.parseLine(line)
+			if parsed is not None:
+				lines.append(parsed[0])
+	return lines
+
+
+def frame_legacy(lines):
+	result = []
+	for lineNumber, cmd in enumerate(lines):
+		commandToSend = "N%d %s" % (lineNumber, cmd)
+		checksum = reduce(lambda x,y:x^y, map(ord, commandToSend))
+		commandToSend = "%s*%d" % (commandToSend, checksum)
+		result.append(commandToSend + "\n")
+	return result
+
+
+def frame(lines):
+	from octoprint.util.comm import LineFramer
+
+	frame = LineFramer.frame
+	return [frame(lineNumber, cmd) for lineNumber, cmd in enumerate(lines)]
+
+
+def frame_precalculated(lines, checksums):
+	from octoprint.util.comm import LineFramer
+
+	frame = LineFramer.frame
+	return [frame(lineNumber, cmd, checksum) for lineNumber, (cmd, checksum) in enumerate(zip(lines, checksums))]
+
+
+def best_of(rounds, func, *args):
+	best = None
+	for _ in range(rounds):
+		start = time.time()
+		func(*args)
+		duration = time.time() - start
+		if best is None or duration < best:
+			best = duration
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks framing of lines for sending")
+	parser.add_argument("--rounds", type=int, default=5)
+	parser.add_argument("files", nargs="*")
+	args = parser.parse_args()
+
+	from octoprint.util.comm import LineFramer
+
+	sources = [(path, read_lines(path)) for path in args.files]
+	if not sources:
+		sources = [("generated", generated_lines())]
+
+	for name, lines in sources:
+		assert frame_legacy(lines) == frame(lines)
+		checksums = [LineFramer.checksum(line) for line in lines]
+
+		print("%s, %d lines" % (name, len(lines)))
+		for label, func, func_args in (("legacy", frame_legacy, (lines,)),
+		                               ("LineFramer", frame, (lines,)),
+		                               ("LineFramer, precalculated", frame_precalculated, (lines, checksums))):
+			print("  %-26s %10.0f lines/sec" % (label, len(lines) / best_of(args.rounds, func, *func_args)))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,112 @@
+# coding=utf-8
+"""
+Compares the metadata backends of :class:`octoprint.filemanager.storage.LocalFileStorage`, ``.metadata.yaml`` files
+rewritten as a whole on every change (``yaml``) and a SQLite database updated per file (``sqlite``), in a folder with
+a given number of files, each with an analysis result and some print history:
+
+* ``history``: adding a history entry after a print, the metadata of the folder being cached
+* ``cold read``: reading the metadata of a single file with the cache missing (e.g. after a restart or after other
+  folders pushed the folder out of the cache)
+* ``list``: listing the folder with the cache missing
+* ``warm list``: listing the folder with the cache in place
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_metadata.py [--rounds N] [--files N]
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+BACKENDS = ("yaml", "sqlite")
+
+
+def file_metadata(i):
+	return dict(
+		hash="%040x" % i,
+		links=[],
+		notes=[],
+		analysis=dict(
+			estimatedPrintTime=3600.0 + i,
+			filament=dict(tool0=dict(length=1400.0 + i, volume=8.9))
+		),
+		history=[dict(timestamp=1400000000.0 + j, success=True, printTime=3700.0 + j, printerProfile="_default") for j in range(5)]
+	)
+
+
+def create_storage(basefolder, backend, count):
+	from octoprint.filemanager.storage import LocalFileStorage
+
+	metadata = dict()
+	for i in range(count):
+		name = "file%05d.gcode" % i
+		open(os.path.join(basefolder, name), "w").close()
+		metadata[name] = file_metadata(i)
+
+	storage = LocalFileStorage(basefolder, metadata_backend=backend)
+	storage._save_metadata(storage.basefolder, metadata)
+	return storage
+
+
+def add_history(storage):
+	storage.add_history("file00000.gcode", dict(timestamp=time.time(), success=True, printTime=3600.0, printerProfile="_default"))
+
+
+def cold_read(storage):
+	storage._metadata_cache.clear()
+	storage.get_metadata("file00000.gcode")
+
+
+def cold_list(storage):
+	storage._metadata_cache.clear()
+	storage.list_files()
+
+
+def warm_list(storage):
+	storage.list_files()
+
+
+def best_of(rounds, func, *args):
+	best = None
+	for _ in range(rounds):
+		start = time.time()
+		func(*args)
+		duration = time.time() - start
+		if best is None or duration < best:
+			best = duration
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks the metadata backends of the local file storage")
+	parser.add_argument("--rounds", type=int, default=5)
+	parser.add_argument("--files", type=int, default=2000)
+	args = parser.parse_args()
+
+	print("%d files in one folder" % args.files)
+	for backend in BACKENDS:
+		basefolder = tempfile.mkdtemp()
+		try:
+			storage = create_storage(basefolder, backend, args.files)
+			storage.get_metadata("file00000.gcode")
+			print("  %-6s history %8.2f ms, cold read %8.2f ms, list %8.2f ms, warm list %8.2f ms" % (backend,
+			                                                                                        best_of(args.rounds, add_history, storage) * 1000,
+			                                                                                        best_of(args.rounds, cold_read, storage) * 1000,
+			                                                                                        best_of(args.rounds, cold_list, storage) * 1000,
+			                                                                                        best_of(args.rounds, warm_list, storage) * 1000))
+		finally:
+			shutil.rmtree(basefolder)
+
+
+if __name__ == "__main__":
+	main()
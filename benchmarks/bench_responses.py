@@ -0,0 +1,91 @@
+# coding=utf-8
+"""
+Replays captured printer responses through the response parsing of :class:`octoprint.util.comm.MachineCom` and
+reports the processed lines per second.
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_responses.py [--rounds N] [--controls] [log ...]
+
+Without any log files given, the captured Marlin and Repetier logs in ``benchmarks/_logs`` are replayed. With
+``--controls`` a couple of typical feedback controls are configured so their matching is included as well.
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import glob
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+
+FEEDBACK_CONTROLS = [
+	{
+		"type": "section",
+		"name": "Feedback",
+		"children": [
+			{"type": "feedback", "name": "Position", "regex": "X:([0-9.]+) Y:([0-9.]+) Z:([0-9.]+) E:([0-9.]+)", "template": "X: {0}, Y: {1}, Z: {2}, E: {3}"},
+			{"type": "feedback", "name": "Firmware", "regex": "FIRMWARE_NAME:([^\s]+)", "template": "Firmware: {0}"},
+			{"type": "feedback", "name": "Fan", "regex": "Fanspeed:(\d+)", "template": "Fan: {0}"},
+			{"type": "feedback", "name": "Endstops", "regex": "x_min:\s*(\w+) y_min:\s*(\w+) z_min:\s*(\w+)", "template": "{0} {1} {2}"}
+		]
+	}
+]
+
+
+def replay(lines):
+	import octoprint.util.comm as comm
+	from octoprint.util.recording import ReplaySerial, RECEIVED
+
+	# plain logs only contain received lines, so the replay never has to wait for writes
+	transport = ReplaySerial([(0.0, RECEIVED, line) for line in lines], closeAtEnd=True)
+
+	start = time.time()
+	machineCom = comm.MachineCom("REPLAY", 115200, callbackObject=comm.MachineComPrintCallback(), transport=transport)
+	machineCom.thread.join()
+	return time.time() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks parsing of printer responses")
+	parser.add_argument("--rounds", type=int, default=10)
+	parser.add_argument("--controls", action="store_true", help="configure some feedback controls")
+	parser.add_argument("logs", nargs="*")
+	args = parser.parse_args()
+
+	logging.getLogger().addHandler(logging.NullHandler())
+
+	logs = args.logs
+	if not logs:
+		logs = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "_logs", "*.log")))
+
+	basedir = tempfile.mkdtemp()
+	try:
+		from octoprint.settings import settings
+		s = settings(init=True, basedir=basedir)
+		s.setBoolean(["feature", "waitForStartOnConnect"], True)
+		if args.controls:
+			s.set(["controls"], FEEDBACK_CONTROLS)
+
+		import octoprint.plugin
+		octoprint.plugin.plugin_manager(init=True)
+
+		for log in logs:
+			with open(log) as f:
+				lines = f.readlines()
+
+			best = min(replay(lines) for _ in range(args.rounds))
+			print("%-20s %6d lines  %10.0f lines/sec" % (os.path.basename(log), len(lines), len(lines) / best))
+	finally:
+		shutil.rmtree(basedir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,120 @@
+# coding=utf-8
+"""
+Measures receiving a file upload through :class:`octoprint.server.util.tornado.UploadStorageFallbackHandler` and
+adding it to a :class:`octoprint.filemanager.storage.LocalFileStorage` afterwards, for a multipart body of a given size
+fed to the handler in chunks like Tornado does:
+
+* ``receive``: parsing the body and writing the file to its temporary location
+* ``add``: moving the file into the storage until its hash is known
+
+Usage::
+
+    PYTHONPATH=src python benchmarks/bench_upload.py [--rounds N] [--size MB] [--chunk KB]
+"""
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+import tornado.httputil
+import tornado.web
+
+
+BOUNDARY = "----WebKitFormBoundarypYiSUx63abAmhT5C"
+
+
+def create_body(size):
+	line = "G1 X10.000 Y10.000 E0.12345\r\n"
+	contents = line * (size / len(line))
+	return "".join([
+		"--%s\r\n" % BOUNDARY,
+		"Content-Disposition: form-data; name=\"file\"; filename=\"test.gcode\"\r\n",
+		"Content-Type: application/octet-stream\r\n",
+		"\r\n",
+		contents,
+		"\r\n--%s\r\n" % BOUNDARY,
+		"Content-Disposition: form-data; name=\"select\"\r\n",
+		"\r\n",
+		"true\r\n",
+		"--%s--\r\n" % BOUNDARY
+	])
+
+
+def receive(body, chunk_size, folder, fallback):
+	from octoprint.server.util.tornado import UploadStorageFallbackHandler
+
+	headers = tornado.httputil.HTTPHeaders({"Content-Type": "multipart/form-data; boundary=" + BOUNDARY,
+	                                        "Content-Length": str(len(body))})
+	request = tornado.httputil.HTTPServerRequest(method="POST", uri="/api/files/local", headers=headers, connection=mock.MagicMock())
+	handler = UploadStorageFallbackHandler(tornado.web.Application(), request, fallback=fallback, path=folder)
+	handler.prepare()
+	for i in range(0, len(body), chunk_size):
+		handler.data_received(body[i:i + chunk_size])
+	handler.post()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks receiving and storing file uploads")
+	parser.add_argument("--rounds", type=int, default=3)
+	parser.add_argument("--size", type=int, default=200)
+	parser.add_argument("--chunk", type=int, default=64)
+	args = parser.parse_args()
+
+	from octoprint.filemanager.storage import LocalFileStorage
+
+	body = create_body(args.size * 1024 * 1024)
+	basefolder = tempfile.mkdtemp()
+	try:
+		upload_folder = os.path.join(basefolder, ".tmp")
+		os.mkdir(upload_folder)
+		storage = LocalFileStorage(basefolder)
+
+		best_receive = best_add = None
+		for _ in range(args.rounds):
+			timings = dict()
+
+			def fallback(request, new_body):
+				timings["received"] = time.time()
+
+				arguments = dict()
+				tornado.httputil.parse_body_arguments(request.headers["Content-Type"], new_body, arguments, dict())
+				upload_path = arguments["file.path"][0]
+				file_hash = arguments["file.hash"][0] if "file.hash" in arguments else None
+
+				class Upload(object):
+					def save(self, path):
+						shutil.move(upload_path, path)
+
+				if file_hash is not None:
+					storage.add_file("test.gcode", Upload(), allow_overwrite=True, file_hash=file_hash)
+				else:
+					storage.add_file("test.gcode", Upload(), allow_overwrite=True)
+				storage.get_hash("test.gcode").result()
+				timings["added"] = time.time()
+
+			start = time.time()
+			receive(body, args.chunk * 1024, upload_folder, fallback)
+
+			duration = timings["received"] - start
+			if best_receive is None or duration < best_receive:
+				best_receive = duration
+			duration = timings["added"] - timings["received"]
+			if best_add is None or duration < best_add:
+				best_add = duration
+
+		print("%d MB upload in %d KB chunks: receive %8.2f ms, add %8.2f ms" % (args.size, args.chunk, best_receive * 1000, best_add * 1000))
+	finally:
+		shutil.rmtree(basefolder)
+
+
+if __name__ == "__main__":
+	main()
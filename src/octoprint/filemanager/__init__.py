@@ -5,6 +5,7 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import functools
 import logging
 import os
 
@@ -12,7 +13,8 @@ from octoprint.events import eventManager, Events
 from octoprint.plugin import plugin_manager, ProgressPlugin
 
 from .destinations import FileDestinations
-from .analysis import QueueEntry, AnalysisQueue
+from .analysis import QueueEntry, AnalysisQueue, without_layers
+from .layerindex import LayerIndex
 from .storage import LocalFileStorage
 
 extensions = dict(
@@ -95,10 +97,12 @@ class NoSuchStorage(Exception):
 
 
 class FileManager(object):
-	def __init__(self, analysis_queue, slicing_manager, printer_profile_manager, initial_storage_managers=None):
+	def __init__(self, analysis_queue, slicing_manager, printer_profile_manager, initial_storage_managers=None, analysis_cache=None, job_cache=None):
 		self._logger = logging.getLogger(__name__)
 		self._analysis_queue = analysis_queue
 		self._analysis_queue.register_finish_callback(self._on_analysis_finished)
+		self._analysis_cache = analysis_cache
+		self._job_cache = job_cache
 
 		self._storage_managers = dict()
 		if initial_storage_managers:
@@ -117,6 +121,7 @@ class FileManager(object):
 		self._progress_plugins = plugin_manager().get_implementations(ProgressPlugin)
 
 		for storage_type, storage_manager in self._storage_managers.items():
+			storage_manager.register_hashed_callback(functools.partial(self._on_file_hashed, storage_type))
 			self._determine_analysis_backlog(storage_type, storage_manager)
 
 	def register_slicingprogress_callback(self, callback):
@@ -132,10 +137,11 @@ class FileManager(object):
 
 			# we'll use the default printer profile for the backlog since we don't know better
 			queue_entry = QueueEntry(entry, file_type, storage_type, path, self._printer_profile_manager.get_default())
-			self._analysis_queue.enqueue(queue_entry, high_priority=False)
+			self._enqueue_analysis(queue_entry, high_priority=False)
 
 	def add_storage(self, storage_type, storage_manager):
 		self._storage_managers[storage_type] = storage_manager
+		storage_manager.register_hashed_callback(functools.partial(self._on_file_hashed, storage_type))
 		self._determine_analysis_backlog(storage_type, storage_manager)
 
 	def remove_storage(self, type):
@@ -166,8 +172,7 @@ class FileManager(object):
 				elif _cancelled:
 					eventManager().fire(Events.SLICING_CANCELLED, {"stl": source_path, "gcode": dest_path})
 				else:
-					source_meta = self.get_metadata(source_location, source_path)
-					hash = source_meta["hash"]
+					hash = self._storage(source_location).get_hash(source_path).result()
 
 					class Wrapper(object):
 						def __init__(self, stl_name, temp_path, hash):
@@ -286,18 +291,22 @@ class FileManager(object):
 			result[dst] = self._storage_managers[dst].list_files(path=path, filter=filter, recursive=recursive)
 		return result
 
-	def add_file(self, destination, path, file_object, links=None, allow_overwrite=False, printer_profile=None, analysis=None):
+	def add_file(self, destination, path, file_object, links=None, allow_overwrite=False, printer_profile=None, analysis=None, file_hash=None):
 		if printer_profile is None:
 			printer_profile = self._printer_profile_manager.get_current_or_default()
 
-		file_path = self._storage(destination).add_file(path, file_object, links=links, printer_profile=printer_profile, allow_overwrite=allow_overwrite)
+		file_path = self._storage(destination).add_file(path, file_object, links=links, printer_profile=printer_profile, allow_overwrite=allow_overwrite, file_hash=file_hash)
 		absolute_path = self._storage(destination).get_absolute_path(file_path)
 
 		if analysis is None:
 			file_type = get_file_type(absolute_path)
 			if file_type:
 				queue_entry = QueueEntry(file_path, file_type[-1], destination, absolute_path, printer_profile)
-				self._analysis_queue.enqueue(queue_entry, high_priority=True)
+
+				# the file is hashed in the background, the analysis cache needs the hash though
+				def on_hashed(future):
+					self._enqueue_analysis(queue_entry, high_priority=True)
+				self._storage(destination).get_hash(file_path).add_done_callback(on_hashed)
 		else:
 			self._add_analysis_result(destination, path, analysis)
 
@@ -317,9 +326,18 @@ class FileManager(object):
 		self._storage(destination).remove_folder(path, recursive=recursive)
 		eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
 
+	def get_revision(self, destination):
+		return self._storage(destination).get_revision()
+
+	def get_changes(self, destination, revision):
+		return self._storage(destination).get_changes(revision)
+
 	def get_metadata(self, destination, path):
 		return self._storage(destination).get_metadata(path)
 
+	def get_layer_index(self, destination, path):
+		return self._storage(destination).get_layer_index(path)
+
 	def add_link(self, destination, path, rel, data):
 		self._storage(destination).add_link(path, rel, data)
 
@@ -374,8 +392,52 @@ class FileManager(object):
 			return
 
 		storage_manager = self._storage_managers[destination]
-		storage_manager.set_additional_metadata(path, "analysis", result)
+		storage_manager.set_additional_metadata(path, "analysis", without_layers(result))
+		if result and result.get("layers"):
+			storage_manager.set_layer_index(path, LayerIndex.from_analysis(result["layers"]))
+
+	def _enqueue_analysis(self, entry, high_priority=False):
+		cache_key = self._get_analysis_cache_key(entry)
+		if cache_key is not None:
+			result = self._analysis_cache.get(*cache_key)
+			if result is not None:
+				self._logger.debug("Using cached analysis result for {entry}".format(**locals()))
+				self._add_analysis_result(entry.location, entry.path, result)
+				eventManager().fire(Events.METADATA_ANALYSIS_FINISHED, {"file": entry.path, "result": without_layers(result)})
+				return
+
+		self._analysis_queue.enqueue(entry, high_priority=high_priority)
+
+	def _get_analysis_cache_key(self, entry):
+		if self._analysis_cache is None or not entry.location in self._storage_managers:
+			return None
+
+		key_data = self._analysis_queue.get_cache_key_data(entry)
+		if key_data is None:
+			return None
+
+		metadata = self._storage_managers[entry.location].get_metadata(entry.path)
+		if not metadata or not "hash" in metadata:
+			return None
+
+		return metadata["hash"], key_data
+
+	def _on_file_hashed(self, destination, path, file_hash):
+		if self._job_cache is None or destination != FileDestinations.LOCAL:
+			return
+
+		file_type = get_file_type(path)
+		if not file_type or file_type[0] != "machinecode":
+			return
+
+		# build the cached print job right away so it's ready once the file gets printed, the cache holds the build
+		# back while a printer is printing
+		self._job_cache.schedule(file_hash, self._storage(destination).get_absolute_path(path))
 
 	def _on_analysis_finished(self, entry, result):
 		self._add_analysis_result(entry.location, entry.path, result)
 
+		cache_key = self._get_analysis_cache_key(entry)
+		if cache_key is not None:
+			self._analysis_cache.set(*cache_key, result=result)
+
@@ -7,12 +7,15 @@ __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms
 
 
 import logging
+import multiprocessing
 import Queue as queue
 import os
 import threading
 import collections
 
 from octoprint.events import Events, eventManager
+from octoprint.settings import settings
+from octoprint.util import cleanUpAfterFork
 
 import octoprint.util.gcodeInterpreter as gcodeInterpreter
 
@@ -22,14 +25,37 @@ class QueueEntry(collections.namedtuple("QueueEntry", "path, type, location, abs
 		return "{location}:{path}".format(location=self.location, path=self.path)
 
 
+def without_layers(result):
+	"""
+	Returns the analysis ``result`` without its per layer breakdown, which is only kept in the file's layer index and
+	not in its metadata, file listings or events.
+	"""
+	if not result or not "layers" in result:
+		return result
+	return dict((key, value) for key, value in result.items() if key != "layers")
+
+
 class AnalysisQueue(object):
-	def __init__(self):
+	"""
+	Analyses files in the background, dispatching by type to the respective analysis queue.
+
+	With ``processes`` set to 0 the analyses run one after the other in a thread of the server process, otherwise
+	each queue analyses up to ``processes`` files in parallel, each in its own worker process. The worker processes are
+	forked right away, so the queue has to be created while the server is starting up, before it starts any other
+	threads.
+	"""
+
+	def __init__(self, processes=0):
 		self._logger = logging.getLogger(__name__)
 		self._callbacks = []
 		self._queues = dict(
-			gcode=GcodeAnalysisQueue(self._analysis_finished)
+			gcode=GcodeAnalysisQueue(self._analysis_finished, processes=processes)
 		)
 
+		# several printers may pause the analysis at the same time, it's only resumed once all of them are done
+		self._pause_count = 0
+		self._pause_mutex = threading.Lock()
+
 	def register_finish_callback(self, callback):
 		self._callbacks.append(callback)
 
@@ -43,20 +69,44 @@ class AnalysisQueue(object):
 		self._queues[entry.type].enqueue(entry, high_priority=high_priority)
 
 	def pause(self):
-		for queue in self._queues.values():
-			queue.pause()
+		with self._pause_mutex:
+			self._pause_count += 1
+			if self._pause_count > 1:
+				return
+
+			for analysis_queue in self._queues.values():
+				analysis_queue.pause()
 
 	def resume(self):
-		for queue in self._queues.values():
-			queue.resume()
+		with self._pause_mutex:
+			if self._pause_count == 0:
+				return
+			self._pause_count -= 1
+			if self._pause_count > 0:
+				return
+
+			for analysis_queue in self._queues.values():
+				analysis_queue.resume()
+
+	def is_paused(self):
+		return self._pause_count > 0
+
+	def get_cache_key_data(self, entry):
+		"""
+		Returns everything besides the file's contents the analysis result of ``entry`` depends on, ``None`` if results
+		for its type can't be cached.
+		"""
+		if not entry.type in self._queues:
+			return None
+		return self._queues[entry.type].get_cache_key_data(entry)
 
 	def _analysis_finished(self, entry, result):
 		for callback in self._callbacks:
 			callback(entry, result)
-		eventManager().fire(Events.METADATA_ANALYSIS_FINISHED, {"file": entry.path, "result": result})
+		eventManager().fire(Events.METADATA_ANALYSIS_FINISHED, {"file": entry.path, "result": without_layers(result)})
 
 class AbstractAnalysisQueue(object):
-	def __init__(self, finished_callback):
+	def __init__(self, finished_callback, processes=0):
 		self._logger = logging.getLogger(__name__)
 
 		self._finished_callback = finished_callback
@@ -64,15 +114,26 @@ class AbstractAnalysisQueue(object):
 		self._active = threading.Event()
 		self._active.set()
 
-		self._currentFile = None
-		self._currentProgress = None
-
 		self._queue = queue.PriorityQueue()
-		self._current = None
 
-		self._worker = threading.Thread(target=self._work)
-		self._worker.daemon = True
-		self._worker.start()
+		# entries currently being analysed, per worker slot
+		self._current = dict()
+		self._current_mutex = threading.Lock()
+
+		if processes > 0:
+			# forked right away, before the worker threads of this queue exist
+			self._processes = [AnalysisProcess(self._do_analysis, self._do_abort) for _ in range(processes)]
+			for process in self._processes:
+				process.start()
+		else:
+			self._processes = None
+
+		self._workers = []
+		for slot in range(max(processes, 1)):
+			worker = threading.Thread(target=self._work, args=(slot,))
+			worker.daemon = True
+			worker.start()
+			self._workers.append(worker)
 
 	def enqueue(self, entry, high_priority=False):
 		if high_priority:
@@ -87,53 +148,74 @@ class AbstractAnalysisQueue(object):
 	def pause(self):
 		self._logger.debug("Pausing analysis")
 		self._active.clear()
-		if self._current is not None:
+
+		with self._current_mutex:
+			slots = list(self._current.keys())
+		if slots:
 			self._logger.debug("Aborting running analysis, will restart when analyzer is resumed")
-			self._do_abort()
+			for slot in slots:
+				if self._processes is not None:
+					self._processes[slot].abort()
+				else:
+					self._do_abort()
 
 	def resume(self):
 		self._logger.debug("Resuming analyzer")
 		self._active.set()
 
-	def _work(self):
+	def _work(self, slot):
 		aborted = None
 		while True:
 			if aborted is not None:
-				entry = aborted
+				entry, checkpoint = aborted
 				aborted = None
 				self._logger.debug("Got an aborted analysis job for entry {entry}, processing this instead of first item in queue".format(**locals()))
 			else:
 				(priority, entry) = self._queue.get()
+				checkpoint = None
 				self._logger.debug("Processing entry {entry} from queue (priority {priority})".format(**locals()))
 
 			self._active.wait()
 
 			try:
-				self._analyze(entry)
-				self._queue.task_done()
-			except gcodeInterpreter.AnalysisAborted:
-				aborted = entry
+				self._analyze(slot, entry, checkpoint=checkpoint)
+			except gcodeInterpreter.AnalysisAborted as e:
+				# keep the latest checkpoint, to continue from there once resumed
+				aborted = (entry, e.checkpoint if e.checkpoint is not None else checkpoint)
 				self._logger.debug("Running analysis of entry {entry} aborted".format(**locals()))
+				continue
+			except:
+				self._logger.exception("Error while analysing entry {entry}".format(**locals()))
+			self._queue.task_done()
 
-	def _analyze(self, entry):
+	def _analyze(self, slot, entry, checkpoint=None):
 		path = entry.absolute_path
 		if path is None or not os.path.exists(path):
 			return
 
-		self._current = entry
-		self._current_progress = 0
+		with self._current_mutex:
+			if not self._active.is_set():
+				# paused while we were picking up the entry
+				raise gcodeInterpreter.AnalysisAborted(checkpoint=checkpoint)
+			self._current[slot] = entry
 
 		try:
 			self._logger.debug("Starting analysis of {entry}".format(**locals()))
 			eventManager().fire(Events.METADATA_ANALYSIS_STARTED, {"file": entry.path, "type": entry.type})
-			result = self._do_analysis()
+			if self._processes is not None:
+				result = self._processes[slot].analyze(entry, checkpoint=checkpoint)
+			else:
+				result = self._do_analysis(entry, checkpoint=checkpoint)
 			self._logger.debug("Analysis of entry {entry} finished, notifying callback".format(**locals()))
-			self._finished_callback(self._current, result)
+			self._finished_callback(entry, result)
 		finally:
-			self._current = None
-			self._current_progress = None
+			with self._current_mutex:
+				del self._current[slot]
 
-	def _do_analysis(self):
+	def get_cache_key_data(self, entry):
+		return None
+
+	def _do_analysis(self, entry, checkpoint=None):
 		return None
 
 	def _do_abort(self):
@@ -142,10 +224,28 @@ class AbstractAnalysisQueue(object):
 
 class GcodeAnalysisQueue(AbstractAnalysisQueue):
 
-	def _do_analysis(self):
+	def get_cache_key_data(self, entry):
+		printer_profile = entry.printer_profile
+		if printer_profile is None:
+			return None
+
+		estimator = settings().get(["gcodeAnalysis", "estimator"])
+		return dict(
+			type="gcode",
+			version=gcodeInterpreter.ANALYSIS_VERSION,
+			backend=gcodeInterpreter.analyzerBackend(settings().get(["gcodeAnalysis", "backend"])),
+			estimator=estimator,
+			planner=printer_profile["planner"] if estimator == "planner" else None,
+			max_extruders=settings().getInt(["gcodeAnalysis", "maxExtruders"]),
+			speed=[printer_profile["axes"]["x"]["speed"], printer_profile["axes"]["y"]["speed"]],
+			offsets=[list(offset) for offset in printer_profile["extruder"]["offsets"]]
+		)
+
+	def _do_analysis(self, entry, checkpoint=None):
 		try:
-			self._gcode = gcodeInterpreter.gcode()
-			self._gcode.load(self._current.absolute_path, self._current.printer_profile)
+			self._gcode = gcodeInterpreter.gcode(backend=settings().get(["gcodeAnalysis", "backend"]),
+			                                     estimator=settings().get(["gcodeAnalysis", "estimator"]))
+			self._gcode.load(entry.absolute_path, entry.printer_profile, checkpoint=checkpoint)
 
 			result = dict()
 			if self._gcode.totalMoveTimeMinute:
@@ -157,10 +257,174 @@ class GcodeAnalysisQueue(AbstractAnalysisQueue):
 						"length": self._gcode.extrusionAmount[i],
 						"volume": self._gcode.extrusionVolume[i]
 					}
+			if self._gcode.layers:
+				result["layers"] = []
+				for layer in self._gcode.layers:
+					result["layers"].append({
+						"z": layer["z"],
+						"line": layer["line"],
+						"offset": layer["offset"],
+						"estimatedPrintTime": layer["moveTimeMinute"] * 60,
+						"filament": dict(("tool%d" % tool, {"length": length}) for tool, length in layer["extrusion"].items())
+					})
 			return result
 		finally:
 			self._gcode = None
 
 	def _do_abort(self):
 		if self._gcode:
-			self._gcode.abort()
\ No newline at end of file
+			self._gcode.abort()
+
+
+_ANALYZE = "analyze"
+_ABORT = "abort"
+_RESULT = "result"
+_ABORTED = "aborted"
+_FAILED = "failed"
+_RECORD = "record"
+
+
+class AnalysisProcess(object):
+	"""
+	Runs analyses one at a time in a separate worker process.
+
+	The process should be forked via :meth:`start` while the server is still starting up, before any other threads
+	exist. It is forked again on use if it died, from whatever thread is analysing then, so the process cleans up what
+	it inherited first, see :func:`octoprint.util.cleanUpAfterFork`. ``analyze`` is called within it with the
+	:class:`QueueEntry` to analyse and the checkpoint to resume from (if any) and has to return the result, ``abort``
+	is called within it to abort the running analysis, which then has to raise
+	:class:`~octoprint.util.gcodeInterpreter.AnalysisAborted`.
+	"""
+
+	def __init__(self, analyze, abort):
+		self._logger = logging.getLogger(__name__)
+		self._analyze = analyze
+		self._abort = abort
+
+		self._process = None
+		self._connection = None
+		self._mutex = threading.Lock()
+
+	def start(self):
+		"""
+		Forks the worker process unless it's already running.
+		"""
+		with self._mutex:
+			if self._process is None or not self._process.is_alive():
+				self._start()
+
+	def analyze(self, entry, checkpoint=None):
+		"""
+		Analyses ``entry`` in the worker process, resuming from ``checkpoint`` if given, and returns the result. Raises
+		:class:`~octoprint.util.gcodeInterpreter.AnalysisAborted` with the checkpoint to resume from if the analysis
+		was aborted.
+		"""
+
+		with self._mutex:
+			if self._process is None or not self._process.is_alive():
+				self._start()
+			connection = self._connection
+			connection.send((_ANALYZE, entry, checkpoint))
+
+		while True:
+			try:
+				message = connection.recv()
+			except (IOError, EOFError):
+				with self._mutex:
+					self._process = None
+				raise RuntimeError("Analysis process died while analysing {entry}".format(entry=entry))
+
+			if message[0] == _RECORD:
+				_, name, level, text = message
+				logging.getLogger(name).log(level, text)
+			elif message[0] == _RESULT:
+				return message[1]
+			elif message[0] == _ABORTED:
+				raise gcodeInterpreter.AnalysisAborted(checkpoint=message[1])
+			elif message[0] == _FAILED:
+				raise RuntimeError("Analysis of {entry} failed: {error}".format(entry=entry, error=message[1]))
+
+	def abort(self):
+		with self._mutex:
+			if self._connection is not None:
+				self._connection.send((_ABORT, None))
+
+	def _start(self):
+		if self._connection is not None:
+			self._connection.close()
+
+		self._connection, connection = multiprocessing.Pipe()
+		self._process = multiprocessing.Process(target=self._serve, args=(connection,), name="AnalysisProcess")
+		self._process.daemon = True
+		self._process.start()
+		connection.close()
+
+	def _serve(self, connection):
+		# runs in the worker process
+		cleanUpAfterFork(keep=[connection.fileno()])
+
+		send_mutex = threading.Lock()
+		def send(message):
+			with send_mutex:
+				connection.send(message)
+
+		handler = _ForwardingLogHandler(send)
+		handler.setFormatter(logging.Formatter("%(message)s"))
+		for logger in [logging.getLogger()] + [l for l in logging.Logger.manager.loggerDict.values() if isinstance(l, logging.Logger)]:
+			for h in list(logger.handlers):
+				logger.removeHandler(h)
+			logger.propagate = True
+		logging.getLogger().addHandler(handler)
+
+		entries = queue.Queue()
+		abort_requested = threading.Event()
+
+		def receive():
+			while True:
+				try:
+					message = connection.recv()
+				except (IOError, EOFError):
+					# the server is gone
+					entries.put(None)
+					break
+
+				if message[0] == _ANALYZE:
+					entries.put((message[1], message[2]))
+				elif message[0] == _ABORT:
+					abort_requested.set()
+					self._abort()
+		receiver = threading.Thread(target=receive, name="AnalysisProcessReceiver")
+		receiver.daemon = True
+		receiver.start()
+
+		while True:
+			job = entries.get()
+			if job is None:
+				break
+			entry, checkpoint = job
+
+			try:
+				if abort_requested.is_set():
+					raise gcodeInterpreter.AnalysisAborted(checkpoint=checkpoint)
+				result = self._analyze(entry, checkpoint=checkpoint)
+			except gcodeInterpreter.AnalysisAborted as e:
+				send((_ABORTED, e.checkpoint))
+			except Exception as e:
+				logging.getLogger(__name__).exception("Error while analysing {entry}".format(entry=entry))
+				send((_FAILED, str(e)))
+			else:
+				send((_RESULT, result))
+			finally:
+				abort_requested.clear()
+
+
+class _ForwardingLogHandler(logging.Handler):
+	def __init__(self, send):
+		logging.Handler.__init__(self)
+		self._send = send
+
+	def emit(self, record):
+		try:
+			self._send((_RECORD, record.name, record.levelno, self.format(record)))
+		except:
+			self.handleError(record)
@@ -0,0 +1,99 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from octoprint.util import safeRename, silentRemove
+
+
+class AnalysisCache(object):
+	"""
+	Persistent cache of analysis results, shared by all files and storages.
+
+	Results are keyed by the hash of the analysed file's contents and the ``key_data`` the analysis depends on
+	otherwise, as provided by :meth:`octoprint.filemanager.analysis.AnalysisQueue.get_cache_key_data` (the version of
+	the analysis and the relevant parts of the printer profile). Identical files therefore only get analysed once,
+	regardless of their name or location.
+
+	Each result is stored as JSON file in ``folder``. At most ``max_entries`` results are kept, the least recently used
+	ones are removed first.
+	"""
+
+	def __init__(self, folder, max_entries=1000):
+		self._logger = logging.getLogger(__name__)
+
+		self._folder = folder
+		self._max_entries = max_entries
+
+		self._mutex = threading.Lock()
+
+	def get(self, file_hash, key_data):
+		"""
+		Returns the cached result for the file with hash ``file_hash`` analysed under ``key_data``, ``None`` if there is
+		none.
+		"""
+		path = self._path(file_hash, key_data)
+		try:
+			with open(path) as f:
+				result = json.load(f)
+		except IOError:
+			return None
+		except ValueError:
+			self._logger.warn("Removing unreadable analysis cache entry {path}".format(**locals()))
+			silentRemove(path)
+			return None
+
+		try:
+			# mark as recently used
+			os.utime(path, None)
+		except OSError:
+			pass
+		return result
+
+	def set(self, file_hash, key_data, result):
+		"""
+		Stores ``result`` as the result for the file with hash ``file_hash`` analysed under ``key_data``.
+		"""
+		fh, temporary_path = tempfile.mkstemp(dir=self._folder)
+		try:
+			with os.fdopen(fh, "w") as f:
+				json.dump(result, f)
+			safeRename(temporary_path, self._path(file_hash, key_data), throw_error=True)
+		except:
+			self._logger.exception("Error while writing analysis cache entry for {file_hash}".format(**locals()))
+			return
+		finally:
+			silentRemove(temporary_path)
+
+		self._evict()
+
+	def _evict(self):
+		with self._mutex:
+			entries = []
+			for entry in os.listdir(self._folder):
+				if not entry.endswith(".json"):
+					continue
+				try:
+					entries.append((os.stat(os.path.join(self._folder, entry)).st_mtime, entry))
+				except OSError:
+					pass
+
+			if len(entries) <= self._max_entries:
+				return
+
+			for _, entry in sorted(entries, reverse=True)[self._max_entries:]:
+				silentRemove(os.path.join(self._folder, entry))
+
+	def _path(self, file_hash, key_data):
+		key = hashlib.sha1(json.dumps(key_data, sort_keys=True)).hexdigest()
+		return os.path.join(self._folder, "{file_hash}.{key}.json".format(file_hash=file_hash, key=key))
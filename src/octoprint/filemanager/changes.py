@@ -0,0 +1,101 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import collections
+import threading
+import uuid
+
+
+class ChangeJournal(object):
+	"""
+	Keeps track of which paths of a storage were changed or removed at which revision, so that clients can ask for
+	everything that changed since a revision they saw before instead of fetching the whole file list again.
+
+	Revisions are handed out as opaque tokens by :attr:`revision`. Tokens contain a random epoch that is created anew
+	with every journal, so tokens from before a restart are not mistaken for current ones. Only the last
+	``max_removed`` removals are remembered, tokens older than the oldest forgotten removal are not valid anymore.
+	"""
+
+	def __init__(self, max_removed=1000):
+		self._epoch = uuid.uuid4().hex[:8]
+		self._revision = 0
+		self._horizon = 0
+		self._max_removed = max_removed
+
+		self._changed = dict()
+		self._removed = collections.OrderedDict()
+		self._mutex = threading.Lock()
+
+	@property
+	def revision(self):
+		"""
+		Token of the current revision.
+		"""
+		with self._mutex:
+			return self._token(self._revision)
+
+	def changed(self, path):
+		"""
+		Records that ``path`` was added or changed.
+		"""
+		with self._mutex:
+			self._revision += 1
+			self._removed.pop(path, None)
+			self._changed[path] = self._revision
+
+	def removed(self, path):
+		"""
+		Records that ``path`` was removed, including anything contained in it if it's a folder.
+		"""
+		with self._mutex:
+			self._revision += 1
+
+			prefix = path + "/"
+			for changed in [p for p in self._changed.keys() if p == path or p.startswith(prefix)]:
+				del self._changed[changed]
+			for removed in [p for p in self._removed.keys() if p.startswith(prefix)]:
+				del self._removed[removed]
+
+			self._removed.pop(path, None)
+			self._removed[path] = self._revision
+			while len(self._removed) > self._max_removed:
+				_, revision = self._removed.popitem(last=False)
+				self._horizon = revision
+
+	def since(self, token):
+		"""
+		Returns a tuple of the paths changed and the paths removed after the revision ``token``, or ``None`` if the
+		token is invalid, stems from a different journal or is too old.
+		"""
+		revision = self._parse(token)
+		if revision is None:
+			return None
+
+		with self._mutex:
+			if revision < self._horizon or revision > self._revision:
+				return None
+
+			changed = [path for path, r in self._changed.items() if r > revision]
+			removed = [path for path, r in self._removed.items() if r > revision]
+			return changed, removed
+
+	def _token(self, revision):
+		return "{epoch}-{revision}".format(epoch=self._epoch, revision=revision)
+
+	def _parse(self, token):
+		if not token or not "-" in token:
+			return None
+
+		epoch, revision = token.rsplit("-", 1)
+		if epoch != self._epoch:
+			return None
+
+		try:
+			return int(revision)
+		except ValueError:
+			return None
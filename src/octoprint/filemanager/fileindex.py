@@ -0,0 +1,159 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import collections
+import os
+import stat
+import threading
+
+import octoprint.filemanager
+
+
+IndexEntry = collections.namedtuple("IndexEntry", "type, size, mtime")
+"""
+An entry in a folder: its ``type`` (``folder`` or the file type, e.g. ``machinecode``), and for files the ``size`` (in
+bytes) and the modification time ``mtime``.
+"""
+
+
+class FileIndex(object):
+	"""
+	In-memory index of the folders below ``basefolder``, mapping each folder to the sub folders and files of supported
+	types it contains.
+
+	Reading from the index doesn't touch the file system. It is built once by :meth:`build` and has to be kept current
+	by calling :meth:`update` or :meth:`remove` for everything that changes. :meth:`update` validates the indexed files
+	against their size and modification time and reports those that were added or changed. Hidden files and folders
+	are not indexed.
+	"""
+
+	def __init__(self, basefolder):
+		self._basefolder = basefolder
+		self._folders = dict()
+		self._lock = threading.RLock()
+
+	def build(self):
+		"""
+		(Re)builds the index from the file system. Returns the paths of all indexed files.
+		"""
+		with self._lock:
+			self._folders = dict()
+			return self._scan(self._basefolder)
+
+	def folders(self):
+		"""
+		Returns the paths of all indexed folders.
+		"""
+		with self._lock:
+			return list(self._folders.keys())
+
+	def entries(self, folder):
+		"""
+		Returns name and :class:`IndexEntry` of everything contained in ``folder``.
+		"""
+		with self._lock:
+			return list(self._folders.get(folder, dict()).items())
+
+	def update(self, path):
+		"""
+		Updates the index for the file or folder at ``path`` from the file system, including everything contained in a
+		folder that wasn't indexed so far. Returns the paths of the files that were added or changed in the process.
+		"""
+
+		folder, name = os.path.split(path)
+		with self._lock:
+			if not folder in self._folders:
+				if folder.startswith(self._basefolder + os.path.sep):
+					# the parent folder is new as well, indexing it takes care of path too
+					return self.update(folder)
+				return []
+
+			entry = _stat(path, name)
+			if entry is None:
+				self._remove(folder, name)
+				return []
+
+			current = self._folders[folder].get(name)
+			self._folders[folder][name] = entry
+			if entry.type == "folder":
+				if path in self._folders:
+					return self._rescan(path)
+				return self._scan(path)
+			elif entry != current:
+				return [path]
+			return []
+
+	def remove(self, path):
+		"""
+		Removes the file or folder at ``path`` and everything contained in it from the index.
+		"""
+		folder, name = os.path.split(path)
+		with self._lock:
+			self._remove(folder, name)
+
+	def _remove(self, folder, name):
+		if folder in self._folders:
+			self._folders[folder].pop(name, None)
+
+		path = os.path.join(folder, name)
+		for indexed in list(self._folders.keys()):
+			if indexed == path or indexed.startswith(path + os.path.sep):
+				del self._folders[indexed]
+
+	def _scan(self, folder):
+		self._folders[folder] = dict()
+		return self._rescan(folder)
+
+	def _rescan(self, folder):
+		entries = self._folders[folder]
+		try:
+			names = set(os.listdir(folder))
+		except OSError:
+			names = set()
+
+		for name in list(entries.keys()):
+			if not name in names:
+				self._remove(folder, name)
+
+		changed = []
+		for name in names:
+			path = os.path.join(folder, name)
+			entry = _stat(path, name)
+			if entry is None:
+				if name in entries:
+					self._remove(folder, name)
+				continue
+
+			current = entries.get(name)
+			entries[name] = entry
+			if entry.type == "folder":
+				if not path in self._folders:
+					changed += self._scan(path)
+			elif entry != current:
+				changed.append(path)
+		return changed
+
+
+def _stat(path, name):
+	if name.startswith("."):
+		return None
+
+	try:
+		result = os.stat(path)
+	except OSError:
+		return None
+
+	if stat.S_ISDIR(result.st_mode):
+		return IndexEntry("folder", None, None)
+	elif not stat.S_ISREG(result.st_mode):
+		return None
+
+	file_type = octoprint.filemanager.get_file_type(name)
+	if not file_type:
+		return None
+	return IndexEntry(file_type[0], result.st_size, result.st_mtime)
@@ -0,0 +1,133 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import hashlib
+import logging
+import os
+import threading
+
+import pylru
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def create_hash(path, blocksize=65536):
+	"""
+	Returns the SHA1 hash of the contents of the file at ``path``.
+	"""
+
+	hash = hashlib.sha1()
+	with open(path, "rb") as f:
+		buffer = f.read(blocksize)
+		while len(buffer) > 0:
+			hash.update(buffer)
+			buffer = f.read(blocksize)
+
+	return hash.hexdigest()
+
+
+def completed_future(result):
+	"""
+	Returns a :class:`~concurrent.futures.Future` that is already done with ``result``.
+	"""
+
+	future = Future()
+	future.set_result(result)
+	return future
+
+
+class FileHasher(object):
+	"""
+	Computes the SHA1 hashes of files in a pool of ``workers`` background threads.
+
+	:meth:`hash` returns a :class:`~concurrent.futures.Future` of the hash right away. Hashes are cached by device,
+	inode, size and modification time of the file, so files that didn't change since are not read again, and
+	concurrent requests for the same file share the same future. At most ``cache_size`` hashes are cached.
+	"""
+
+	def __init__(self, workers=2, cache_size=1000):
+		self._logger = logging.getLogger(__name__)
+
+		self._executor = ThreadPoolExecutor(max_workers=workers)
+		self._cache = pylru.lrucache(cache_size)
+		self._pending = dict()
+		self._mutex = threading.Lock()
+
+	def hash(self, path):
+		"""
+		Returns a :class:`~concurrent.futures.Future` of the hash of the file at ``path``. If the file can't be read,
+		the future fails with the corresponding :class:`IOError` or :class:`OSError`.
+		"""
+
+		try:
+			key = self._key(path)
+		except OSError as e:
+			future = Future()
+			future.set_exception(e)
+			return future
+
+		with self._mutex:
+			if key in self._cache:
+				return completed_future(self._cache[key])
+			if key in self._pending:
+				return self._pending[key]
+
+			future = self._executor.submit(self._hash, path, key)
+			self._pending[key] = future
+			return future
+
+	def cached(self, path):
+		"""
+		Returns the hash of the file at ``path`` if it is known already without reading the file, ``None`` otherwise.
+		"""
+
+		try:
+			key = self._key(path)
+		except OSError:
+			return None
+
+		with self._mutex:
+			if key in self._cache:
+				return self._cache[key]
+		return None
+
+	def remember(self, path, file_hash):
+		"""
+		Caches ``file_hash`` as the hash of the file at ``path``, for files whose hash was calculated while writing them.
+		"""
+
+		try:
+			key = self._key(path)
+		except OSError:
+			return
+
+		with self._mutex:
+			self._cache[key] = file_hash
+
+	def shutdown(self, wait=True):
+		self._executor.shutdown(wait=wait)
+
+	def _hash(self, path, key):
+		try:
+			file_hash = create_hash(path)
+			with self._mutex:
+				try:
+					unchanged = self._key(path) == key
+				except OSError:
+					unchanged = False
+				if unchanged:
+					# only cache the hash if the file didn't change while reading it
+					self._cache[key] = file_hash
+			return file_hash
+		finally:
+			with self._mutex:
+				self._pending.pop(key, None)
+
+	def _key(self, path):
+		stat = os.stat(path)
+		return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime
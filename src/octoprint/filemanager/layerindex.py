@@ -0,0 +1,168 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import bisect
+import collections
+import struct
+
+
+Layer = collections.namedtuple("Layer", "offset, line, z, time, filament")
+"""
+A layer change: byte ``offset`` and ``line`` (counted from 0) at which the layer starts, its height ``z`` (``None`` if
+unknown), and the estimated print ``time`` (in seconds) and ``filament`` per tool (in mm) used up until then.
+"""
+
+
+class InvalidLayerIndex(Exception):
+	pass
+
+
+class LayerIndex(object):
+	"""
+	Index of the layer changes within a GCODE file, as generated by the GCODE analysis.
+
+	Allows to look up the layer at a position within the file by byte offset or line in ``O(log n)``, e.g. for
+	progress reporting, print time estimations or resuming a print at a specific layer, without having to go through the
+	file again.
+
+	The index is stored in a compact binary format, see :meth:`to_bytes`.
+	"""
+
+	_magic = "OPLI"
+	_version = 1
+
+	_header = struct.Struct("<4sBBId")
+	"""Magic, version, number of tools, number of layers and total estimated print time."""
+
+	def __init__(self, layers=None, total_time=0.0, tools=1):
+		self._layers = list(layers) if layers else []
+		self._offsets = [layer.offset for layer in self._layers]
+		self._lines = [layer.line for layer in self._layers]
+
+		self.total_time = total_time
+		self.tools = tools
+
+	@classmethod
+	def from_analysis(cls, layers):
+		"""
+		Creates the index from the ``layers`` of a GCODE analysis result.
+		"""
+
+		tools = 1
+		for layer in layers:
+			for tool in layer["filament"].keys():
+				tools = max(tools, int(tool[len("tool"):]) + 1)
+
+		time = 0.0
+		filament = [0.0] * tools
+		result = []
+		for layer in layers:
+			result.append(Layer(layer["offset"], layer["line"], layer["z"], time, tuple(filament)))
+
+			time += layer["estimatedPrintTime"]
+			for tool, data in layer["filament"].items():
+				filament[int(tool[len("tool"):])] += data["length"]
+
+		return cls(result, total_time=time, tools=tools)
+
+	@classmethod
+	def from_bytes(cls, data):
+		if len(data) < cls._header.size:
+			raise InvalidLayerIndex("Layer index is truncated")
+
+		magic, version, tools, count, total_time = cls._header.unpack_from(data)
+		if magic != cls._magic or version != cls._version:
+			raise InvalidLayerIndex("Not a layer index of version {version}".format(version=cls._version))
+
+		record = cls._record(tools)
+		if len(data) != cls._header.size + count * record.size:
+			raise InvalidLayerIndex("Layer index is truncated")
+
+		layers = []
+		for i in range(count):
+			values = record.unpack_from(data, cls._header.size + i * record.size)
+			offset, line, z = values[:3]
+			layers.append(Layer(offset, line, z if z == z else None, values[3], values[4:]))
+
+		return cls(layers, total_time=total_time, tools=tools)
+
+	@classmethod
+	def load(cls, path):
+		with open(path, "rb") as f:
+			return cls.from_bytes(f.read())
+
+	def to_bytes(self):
+		"""
+		Serializes the index: a header of magic (``OPLI``), version, number of tools, number of layers and total
+		estimated print time, followed by one record per layer of offset, line, z (NaN if unknown), time and filament
+		per tool, all little endian.
+		"""
+
+		record = self._record(self.tools)
+		data = [self._header.pack(self._magic, self._version, self.tools, len(self._layers), self.total_time)]
+		for layer in self._layers:
+			z = layer.z if layer.z is not None else float("nan")
+			data.append(record.pack(layer.offset, layer.line, z, layer.time, *layer.filament))
+		return "".join(data)
+
+	def save(self, path):
+		with open(path, "wb") as f:
+			f.write(self.to_bytes())
+
+	def layer_at_offset(self, offset):
+		"""
+		Returns the number of the layer the byte ``offset`` within the file belongs to, ``None`` if the index is empty.
+		"""
+		return self._find(self._offsets, offset)
+
+	def layer_at_line(self, line):
+		"""
+		Returns the number of the layer the ``line`` (counted from 0) belongs to, ``None`` if the index is empty.
+		"""
+		return self._find(self._lines, line)
+
+	def time_at_offset(self, offset, end=None):
+		"""
+		Returns the estimated print time (in seconds) up until the byte ``offset`` within the file, interpolated
+		linearly between the starts of the layers. Within the last layer it is interpolated towards ``total_time`` at
+		``end``, the size of the file, if provided. ``None`` if the index is empty.
+		"""
+		index = self.layer_at_offset(offset)
+		if index is None:
+			return None
+
+		layer = self._layers[index]
+		if index + 1 < len(self._layers):
+			next_offset, next_time = self._layers[index + 1].offset, self._layers[index + 1].time
+		elif end is not None:
+			next_offset, next_time = end, self.total_time
+		else:
+			return layer.time
+
+		if next_offset <= layer.offset:
+			return layer.time
+		fraction = min(1.0, max(0.0, float(offset - layer.offset) / (next_offset - layer.offset)))
+		return layer.time + fraction * (next_time - layer.time)
+
+	def _find(self, keys, value):
+		if not keys:
+			return None
+		return max(0, bisect.bisect_right(keys, value) - 1)
+
+	def __getitem__(self, index):
+		return self._layers[index]
+
+	def __len__(self):
+		return len(self._layers)
+
+	def __iter__(self):
+		return iter(self._layers)
+
+	@staticmethod
+	def _record(tools):
+		return struct.Struct("<QQdd" + "d" * tools)
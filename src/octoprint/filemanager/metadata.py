@@ -0,0 +1,323 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import yaml
+
+from octoprint.util import safeRename, silentRemove
+
+try:
+	import sqlite3
+except ImportError:
+	sqlite3 = None
+
+
+def create_metadata_store(basefolder, backend=None):
+	"""
+	Creates the metadata store for the files in ``basefolder``. ``backend`` may be ``yaml`` (the default) for
+	:class:`YamlMetadataStore` or ``sqlite`` for :class:`SqliteMetadataStore`. Falls back to ``yaml`` if SQLite is
+	requested but not available.
+
+	When switching back from ``sqlite`` to ``yaml``, the metadata in the database is exported to ``.metadata.yaml``
+	files first, see :func:`export_database`.
+	"""
+
+	if backend is None:
+		backend = "yaml"
+
+	if backend == "sqlite":
+		if sqlite3 is not None:
+			return SqliteMetadataStore(basefolder)
+		logging.getLogger(__name__).warn("SQLite is not available, falling back to .metadata.yaml files for the file metadata")
+	elif backend != "yaml":
+		logging.getLogger(__name__).warn("Unknown metadata backend {backend}, using .metadata.yaml files".format(backend=backend))
+
+	if sqlite3 is not None and os.path.exists(os.path.join(basefolder, SqliteMetadataStore.filename)):
+		export_database(basefolder)
+
+	return YamlMetadataStore(basefolder)
+
+
+def export_database(basefolder):
+	"""
+	Exports the metadata in the ``.metadata.db`` of ``basefolder`` to ``.metadata.yaml`` files and renames the
+	database to ``.metadata.db.exported`` afterwards, so it doesn't get exported again over later changes.
+	"""
+
+	logger = logging.getLogger(__name__)
+	database_path = os.path.join(basefolder, SqliteMetadataStore.filename)
+
+	try:
+		store = SqliteMetadataStore(basefolder)
+		try:
+			exported = store.export_to_yaml()
+		finally:
+			store.close()
+		safeRename(database_path, database_path + SqliteMetadataStore.exported_suffix, throw_error=True)
+	except:
+		logger.exception("Error while exporting {database_path} to {filename} files".format(database_path=database_path, filename=YamlMetadataStore.filename))
+	else:
+		logger.info("Exported the metadata of {exported} folders from {database_path} to {filename} files".format(exported=exported, database_path=database_path, filename=YamlMetadataStore.filename))
+
+
+class MetadataStore(object):
+	"""
+	Persists the metadata of the files managed by a :class:`~octoprint.filemanager.storage.LocalFileStorage`.
+
+	Metadata is handled per folder as a dict mapping the names of the files in the folder to their metadata. Folders
+	are identified by their absolute ``path``.
+
+	``indexed`` stores look up the metadata of single files without reading that of the whole folder.
+	"""
+
+	indexed = False
+
+	def get_folder(self, path):
+		"""
+		Returns the metadata of all files in the folder ``path``, ``None`` if it could not be read.
+		"""
+		raise NotImplementedError()
+
+	def get(self, path, name):
+		"""
+		Returns the metadata of the file ``name`` in the folder ``path``, ``None`` if there is none.
+		"""
+		metadata = self.get_folder(path)
+		if metadata and name in metadata:
+			return metadata[name]
+		return None
+
+	def save(self, path, metadata, names=None):
+		"""
+		Saves ``metadata`` as the metadata of the folder ``path``. If ``names`` is given, only the files with these
+		names have changed, names not contained in ``metadata`` (any more) are removed.
+		"""
+		raise NotImplementedError()
+
+	def remove_folder(self, path):
+		"""
+		Removes the metadata of the folder ``path`` and all its sub folders.
+		"""
+		pass
+
+	def find_by_hash(self, file_hash):
+		"""
+		Returns folder path and name of all files with the hash ``file_hash``.
+		"""
+		raise NotImplementedError()
+
+
+class YamlMetadataStore(MetadataStore):
+	"""
+	Stores the metadata of each folder in a ``.metadata.yaml`` file within the folder, which is rewritten as a whole on
+	every change.
+	"""
+
+	filename = ".metadata.yaml"
+
+	def __init__(self, basefolder):
+		self._logger = logging.getLogger(__name__)
+		self._basefolder = basefolder
+		self._lock = threading.Lock()
+
+	def get_folder(self, path):
+		metadata_path = os.path.join(path, self.filename)
+		if not os.path.exists(metadata_path):
+			return dict()
+
+		with self._lock:
+			return _load_yaml(metadata_path)
+
+	def save(self, path, metadata, names=None):
+		metadata_path = os.path.join(path, self.filename)
+
+		fh, metadata_temporary_path = tempfile.mkstemp()
+		os.close(fh)
+
+		with self._lock:
+			try:
+				with open(metadata_temporary_path, "w") as f:
+					yaml.safe_dump(metadata, stream=f, default_flow_style=False, indent="  ", allow_unicode=True)
+				safeRename(metadata_temporary_path, metadata_path, throw_error=True)
+			except:
+				self._logger.exception("Error while writing {filename} to {path}".format(filename=self.filename, path=path))
+			finally:
+				silentRemove(metadata_temporary_path)
+
+	def find_by_hash(self, file_hash):
+		result = []
+		for folder, dirs, files in os.walk(self._basefolder):
+			dirs[:] = [d for d in dirs if not d.startswith(".")]
+			if not self.filename in files:
+				continue
+
+			metadata = self.get_folder(folder)
+			if not metadata:
+				continue
+
+			for name, data in metadata.items():
+				if isinstance(data, dict) and data.get("hash") == file_hash:
+					result.append((folder, name))
+		return result
+
+
+class SqliteMetadataStore(MetadataStore):
+	"""
+	Stores the metadata of all files in a SQLite database ``.metadata.db`` in the base folder, one row per file indexed
+	by folder and name and by hash. Changes only update the rows of the files that actually changed.
+
+	The ``.metadata.yaml`` file of a folder is imported into the database when the folder is accessed for the first
+	time. The file itself stays in place but is not updated anymore, :meth:`export_to_yaml` writes the current
+	metadata back to it.
+	"""
+
+	filename = ".metadata.db"
+	exported_suffix = ".exported"
+
+	indexed = True
+
+	def __init__(self, basefolder):
+		self._logger = logging.getLogger(__name__)
+		self._basefolder = basefolder
+		self._lock = threading.Lock()
+
+		self._connection = sqlite3.connect(os.path.join(basefolder, self.filename), check_same_thread=False)
+		with self._lock, self._connection:
+			self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (folder TEXT NOT NULL, name TEXT NOT NULL, hash TEXT, data TEXT NOT NULL, PRIMARY KEY (folder, name))")
+			self._connection.execute("CREATE INDEX IF NOT EXISTS metadata_hash ON metadata (hash)")
+
+			# the folders whose metadata is kept in the database
+			self._connection.execute("CREATE TABLE IF NOT EXISTS folders (folder TEXT NOT NULL PRIMARY KEY)")
+			self._connection.execute("INSERT OR IGNORE INTO folders (folder) SELECT DISTINCT folder FROM metadata")
+			self._folders = set(row[0] for row in self._connection.execute("SELECT folder FROM folders"))
+
+	def get_folder(self, path):
+		folder = self._import(path)
+		with self._lock:
+			rows = self._connection.execute("SELECT name, data FROM metadata WHERE folder = ?", (folder,)).fetchall()
+		return dict((name, json.loads(data)) for name, data in rows)
+
+	def get(self, path, name):
+		folder = self._import(path)
+		with self._lock:
+			row = self._connection.execute("SELECT data FROM metadata WHERE folder = ? AND name = ?", (folder, name)).fetchone()
+		if row is None:
+			return None
+		return json.loads(row[0])
+
+	def save(self, path, metadata, names=None):
+		try:
+			folder = self._import(path)
+			with self._lock, self._connection:
+				self._write(folder, metadata, names=names)
+		except:
+			self._logger.exception("Error while writing metadata of {path} to {filename}".format(path=path, filename=self.filename))
+
+	def remove_folder(self, path):
+		folder = self._folder(path)
+		prefix = folder + "/"
+		with self._lock, self._connection:
+			self._connection.execute("DELETE FROM metadata WHERE folder = ? OR substr(folder, 1, ?) = ?", (folder, len(prefix), prefix))
+			self._connection.execute("DELETE FROM folders WHERE folder = ? OR substr(folder, 1, ?) = ?", (folder, len(prefix), prefix))
+			self._folders = set(f for f in self._folders if f != folder and not f.startswith(prefix))
+
+	def find_by_hash(self, file_hash):
+		with self._lock:
+			rows = self._connection.execute("SELECT folder, name FROM metadata WHERE hash = ?", (file_hash,)).fetchall()
+		return [(self._path(folder), name) for folder, name in rows]
+
+	def export_to_yaml(self):
+		"""
+		Writes the metadata of all folders kept in the database that still exist to their ``.metadata.yaml`` files.
+		Returns the number of written files.
+		"""
+		with self._lock:
+			folders = list(self._folders)
+
+		yaml_store = YamlMetadataStore(self._basefolder)
+		exported = 0
+		for folder in folders:
+			path = self._path(folder)
+			if not os.path.isdir(path):
+				continue
+			yaml_store.save(path, self.get_folder(path))
+			exported += 1
+		return exported
+
+	def close(self):
+		with self._lock:
+			self._connection.close()
+
+	def _import(self, path):
+		"""
+		Imports the ``.metadata.yaml`` of the folder ``path`` if the folder is not yet kept in the database. Returns
+		the folder's key in the database.
+		"""
+		folder = self._folder(path)
+		if folder in self._folders or not os.path.isdir(path):
+			return folder
+
+		metadata = None
+		metadata_path = os.path.join(path, YamlMetadataStore.filename)
+		if os.path.exists(metadata_path):
+			metadata = _load_yaml(metadata_path)
+
+		with self._lock, self._connection:
+			if folder in self._folders:
+				return folder
+
+			if metadata:
+				self._write(folder, metadata)
+				self._logger.info("Imported {metadata_path} into {filename}".format(metadata_path=metadata_path, filename=self.filename))
+			self._connection.execute("INSERT OR IGNORE INTO folders (folder) VALUES (?)", (folder,))
+			self._folders.add(folder)
+		return folder
+
+	def _write(self, folder, metadata, names=None):
+		if names is None:
+			# everything might have changed, including files having been removed
+			names = set(metadata.keys())
+			names.update(row[0] for row in self._connection.execute("SELECT name FROM metadata WHERE folder = ?", (folder,)))
+
+		for name in names:
+			if name in metadata:
+				data = metadata[name]
+				file_hash = data.get("hash") if isinstance(data, dict) else None
+				self._connection.execute("INSERT OR REPLACE INTO metadata (folder, name, hash, data) VALUES (?, ?, ?, ?)",
+				                         (folder, name, file_hash, json.dumps(data)))
+			else:
+				self._connection.execute("DELETE FROM metadata WHERE folder = ? AND name = ?", (folder, name))
+
+	def _folder(self, path):
+		folder = os.path.relpath(path, self._basefolder)
+		if folder == os.curdir:
+			return ""
+		return folder.replace(os.path.sep, "/")
+
+	def _path(self, folder):
+		if not folder:
+			return self._basefolder
+		return os.path.join(self._basefolder, *folder.split("/"))
+
+
+def _load_yaml(path):
+	try:
+		with open(path) as f:
+			metadata = yaml.safe_load(f)
+	except:
+		logging.getLogger(__name__).exception("Error while reading {path}".format(path=path))
+		return None
+
+	if not isinstance(metadata, dict):
+		return dict()
+	return metadata
@@ -10,10 +10,18 @@ import logging
 import os
 import pylru
 import tempfile
+import threading
+
+from concurrent.futures import Future
 
 import octoprint.filemanager
 
-from octoprint.util import safeRename
+from octoprint.filemanager.changes import ChangeJournal
+from octoprint.filemanager.fileindex import FileIndex
+from octoprint.filemanager.hashing import FileHasher, completed_future
+from octoprint.filemanager.layerindex import LayerIndex, InvalidLayerIndex
+from octoprint.filemanager.metadata import create_metadata_store, YamlMetadataStore
+from octoprint.util import safeRename, silentRemove
 
 
 class StorageInterface(object):
@@ -24,6 +32,10 @@ class StorageInterface(object):
 		return
 		yield
 
+	def register_hashed_callback(self, callback):
+		# storages that don't hash their files never call it
+		pass
+
 	def file_exists(self, path):
 		raise NotImplementedError()
 
@@ -36,7 +48,7 @@ class StorageInterface(object):
 	def remove_folder(self, path, recursive=True):
 		raise NotImplementedError()
 
-	def add_file(self, path, file_object, printer_profile=None, links=None, allow_overwrite=False):
+	def add_file(self, path, file_object, printer_profile=None, links=None, allow_overwrite=False, file_hash=None):
 		raise NotImplementedError()
 
 	def remove_file(self, path):
@@ -45,6 +57,18 @@ class StorageInterface(object):
 	def get_metadata(self, path):
 		raise NotImplementedError()
 
+	def get_hash(self, path):
+		raise NotImplementedError()
+
+	def find_files_by_hash(self, file_hash):
+		raise NotImplementedError()
+
+	def get_revision(self):
+		raise NotImplementedError()
+
+	def get_changes(self, revision):
+		raise NotImplementedError()
+
 	def add_link(self, path, rel, data):
 		raise NotImplementedError()
 
@@ -57,6 +81,12 @@ class StorageInterface(object):
 	def remove_additional_metadata(self, path, key):
 		raise NotImplementedError()
 
+	def get_layer_index(self, path):
+		raise NotImplementedError()
+
+	def set_layer_index(self, path, layer_index):
+		raise NotImplementedError()
+
 	def sanitize(self, path):
 		raise NotImplementedError()
 
@@ -81,7 +111,7 @@ class StorageInterface(object):
 
 class LocalFileStorage(StorageInterface):
 
-	def __init__(self, basefolder, create=False):
+	def __init__(self, basefolder, create=False, metadata_backend=None, hasher=None):
 		self._logger = logging.getLogger(__name__)
 
 		self.basefolder = os.path.realpath(os.path.abspath(basefolder))
@@ -90,10 +120,24 @@ class LocalFileStorage(StorageInterface):
 		if not os.path.exists(self.basefolder) or not os.path.isdir(self.basefolder):
 			raise RuntimeError("{basefolder} is not a valid directory".format(**locals()))
 
-		import threading
-		self._metadata_lock = threading.Lock()
-
+		self._metadata_store = create_metadata_store(self.basefolder, backend=metadata_backend)
 		self._metadata_cache = pylru.lrucache(10)
+		self._metadata_lock = threading.RLock()
+
+		if hasher is None:
+			hasher = FileHasher()
+		self._hasher = hasher
+		self._pending_hashes = dict()
+		self._pending_hashes_mutex = threading.Lock()
+		self._links_to_unhashed = dict()
+		self._hashed_callbacks = []
+
+		self._changes = ChangeJournal()
+
+		self._file_index = FileIndex(self.basefolder)
+		self._file_index.build()
+		for folder in self._file_index.folders():
+			self._add_missing_metadata(folder)
 
 	@property
 	def analysis_backlog(self):
@@ -125,6 +169,16 @@ class LocalFileStorage(StorageInterface):
 				for sub_entry in self._analysis_backlog_generator(absolute_path):
 					yield self.join_path(entry, sub_entry[0]), sub_entry[1], sub_entry[2]
 
+	def register_hashed_callback(self, callback):
+		"""
+		Registers ``callback`` to be called with the virtual path and the hash of a file whenever a new hash was stored
+		for it, i.e. after it was added or found in or changed on the base folder and then hashed in the background.
+		The callback is called on the thread that hashed the file.
+
+		:param callback: the callback to register
+		"""
+		self._hashed_callbacks.append(callback)
+
 	def file_exists(self, path):
 		path, name = self.sanitize(path)
 		file_path = os.path.join(path, name)
@@ -203,6 +257,8 @@ class LocalFileStorage(StorageInterface):
 				raise RuntimeError("{sanitized_foldername} does already exist in {virtual_path}".format(**locals()))
 		else:
 			os.mkdir(folder_path)
+		self._file_index.update(folder_path)
+		self._changes.changed(self.rel_path(folder_path))
 
 		return self.rel_path((path, name))
 
@@ -212,7 +268,7 @@ class LocalFileStorage(StorageInterface):
 
 		:param path: the path of the folder to remove
 		:param recursive: if set to True, contained folders and files will also be removed, otherwise and error will
-		                  be raised if the folder is not empty (apart from ``.metadata.yaml``) when it's to be removed
+		                  be raised if the folder is not empty (apart from its metadata) when it's to be removed
 		"""
 
 		path, name = self.sanitize(path)
@@ -222,15 +278,24 @@ class LocalFileStorage(StorageInterface):
 			return
 
 		contents = os.listdir(folder_path)
-		if ".metadata.yaml" in contents:
-			contents.remove(".metadata.yaml")
+		for entry in (YamlMetadataStore.filename, ".layers"):
+			if entry in contents:
+				contents.remove(entry)
 		if contents and not recursive:
 			raise RuntimeError("{sanitized_foldername} in {virtual_path} is not empty".format(**locals()))
 
 		import shutil
 		shutil.rmtree(folder_path)
+		self._file_index.remove(folder_path)
+		self._changes.removed(self.rel_path(folder_path))
+
+		with self._metadata_lock:
+			self._metadata_store.remove_folder(folder_path)
+			for cached_path in list(self._metadata_cache.keys()):
+				if cached_path == folder_path or cached_path.startswith(folder_path + os.path.sep):
+					del self._metadata_cache[cached_path]
 
-	def add_file(self, path, file_object, printer_profile=None, links=None, allow_overwrite=False):
+	def add_file(self, path, file_object, printer_profile=None, links=None, allow_overwrite=False, file_hash=None):
 		"""
 		Adds the file ``file_object`` as ``path``
 
@@ -241,6 +306,8 @@ class LocalFileStorage(StorageInterface):
 		:param links: any links to add with the file
 		:param allow_overwrite: if set to True no error will be raised if the file already exists and the existing file
 		                        and its metadata will just be silently overwritten
+		:param file_hash: the SHA1 hash of the file's contents if already known, e.g. because it was calculated while
+		                  receiving the file, saves reading the file again for hashing it
 		:return: the sanitized name of the file to be used for future references to it
 		"""
 
@@ -248,10 +315,6 @@ class LocalFileStorage(StorageInterface):
 		if not octoprint.filemanager.valid_file_type(name):
 			raise RuntimeError("{name} is an unrecognized file type".format(**locals()))
 
-		metadata = self._get_metadata(path)
-		if not metadata:
-			metadata = dict()
-
 		file_path = os.path.join(path, name)
 		if os.path.exists(file_path) and not os.path.isfile(file_path):
 			raise RuntimeError("{name} does already exist in {path} and is not a file".format(**locals()))
@@ -264,16 +327,20 @@ class LocalFileStorage(StorageInterface):
 
 		# save the file
 		file_object.save(file_path)
+		self._file_index.update(file_path)
+		if file_hash is not None:
+			self._hasher.remember(file_path, file_hash)
 
-		# save the file's hash to the metadata of the folder
-		file_hash = self._create_hash(file_path)
-		if not name in metadata or not "hash" in metadata[name] or metadata[name]["hash"] != file_hash:
-			# make sure to create a new metadata entry if we've never seen that file with that content before
-			file_metadata = dict(
-				hash=file_hash
-			)
-			metadata[name] = file_metadata
-			self._save_metadata(path, metadata)
+		# start over with the metadata of the file, it gets hashed in the background and gets its former metadata back
+		# once the hash shows that we've already seen the file with that content
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			previous = metadata.get(name)
+			if not isinstance(previous, dict):
+				previous = None
+			metadata[name] = dict()
+			self._save_metadata(path, metadata, names=[name])
+		self._hash_in_background(file_path, previous=previous)
 
 		# process any links that were also provided for adding to the file
 		if not links:
@@ -296,8 +363,6 @@ class LocalFileStorage(StorageInterface):
 
 		path, name = self.sanitize(path)
 
-		metadata = self._get_metadata(path)
-
 		file_path = os.path.join(path, name)
 		if not os.path.exists(file_path):
 			return
@@ -308,18 +373,49 @@ class LocalFileStorage(StorageInterface):
 			os.remove(file_path)
 		except Exception as e:
 			raise RuntimeError("Could not delete {name} in {path}".format(**locals()), e)
+		self._file_index.remove(file_path)
+		self._changes.removed(self.rel_path(file_path))
+		silentRemove(self._layer_index_path(path, name))
 
-		if name in metadata:
-			if "hash" in metadata[name]:
-				hash = metadata[name]["hash"]
-				for m in metadata.values():
-					if not "links" in m:
-						continue
-					for link in m["links"]:
-						if "rel" in link and "hash" in link and (link["rel"] == "model" or link["rel"] == "machinecode") and link["hash"] == hash:
-							m["links"].remove(link)
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			if not name in metadata:
+				return
+
+			changed = [name]
+			hash = metadata[name].get("hash") if isinstance(metadata[name], dict) else None
+			for other_name, m in metadata.items():
+				if other_name == name or not isinstance(m, dict) or not "links" in m:
+					continue
+				for link in list(m["links"]):
+					# links added while the file was still being hashed don't know its hash yet
+					if link.get("rel") in ("model", "machinecode") and link.get("name") == name and link.get("hash", hash) == hash:
+						m["links"].remove(link)
+						changed.append(other_name)
 			del metadata[name]
-			self._save_metadata(path, metadata)
+			self._save_metadata(path, metadata, names=changed)
+
+	def refresh(self, path):
+		"""
+		Updates the file index for the file or folder at the absolute ``path`` after it was changed outside of the
+		storage, e.g. by copying files into the base folder directly. Files that were added or changed get (re)hashed.
+
+		:param path: the absolute path of the file or folder that was added, changed or removed
+		"""
+
+		path = os.path.realpath(path)
+		if not path.startswith(self.basefolder + os.path.sep):
+			return
+		if any(element.startswith(".") for element in self.rel_path(path).split("/")):
+			# metadata, layer indices and the like
+			return
+
+		if not os.path.exists(path):
+			self._changes.removed(self.rel_path(path))
+
+		for file_path in self._file_index.update(path):
+			self._changes.changed(self.rel_path(file_path))
+			self._hash_in_background(file_path)
 
 	def get_metadata(self, path):
 		"""
@@ -331,11 +427,61 @@ class LocalFileStorage(StorageInterface):
 
 		path, name = self.sanitize(path)
 
-		metadata = self._get_metadata(path)
-		if name in metadata:
-			return metadata[name]
-		else:
-			return None
+		with self._metadata_lock:
+			if self._metadata_store.indexed and not path in self._metadata_cache:
+				# no need to load the metadata of the whole folder
+				return self._metadata_store.get(path, name)
+
+			metadata = self._get_metadata(path)
+			if name in metadata:
+				return metadata[name]
+			else:
+				return None
+
+	def get_hash(self, path):
+		"""
+		Retrieves the hash of the file ``path``. Files are hashed in the background after they were added or changed,
+		so the hash might not be known yet.
+
+		:param path: virtual path to the file for which to retrieve the hash
+		:return: a :class:`~concurrent.futures.Future` of the hash, done once it is known and stored in the file's
+		         metadata
+		"""
+
+		path, name = self.sanitize(path)
+		return self._get_hash(path, name)
+
+	def find_files_by_hash(self, file_hash):
+		"""
+		Retrieves all files with the hash ``file_hash``, i.e. with identical contents.
+
+		:param file_hash: the hash of the files to look for
+		:return: a list of the virtual paths of the files
+		"""
+
+		return [self.rel_path((folder, name)) for folder, name in self._metadata_store.find_by_hash(file_hash) if os.path.isfile(os.path.join(folder, name))]
+
+	def get_revision(self):
+		"""
+		Retrieves a token for the current revision of the storage, to be used with :meth:`get_changes`. The token
+		changes whenever a file or folder or the metadata of a file is added, changed or removed.
+
+		:return: the token of the current revision
+		"""
+
+		return self._changes.revision
+
+	def get_changes(self, revision):
+		"""
+		Retrieves the paths of the files and folders that were added, changed or removed since ``revision``.
+
+		:param revision: a revision token as returned by :meth:`get_revision`
+		:return: a tuple of the paths of the added or changed entries and the paths of the removed entries, or
+		         ``None`` if the changes since ``revision`` are unknown, e.g. because the token stems from before a
+		         restart, in which case clients have to fetch the whole file list again
+		"""
+
+		return self._changes.since(revision)
 
 	def get_link(self, path, rel):
 		path, name = self.sanitize(path)
@@ -413,28 +559,29 @@ class LocalFileStorage(StorageInterface):
 		"""
 
 		path, name = self.sanitize(path)
-		metadata = self._get_metadata(path)
-		metadata_dirty = False
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			metadata_dirty = False
 
-		if not name in metadata:
-			return
+			if not name in metadata:
+				return
 
-		if not key in metadata[name] or overwrite:
-			metadata[name][key] = data
-			metadata_dirty = True
-		elif key in metadata[name] and isinstance(metadata[name][key], dict) and isinstance(data, dict) and merge:
-			current_data = metadata[name][key]
+			if not key in metadata[name] or overwrite:
+				metadata[name][key] = data
+				metadata_dirty = True
+			elif key in metadata[name] and isinstance(metadata[name][key], dict) and isinstance(data, dict) and merge:
+				current_data = metadata[name][key]
 
-			import octoprint.util
-			new_data = octoprint.util.dict_merge(current_data, data)
-			metadata[name][key] = new_data
-			metadata_dirty = True
-		elif key in metadata[name] and overwrite:
-			metadata[name][key] = data
-			metadata_dirty = True
+				import octoprint.util
+				new_data = octoprint.util.dict_merge(current_data, data)
+				metadata[name][key] = new_data
+				metadata_dirty = True
+			elif key in metadata[name] and overwrite:
+				metadata[name][key] = data
+				metadata_dirty = True
 
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+			if metadata_dirty:
+				self._save_metadata(path, metadata, names=[name])
 
 	def remove_additional_metadata(self, path, key):
 		"""
@@ -445,16 +592,64 @@ class LocalFileStorage(StorageInterface):
 		"""
 
 		path, name = self.sanitize(path)
-		metadata = self._get_metadata(path)
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
 
-		if not name in metadata:
-			return
+			if not name in metadata:
+				return
+
+			if not key in metadata[name]:
+				return
+
+			del metadata[name][key]
+			self._save_metadata(path, metadata, names=[name])
+
+	def get_layer_index(self, path):
+		"""
+		Retrieves the layer index of the file ``path`` as stored by :meth:`set_layer_index`.
+
+		:param path: the virtual path to the file for which to retrieve the layer index
+		:return: the :class:`~octoprint.filemanager.layerindex.LayerIndex` of the file, ``None`` if there is none
+		"""
 
-		if not key in metadata[name]:
+		path, name = self.sanitize(path)
+		index_path = self._layer_index_path(path, name)
+		if not os.path.exists(index_path):
+			return None
+
+		try:
+			return LayerIndex.load(index_path)
+		except (IOError, InvalidLayerIndex):
+			self._logger.exception("Error while reading layer index of {name} in {path}".format(**locals()))
+			return None
+
+	def set_layer_index(self, path, layer_index):
+		"""
+		Stores the ``layer_index`` of the file ``path``. The index is kept in the ``.layers`` folder next to the folder's
+		``.metadata.yaml`` and removed together with the file or when its contents change.
+
+		:param path: the virtual path to the file for which to store the layer index
+		:param layer_index: the :class:`~octoprint.filemanager.layerindex.LayerIndex` to store
+		"""
+
+		path, name = self.sanitize(path)
+		if not os.path.isfile(os.path.join(path, name)):
 			return
 
-		del metadata[name][key]
-		self._save_metadata(path, metadata)
+		index_path = self._layer_index_path(path, name)
+		index_folder = os.path.dirname(index_path)
+		if not os.path.exists(index_folder):
+			os.makedirs(index_folder)
+
+		fh, index_temporary_path = tempfile.mkstemp(dir=index_folder)
+		os.close(fh)
+		try:
+			layer_index.save(index_temporary_path)
+			safeRename(index_temporary_path, index_path, throw_error=True)
+		except:
+			self._logger.exception("Error while writing layer index of {name} in {path}".format(**locals()))
+		finally:
+			silentRemove(index_temporary_path)
 
 	def split_path(self, path):
 		"""
@@ -492,304 +687,451 @@ class LocalFileStorage(StorageInterface):
 	##~~ internals
 
 	def _add_history(self, name, path, data):
-		metadata = self._get_metadata(path)
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
 
-		if not name in metadata:
-			metadata[name] = dict()
+			if not name in metadata:
+				metadata[name] = dict()
 
-		if not "hash" in metadata[name]:
-			metadata[name]["hash"] = self._create_hash(os.path.join(path, name))
+			if not "history" in metadata[name]:
+				metadata[name]["history"] = []
 
-		if not "history" in metadata[name]:
-			metadata[name]["history"] = []
+			metadata[name]["history"].append(data)
+			self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
+			self._save_metadata(path, metadata, names=[name])
+			hashed = "hash" in metadata[name]
 
-		metadata[name]["history"].append(data)
-		self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
-		self._save_metadata(path, metadata)
+		if not hashed:
+			self._get_hash(path, name)
 
 	def _update_history(self, name, path, index, data):
-		metadata = self._get_metadata(path)
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
 
-		if not name in metadata or not "history" in metadata[name]:
-			return
+			if not name in metadata or not "history" in metadata[name]:
+				return
 
-		try:
-			metadata[name]["history"][index].update(data)
-			self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
-			self._save_metadata(path, metadata)
-		except IndexError:
-			pass
+			try:
+				metadata[name]["history"][index].update(data)
+				self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
+				self._save_metadata(path, metadata, names=[name])
+			except IndexError:
+				pass
 
 	def _delete_history(self, name, path, index):
-		metadata = self._get_metadata(path)
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
 
-		if not name in metadata or not "history" in metadata[name]:
-			return
+			if not name in metadata or not "history" in metadata[name]:
+				return
 
-		try:
-			del metadata[name]["history"][index]
-			self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
-			self._save_metadata(path, metadata)
-		except IndexError:
-			pass
+			try:
+				del metadata[name]["history"][index]
+				self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
+				self._save_metadata(path, metadata, names=[name])
+			except IndexError:
+				pass
 
 	def _calculate_stats_from_history(self, name, path, metadata=None, save=True):
-		if metadata is None:
-			metadata = self._get_metadata(path)
+		with self._metadata_lock:
+			if metadata is None:
+				metadata = self._get_metadata(path)
 
-		if not name in metadata or not "history" in metadata[name]:
-			return
+			if not name in metadata or not "history" in metadata[name]:
+				return
 
-		# collect data from history
-		former_print_times = dict()
-		last_print = dict()
+			# collect data from history
+			former_print_times = dict()
+			last_print = dict()
 
 
-		for history_entry in metadata[name]["history"]:
-			if not "printTime" in history_entry or not "success" in history_entry or not history_entry["success"] or not "printerProfile" in history_entry:
-				continue
+			for history_entry in metadata[name]["history"]:
+				if not "printTime" in history_entry or not "success" in history_entry or not history_entry["success"] or not "printerProfile" in history_entry:
+					continue
 
-			printer_profile = history_entry["printerProfile"]
-			print_time = history_entry["printTime"]
+				printer_profile = history_entry["printerProfile"]
+				print_time = history_entry["printTime"]
 
-			if not printer_profile in former_print_times:
-				former_print_times[printer_profile] = []
-			former_print_times[printer_profile].append(print_time)
+				if not printer_profile in former_print_times:
+					former_print_times[printer_profile] = []
+				former_print_times[printer_profile].append(print_time)
 
-			if not printer_profile in last_print or last_print[printer_profile] is None or ("timestamp" in history_entry and history_entry["timestamp"] > last_print[printer_profile]["timestamp"]):
-				last_print[printer_profile] = history_entry
+				if not printer_profile in last_print or last_print[printer_profile] is None or ("timestamp" in history_entry and history_entry["timestamp"] > last_print[printer_profile]["timestamp"]):
+					last_print[printer_profile] = history_entry
 
-		# calculate stats
-		statistics = dict(averagePrintTime=dict(), lastPrintTime=dict())
+			# calculate stats
+			statistics = dict(averagePrintTime=dict(), lastPrintTime=dict())
 
-		for printer_profile in former_print_times:
-			if not former_print_times[printer_profile]:
-				continue
-			statistics["averagePrintTime"][printer_profile] = sum(former_print_times[printer_profile]) / float(len(former_print_times[printer_profile]))
+			for printer_profile in former_print_times:
+				if not former_print_times[printer_profile]:
+					continue
+				statistics["averagePrintTime"][printer_profile] = sum(former_print_times[printer_profile]) / float(len(former_print_times[printer_profile]))
 
-		for printer_profile in last_print:
-			if not last_print[printer_profile]:
-				continue
-			statistics["lastPrintTime"][printer_profile] = last_print[printer_profile]["printTime"]
+			for printer_profile in last_print:
+				if not last_print[printer_profile]:
+					continue
+				statistics["lastPrintTime"][printer_profile] = last_print[printer_profile]["printTime"]
 
-		metadata[name]["statistics"] = statistics
+			metadata[name]["statistics"] = statistics
 
-		if save:
-			self._save_metadata(path, metadata)
+			if save:
+				self._save_metadata(path, metadata, names=[name])
 
 	def _get_links(self, name, path, searched_rel):
-		metadata = self._get_metadata(path)
-		result = []
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			result = []
 
-		if not name in metadata:
-			return result
+			if not name in metadata:
+				return result
 
-		if not "links" in metadata[name]:
-			return result
+			if not "links" in metadata[name]:
+				return result
 
-		for data in metadata[name]["links"]:
-			if not "rel" in data or not data["rel"] == searched_rel:
-				continue
-			result.append(data)
-		return result
+			for data in metadata[name]["links"]:
+				if not "rel" in data or not data["rel"] == searched_rel:
+					continue
+				result.append(data)
+			return result
 
 	def _add_links(self, name, path, links):
 		file_type = octoprint.filemanager.get_file_type(name)
 		if file_type:
 			file_type = file_type[0]
 
-		metadata = self._get_metadata(path)
-		metadata_dirty = False
+		changed = set()
+		unhashed = []
 
-		if not name in metadata:
-			metadata[name] = dict()
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
 
-		if not "hash" in metadata[name]:
-			metadata[name]["hash"] = self._create_hash(os.path.join(path, name))
+			if not name in metadata:
+				metadata[name] = dict()
 
-		if not "links" in metadata[name]:
-			metadata[name]["links"] = []
+			if not "links" in metadata[name]:
+				metadata[name]["links"] = []
 
-		for rel, data in links:
-			if (rel == "model" or rel == "machinecode") and "name" in data:
-				if file_type == "model" and rel == "model":
-					# adding a model link to a model doesn't make sense
-					return
-				elif file_type == "machinecode" and rel == "machinecode":
-					# adding a machinecode link to a machinecode doesn't make sense
-					return
+			for rel, data in links:
+				if (rel == "model" or rel == "machinecode") and "name" in data:
+					if file_type == "model" and rel == "model":
+						# adding a model link to a model doesn't make sense
+						return
+					elif file_type == "machinecode" and rel == "machinecode":
+						# adding a machinecode link to a machinecode doesn't make sense
+						return
 
-				ref_path = os.path.join(path, data["name"])
-				if not os.path.exists(ref_path):
-					# file doesn't exist, we won't create the link
-					continue
+					ref_path = os.path.join(path, data["name"])
+					if not os.path.exists(ref_path):
+						# file doesn't exist, we won't create the link
+						continue
+
+					if not data["name"] in metadata or not "hash" in metadata[data["name"]]:
+						# target file isn't hashed yet, _store_hash adds the link once it is
+						self._links_to_unhashed.setdefault(ref_path, []).append((name, rel, data))
+						unhashed.append(data["name"])
+						continue
 
-				# fetch hash of target file
-				if data["name"] in metadata and "hash" in metadata[data["name"]]:
 					hash = metadata[data["name"]]["hash"]
-				else:
-					hash = self._create_hash(ref_path)
-					if not data["name"] in metadata:
-						metadata[data["name"]] = dict(
-							hash=hash,
-							links=[]
-						)
-					else:
-						metadata[data["name"]]["hash"] = hash
+					if "hash" in data and not data["hash"] == hash:
+						# file doesn't have the correct hash, we won't create the link
+						continue
 
-				if "hash" in data and not data["hash"] == hash:
-					# file doesn't have the correct hash, we won't create the link
-					continue
+					if not "links" in metadata[data["name"]]:
+						metadata[data["name"]]["links"] = []
+
+					# add reverse link to link target file, if the file itself isn't hashed yet the hash of the reverse
+					# link gets filled in by _store_hash
+					reverse_link = dict(rel="machinecode" if rel == "model" else "model", name=name)
+					if "hash" in metadata[name]:
+						reverse_link["hash"] = metadata[name]["hash"]
+					metadata[data["name"]]["links"].append(reverse_link)
+					changed.add(data["name"])
+
+					link_dict = dict(
+						rel=rel,
+						name=data["name"],
+						hash=hash
+					)
 
-				if not "links" in metadata[data["name"]]:
-					metadata[data["name"]]["links"] = []
+				elif rel == "web" and "href" in data:
+					link_dict = dict(
+						rel=rel,
+						href=data["href"]
+					)
+					if "retrieved" in data:
+						link_dict["retrieved"] = data["retrieved"]
 
-				# add reverse link to link target file
-				metadata[data["name"]]["links"].append(
-					dict(rel="machinecode" if rel == "model" else "model", name=name, hash=metadata[name]["hash"])
-				)
-				metadata_dirty = True
+				else:
+					continue
 
-				link_dict = dict(
-					rel=rel,
-					name=data["name"],
-					hash=hash
-				)
+				if link_dict:
+					metadata[name]["links"].append(link_dict)
+					changed.add(name)
 
-			elif rel == "web" and "href" in data:
-				link_dict = dict(
-					rel=rel,
-					href=data["href"]
-				)
-				if "retrieved" in data:
-					link_dict["retrieved"] = data["retrieved"]
+			if changed:
+				self._save_metadata(path, metadata, names=changed)
 
-			else:
-				continue
+		for ref_name in unhashed:
+			self._get_hash(path, ref_name)
 
-			if link_dict:
-				metadata[name]["links"].append(link_dict)
-				metadata_dirty = True
+	def _remove_links(self, name, path, links):
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			changed = set()
 
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+			if not name in metadata:
+				return
 
-	def _remove_links(self, name, path, links):
-		metadata = self._get_metadata(path)
-		metadata_dirty = False
+			for rel, data in links:
+				if (rel == "model" or rel == "machinecode") and "name" in data:
+					if data["name"] in metadata and "links" in metadata[data["name"]]:
+						hash = metadata[name].get("hash")
+						ref_rel = "model" if rel == "machinecode" else "machinecode"
+						for link in list(metadata[data["name"]]["links"]):
+							if link["rel"] == ref_rel and "name" in link and link["name"] == name and link.get("hash") == hash:
+								metadata[data["name"]]["links"].remove(link)
+								changed.add(data["name"])
 
-		if not name in metadata or not "hash" in metadata[name]:
-			hash = self._create_hash(os.path.join(path, name))
-		else:
-			hash = metadata[name]["hash"]
-
-		for rel, data in links:
-			if (rel == "model" or rel == "machinecode") and "name" in data:
-				if data["name"] in metadata and "links" in metadata[data["name"]]:
-					ref_rel = "model" if rel == "machinecode" else "machinecode"
-					for link in metadata[data["name"]]["links"]:
-						if link["rel"] == ref_rel and "name" in link and link["name"] == name and "hash" in link and link["hash"] == hash:
-							metadata[data["name"]]["links"].remove(link)
-							metadata_dirty = True
-
-			if "links" in metadata[name]:
-				for link in metadata[name]["links"]:
-					if not link["rel"] == rel:
-						continue
+				if "links" in metadata[name]:
+					for link in metadata[name]["links"]:
+						if not link["rel"] == rel:
+							continue
 
-					matches = True
-					for k, v in data.items():
-						if not k in link or not link[k] == v:
-							matches = False
-							break
+						matches = True
+						for k, v in data.items():
+							if not k in link or not link[k] == v:
+								matches = False
+								break
 
-					if not matches:
-						continue
+						if not matches:
+							continue
 
-					metadata[name]["links"].remove(link)
-					metadata_dirty = True
+						metadata[name]["links"].remove(link)
+						changed.add(name)
 
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+			if changed:
+				self._save_metadata(path, metadata, names=changed)
 
 	def _list_folder(self, path, filter=None, recursive=True):
-		metadata = self._get_metadata(path)
-		if not metadata:
-			metadata = dict()
-		metadata_dirty = False
+		entries = self._file_index.entries(path)
+
+		metadata = dict()
+		if any(index_entry.type != "folder" for _, index_entry in entries):
+			with self._metadata_lock:
+				metadata = dict((entry, dict(data)) for entry, data in self._get_metadata(path).items() if isinstance(data, dict))
 
 		result = dict()
-		for entry in os.listdir(path):
-			if entry.startswith("."):
-				# no hidden files and folders
+		for entry, index_entry in entries:
+			# folder recursion
+			if index_entry.type == "folder":
+				if recursive:
+					sub_result = self._list_folder(os.path.join(path, entry), filter=filter)
+					result[entry] = dict(
+						name=entry,
+						type="folder",
+						children=sub_result
+					)
 				continue
 
-			entry_path = os.path.join(path, entry)
-
 			# file handling
-			if os.path.isfile(entry_path):
-				file_type = octoprint.filemanager.get_file_type(entry)
-				if not file_type:
-					# only supported extensions
+			if entry in metadata and isinstance(metadata[entry], dict):
+				entry_data = metadata[entry]
+			else:
+				# not hashed yet
+				entry_data = dict(
+					links=[],
+					notes=[]
+				)
+
+			# TODO extract model hash from source if possible to recreate link
+
+			if not filter or filter(entry, entry_data):
+				# only add files passing the optional filter
+				extended_entry_data = dict()
+				extended_entry_data.update(entry_data)
+				extended_entry_data["name"] = entry
+				extended_entry_data["type"] = index_entry.type
+				extended_entry_data["size"] = index_entry.size
+				extended_entry_data["date"] = int(index_entry.mtime)
+
+				result[entry] = extended_entry_data
+
+		# TODO recreate links if we have metadata less entries
+
+		return result
+
+	def _add_missing_metadata(self, path):
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			added = []
+
+			for entry, index_entry in self._file_index.entries(path):
+				if index_entry.type == "folder" or (entry in metadata and isinstance(metadata[entry], dict)):
 					continue
-				else:
-					file_type = file_type[0]
 
-				if entry in metadata and isinstance(metadata[entry], dict):
-					entry_data = metadata[entry]
-				else:
-					entry_data = dict(
-						hash=self._create_hash(entry_path),
-						links=[],
-						notes=[]
-					)
-					metadata[entry] = entry_data
-					metadata_dirty = True
+				metadata[entry] = dict(
+					links=[],
+					notes=[]
+				)
+				added.append(entry)
 
-				# TODO extract model hash from source if possible to recreate link
+		if added:
+			self._save_metadata(path, metadata, names=added)
+			for entry in added:
+				self._hash_in_background(os.path.join(path, entry))
 
-				if not filter or filter(entry, entry_data):
-					# only add files passing the optional filter
-					extended_entry_data = dict()
-					extended_entry_data.update(entry_data)
-					extended_entry_data["name"] = entry
-					extended_entry_data["type"] = file_type
-					stat = os.stat(entry_path)
-					if stat:
-						extended_entry_data["size"] = stat.st_size
-						extended_entry_data["date"] = int(stat.st_mtime)
+	def _get_hash(self, path, name):
+		file_path = os.path.join(path, name)
 
-					result[entry] = extended_entry_data
+		with self._pending_hashes_mutex:
+			if file_path in self._pending_hashes:
+				return self._pending_hashes[file_path]
 
-			# folder recursion
-			elif os.path.isdir(entry_path) and recursive:
-				sub_result = self._list_folder(entry_path, filter=filter)
-				result[entry] = dict(
-					name=entry,
-					type="folder",
-					children=sub_result
+		with self._metadata_lock:
+			metadata = self._get_metadata(path)
+			if name in metadata and isinstance(metadata[name], dict) and "hash" in metadata[name]:
+				return completed_future(metadata[name]["hash"])
+		return self._hash_in_background(file_path)
+
+	def _hash_in_background(self, file_path, previous=None):
+		"""
+		Hashes the file at ``file_path`` in the background and stores the hash in its metadata once it is known, see
+		:meth:`_store_hash`. Returns a :class:`~concurrent.futures.Future` of the hash, done after it was stored and the
+		hashed callbacks were called.
+		"""
+
+		path, name = os.path.split(file_path)
+		stored = Future()
+		with self._pending_hashes_mutex:
+			self._pending_hashes[file_path] = stored
+
+		def on_hashed(future):
+			try:
+				file_hash = future.result()
+				stored_new = self._store_hash(path, name, file_hash, previous=previous)
+			except Exception as e:
+				self._logger.debug("Could not hash {file_path}: {e}".format(**locals()))
+				error = e
+			else:
+				error = None
+			finally:
+				with self._pending_hashes_mutex:
+					if self._pending_hashes.get(file_path) is stored:
+						del self._pending_hashes[file_path]
+
+			if error is not None:
+				stored.set_exception(error)
+				return
+
+			if stored_new:
+				rel_path = self.rel_path(file_path)
+				for callback in self._hashed_callbacks:
+					try:
+						callback(rel_path, file_hash)
+					except:
+						self._logger.exception("Error while calling hashed callback for {rel_path}".format(**locals()))
+			stored.set_result(file_hash)
+
+		self._hasher.hash(file_path).add_done_callback(on_hashed)
+		return stored
+
+	def _store_hash(self, path, name, file_hash, previous=None):
+		"""
+		Stores ``file_hash`` as the hash of ``name`` on ``path``. If the file had the same hash before it was replaced
+		(``previous`` being its metadata back then), the former metadata is restored. If the hash changed otherwise,
+		the metadata starts over. Returns True if the hash was stored, False if the file was removed in the meantime or
+		already had that hash.
+
+		With a metadata store indexed by hash, a file without a hash yet takes over the metadata left behind by a file
+		with the same hash that doesn't exist anymore, e.g. after its folder was renamed outside of OctoPrint.
+		"""
+
+		with self._metadata_lock:
+			links_to_add = self._links_to_unhashed.pop(os.path.join(path, name), [])
+
+			if not os.path.isfile(os.path.join(path, name)):
+				# removed in the meantime
+				return False
+
+			metadata = self._get_metadata(path)
+			if not name in metadata or not isinstance(metadata[name], dict):
+				metadata[name] = dict()
+			current_hash = metadata[name].get("hash")
+
+			if previous is None and current_hash is None and self._metadata_store.indexed:
+				previous = self._take_orphaned_metadata(path, name, file_hash)
+
+			if previous is not None:
+				if previous.get("hash") == file_hash:
+					# same contents as before, keep what we knew about the file
+					entry = metadata[name]
+					links = entry.get("links", [])
+					for key, value in previous.items():
+						if not key in entry:
+							entry[key] = value
+					entry["links"] = previous.get("links", []) + [link for link in links if not link in previous.get("links", [])]
+				else:
+					silentRemove(self._layer_index_path(path, name))
+			elif current_hash == file_hash:
+				return False
+			elif current_hash is not None:
+				# the contents changed
+				metadata[name] = dict(
+					links=[],
+					notes=[]
 				)
+				silentRemove(self._layer_index_path(path, name))
 
-		# TODO recreate links if we have metadata less entries
+			metadata[name]["hash"] = file_hash
+			changed = [name]
+
+			# links added while the file was still being hashed lack its hash
+			for other_name, other in metadata.items():
+				if other_name == name or not isinstance(other, dict):
+					continue
+				for link in other.get("links", []):
+					if link.get("rel") in ("model", "machinecode") and link.get("name") == name and not "hash" in link:
+						link["hash"] = file_hash
+						if not other_name in changed:
+							changed.append(other_name)
 
-		# save metadata
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+			self._save_metadata(path, metadata, names=changed)
 
-		return result
+			# links to the file that had to wait for its hash
+			for other_name, rel, data in links_to_add:
+				self._add_links(other_name, path, [(rel, data)])
+
+			return True
+
+	def _take_orphaned_metadata(self, path, name, file_hash):
+		"""
+		Removes and returns the metadata stored for a file with ``file_hash`` that doesn't exist anymore, moving its
+		layer index over to ``name`` on ``path``. Returns ``None`` if there is no such metadata. Expects the caller to
+		hold the metadata lock.
+		"""
+
+		for orphan_path, orphan_name in self._metadata_store.find_by_hash(file_hash):
+			if os.path.isfile(os.path.join(orphan_path, orphan_name)):
+				continue
+
+			orphan_metadata = self._get_metadata(orphan_path)
+			orphaned = orphan_metadata.pop(orphan_name, None)
+			self._save_metadata(orphan_path, orphan_metadata, names=[orphan_name])
+			if not isinstance(orphaned, dict):
+				continue
 
-	def _create_hash(self, path):
-		import hashlib
+			orphan_index_path = self._layer_index_path(orphan_path, orphan_name)
+			index_path = self._layer_index_path(path, name)
+			if os.path.exists(orphan_index_path) and not os.path.exists(index_path):
+				index_folder = os.path.dirname(index_path)
+				if not os.path.exists(index_folder):
+					os.makedirs(index_folder)
+				safeRename(orphan_index_path, index_path)
 
-		blocksize = 65536
-		hash = hashlib.sha1()
-		with open(path, "rb") as f:
-			buffer = f.read(blocksize)
-			while len(buffer) > 0:
-				hash.update(buffer)
-				buffer = f.read(blocksize)
+			self._logger.info("Took over the metadata of {orphan_name} in {orphan_path} for {name} in {path}".format(**locals()))
+			return orphaned
 
-		return hash.hexdigest()
+		return None
 
 	def sanitize(self, path):
 		name = None
@@ -849,37 +1191,29 @@ class LocalFileStorage(StorageInterface):
 
 		return path
 
-	def _get_metadata(self, path):
-		if path in self._metadata_cache:
-			return self._metadata_cache[path]
+	def _layer_index_path(self, path, name):
+		return os.path.join(path, ".layers", name + ".idx")
 
-		metadata_path = os.path.join(path, ".metadata.yaml")
-		if os.path.exists(metadata_path):
-			with self._metadata_lock:
-				with open(metadata_path) as f:
-					try:
-						import yaml
-						metadata = yaml.safe_load(f)
-					except:
-						self._logger.exception("Error while reading .metadata.yaml from {path}".format(**locals()))
-					else:
-						self._metadata_cache[path] = metadata
-						return metadata
-		return dict()
+	def _get_metadata(self, path):
+		# callers modifying the returned metadata have to hold the metadata lock until they saved it again
+		with self._metadata_lock:
+			if path in self._metadata_cache:
+				return self._metadata_cache[path]
 
-	def _save_metadata(self, path, metadata):
-		metadata_path = os.path.join(path, ".metadata.yaml")
+			metadata = self._metadata_store.get_folder(path)
+			if not metadata:
+				return dict()
 
-		fh, metadata_temporary_path = tempfile.mkstemp()
-		os.close(fh)
+			self._metadata_cache[path] = metadata
+			return metadata
 
+	def _save_metadata(self, path, metadata, names=None):
 		with self._metadata_lock:
-			try:
-				with open(metadata_temporary_path, "w") as f:
-					import yaml
-					yaml.safe_dump(metadata, stream=f, default_flow_style=False, indent="  ", allow_unicode=True)
-				safeRename(metadata_temporary_path, metadata_path, throw_error=True)
-			except:
-				self._logger.exception("Error while writing .metadata.yaml to {path}".format(**locals()))
-			else:
-				self._metadata_cache[path] = metadata
+			self._metadata_store.save(path, metadata, names=names)
+			self._metadata_cache[path] = metadata
+
+		if names is None:
+			names = metadata.keys()
+		for name in names:
+			if name in metadata:
+				self._changes.changed(self.rel_path((path, name)))
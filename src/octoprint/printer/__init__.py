@@ -9,21 +9,25 @@ import os
 import logging
 
 import octoprint.util.comm as comm
+import octoprint.util.commworker as commworker
 import octoprint.util as util
 
 from octoprint.settings import settings
 from octoprint.events import eventManager, Events
 
 from octoprint.filemanager.destinations import FileDestinations
+from octoprint.util.logbuffer import LogBuffer, LogForwarder
 
 from octoprint.plugin import plugin_manager, ProgressPlugin
 
+DEFAULT_PRINTER = "_default"
+
 def getConnectionOptions():
 	"""
 	 Retrieves the available ports, baudrates, prefered port and baudrate for connecting to the printer.
 	"""
 	return {
-		"ports": comm.serialList(),
+		"ports": comm.serialDiscovery().getPorts(),
 		"baudrates": comm.baudrateList(),
 		"portPreference": settings().get(["serial", "port"]),
 		"baudratePreference": settings().getInt(["serial", "baudrate"]),
@@ -31,10 +35,17 @@ def getConnectionOptions():
 	}
 
 class Printer():
-	def __init__(self, fileManager, analysisQueue, printerProfileManager):
+	def __init__(self, fileManager, analysisQueue, printerProfileManager, identifier=DEFAULT_PRINTER, name=None, connectionDefaults=None, busyPorts=None, jobCache=None):
 		from collections import deque
 
 		self._logger = logging.getLogger(__name__)
+
+		self._identifier = identifier
+		self._name = name
+		self._connectionDefaults = connectionDefaults if connectionDefaults is not None else dict()
+
+		# returns the ports used by other printers, which this one must not touch
+		self._busyPorts = busyPorts
 		#self._estimationLogger = logging.getLogger("ESTIMATIONS")
 		#self._printTimeLogger = logging.getLogger("PRINT_TIME")
 
@@ -42,6 +53,8 @@ class Printer():
 		self._fileManager = fileManager
 		self._printerProfileManager = printerProfileManager
 
+		self._jobCache = jobCache
+
 		# state
 		# TODO do we really need to hold the temperature here?
 		self._temp = None
@@ -55,11 +68,11 @@ class Printer():
 		self._messages = deque([], 300)
 		self._messageBacklog = []
 
-		self._latestLog = None
-		self._log = deque([], 300)
-		self._logBacklog = []
+		self._logBuffer = LogBuffer(settings().getInt(["serial", "logBuffer"]))
+		self._serialLogForwarder = LogForwarder(self._logBuffer, logging.getLogger("SERIAL" if self.isDefault() else "SERIAL." + identifier))
 
 		self._state = None
+		self._printerProfile = None
 
 		self._currentZ = None
 
@@ -92,8 +105,8 @@ class Printer():
 			ratelimit=0.5,
 			updateCallback=self._sendCurrentDataCallbacks,
 			addTemperatureCallback=self._sendAddTemperatureCallbacks,
-			addLogCallback=self._sendAddLogCallbacks,
-			addMessageCallback=self._sendAddMessageCallbacks
+			addMessageCallback=self._sendAddMessageCallbacks,
+			logBuffer=self._logBuffer
 		)
 		self._stateMonitor.reset(
 			state={"text": self.getStateString(), "flags": self._getStateFlags()},
@@ -133,11 +146,6 @@ class Printer():
 			try: callback.addTemperature(data)
 			except: self._logger.exception("Exception while adding temperature data point")
 
-	def _sendAddLogCallbacks(self, data):
-		for callback in self._callbacks:
-			try: callback.addLog(data)
-			except: self._logger.exception("Exception while adding communication log entry")
-
 	def _sendAddMessageCallbacks(self, data):
 		for callback in self._callbacks:
 			try: callback.addMessage(data)
@@ -195,13 +203,40 @@ class Printer():
 
 	def connect(self, port=None, baudrate=None, profile=None):
 		"""
-		 Connects to the printer. If port and/or baudrate is provided, uses these settings, otherwise autodetection
-		 will be attempted.
+		 Connects to the printer. If port and/or baudrate is provided, uses these settings, otherwise the printer's
+		 connection defaults are used, falling back to autodetection. Ports used by other printers are never probed
+		 or opened.
 		"""
+		if port is None:
+			port = self._connectionDefaults.get("port")
+		if baudrate is None:
+			baudrate = self._connectionDefaults.get("baudrate")
+		if profile is None:
+			profile = self._connectionDefaults.get("profile")
+
+		if not self.isDefault():
+			# only the default printer falls back to the serial settings, all others autodetect what's not configured
+			if port is None:
+				port = "AUTO"
+			if baudrate is None:
+				baudrate = 0
+
+		excludedPorts = self._busyPorts() if self._busyPorts is not None else []
+
 		if self._comm is not None:
 			self._comm.close()
-		self._comm = comm.MachineCom(port, baudrate, callbackObject=self)
-		self._printerProfileManager.select(profile)
+		if settings().getBoolean(["serial", "workerProcess"]):
+			self._comm = commworker.RemoteMachineCom(port, baudrate, callbackObject=self, logBuffer=self._logBuffer, excludedPorts=excludedPorts)
+		else:
+			self._comm = comm.MachineCom(port, baudrate, callbackObject=self, logBuffer=self._logBuffer, excludedPorts=excludedPorts)
+
+		if self._printerProfileManager.exists(profile):
+			self._printerProfile = self._printerProfileManager.get(profile)
+		else:
+			self._printerProfile = None
+		if self.isDefault():
+			# the profile manager's current profile is the one of the default printer
+			self._printerProfileManager.select(profile)
 
 	def disconnect(self):
 		"""
@@ -210,7 +245,9 @@ class Printer():
 		if self._comm is not None:
 			self._comm.close()
 		self._comm = None
-		self._printerProfileManager.deselect()
+		self._printerProfile = None
+		if self.isDefault():
+			self._printerProfileManager.deselect()
 		eventManager().fire(Events.DISCONNECTED)
 
 	def command(self, command):
@@ -230,7 +267,7 @@ class Printer():
 			self._comm.sendCommand(command)
 
 	def jog(self, axis, amount):
-		printer_profile = self._printerProfileManager.get_current_or_default()
+		printer_profile = self._getPrinterProfile()
 		movement_speed = printer_profile["axes"][axis]["speed"]
 		self.commands(["G91", "G1 %s%.4f F%d" % (axis.upper(), amount, movement_speed), "G90"])
 
@@ -238,7 +275,7 @@ class Printer():
 		self.commands(["G91", "G28 %s" % " ".join(map(lambda x: "%s0" % x.upper(), axes)), "G90"])
 
 	def extrude(self, amount):
-		printer_profile = self._printerProfileManager.get_current_or_default()
+		printer_profile = self._getPrinterProfile()
 		extrusion_speed = printer_profile["axes"]["e"]["speed"]
 		self.commands(["G91", "G1 E%s F%d" % (amount, extrusion_speed), "G90"])
 
@@ -251,7 +288,7 @@ class Printer():
 
 	def setTemperature(self, type, value):
 		if type.startswith("tool"):
-			printer_profile = self._printerProfileManager.get_current_or_default()
+			printer_profile = self._getPrinterProfile()
 			extruder_count = printer_profile["extruder"]["count"]
 			if extruder_count > 1:
 				try:
@@ -294,10 +331,33 @@ class Printer():
 			return
 
 		self._printAfterSelect = printAfterSelect
-		self._comm.selectFile(filename, sd)
+		self._comm.selectFile(filename, sd, cachedJob=None if sd else self._getCachedJob(filename))
 		self._setProgressData(0, None, None, None)
 		self._setCurrentZ(None)
 
+	def _getCachedJob(self, filename):
+		"""
+		 Retrieves the cached print job for the local file ``filename``, scheduling it to be built if it's not
+		 available yet so that it can be used for the next print of the file. Jobs of files that aren't hashed yet are
+		 built by the file manager once their hash is known.
+		"""
+		if self._jobCache is None:
+			return None
+
+		try:
+			metadata = self._fileManager.get_metadata(FileDestinations.LOCAL, filename)
+		except:
+			self._logger.exception("Error while retrieving metadata for %s" % filename)
+			return None
+
+		if not metadata or not "hash" in metadata:
+			return None
+
+		cachedJob = self._jobCache.get(metadata["hash"])
+		if not cachedJob.available:
+			self._jobCache.schedule(metadata["hash"], filename)
+		return cachedJob
+
 	def unselectFile(self):
 		if self._comm is not None and (self._comm.isBusy() or self._comm.isStreaming()):
 			return
@@ -340,7 +400,7 @@ class Printer():
 		self._comm.cancelPrint()
 
 		if disableMotorsAndHeater:
-			printer_profile = self._printerProfileManager.get_current_or_default()
+			printer_profile = self._getPrinterProfile()
 			extruder_count = printer_profile["extruder"]["count"]
 
 			# disable motors, switch off hotends, bed and fan
@@ -355,7 +415,7 @@ class Printer():
 
 		# mark print as failure
 		if self._selectedFile is not None:
-			self._fileManager.log_print(FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL, self._selectedFile["filename"], time.time(), self._comm.getPrintTime(), False, self._printerProfileManager.get_current_or_default()["id"])
+			self._fileManager.log_print(FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL, self._selectedFile["filename"], time.time(), self._comm.getPrintTime(), False, self._getPrinterProfile()["id"])
 			payload = {
 				"file": self._selectedFile["filename"],
 				"origin": FileDestinations.LOCAL
@@ -366,6 +426,11 @@ class Printer():
 
 	#~~ state monitoring
 
+	def _getPrinterProfile(self):
+		if self._printerProfile is not None:
+			return self._printerProfile
+		return self._printerProfileManager.get_default()
+
 	def _setCurrentZ(self, currentZ):
 		self._currentZ = currentZ
 		self._stateMonitor.setCurrentZ(self._currentZ)
@@ -374,10 +439,6 @@ class Printer():
 		self._state = state
 		self._stateMonitor.setState({"text": self.getStateString(), "flags": self._getStateFlags()})
 
-	def _addLog(self, log):
-		self._log.append(log)
-		self._stateMonitor.addLog(log)
-
 	def _addMessage(self, message):
 		self._messages.append(message)
 		self._stateMonitor.addMessage(message)
@@ -403,13 +464,21 @@ class Printer():
 
 			return result
 
-	def _setProgressData(self, progress, filepos, printTime, cleanedPrintTime):
+	def _setProgressData(self, progress, filepos, printTime, cleanedPrintTime, readAhead=None):
 		estimatedTotalPrintTime = self._estimateTotalPrintTime(progress, cleanedPrintTime)
 		statisticalTotalPrintTime = None
 		totalPrintTime = estimatedTotalPrintTime
 
 		if self._selectedFile and "estimatedPrintTime" in self._selectedFile and self._selectedFile["estimatedPrintTime"]:
 			statisticalTotalPrintTime = self._selectedFile["estimatedPrintTime"]
+
+			layerIndex = self._selectedFile.get("layerIndex")
+			if layerIndex is not None and layerIndex.total_time and filepos is not None and cleanedPrintTime is not None:
+				# the layer index knows how the print time is distributed across the file, so the time left at the
+				# current position doesn't have to be assumed proportional to the bytes left
+				timeLeft = layerIndex.total_time - layerIndex.time_at_offset(filepos, end=self._selectedFile["filesize"])
+				statisticalTotalPrintTime = cleanedPrintTime + timeLeft * statisticalTotalPrintTime / layerIndex.total_time
+
 			if progress and cleanedPrintTime:
 				if estimatedTotalPrintTime is None:
 					totalPrintTime = statisticalTotalPrintTime
@@ -430,7 +499,8 @@ class Printer():
 			"completion": self._progress * 100 if self._progress is not None else None,
 			"filepos": filepos,
 			"printTime": int(self._printTime) if self._printTime is not None else None,
-			"printTimeLeft": int(self._printTimeLeft) if self._printTimeLeft is not None else None
+			"printTimeLeft": int(self._printTimeLeft) if self._printTimeLeft is not None else None,
+			"readAhead": readAhead
 		})
 
 		if progress:
@@ -470,7 +540,8 @@ class Printer():
 				"filename": filename,
 				"filesize": filesize,
 				"sd": sd,
-				"estimatedPrintTime": None
+				"estimatedPrintTime": None,
+				"layerIndex": None
 			}
 		else:
 			self._selectedFile = None
@@ -510,7 +581,7 @@ class Printer():
 					if "filament" in fileData["analysis"].keys():
 						filament = fileData["analysis"]["filament"]
 				if "statistics" in fileData:
-					printer_profile = self._printerProfileManager.get_current_or_default()["id"]
+					printer_profile = self._getPrinterProfile()["id"]
 					if "averagePrintTime" in fileData["statistics"] and printer_profile in fileData["statistics"]["averagePrintTime"]:
 						averagePrintTime = fileData["statistics"]["averagePrintTime"][printer_profile]
 					if "lastPrintTime" in fileData["statistics"] and printer_profile in fileData["statistics"]["lastPrintTime"]:
@@ -522,6 +593,12 @@ class Printer():
 					# TODO apply factor which first needs to be tracked!
 					self._selectedFile["estimatedPrintTime"] = estimatedPrintTime
 
+			if not sd:
+				try:
+					self._selectedFile["layerIndex"] = self._fileManager.get_layer_index(FileDestinations.LOCAL, filename)
+				except:
+					self._logger.exception("Error while retrieving layer index for %s" % filename)
+
 		self._stateMonitor.setJobData({
 			"file": {
 				"name": os.path.basename(filename) if filename is not None else None,
@@ -540,7 +617,7 @@ class Printer():
 			data = self._stateMonitor.getCurrentData()
 			data.update({
 				"temps": list(self._temps),
-				"logs": list(self._log),
+				"logs": self._logBuffer.tail(300),
 				"messages": list(self._messages)
 			})
 			callback.sendHistoryData(data)
@@ -564,9 +641,10 @@ class Printer():
 
 	def mcLog(self, message):
 		"""
-		 Callback method for the comm object, called upon log output.
+		 Callback method for the comm object, called upon log output if the comm object doesn't write to the log buffer
+		 directly.
 		"""
-		self._addLog(message)
+		self._logBuffer.append(message)
 
 	def mcTempUpdate(self, temp, bedTemp):
 		self._addTemperatureData(temp, bedTemp)
@@ -581,12 +659,16 @@ class Printer():
 		if self._comm is not None and oldState == self._comm.STATE_PRINTING:
 			if self._selectedFile is not None:
 				if state == self._comm.STATE_OPERATIONAL:
-					self._fileManager.log_print(FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL, self._selectedFile["filename"], time.time(), self._comm.getPrintTime(), True, self._printerProfileManager.get_current_or_default()["id"])
+					self._fileManager.log_print(FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL, self._selectedFile["filename"], time.time(), self._comm.getPrintTime(), True, self._getPrinterProfile()["id"])
 				elif state == self._comm.STATE_CLOSED or state == self._comm.STATE_ERROR or state == self._comm.STATE_CLOSED_WITH_ERROR:
-					self._fileManager.log_print(FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL, self._selectedFile["filename"], time.time(), self._comm.getPrintTime(), False, self._printerProfileManager.get_current_or_default()["id"])
+					self._fileManager.log_print(FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL, self._selectedFile["filename"], time.time(), self._comm.getPrintTime(), False, self._getPrinterProfile()["id"])
 			self._analysisQueue.resume() # printing done, put those cpu cycles to good use
+			if self._jobCache is not None:
+				self._jobCache.resume()
 		elif self._comm is not None and state == self._comm.STATE_PRINTING:
 			self._analysisQueue.pause() # do not analyse files while printing
+			if self._jobCache is not None:
+				self._jobCache.pause() # nor build cached jobs
 
 		self._setState(state)
 
@@ -603,7 +685,7 @@ class Printer():
 		 Triggers storage of new values for printTime, printTimeLeft and the current progress.
 		"""
 
-		self._setProgressData(self._comm.getPrintProgress(), self._comm.getPrintFilepos(), self._comm.getPrintTime(), self._comm.getCleanedPrintTime())
+		self._setProgressData(self._comm.getPrintProgress(), self._comm.getPrintFilepos(), self._comm.getPrintTime(), self._comm.getCleanedPrintTime(), readAhead=self._comm.getPrintReadAhead())
 
 	def mcZChange(self, newZ):
 		"""
@@ -714,6 +796,21 @@ class Printer():
 
 	#~~ state reports
 
+	def getIdentifier(self):
+		return self._identifier
+
+	def getName(self):
+		return self._name
+
+	def isDefault(self):
+		return self._identifier == DEFAULT_PRINTER
+
+	def getConnectionDefaults(self):
+		return dict(self._connectionDefaults)
+
+	def setConnectionDefaults(self, connectionDefaults):
+		self._connectionDefaults = dict(connectionDefaults)
+
 	def getStateString(self):
 		"""
 		 Returns a human readable string corresponding to the current communication state.
@@ -762,9 +859,26 @@ class Printer():
 			return "Closed", None, None, None
 
 		port, baudrate = self._comm.getConnection()
-		printer_profile = self._printerProfileManager.get_current_or_default()
+		printer_profile = self._getPrinterProfile()
 		return self._comm.getStateString(), port, baudrate, printer_profile
 
+	def createLogCursor(self, backlog=0):
+		"""
+		 Creates a cursor for reading the communication log at the caller's own pace, see
+		 :class:`~octoprint.util.logbuffer.LogCursor`. The first read returns the last ``backlog`` lines.
+		"""
+		return self._logBuffer.cursor(backlog=backlog)
+
+	def getResendStatistics(self):
+		if self._comm is None:
+			return None
+		return self._comm.getResendStatistics()
+
+	def getRoundTripTime(self):
+		if self._comm is None:
+			return None
+		return self._comm.getRoundTripTime()
+
 	def isClosedOrError(self):
 		return self._comm is None or self._comm.isClosedOrError()
 
@@ -790,13 +904,16 @@ class Printer():
 			return self._comm.isSdReady()
 
 class StateMonitor(object):
-	def __init__(self, ratelimit, updateCallback, addTemperatureCallback, addLogCallback, addMessageCallback):
+	def __init__(self, ratelimit, updateCallback, addTemperatureCallback, addMessageCallback, logBuffer):
 		self._ratelimit = ratelimit
 		self._updateCallback = updateCallback
 		self._addTemperatureCallback = addTemperatureCallback
-		self._addLogCallback = addLogCallback
 		self._addMessageCallback = addMessageCallback
 
+		# new log lines are noticed by polling the buffer, so appending to it stays free of any notification overhead
+		self._logBuffer = logBuffer
+		self._logSequence = logBuffer.getSequence()
+
 		self._state = None
 		self._jobData = None
 		self._gcodeData = None
@@ -824,10 +941,6 @@ class StateMonitor(object):
 		self._addTemperatureCallback(temperature)
 		self._changeEvent.set()
 
-	def addLog(self, log):
-		self._addLogCallback(log)
-		self._changeEvent.set()
-
 	def addMessage(self, message):
 		self._addMessageCallback(message)
 		self._changeEvent.set()
@@ -855,7 +968,9 @@ class StateMonitor(object):
 
 	def _work(self):
 		while True:
-			self._changeEvent.wait()
+			self._changeEvent.wait(self._ratelimit)
+			if not self._changeEvent.isSet() and self._logBuffer.getSequence() == self._logSequence:
+				continue
 
 			with self._stateMutex:
 				now = time.time()
@@ -864,6 +979,7 @@ class StateMonitor(object):
 				if additionalWaitTime > 0:
 					time.sleep(additionalWaitTime)
 
+				self._logSequence = self._logBuffer.getSequence()
 				data = self.getCurrentData()
 				self._updateCallback(data)
 				self._lastUpdate = time.time()
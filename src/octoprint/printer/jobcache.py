@@ -0,0 +1,299 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import collections
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from octoprint.util import safeRename, silentRemove
+from octoprint.util.comm import LineFramer, PrintingGcodeFileInformation
+
+
+class PrintJobCache(object):
+	"""
+	Keeps pre-processed versions of GCODE files for printing, keyed by the file's hash as stored in its metadata.
+
+	Each cached job consists of two files inside ``folder``:
+
+	``<hash>.commands``
+	    All commands of the file, stripped of comments and whitespace, separated by newlines.
+	``<hash>.index``
+	    A header followed by one fixed size record per command, holding the command's offset and length in the
+	    commands file, the position in the source file after the command's line, the command's type and tool as
+	    determined by :meth:`octoprint.util.comm.PrintingGcodeFileInformation.parseLine` and its checksum as
+	    calculated by :meth:`octoprint.util.comm.LineFramer.checksum`.
+
+	The index is written last, so an entry only counts as available once its index exists. At most ``max_entries``
+	jobs are kept, the least recently used ones are removed first.
+
+	Jobs are built in the background as soon as a file's hash is known. While a printer is printing (see :meth:`pause`
+	and :meth:`resume`) no jobs are built, jobs scheduled or aborted in the meantime are built once all prints are done.
+	"""
+
+	def __init__(self, folder, max_entries=20):
+		self._logger = logging.getLogger(__name__)
+
+		self._folder = folder
+		self._max_entries = max_entries
+
+		self._building = set()
+		self._building_mutex = threading.Lock()
+
+		self._deferred = collections.OrderedDict()
+		self._pause_count = 0
+
+	def get(self, file_hash):
+		"""
+		Returns the :class:`CachedPrintJob` for ``file_hash``. The returned job might not be available yet, check
+		:attr:`CachedPrintJob.available` and use :meth:`schedule` to have it built.
+		"""
+		return CachedPrintJob(self._commands_path(file_hash), self._index_path(file_hash))
+
+	def is_building(self, file_hash):
+		with self._building_mutex:
+			return file_hash in self._building
+
+	def schedule(self, file_hash, path):
+		"""
+		Builds the cached job for the file at ``path`` with hash ``file_hash`` in a background thread, unless it's
+		already available or being built. While paused, the job is only built once the cache is resumed.
+		"""
+		if self.get(file_hash).available:
+			return
+
+		with self._building_mutex:
+			if file_hash in self._building:
+				return
+			if self._pause_count > 0:
+				self._deferred[file_hash] = path
+				return
+			self._building.add(file_hash)
+
+		def run():
+			try:
+				if not self.build(file_hash, path):
+					# a print started in the meantime
+					with self._building_mutex:
+						self._deferred[file_hash] = path
+			except:
+				self._logger.exception("Error while building cached print job for {path}".format(**locals()))
+			finally:
+				with self._building_mutex:
+					self._building.discard(file_hash)
+				if not self.is_paused():
+					self._schedule_deferred()
+
+		thread = threading.Thread(target=run)
+		thread.daemon = True
+		thread.start()
+
+	def pause(self):
+		"""
+		Stops building jobs, e.g. because a printer started printing. Jobs currently being built are aborted and built
+		again after :meth:`resume`. Calls nest, every call has to be matched by a call to :meth:`resume`.
+		"""
+		with self._building_mutex:
+			self._pause_count += 1
+
+	def resume(self):
+		"""
+		Builds the jobs scheduled while paused once every call to :meth:`pause` was matched.
+		"""
+		with self._building_mutex:
+			if self._pause_count == 0:
+				return
+			self._pause_count -= 1
+			if self._pause_count > 0:
+				return
+
+		self._schedule_deferred()
+
+	def is_paused(self):
+		return self._pause_count > 0
+
+	def _schedule_deferred(self):
+		with self._building_mutex:
+			deferred = self._deferred.items()
+			self._deferred.clear()
+
+		for file_hash, path in deferred:
+			self.schedule(file_hash, path)
+
+	def build(self, file_hash, path):
+		"""
+		Parses the file at ``path`` and stores the result as cached job for ``file_hash``. Returns ``False`` without
+		storing anything if the cache got paused in the meantime, ``True`` otherwise.
+		"""
+		stat = os.stat(path)
+
+		commands_fh, commands_temporary_path = tempfile.mkstemp(dir=self._folder)
+		index_fh, index_temporary_path = tempfile.mkstemp(dir=self._folder)
+		try:
+			with os.fdopen(commands_fh, "wb") as commands_file:
+				with os.fdopen(index_fh, "wb") as index_file:
+					index_file.write(CachedPrintJob.HEADER.pack(CachedPrintJob.MAGIC, CachedPrintJob.VERSION, 0, stat.st_size, stat.st_mtime))
+
+					count = 0
+					offset = 0
+					filepos = 0
+					record = CachedPrintJob.RECORD
+					parse_line = PrintingGcodeFileInformation.parseLine
+					checksum = LineFramer.checksum
+					with open(path, "rb") as f:
+						for line in f:
+							if self._pause_count > 0:
+								return False
+
+							filepos += len(line)
+							parsed = parse_line(line)
+							if parsed is None:
+								continue
+
+							command, line_type, tool = parsed
+							commands_file.write(command + "\n")
+							index_file.write(record.pack(offset, len(command), filepos, line_type, tool if tool is not None else -1, checksum(command)))
+							offset += len(command) + 1
+							count += 1
+
+					index_file.seek(0)
+					index_file.write(CachedPrintJob.HEADER.pack(CachedPrintJob.MAGIC, CachedPrintJob.VERSION, count, stat.st_size, stat.st_mtime))
+
+			safeRename(commands_temporary_path, self._commands_path(file_hash), throw_error=True)
+			safeRename(index_temporary_path, self._index_path(file_hash), throw_error=True)
+		finally:
+			silentRemove(commands_temporary_path)
+			silentRemove(index_temporary_path)
+
+		self._logger.info("Built cached print job for {path}".format(**locals()))
+		self._evict()
+		return True
+
+	def remove(self, file_hash):
+		silentRemove(self._index_path(file_hash))
+		silentRemove(self._commands_path(file_hash))
+
+	def _evict(self):
+		entries = []
+		for entry in os.listdir(self._folder):
+			if not entry.endswith(".index"):
+				continue
+			try:
+				entries.append((os.stat(os.path.join(self._folder, entry)).st_mtime, entry[:-len(".index")]))
+			except OSError:
+				pass
+
+		if len(entries) <= self._max_entries:
+			return
+
+		for _, file_hash in sorted(entries, reverse=True)[self._max_entries:]:
+			self.remove(file_hash)
+
+	def _commands_path(self, file_hash):
+		return os.path.join(self._folder, file_hash + ".commands")
+
+	def _index_path(self, file_hash):
+		return os.path.join(self._folder, file_hash + ".index")
+
+
+class CachedPrintJob(object):
+	"""
+	A single job inside the :class:`PrintJobCache`. Both files are memory mapped on :meth:`open`, retrieving a command
+	via :meth:`get` is then just a matter of unpacking its index record and slicing the commands.
+	"""
+
+	MAGIC = "OPJC"
+	VERSION = 2
+
+	# magic, version, number of commands, size and modification time of the source file
+	HEADER = struct.Struct("<4sHQQd")
+
+	# offset and length in the commands file, position in the source file, line type, tool or -1, checksum
+	RECORD = struct.Struct("<QIQBhB")
+
+	def __init__(self, commands_path, index_path):
+		self._commands_path = commands_path
+		self._index_path = index_path
+
+		self._commands = None
+		self._index = None
+		self._count = 0
+
+	@property
+	def available(self):
+		"""
+		Whether the job has been built by the current version of the cache.
+		"""
+		try:
+			with open(self._index_path, "rb") as f:
+				header = f.read(self.HEADER.size)
+		except IOError:
+			return False
+
+		if len(header) != self.HEADER.size:
+			return False
+		magic, version = self.HEADER.unpack(header)[:2]
+		return magic == self.MAGIC and version == self.VERSION
+
+	def open(self, source=None):
+		"""
+		Maps the job into memory. Returns False if the job is not available or, if ``source`` is given, doesn't match
+		the current size and modification time of that file anymore.
+		"""
+		self.close()
+		if not self.available:
+			return False
+
+		with open(self._index_path, "rb") as f:
+			index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, version, count, size, mtime = self.HEADER.unpack_from(index, 0)
+		if magic != self.MAGIC or version != self.VERSION or len(index) != self.HEADER.size + count * self.RECORD.size:
+			index.close()
+			return False
+
+		if source is not None:
+			stat = os.stat(source)
+			if stat.st_size != size or stat.st_mtime != mtime:
+				index.close()
+				return False
+
+		commands = ""
+		if os.path.getsize(self._commands_path) > 0:
+			with open(self._commands_path, "rb") as f:
+				commands = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		# mark as recently used
+		os.utime(self._index_path, None)
+
+		self._index = index
+		self._commands = commands
+		self._count = count
+		return True
+
+	def close(self):
+		if self._index is not None:
+			self._index.close()
+			self._index = None
+		if self._commands is not None and not isinstance(self._commands, basestring):
+			self._commands.close()
+		self._commands = None
+		self._count = 0
+
+	def get(self, index):
+		"""
+		Returns the command at ``index`` as a tuple ``(command, filepos, line_type, tool, checksum)``.
+		"""
+		offset, length, filepos, line_type, tool, checksum = self.RECORD.unpack_from(self._index, self.HEADER.size + index * self.RECORD.size)
+		return self._commands[offset:offset + length], filepos, line_type, tool if tool >= 0 else None, checksum
+
+	def __len__(self):
+		return self._count
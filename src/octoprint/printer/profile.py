@@ -57,6 +57,12 @@ class PrinterProfileManager(object):
 			y = dict(speed=6000, inverted=False),
 			z = dict(speed=200, inverted=False),
 			e = dict(speed=300, inverted=False)
+		),
+		planner=dict(
+			acceleration = 3000,
+			travelAcceleration = 3000,
+			retractAcceleration = 3000,
+			jerk = dict(x=10, y=10, z=0.3, e=5)
 		)
 	)
 
@@ -196,7 +202,7 @@ class PrinterProfileManager(object):
 		import yaml
 		with open(path) as f:
 			profile = yaml.safe_load(f)
-		profile = self._ensure_valid_profile(profile)
+		profile = self._ensure_valid_profile(self._migrate_profile(profile))
 		if not profile:
 			self._logger.warn("Invalid profile: %s" % path)
 			raise InvalidProfileError()
@@ -248,6 +254,16 @@ class PrinterProfileManager(object):
 		sanitized_name = sanitized_name.replace(" ", "_")
 		return sanitized_name
 
+	def _migrate_profile(self, profile):
+		if not isinstance(profile, dict):
+			return profile
+
+		# planner settings were added later on, profiles created before that get the defaults
+		if not "planner" in profile:
+			profile["planner"] = copy.deepcopy(self.__class__.default["planner"])
+
+		return profile
+
 	def _ensure_valid_profile(self, profile):
 		# ensure all keys are present
 		if not dict_contains_keys(self.default, profile):
@@ -274,7 +290,9 @@ class PrinterProfileManager(object):
 				return False
 
 		# convert floats
-		for path in (("volume", "width"), ("volume", "depth"), ("volume", "height"), ("extruder", "nozzleDiameter")):
+		for path in (("volume", "width"), ("volume", "depth"), ("volume", "height"), ("extruder", "nozzleDiameter"),
+		             ("planner", "acceleration"), ("planner", "travelAcceleration"), ("planner", "retractAcceleration"),
+		             ("planner", "jerk", "x"), ("planner", "jerk", "y"), ("planner", "jerk", "z"), ("planner", "jerk", "e")):
 			try:
 				convert_value(profile, path, float)
 			except:
@@ -287,6 +305,13 @@ class PrinterProfileManager(object):
 			except:
 				return False
 
+		# validate planner settings
+		planner = profile["planner"]
+		if min(planner["acceleration"], planner["travelAcceleration"], planner["retractAcceleration"]) <= 0:
+			return False
+		if min(planner["jerk"].values()) < 0:
+			return False
+
 		# validate form factor
 		if not profile["volume"]["formFactor"] in BedTypes.values():
 			return False
@@ -0,0 +1,204 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import collections
+import functools
+import logging
+import re
+import threading
+
+from octoprint.settings import settings
+from octoprint.printer import DEFAULT_PRINTER
+
+
+class InvalidPrinterError(Exception):
+	pass
+
+
+class PrinterRegistry(object):
+	"""
+	Hosts all printers served by this instance, sharing the file manager, analysis queue and printer profiles between
+	them.
+
+	The default printer (identifier ``_default``) is always available and connects via the ``serial`` settings.
+	Additional printers are configured in ``printers`` in ``config.yaml``, each with ``id``, ``name`` and optionally
+	``port``, ``baudrate``, ``profile`` and ``autoconnect``. No two printers may be configured with the same port.
+
+	``printer_factory`` is called with the ``identifier``, ``name``, ``connectionDefaults`` and ``busyPorts`` of each
+	printer to register and has to return the :class:`~octoprint.printer.Printer` instance for it. ``busyPorts``
+	returns the ports the other printers are currently connected to, which the printer must not probe or open.
+	"""
+
+	# ports that don't identify a device
+	unspecific_ports = (None, "AUTO", "VIRTUAL")
+
+	valid_identifier = re.compile("^[a-zA-Z0-9_-]+$")
+
+	def __init__(self, printer_factory):
+		self._logger = logging.getLogger(__name__)
+		self._printer_factory = printer_factory
+
+		self._printers = collections.OrderedDict()
+		self._autoconnect = dict()
+		self._ports = dict()
+		self._mutex = threading.RLock()
+
+	def load(self):
+		"""
+		Registers the default printer and all printers configured in the settings.
+		"""
+		self.add(DEFAULT_PRINTER,
+		         name=settings().get(["appearance", "name"]) or None,
+		         autoconnect=settings().getBoolean(["serial", "autoconnect"]))
+
+		for config in settings().get(["printers"]) or []:
+			if not isinstance(config, dict) or not "id" in config:
+				self._logger.warn("Ignoring printer configuration without id: {config!r}".format(config=config))
+				continue
+
+			try:
+				self.add(config["id"],
+				         name=config.get("name"),
+				         port=config.get("port"),
+				         baudrate=config.get("baudrate"),
+				         profile=config.get("profile"),
+				         autoconnect=config.get("autoconnect", False))
+			except InvalidPrinterError as e:
+				self._logger.warn("Ignoring printer {id}: {message}".format(id=config["id"], message=str(e)))
+
+	def add(self, identifier, name=None, port=None, baudrate=None, profile=None, autoconnect=False):
+		if not self.valid_identifier.match(identifier):
+			raise InvalidPrinterError("Invalid identifier, only letters, digits, _ and - are allowed: {identifier}".format(identifier=identifier))
+
+		with self._mutex:
+			if identifier in self._printers:
+				raise InvalidPrinterError("A printer with this identifier is already registered: {identifier}".format(identifier=identifier))
+
+			configured_port = port
+			if identifier == DEFAULT_PRINTER and configured_port is None:
+				configured_port = settings().get(["serial", "port"])
+			self._validate_port(identifier, configured_port)
+
+			connection_defaults = dict(port=port, baudrate=baudrate, profile=profile)
+			printer = self._printer_factory(identifier=identifier, name=name, connectionDefaults=connection_defaults,
+			                                busyPorts=functools.partial(self.busy_ports, exclude=identifier))
+			self._printers[identifier] = printer
+			self._autoconnect[identifier] = autoconnect
+			self._ports[identifier] = configured_port
+
+		self._logger.info("Registered printer {identifier}".format(identifier=identifier))
+		return printer
+
+	def get(self, identifier):
+		"""
+		Returns the printer registered as ``identifier``, ``None`` if there is no such printer.
+		"""
+		with self._mutex:
+			return self._printers.get(identifier)
+
+	def get_default(self):
+		return self.get(DEFAULT_PRINTER)
+
+	def get_all(self):
+		"""
+		Returns all registered printers in the order in which they were registered.
+		"""
+		with self._mutex:
+			return list(self._printers.values())
+
+	def identifiers(self):
+		with self._mutex:
+			return list(self._printers.keys())
+
+	def save_connection_defaults(self, identifier, port=None, baudrate=None, profile=None, autoconnect=None, save=True):
+		"""
+		Stores ``port``, ``baudrate`` and ``profile`` (if ``save`` is True) and ``autoconnect`` (if not None) as the
+		connection defaults of the additional printer ``identifier`` in its entry in ``printers``. The settings still
+		need to be saved afterwards. The default printer's connection defaults are the ``serial`` settings instead.
+		"""
+		if identifier == DEFAULT_PRINTER:
+			raise InvalidPrinterError("The connection defaults of the default printer are the serial settings")
+
+		with self._mutex:
+			printer = self._printers.get(identifier)
+			if printer is None:
+				raise InvalidPrinterError("Unknown printer: {identifier}".format(identifier=identifier))
+
+			if save:
+				self._validate_port(identifier, port)
+
+			configs = []
+			for config in settings().get(["printers"]) or []:
+				if isinstance(config, dict) and config.get("id") == identifier:
+					config = dict(config)
+					if save:
+						config.update(port=port, baudrate=baudrate, profile=profile)
+					if autoconnect is not None:
+						config["autoconnect"] = autoconnect
+				configs.append(config)
+			settings().set(["printers"], configs)
+
+			if save:
+				printer.setConnectionDefaults(dict(port=port, baudrate=baudrate, profile=profile))
+				self._ports[identifier] = port
+			if autoconnect is not None:
+				self._autoconnect[identifier] = autoconnect
+
+	def busy_ports(self, exclude=None):
+		"""
+		Returns the ports the printers apart from ``exclude`` are currently connected to or connecting to.
+		"""
+		with self._mutex:
+			printers = [printer for identifier, printer in self._printers.items() if identifier != exclude]
+
+		ports = []
+		for printer in printers:
+			if printer.isClosedOrError():
+				continue
+			_, port, _, _ = printer.getCurrentConnection()
+			if not port in self.unspecific_ports:
+				ports.append(port)
+		return ports
+
+	def autoconnect(self, available_ports):
+		"""
+		Connects all printers configured to autoconnect whose port is among ``available_ports``.
+		"""
+		default_port = settings().get(["serial", "port"])
+
+		with self._mutex:
+			printers = list(self._printers.items())
+
+		for identifier, printer in printers:
+			if not self._autoconnect.get(identifier):
+				continue
+
+			if printer.isDefault():
+				port = default_port
+			else:
+				port = printer.getConnectionDefaults().get("port")
+
+			if port in available_ports:
+				self._logger.info("Autoconnecting printer {identifier} on {port}".format(identifier=identifier, port=port))
+				printer.connect(port=port)
+
+	def _validate_port(self, identifier, port):
+		if port in self.unspecific_ports:
+			return
+
+		for other, other_port in self._ports.items():
+			if other != identifier and other_port == port:
+				raise InvalidPrinterError("Port {port} is already configured for printer {other}".format(port=port, other=other))
+
+	def __contains__(self, identifier):
+		with self._mutex:
+			return identifier in self._printers
+
+	def __len__(self):
+		with self._mutex:
+			return len(self._printers)
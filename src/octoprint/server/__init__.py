@@ -18,6 +18,7 @@ from urlparse import urlparse
 from jinja2 import Template
 
 import os
+import functools
 import logging
 import logging.config
 import atexit
@@ -30,6 +31,7 @@ babel = Babel(app)
 debug = False
 
 printer = None
+printerRegistry = None
 printerProfileManager = None
 fileManager = None
 slicingManager = None
@@ -46,7 +48,9 @@ user_permission = Permission(RoleNeed("user"))
 
 # only import the octoprint stuff down here, as it might depend on things defined above to be initialized already
 from octoprint.printer import Printer, getConnectionOptions
+from octoprint.printer.jobcache import PrintJobCache
 from octoprint.printer.profile import PrinterProfileManager
+from octoprint.printer.registry import PrinterRegistry
 from octoprint.settings import settings
 import octoprint.users as users
 import octoprint.events as events
@@ -56,6 +60,7 @@ import octoprint._version
 import octoprint.util
 import octoprint.filemanager.storage
 import octoprint.filemanager.analysis
+import octoprint.filemanager.analysiscache
 import octoprint.slicing
 
 from . import util
@@ -387,6 +392,7 @@ class Server():
 			self._checkForRoot()
 
 		global printer
+		global printerRegistry
 		global printerProfileManager
 		global fileManager
 		global slicingManager
@@ -416,17 +422,27 @@ class Server():
 		sys.excepthook = exception_logger
 		logger.info("Starting OctoPrint %s" % DISPLAY_VERSION)
 
+		# the analysis worker processes are forked right away, before any other threads are started
+		analysisQueue = octoprint.filemanager.analysis.AnalysisQueue(processes=settings().getInt(["gcodeAnalysis", "processes"]))
+
 		# then initialize the plugin manager
 		pluginManager = octoprint.plugin.plugin_manager(init=True)
 
 		printerProfileManager = PrinterProfileManager()
 		eventManager = events.eventManager()
-		analysisQueue = octoprint.filemanager.analysis.AnalysisQueue()
 		slicingManager = octoprint.slicing.SlicingManager(settings().getBaseFolder("slicingProfiles"), printerProfileManager)
 		storage_managers = dict()
-		storage_managers[octoprint.filemanager.FileDestinations.LOCAL] = octoprint.filemanager.storage.LocalFileStorage(settings().getBaseFolder("uploads"))
-		fileManager = octoprint.filemanager.FileManager(analysisQueue, slicingManager, printerProfileManager, initial_storage_managers=storage_managers)
-		printer = Printer(fileManager, analysisQueue, printerProfileManager)
+		storage_managers[octoprint.filemanager.FileDestinations.LOCAL] = octoprint.filemanager.storage.LocalFileStorage(settings().getBaseFolder("uploads"), metadata_backend=settings().get(["fileMetadata", "backend"]))
+		analysisCache = None
+		if settings().getBoolean(["analysisCache", "enabled"]):
+			analysisCache = octoprint.filemanager.analysiscache.AnalysisCache(settings().getBaseFolder("analysisCache"), max_entries=settings().getInt(["analysisCache", "maxEntries"]))
+		jobCache = None
+		if settings().getBoolean(["jobCache", "enabled"]):
+			jobCache = PrintJobCache(settings().getBaseFolder("jobCache"), max_entries=settings().getInt(["jobCache", "maxEntries"]))
+		fileManager = octoprint.filemanager.FileManager(analysisQueue, slicingManager, printerProfileManager, initial_storage_managers=storage_managers, analysis_cache=analysisCache, job_cache=jobCache)
+		printerRegistry = PrinterRegistry(functools.partial(Printer, fileManager, analysisQueue, printerProfileManager, jobCache=jobCache))
+		printerRegistry.load()
+		printer = printerRegistry.get_default()
 		appSessionManager = util.flask.AppSessionManager()
 
 		pluginManager.initialize_implementations(dict(
@@ -531,13 +547,27 @@ class Server():
 
 		self._router = SockJSRouter(self._createSocketConnection, "/sockjs")
 
+		# every additional printer gets its own push channel
+		printer_routers = []
+		for p in printerRegistry.get_all():
+			if p.isDefault():
+				continue
+			printer_routers.append(SockJSRouter(functools.partial(self._createSocketConnection, selectedPrinter=p), "/printers/{identifier}/sockjs".format(identifier=p.getIdentifier())))
+		printer_urls = [url for router in printer_routers for url in router.urls]
+
 		upload_suffixes = dict(name=settings().get(["server", "uploads", "nameSuffix"]), path=settings().get(["server", "uploads", "pathSuffix"]))
-		self._tornado_app = Application(self._router.urls + [
+
+		# uploads are received into a hidden folder within the uploads folder, so moving them into place afterwards is
+		# just a rename
+		upload_tmp = os.path.join(settings().getBaseFolder("uploads"), ".tmp")
+		if not os.path.exists(upload_tmp):
+			os.makedirs(upload_tmp)
+		self._tornado_app = Application(self._router.urls + printer_urls + [
 			(r"/downloads/timelapse/([^/]*\.mpg)", util.tornado.LargeResponseHandler, dict(path=settings().getBaseFolder("timelapse"), as_attachment=True)),
 			(r"/downloads/files/local/([^/]*\.(gco|gcode|g))", util.tornado.LargeResponseHandler, dict(path=settings().getBaseFolder("uploads"), as_attachment=True)),
 			(r"/downloads/logs/([^/]*)", util.tornado.LargeResponseHandler, dict(path=settings().getBaseFolder("logs"), as_attachment=True, access_validation=util.tornado.access_validation_factory(app, loginManager, util.flask.admin_validator))),
 			(r"/downloads/camera/current", util.tornado.UrlForwardHandler, dict(url=settings().get(["webcam", "snapshot"]), as_attachment=True, access_validation=util.tornado.access_validation_factory(app, loginManager, util.flask.user_validator))),
-			(r".*", util.tornado.UploadStorageFallbackHandler, dict(fallback=util.tornado.WsgiInputContainer(app.wsgi_app), file_prefix="octoprint-file-upload-", file_suffix=".tmp", suffixes=upload_suffixes))
+			(r".*", util.tornado.UploadStorageFallbackHandler, dict(fallback=util.tornado.WsgiInputContainer(app.wsgi_app), file_prefix="octoprint-file-upload-", file_suffix=".tmp", path=upload_tmp, suffixes=upload_suffixes))
 		])
 		max_body_sizes = [
 			("POST", r"/api/files/([^/]*)", settings().getInt(["server", "uploads", "maxSize"]))
@@ -546,16 +576,12 @@ class Server():
 		self._server.listen(self._port, address=self._host)
 
 		eventManager.fire(events.Events.STARTUP)
-		if settings().getBoolean(["serial", "autoconnect"]):
-			(port, baudrate) = settings().get(["serial", "port"]), settings().getInt(["serial", "baudrate"])
-			printer_profile = printerProfileManager.get_default()
-			connectionOptions = getConnectionOptions()
-			if port in connectionOptions["ports"]:
-				printer.connect(port=port, baudrate=baudrate, profile=printer_profile["id"] if "id" in printer_profile else "_default")
+		printerRegistry.autoconnect(getConnectionOptions()["ports"])
 
 		# start up watchdogs
 		observer = Observer()
 		observer.schedule(util.watchdog.GcodeWatchdogHandler(fileManager, printer), settings().getBaseFolder("watched"))
+		observer.schedule(util.watchdog.StorageWatchdogHandler(storage_managers[octoprint.filemanager.FileDestinations.LOCAL]), settings().getBaseFolder("uploads"), recursive=True)
 		observer.start()
 
 		ioloop = IOLoop.instance()
@@ -598,9 +624,11 @@ class Server():
 			logger.fatal("Now that is embarrassing... Something really really went wrong here. Please report this including the stacktrace below in OctoPrint's bugtracker. Thanks!")
 			logger.exception("Stacktrace follows:")
 
-	def _createSocketConnection(self, session):
+	def _createSocketConnection(self, session, selectedPrinter=None):
 		global printer, fileManager, analysisQueue, userManager, eventManager
-		return util.sockjs.PrinterStateConnection(printer, fileManager, analysisQueue, userManager, eventManager, pluginManager, session)
+		if selectedPrinter is None:
+			selectedPrinter = printer
+		return util.sockjs.PrinterStateConnection(selectedPrinter, fileManager, analysisQueue, userManager, eventManager, pluginManager, session)
 
 	def _checkForRoot(self):
 		if "geteuid" in dir(os) and os.geteuid() == 0:
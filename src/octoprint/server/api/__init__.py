@@ -9,7 +9,8 @@ import logging
 import netaddr
 import sarge
 
-from flask import Blueprint, request, jsonify, abort, current_app, session, make_response
+from flask import Blueprint, request, jsonify, abort, current_app, session, make_response, g
+from werkzeug.local import LocalProxy
 from flask.ext.login import login_user, logout_user, current_user
 from flask.ext.principal import Identity, identity_changed, AnonymousIdentity
 
@@ -27,6 +28,9 @@ from octoprint.server.util.flask import restricted_access
 
 api = Blueprint("api", __name__)
 
+# the printer the current request is directed at, selected via the "printer" query parameter
+current_printer = LocalProxy(lambda: g.printer)
+
 from . import printer as api_printer
 from . import job as api_job
 from . import connection as api_connection
@@ -37,6 +41,7 @@ from . import users as api_users
 from . import log as api_logs
 from . import slicing as api_slicing
 from . import printer_profiles as api_printer_profiles
+from . import printers as api_printers
 
 
 VERSION = "0.1"
@@ -44,6 +49,16 @@ VERSION = "0.1"
 api.before_request(apiKeyRequestHandler)
 api.after_request(corsResponseHandler)
 
+@api.before_request
+def selectPrinter():
+	identifier = request.args.get("printer")
+	if identifier is None:
+		g.printer = octoprint.server.printer
+	else:
+		g.printer = octoprint.server.printerRegistry.get(identifier)
+		if g.printer is None:
+			return make_response("Unknown printer: %s" % identifier, 404)
+
 #~~ data from plugins
 
 @api.route("/plugin/<string:name>", methods=["GET"])
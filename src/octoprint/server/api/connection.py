@@ -9,20 +9,24 @@ from flask import request, jsonify, make_response
 
 from octoprint.settings import settings
 from octoprint.printer import getConnectionOptions
-from octoprint.server import printer, printerProfileManager, NO_CONTENT
-from octoprint.server.api import api
+from octoprint.printer.registry import InvalidPrinterError
+from octoprint.server import printerProfileManager, NO_CONTENT
+import octoprint.server
+from octoprint.server.api import api, current_printer
 from octoprint.server.util.flask import restricted_access
 import octoprint.util as util
 
 
 @api.route("/connection", methods=["GET"])
 def connectionState():
-	state, port, baudrate, printer_profile = printer.getCurrentConnection()
+	state, port, baudrate, printer_profile = current_printer.getCurrentConnection()
 	current = {
 		"state": state,
 		"port": port,
 		"baudrate": baudrate,
-		"printerProfile": printer_profile["id"] if printer_profile is not None and "id" in printer_profile else "_default"
+		"printerProfile": printer_profile["id"] if printer_profile is not None and "id" in printer_profile else "_default",
+		"resends": current_printer.getResendStatistics(),
+		"roundTripTime": current_printer.getRoundTripTime()
 	}
 
 	return jsonify({"current": current, "options": _get_options()})
@@ -58,16 +62,25 @@ def connectionCommand():
 			printerProfile = data["printerProfile"]
 			if not printerProfileManager.exists(printerProfile):
 				return make_response("Invalid printer profile: %s" % printerProfile, 400)
-		if "save" in data.keys() and data["save"]:
-			settings().set(["serial", "port"], port)
-			settings().setInt(["serial", "baudrate"], baudrate)
-			printerProfileManager.set_default(printerProfile)
-		if "autoconnect" in data.keys():
-			settings().setBoolean(["serial", "autoconnect"], data["autoconnect"])
+		save = "save" in data.keys() and data["save"]
+		autoconnect = data["autoconnect"] if "autoconnect" in data.keys() else None
+		if current_printer.isDefault():
+			if save:
+				settings().set(["serial", "port"], port)
+				settings().setInt(["serial", "baudrate"], baudrate)
+				printerProfileManager.set_default(printerProfile)
+			if autoconnect is not None:
+				settings().setBoolean(["serial", "autoconnect"], autoconnect)
+		elif save or autoconnect is not None:
+			# other printers keep their connection defaults in their own configuration
+			try:
+				octoprint.server.printerRegistry.save_connection_defaults(current_printer.getIdentifier(), port=port, baudrate=baudrate, profile=printerProfile, autoconnect=autoconnect, save=save)
+			except InvalidPrinterError as e:
+				return make_response(str(e), 400)
 		settings().save()
-		printer.connect(port=port, baudrate=baudrate, profile=printerProfile)
+		current_printer.connect(port=port, baudrate=baudrate, profile=printerProfile)
 	elif command == "disconnect":
-		printer.disconnect()
+		current_printer.disconnect()
 
 	return NO_CONTENT
 
@@ -85,4 +98,11 @@ def _get_options():
 		printerProfilePreference=default_profile["id"] if "id" in default_profile else None
 	)
 
+	if not current_printer.isDefault():
+		# other printers have their own preferences
+		connection_defaults = current_printer.getConnectionDefaults()
+		options.update(portPreference=connection_defaults.get("port"),
+		               baudratePreference=connection_defaults.get("baudrate"),
+		               printerProfilePreference=connection_defaults.get("profile"))
+
 	return options
\ No newline at end of file
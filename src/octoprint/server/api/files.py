@@ -5,14 +5,19 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import base64
+import hashlib
+import json
+
 from flask import request, jsonify, make_response, url_for
 
 import octoprint.util as util
 from octoprint.filemanager.destinations import FileDestinations
 from octoprint.settings import settings, valid_boolean_trues
-from octoprint.server import printer, fileManager, slicingManager, eventManager, NO_CONTENT
+from octoprint.server import fileManager, slicingManager, eventManager, NO_CONTENT
 from octoprint.server.util.flask import restricted_access
-from octoprint.server.api import api
+from octoprint.server.util.tornado import get_upload_hash
+from octoprint.server.api import api, current_printer
 from octoprint.events import Events
 import octoprint.filemanager
 
@@ -25,9 +30,7 @@ def readGcodeFiles():
 	filter = None
 	if "filter" in request.values:
 		filter = request.values["filter"]
-	files = _getFileList(FileDestinations.LOCAL, filter=filter)
-	files.extend(_getFileList(FileDestinations.SDCARD))
-	return jsonify(files=files, free=util.getFreeBytes(settings().getBaseFolder("uploads")))
+	return _getFileListResponse([FileDestinations.LOCAL, FileDestinations.SDCARD], filter=filter)
 
 
 @api.route("/files/<string:origin>", methods=["GET"])
@@ -35,25 +38,192 @@ def readGcodeFilesForOrigin(origin):
 	if origin not in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
 		return make_response("Unknown origin: %s" % origin, 404)
 
-	files = _getFileList(origin)
-
-	if origin == FileDestinations.LOCAL:
-		return jsonify(files=files, free=util.getFreeBytes(settings().getBaseFolder("uploads")))
-	else:
-		return jsonify(files=files)
+	return _getFileListResponse([origin])
 
 
-def _getFileDetails(origin, filename):
-	files = _getFileList(origin)
+def _getFileDetails(origin, filename, fields=None):
+	files = _getFileList(origin, names=[filename], fields=fields)
 	for file in files:
 		if file["name"] == filename:
 			return file
 	return None
 
 
-def _getFileList(origin, filter=None):
+def _getFields():
+	"""
+	Returns the fields requested via the ``fields`` request parameter, ``None`` if all fields are requested.
+	"""
+	if not "fields" in request.values:
+		return None
+
+	fields = set(field.strip() for field in request.values["fields"].split(",") if field.strip())
+	fields.update(["name", "origin"])
+	return fields
+
+
+def _getLayers(layerIndex):
+	"""
+	Converts the ``layerIndex`` of a file to the list of its layers as returned by the API.
+	"""
+	layers = []
+	for layer in layerIndex:
+		layers.append({
+			"z": layer.z,
+			"line": layer.line,
+			"offset": layer.offset,
+			"printTime": layer.time,
+			"filament": dict(("tool%d" % tool, {"length": length}) for tool, length in enumerate(layer.filament))
+		})
+	return layers
+
+
+_sortKeys = {
+	"name": lambda file: file["name"].lower(),
+	"date": lambda file: file.get("date"),
+	"size": lambda file: file.get("size"),
+	"lastPrint": lambda file: file["prints"]["last"]["date"] if "prints" in file else None
+}
+
+
+def _getFileListResponse(origins, filter=None):
+	"""
+	Creates the response for a file list request on ``origins``, supporting the following optional request parameters:
+
+	* ``since``: only return the local files that changed since the ``revision`` returned by an earlier request and
+	  the names of those that were removed since then as ``removed``
+	* ``sort`` (``name``, ``date``, ``size`` or ``lastPrint``) and ``order`` (``asc`` or ``desc``)
+	* ``limit`` and ``after``: return only ``limit`` files, and if there are more a cursor as ``next`` that continues the
+	  list with the following files when supplied as ``after``
+	* ``fields``: comma separated list of the fields to return for each file, ``name`` and ``origin`` are always
+	  included
+
+	The response carries an ETag based on the current revision of the files and the request parameters.
+	"""
+
+	sort = request.values.get("sort", "name")
+	if not sort in _sortKeys:
+		return make_response("Unknown sort key: %s" % sort, 400)
+
+	order = request.values.get("order", "asc")
+	if not order in ["asc", "desc"]:
+		return make_response("Unknown order: %s" % order, 400)
+
+	limit = None
+	if "limit" in request.values:
+		try:
+			limit = int(request.values["limit"])
+		except ValueError:
+			limit = None
+		if limit is None or limit < 1:
+			return make_response("Invalid limit: %s" % request.values["limit"], 400)
+
+	after = None
+	if "after" in request.values:
+		after = _decodeCursor(request.values["after"], sort, order)
+		if after is None:
+			return make_response("Invalid cursor: %s" % request.values["after"], 400)
+
+	fields = _getFields()
+
+	revision = None
+	if FileDestinations.LOCAL in origins:
+		revision = fileManager.get_revision(FileDestinations.LOCAL)
+
+	# the ETag covers everything the response is made of, apart from the free disk space
+	etag = hashlib.sha1()
+	etag.update(repr(revision))
+	if FileDestinations.SDCARD in origins:
+		etag.update(repr(current_printer.getSdFiles()))
+	etag.update(repr(sorted(request.values.items())))
+	etag = etag.hexdigest()
+
+	if request.if_none_match.contains(etag):
+		response = make_response("", 304)
+		response.set_etag(etag)
+		return response
+
+	names = None
+	removed = None
+	if "since" in request.values and revision is not None:
+		changes = fileManager.get_changes(FileDestinations.LOCAL, request.values["since"])
+		if changes is not None:
+			# only files in the root folder are listed
+			changed, removed = changes
+			names = [path for path in changed if not "/" in path]
+			removed = [path for path in removed if not "/" in path]
+
+	# files get sorted before the projection, make sure the sort key is available
+	required_fields = fields
+	if fields is not None:
+		required_fields = set(fields)
+		if sort == "lastPrint":
+			required_fields.add("prints")
+
+	files = []
+	for origin in origins:
+		files.extend(_getFileList(origin,
+		                          filter=filter if origin == FileDestinations.LOCAL else None,
+		                          names=names if origin == FileDestinations.LOCAL else None,
+		                          fields=required_fields))
+
+	def key(file):
+		value = _sortKeys[sort](file)
+		return (value is not None, value), file["origin"], file["name"]
+
+	files.sort(key=key, reverse=(order == "desc"))
+
+	if after is not None:
+		if order == "desc":
+			files = [file for file in files if key(file) < after]
+		else:
+			files = [file for file in files if key(file) > after]
+
+	next = None
+	if limit is not None and len(files) > limit:
+		files = files[:limit]
+		next = _encodeCursor(key(files[-1]), sort, order)
+
+	if fields is not None:
+		files = [dict((k, v) for k, v in file.items() if k in fields) for file in files]
+
+	result = dict(files=files)
+	if revision is not None:
+		result["revision"] = revision
+	if removed is not None:
+		result["removed"] = removed
+	if next is not None:
+		result["next"] = next
+	if FileDestinations.LOCAL in origins:
+		result["free"] = util.getFreeBytes(settings().getBaseFolder("uploads"))
+
+	response = jsonify(result)
+	response.set_etag(etag)
+	return response
+
+
+def _encodeCursor(key, sort, order):
+	return base64.urlsafe_b64encode(json.dumps([sort, order, list(key[0]), key[1], key[2]]))
+
+
+def _decodeCursor(cursor, sort, order):
+	try:
+		cursor_sort, cursor_order, value, origin, name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+	except:
+		return None
+
+	if cursor_sort != sort or cursor_order != order or not isinstance(value, list) or len(value) != 2:
+		return None
+	return tuple(value), origin, name
+
+
+def _getFileList(origin, filter=None, names=None, fields=None):
+	"""
+	Returns the files on ``origin``. For local files only those with one of the ``names`` are included if provided,
+	and if ``fields`` are provided only those will be populated that are expensive to build.
+	"""
+
 	if origin == FileDestinations.SDCARD:
-		sdFileList = printer.getSdFiles()
+		sdFileList = current_printer.getSdFiles()
 
 		files = []
 		if sdFileList is not None:
@@ -61,11 +231,12 @@ def _getFileList(origin, filter=None):
 				file = {
 					"type": "machinecode",
 					"name": sdFile,
-					"origin": FileDestinations.SDCARD,
-					"refs": {
+					"origin": FileDestinations.SDCARD
+				}
+				if fields is None or "refs" in fields:
+					file["refs"] = {
 						"resource": url_for(".readGcodeFile", target=FileDestinations.SDCARD, filename=sdFile, _external=True)
 					}
-				}
 				if sdSize is not None:
 					file.update({"size": sdSize})
 				files.append(file)
@@ -73,7 +244,17 @@ def _getFileList(origin, filter=None):
 		filter_func = None
 		if filter:
 			filter_func = lambda entry, entry_data: octoprint.filemanager.valid_file_type(entry, type=filter)
-		files = fileManager.list_files(origin, filter=filter_func, recursive=False)[origin].values()
+		files = fileManager.list_files(origin, filter=filter_func, recursive=False)[origin]
+		if names is not None:
+			files = [files[name] for name in names if name in files]
+		else:
+			files = files.values()
+
+		with_prints = fields is None or "prints" in fields
+		with_refs = fields is None or "refs" in fields
+		if with_refs:
+			download_base = url_for("index", _external=True) + "downloads/files/" + FileDestinations.LOCAL + "/"
+
 		for file in files:
 			file["origin"] = FileDestinations.LOCAL
 
@@ -82,42 +263,45 @@ def _getFileList(origin, filter=None):
 				del file["analysis"]
 
 			if "history" in file and octoprint.filemanager.valid_file_type(file["name"], type="gcode"):
-				# convert print log
 				history = file["history"]
 				del file["history"]
-				success = 0
-				failure = 0
-				last = None
-				for entry in history:
-					success += 1 if "success" in entry and entry["success"] else 0
-					failure += 1 if "success" in entry and not entry["success"] else 0
-					if not last or ("timestamp" in entry and "timestamp" in last and entry["timestamp"] > last["timestamp"]):
-						last = entry
-				if last:
-					prints = dict(
-						success=success,
-						failure=failure,
-						last=dict(
-							success=last["success"],
-							date=last["timestamp"]
+
+				if with_prints:
+					# convert print log
+					success = 0
+					failure = 0
+					last = None
+					for entry in history:
+						success += 1 if "success" in entry and entry["success"] else 0
+						failure += 1 if "success" in entry and not entry["success"] else 0
+						if not last or ("timestamp" in entry and "timestamp" in last and entry["timestamp"] > last["timestamp"]):
+							last = entry
+					if last:
+						prints = dict(
+							success=success,
+							failure=failure,
+							last=dict(
+								success=last["success"],
+								date=last["timestamp"]
+							)
 						)
-					)
-					if "printTime" in last:
-						prints["last"]["printTime"] = last["printTime"]
-					file["prints"] = prints
+						if "printTime" in last:
+							prints["last"]["printTime"] = last["printTime"]
+						file["prints"] = prints
 
-			file.update({
-				"refs": {
-					"resource": url_for(".readGcodeFile", target=FileDestinations.LOCAL, filename=file["name"], _external=True),
-					"download": url_for("index", _external=True) + "downloads/files/" + FileDestinations.LOCAL + "/" + file["name"]
-				}
-			})
+			if with_refs:
+				file.update({
+					"refs": {
+						"resource": url_for(".readGcodeFile", target=FileDestinations.LOCAL, filename=file["name"], _external=True),
+						"download": download_base + file["name"]
+					}
+				})
 	return files
 
 
 def _verifyFileExists(origin, filename):
 	if origin == FileDestinations.SDCARD:
-		return filename in map(lambda x: x[0], printer.getSdFiles())
+		return filename in map(lambda x: x[0], current_printer.getSdFiles())
 	else:
 		return fileManager.file_exists(origin, filename)
 
@@ -131,11 +315,15 @@ def uploadGcodeFile(target):
 	input_name = "file"
 	input_upload_name = input_name + "." + settings().get(["server", "uploads", "nameSuffix"])
 	input_upload_path = input_name + "." + settings().get(["server", "uploads", "pathSuffix"])
+	file_hash = None
 	if input_upload_name in request.values and input_upload_path in request.values:
 		import shutil
 		upload = util.Object()
 		upload.filename = request.values[input_upload_name]
 		upload.save = lambda new_path: shutil.move(request.values[input_upload_path], new_path)
+
+		# the upload got hashed while it was received, unless the path came from the client
+		file_hash = get_upload_hash(request.values[input_upload_path])
 	elif input_name in request.files:
 		upload = request.files[input_name]
 	else:
@@ -150,15 +338,15 @@ def uploadGcodeFile(target):
 
 	if sd:
 		# validate that all preconditions for SD upload are met before attempting it
-		if not (printer.isOperational() and not (printer.isPrinting() or printer.isPaused())):
+		if not (current_printer.isOperational() and not (current_printer.isPrinting() or current_printer.isPaused())):
 			return make_response("Can not upload to SD card, printer is either not operational or already busy", 409)
-		if not printer.isSdReady():
+		if not current_printer.isSdReady():
 			return make_response("Can not upload to SD card, not yet initialized", 409)
 
 	# determine current job
 	currentFilename = None
 	currentOrigin = None
-	currentJob = printer.getCurrentJob()
+	currentJob = current_printer.getCurrentJob()
 	if currentJob is not None and "file" in currentJob.keys():
 		currentJobFile = currentJob["file"]
 		if "name" in currentJobFile.keys() and "origin" in currentJobFile.keys():
@@ -174,9 +362,12 @@ def uploadGcodeFile(target):
 		return make_response("Can not upload file %s, wrong format?" % upload.filename, 415)
 
 	# prohibit overwriting currently selected file while it's being printed
-	if futureFilename == currentFilename and target == currentOrigin and printer.isPrinting() or printer.isPaused():
+	if futureFilename == currentFilename and target == currentOrigin and current_printer.isPrinting() or current_printer.isPaused():
 		return make_response("Trying to overwrite file that is currently being printed: %s" % currentFilename, 409)
 
+	# the callbacks below might run after the request has been handled
+	printer = current_printer._get_current_object()
+
 	def fileProcessingFinished(filename, absFilename, destination):
 		"""
 		Callback for when the file processing (upload, optional slicing, addition to analysis queue) has
@@ -203,7 +394,7 @@ def uploadGcodeFile(target):
 		if octoprint.filemanager.valid_file_type(added_file, "gcode") and (selectAfterUpload or printAfterSelect or (currentFilename == filename and currentOrigin == destination)):
 			printer.selectFile(absFilename, destination == FileDestinations.SDCARD, printAfterSelect)
 
-	added_file = fileManager.add_file(FileDestinations.LOCAL, upload.filename, upload, allow_overwrite=True)
+	added_file = fileManager.add_file(FileDestinations.LOCAL, upload.filename, upload, allow_overwrite=True, file_hash=file_hash)
 	if added_file is None:
 		return make_response("Could not upload the file %s" % upload.filename, 500)
 	if octoprint.filemanager.valid_file_type(added_file, "stl"):
@@ -254,10 +445,20 @@ def readGcodeFile(target, filename):
 	if not target in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
 		return make_response("Unknown target: %s" % target, 404)
 
-	file = _getFileDetails(target, filename)
+	fields = _getFields()
+	file = _getFileDetails(target, filename, fields=fields)
 	if not file:
 		return make_response("File not found on '%s': %s" % (target, filename), 404)
 
+	# the layers are only included on request, they can be large
+	if fields is not None and "layers" in fields and target == FileDestinations.LOCAL:
+		layerIndex = fileManager.get_layer_index(target, filename)
+		if layerIndex is not None:
+			file["layers"] = _getLayers(layerIndex)
+
+	if fields is not None:
+		file = dict((k, v) for k, v in file.items() if k in fields)
+
 	return jsonify(file)
 
 
@@ -284,7 +485,7 @@ def gcodeFileCommand(filename, target):
 		# selects/loads a file
 		printAfterLoading = False
 		if "print" in data.keys() and data["print"] in valid_boolean_trues:
-			if not printer.isOperational():
+			if not current_printer.isOperational():
 				return make_response("Printer is not operational, cannot directly start printing", 409)
 			printAfterLoading = True
 
@@ -294,7 +495,7 @@ def gcodeFileCommand(filename, target):
 			sd = True
 		else:
 			filenameToSelect = fileManager.get_absolute_path(target, filename)
-		printer.selectFile(filenameToSelect, sd, printAfterLoading)
+		current_printer.selectFile(filenameToSelect, sd, printAfterLoading)
 
 	elif command == "slice":
 		if "slicer" in data.keys():
@@ -312,7 +513,7 @@ def gcodeFileCommand(filename, target):
 		if not octoprint.filemanager.valid_file_type(filename, type="stl"):
 			return make_response("Cannot slice {filename}, not an STL file".format(**locals()), 415)
 
-		if slicer_instance.get_slicer_properties()["same_device"] and (printer.isPrinting() or printer.isPaused()):
+		if slicer_instance.get_slicer_properties()["same_device"] and (current_printer.isPrinting() or current_printer.isPaused()):
 			# slicer runs on same device as OctoPrint, slicing while printing is hence disabled
 			return make_response("Cannot slice on {slicer} while printing due to performance reasons".format(**locals()), 409)
 
@@ -326,7 +527,7 @@ def gcodeFileCommand(filename, target):
 
 		# prohibit overwriting the file that is currently being printed
 		currentOrigin, currentFilename = _getCurrentFile()
-		if currentFilename == gcode_name and currentOrigin == target and (printer.isPrinting() or printer.isPaused()):
+		if currentFilename == gcode_name and currentOrigin == target and (current_printer.isPrinting() or current_printer.isPaused()):
 			make_response("Trying to slice into file that is currently being printed: %s" % gcode_name, 409)
 
 		if "profile" in data.keys() and data["profile"]:
@@ -349,13 +550,13 @@ def gcodeFileCommand(filename, target):
 
 		select_after_slicing = False
 		if "select" in data.keys() and data["select"] in valid_boolean_trues:
-			if not printer.isOperational():
+			if not current_printer.isOperational():
 				return make_response("Printer is not operational, cannot directly select for printing", 409)
 			select_after_slicing = True
 
 		print_after_slicing = False
 		if "print" in data.keys() and data["print"] in valid_boolean_trues:
-			if not printer.isOperational():
+			if not current_printer.isOperational():
 				return make_response("Printer is not operational, cannot directly start printing", 409)
 			select_after_slicing = print_after_slicing = True
 
@@ -364,6 +565,7 @@ def gcodeFileCommand(filename, target):
 		for key in override_keys:
 			overrides[key[len("profile."):]] = data[key]
 
+		printer = current_printer._get_current_object()
 		def slicing_done(target, gcode_name, select_after_slicing, print_after_slicing):
 			if select_after_slicing or print_after_slicing:
 				sd = False
@@ -414,7 +616,7 @@ def deleteGcodeFile(filename, target):
 
 	# prohibit deleting files that are currently in use
 	currentOrigin, currentFilename = _getCurrentFile()
-	if currentFilename == filename and currentOrigin == target and (printer.isPrinting() or printer.isPaused()):
+	if currentFilename == filename and currentOrigin == target and (current_printer.isPrinting() or current_printer.isPaused()):
 		make_response("Trying to delete file that is currently being printed: %s" % filename, 409)
 
 	if (target, filename) in fileManager.get_busy_files():
@@ -422,18 +624,18 @@ def deleteGcodeFile(filename, target):
 
 	# deselect the file if it's currently selected
 	if currentFilename is not None and filename == currentFilename:
-		printer.unselectFile()
+		current_printer.unselectFile()
 
 	# delete it
 	if target == FileDestinations.SDCARD:
-		printer.deleteSdFile(filename)
+		current_printer.deleteSdFile(filename)
 	else:
 		fileManager.remove_file(target, filename)
 
 	return NO_CONTENT
 
 def _getCurrentFile():
-	currentJob = printer.getCurrentJob()
+	currentJob = current_printer.getCurrentJob()
 	if currentJob is not None and "file" in currentJob.keys() and "name" in currentJob["file"] and "origin" in currentJob["file"]:
 		return currentJob["file"]["origin"], currentJob["file"]["name"]
 	else:
@@ -7,16 +7,16 @@ __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms
 
 from flask import request, make_response, jsonify
 
-from octoprint.server import printer, NO_CONTENT
+from octoprint.server import NO_CONTENT
 from octoprint.server.util.flask import restricted_access
-from octoprint.server.api import api
+from octoprint.server.api import api, current_printer
 import octoprint.util as util
 
 
 @api.route("/job", methods=["POST"])
 @restricted_access
 def controlJob():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	valid_commands = {
@@ -30,30 +30,30 @@ def controlJob():
 	if response is not None:
 		return response
 
-	activePrintjob = printer.isPrinting() or printer.isPaused()
+	activePrintjob = current_printer.isPrinting() or current_printer.isPaused()
 
 	if command == "start":
 		if activePrintjob:
 			return make_response("Printer already has an active print job, did you mean 'restart'?", 409)
-		printer.startPrint()
+		current_printer.startPrint()
 	elif command == "restart":
-		if not printer.isPaused():
+		if not current_printer.isPaused():
 			return make_response("Printer does not have an active print job or is not paused", 409)
-		printer.startPrint()
+		current_printer.startPrint()
 	elif command == "pause":
 		if not activePrintjob:
 			return make_response("Printer is neither printing nor paused, 'pause' command cannot be performed", 409)
-		printer.togglePausePrint()
+		current_printer.togglePausePrint()
 	elif command == "cancel":
 		if not activePrintjob:
 			return make_response("Printer is neither printing nor paused, 'cancel' command cannot be performed", 409)
-		printer.cancelPrint()
+		current_printer.cancelPrint()
 	return NO_CONTENT
 
 
 @api.route("/job", methods=["GET"])
 def jobState():
-	currentData = printer.getCurrentData()
+	currentData = current_printer.getCurrentData()
 	return jsonify({
 		"job": currentData["job"],
 		"progress": currentData["progress"],
@@ -10,8 +10,8 @@ from flask.exceptions import JSONBadRequest
 import re
 
 from octoprint.settings import settings, valid_boolean_trues
-from octoprint.server import printer, NO_CONTENT
-from octoprint.server.api import api
+from octoprint.server import NO_CONTENT
+from octoprint.server.api import api, current_printer
 from octoprint.server.util.flask import restricted_access
 import octoprint.util as util
 
@@ -20,7 +20,7 @@ import octoprint.util as util
 
 @api.route("/printer", methods=["GET"])
 def printerState():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	# process excludes
@@ -38,11 +38,11 @@ def printerState():
 
 	# add sd information
 	if not "sd" in excludes and settings().getBoolean(["feature", "sdSupport"]):
-		result.update({"sd": {"ready": printer.isSdReady()}})
+		result.update({"sd": {"ready": current_printer.isSdReady()}})
 
 	# add state information
 	if not "state" in excludes:
-		state = printer.getCurrentData()["state"]
+		state = current_printer.getCurrentData()["state"]
 		result.update({"state": state})
 
 	return jsonify(result)
@@ -54,7 +54,7 @@ def printerState():
 @api.route("/printer/tool", methods=["POST"])
 @restricted_access
 def printerToolCommand():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	valid_commands = {
@@ -77,7 +77,7 @@ def printerToolCommand():
 		if not tool.startswith("tool"):
 			return make_response("Invalid tool for selection: %s" % tool, 400)
 
-		printer.changeTool(tool)
+		current_printer.changeTool(tool)
 
 	##~~ temperature
 	elif command == "target":
@@ -94,7 +94,7 @@ def printerToolCommand():
 
 		# perform the actual temperature commands
 		for tool in validated_values.keys():
-			printer.setTemperature(tool, validated_values[tool])
+			current_printer.setTemperature(tool, validated_values[tool])
 
 	##~~ temperature offset
 	elif command == "offset":
@@ -112,25 +112,25 @@ def printerToolCommand():
 			validated_values[tool] = value
 
 		# set the offsets
-		printer.setTemperatureOffset(validated_values)
+		current_printer.setTemperatureOffset(validated_values)
 
 	##~~ extrusion
 	elif command == "extrude":
-		if printer.isPrinting():
+		if current_printer.isPrinting():
 			# do not extrude when a print job is running
 			return make_response("Printer is currently printing", 409)
 
 		amount = data["amount"]
 		if not isinstance(amount, (int, long, float)):
 			return make_response("Not a number for extrusion amount: %r" % amount, 400)
-		printer.extrude(amount)
+		current_printer.extrude(amount)
 
 	return NO_CONTENT
 
 
 @api.route("/printer/tool", methods=["GET"])
 def printerToolState():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	def deleteBed(x):
@@ -149,7 +149,7 @@ def printerToolState():
 @api.route("/printer/bed", methods=["POST"])
 @restricted_access
 def printerBedCommand():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	valid_commands = {
@@ -169,7 +169,7 @@ def printerBedCommand():
 			return make_response("Not a number: %r" % target, 400)
 
 		# perform the actual temperature command
-		printer.setTemperature("bed", target)
+		current_printer.setTemperature("bed", target)
 
 	##~~ temperature offset
 	elif command == "offset":
@@ -182,14 +182,14 @@ def printerBedCommand():
 			return make_response("Offset not in range [-50, 50]: %f" % offset, 400)
 
 		# set the offsets
-		printer.setTemperatureOffset({"bed": offset})
+		current_printer.setTemperatureOffset({"bed": offset})
 
 	return NO_CONTENT
 
 
 @api.route("/printer/bed", methods=["GET"])
 def printerBedState():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	def deleteTools(x):
@@ -213,7 +213,7 @@ def printerBedState():
 @api.route("/printer/printhead", methods=["POST"])
 @restricted_access
 def printerPrintheadCommand():
-	if not printer.isOperational() or printer.isPrinting():
+	if not current_printer.isOperational() or current_printer.isPrinting():
 		# do not jog when a print job is running or we don't have a connection
 		return make_response("Printer is not operational or currently printing", 409)
 
@@ -239,7 +239,7 @@ def printerPrintheadCommand():
 
 		# execute the jog commands
 		for axis, value in validated_values.iteritems():
-			printer.jog(axis, value)
+			current_printer.jog(axis, value)
 
 	##~~ home command
 	elif command == "home":
@@ -251,7 +251,7 @@ def printerPrintheadCommand():
 			validated_values.append(axis)
 
 		# execute the home command
-		printer.home(validated_values)
+		current_printer.home(validated_values)
 
 	return NO_CONTENT
 
@@ -265,7 +265,7 @@ def printerSdCommand():
 	if not settings().getBoolean(["feature", "sdSupport"]):
 		return make_response("SD support is disabled", 404)
 
-	if not printer.isOperational() or printer.isPrinting() or printer.isPaused():
+	if not current_printer.isOperational() or current_printer.isPrinting() or current_printer.isPaused():
 		return make_response("Printer is not operational or currently busy", 409)
 
 	valid_commands = {
@@ -278,11 +278,11 @@ def printerSdCommand():
 		return response
 
 	if command == "init":
-		printer.initSdCard()
+		current_printer.initSdCard()
 	elif command == "refresh":
-		printer.refreshSdFiles()
+		current_printer.refreshSdFiles()
 	elif command == "release":
-		printer.releaseSdCard()
+		current_printer.releaseSdCard()
 
 	return NO_CONTENT
 
@@ -292,7 +292,7 @@ def printerSdState():
 	if not settings().getBoolean(["feature", "sdSupport"]):
 		return make_response("SD support is disabled", 404)
 
-	return jsonify(ready=printer.isSdReady())
+	return jsonify(ready=current_printer.isSdReady())
 
 
 ##~~ Commands
@@ -301,7 +301,7 @@ def printerSdState():
 @api.route("/printer/command", methods=["POST"])
 @restricted_access
 def printerCommand():
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
 	if not "application/json" in request.headers["Content-Type"]:
@@ -331,7 +331,7 @@ def printerCommand():
 			commandToSend = command % parameters
 		commandsToSend.append(commandToSend)
 
-	printer.commands(commandsToSend)
+	current_printer.commands(commandsToSend)
 
 	return NO_CONTENT
 
@@ -344,13 +344,13 @@ def getCustomControls():
 
 
 def _getTemperatureData(filter):
-	if not printer.isOperational():
+	if not current_printer.isOperational():
 		return make_response("Printer is not operational", 409)
 
-	tempData = printer.getCurrentTemperatures()
+	tempData = current_printer.getCurrentTemperatures()
 
 	if "history" in request.values.keys() and request.values["history"] in valid_boolean_trues:
-		tempHistory = printer.getTemperatureHistory()
+		tempHistory = current_printer.getTemperatureHistory()
 
 		limit = 300
 		if "limit" in request.values.keys() and unicode(request.values["limit"]).isnumeric():
@@ -0,0 +1,44 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+from flask import jsonify, make_response, url_for
+
+import octoprint.server
+from octoprint.server.api import api
+
+
+@api.route("/printers", methods=["GET"])
+def getPrinters():
+	return jsonify(printers=[_getPrinterData(printer) for printer in octoprint.server.printerRegistry.get_all()])
+
+
+@api.route("/printers/<string:identifier>", methods=["GET"])
+def getPrinter(identifier):
+	printer = octoprint.server.printerRegistry.get(identifier)
+	if printer is None:
+		return make_response("Unknown printer: %s" % identifier, 404)
+	return jsonify(_getPrinterData(printer))
+
+
+def _getPrinterData(printer):
+	state, port, baudrate, printer_profile = printer.getCurrentConnection()
+	identifier = printer.getIdentifier()
+
+	return {
+		"id": identifier,
+		"name": printer.getName(),
+		"default": printer.isDefault(),
+		"state": printer.getCurrentData()["state"],
+		"connection": {
+			"state": state,
+			"port": port,
+			"baudrate": baudrate,
+			"printerProfile": printer_profile["id"] if printer_profile is not None and "id" in printer_profile else "_default"
+		},
+		"push": "/sockjs" if printer.isDefault() else "/printers/{identifier}/sockjs".format(identifier=identifier),
+		"resource": url_for(".getPrinter", identifier=identifier, _external=True)
+	}
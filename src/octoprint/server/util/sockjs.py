@@ -5,6 +5,7 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import json
 import logging
 import threading
 import sockjs.tornado
@@ -12,6 +13,8 @@ import sockjs.tornado
 import octoprint.timelapse
 import octoprint.server
 from octoprint.events import Events
+from octoprint.settings import settings
+from octoprint.util.logbuffer import compileFilters
 
 
 class PrinterStateConnection(sockjs.tornado.SockJSConnection):
@@ -22,8 +25,7 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection):
 
 		self._temperatureBacklog = []
 		self._temperatureBacklogMutex = threading.Lock()
-		self._logBacklog = []
-		self._logBacklogMutex = threading.Lock()
+		self._logCursor = None
 		self._messageBacklog = []
 		self._messageBacklogMutex = threading.Lock()
 
@@ -49,6 +51,7 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection):
 		# connected => update the API key, might be necessary if the client was left open while the server restarted
 		self._emit("connected", {"apikey": octoprint.server.UI_API_KEY, "version": octoprint.server.VERSION, "display_version": octoprint.server.DISPLAY_VERSION})
 
+		self._logCursor = self._printer.createLogCursor(backlog=300)
 		self._printer.registerCallback(self)
 		self._fileManager.register_slicingprogress_callback(self)
 		octoprint.timelapse.registerCallback(self)
@@ -72,7 +75,28 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection):
 			self._eventManager.unsubscribe(event, self._onEvent)
 
 	def on_message(self, message):
-		pass
+		try:
+			message = json.loads(message)
+		except ValueError:
+			self._logger.warn("Invalid message from client %s, ignoring it" % self._remoteAddress)
+			return
+
+		if isinstance(message, dict) and "logFilters" in message:
+			self._setLogFilters(message["logFilters"])
+
+	def _setLogFilters(self, regexes):
+		# only the configured terminal filters may be used, clients don't get to run arbitrary expressions on the server
+		available = set(f["regex"] for f in settings().get(["terminalFilters"]) if "regex" in f)
+		if not isinstance(regexes, list):
+			regexes = []
+		regexes = [regex for regex in regexes if regex in available]
+		if self._logCursor is not None:
+			self._logCursor.setFilter(compileFilters(regexes))
+
+	def _readLogs(self):
+		if self._logCursor is None:
+			return [], 0
+		return self._logCursor.read()
 
 	def sendCurrentData(self, data):
 		# add current temperature, log and message backlogs to sent data
@@ -80,9 +104,7 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection):
 			temperatures = self._temperatureBacklog
 			self._temperatureBacklog = []
 
-		with self._logBacklogMutex:
-			logs = self._logBacklog
-			self._logBacklog = []
+		logs, logsDropped = self._readLogs()
 
 		with self._messageBacklogMutex:
 			messages = self._messageBacklog
@@ -98,12 +120,15 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection):
 		data.update({
 			"temps": temperatures,
 			"logs": logs,
+			"logsDropped": logsDropped,
 			"messages": messages,
 			"busyFiles": busy_files,
 		})
 		self._emit("current", data)
 
 	def sendHistoryData(self, data):
+		# the history is read through our own cursor, so the following updates continue exactly where it ends
+		data["logs"], data["logsDropped"] = self._readLogs()
 		self._emit("history", data)
 
 	def sendEvent(self, type, payload=None):
@@ -123,10 +148,6 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection):
 	def sendPluginMessage(self, plugin, data):
 		self._emit("plugin", dict(plugin=plugin, data=data))
 
-	def addLog(self, data):
-		with self._logBacklogMutex:
-			self._logBacklog.append(data)
-
 	def addMessage(self, data):
 		with self._messageBacklogMutex:
 			self._messageBacklog.append(data)
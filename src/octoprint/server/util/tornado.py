@@ -5,6 +5,7 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import hashlib
 import logging
 import os
 import datetime
@@ -13,6 +14,7 @@ import mimetypes
 import email
 import time
 import re
+import threading
 
 import tornado
 import tornado.web
@@ -32,12 +34,28 @@ import octoprint.util
 #~~ WSGI middleware
 
 
+# hashes of the uploads currently stored by UploadStorageFallbackHandler, by path of the temporary file
+_upload_hashes = dict()
+_upload_hashes_mutex = threading.Lock()
+
+
+def get_upload_hash(path):
+	"""
+	Returns the SHA1 hash of the upload :class:`UploadStorageFallbackHandler` stored in the temporary file ``path``
+	while receiving the request currently being handled, ``None`` if ``path`` is no such file. Other than the form
+	fields describing the upload, the hash can't be supplied by the client.
+	"""
+	with _upload_hashes_mutex:
+		return _upload_hashes.get(path)
+
+
 @tornado.web.stream_request_body
 class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 	"""
 	A `RequestHandler` similar to `tornado.web.FallbackHandler` which fetches any files contained in the request bodies
 	of content type `multipart`, stores them in temporary files and supplies the `fallback` with the file's `name`,
-	`content_type`, `path` and `size` instead via a rewritten body.
+	`content_type`, `path` and `size` instead via a rewritten body. The SHA1 hash of each file is available through
+	:func:`get_upload_hash` while the `fallback` handles the request.
 
 	Basically similar to what the nginx upload module does.
 
@@ -88,11 +106,24 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 
 	The underlying application can then access the contained files via their respective paths and just move them
 	where necessary.
+
+	The body is parsed while it is received, in a single pass over the data: file contents are written to the
+	temporary files and hashed as they come in, and only what can't be processed yet (a potentially incomplete
+	boundary or part header) is kept in a reusable buffer.
 	"""
 
 	# the request methods that may contain a request body
 	BODY_METHODS = ("POST", "PATCH", "PUT")
 
+	# maximum size of a part header
+	MAX_HEADER_SIZE = 64 * 1024
+
+	# states of the multipart parser
+	STATE_DATA = "data"
+	STATE_BOUNDARY = "boundary"
+	STATE_HEADER = "header"
+	STATE_EPILOGUE = "epilogue"
+
 	def initialize(self, fallback, file_prefix="tmp", file_suffix="", path=None, suffixes=None):
 		if not suffixes:
 			suffixes = dict()
@@ -120,8 +151,16 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		# bytes left to read according to content_length of request body
 		self._bytes_left = 0
 
-		# buffer needed for identifying form data parts
-		self._buffer = b""
+		# state of the multipart parser, the data before the first boundary is ignored like that of a part without
+		# a name
+		self._state = UploadStorageFallbackHandler.STATE_DATA
+
+		# buffer for data that couldn't be processed yet, starts with the line break preceding every boundary within
+		# the body so that the first boundary is recognized just like the following ones
+		self._buffer = bytearray(b"\r\n")
+
+		# chunks of the body of non multipart requests
+		self._body = []
 
 		# buffer for new body
 		self._new_body = b""
@@ -157,6 +196,9 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 						break
 				else:
 					self._multipart_boundary = None
+
+				if not self._multipart_boundary:
+					raise tornado.web.HTTPError(400, reason="No multipart boundary supplied")
 		else:
 			self._fallback(self.request, b"")
 			self._finished = True
@@ -165,59 +207,119 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		"""
 		Called by Tornado on receiving a chunk of the request body. If request is a multipart request, takes care of
 		processing the multipart data structure via `self._process_multipart_data`. If not, just adds the chunk to
-		internal in-memory buffer.
+		the chunks of the body.
 
 		:param chunk: chunk of data received from Tornado
 		"""
 
-		data = self._buffer + chunk
 		if self.is_multipart():
-			self._process_multipart_data(data)
+			self._process_multipart_data(chunk)
 		else:
-			self._buffer = data
+			self._body.append(chunk)
 
 	def is_multipart(self):
 		"""Checks whether this request is a `multipart` request"""
 		return self._content_type is not None and self._content_type.startswith("multipart")
 
+	def on_connection_close(self):
+		"""
+		Called if the client closed the connection before the request was handled, takes care of removing the
+		temporary files created so far.
+		"""
+		if self._current_part is not None and "file" in self._current_part:
+			self._current_part["file"].close()
+			self._files.append(self._current_part["path"])
+			self._current_part = None
+
+		self._remove_files()
+
+	def _remove_files(self):
+		with _upload_hashes_mutex:
+			for f in self._files:
+				_upload_hashes.pop(f, None)
+
+		for f in self._files:
+			octoprint.util.silentRemove(f)
+		self._files = []
+
 	def _process_multipart_data(self, data):
 		"""
 		Processes the given data, parsing it for multipart definitions and calling the appropriate methods.
 
+		The data is appended to the internal buffer and processed as far as possible. Part data is passed on to
+		`self._on_part_data` as views on the buffer without copying it. Only the tail of the buffer that might contain
+		the beginning of a boundary, or an incomplete part header, is kept for the next round.
+
 		:param data: the data to process as a string
 		"""
 
-		# check for boundary
-		delimiter = b"--%s" % self._multipart_boundary
-		delimiter_loc = data.find(delimiter)
+		delimiter = b"\r\n--%s" % self._multipart_boundary
 		delimiter_len = len(delimiter)
-		end_of_header = None
-		if delimiter_loc != -1:
-			# found the delimiter in the currently available data
-			delimiter_data_end = 0 if delimiter_loc == 0 else delimiter_loc - 2
-			data, self._buffer = data[0:delimiter_data_end], data[delimiter_loc:]
-			end_of_header = self._buffer.find("\r\n\r\n")
-		else:
-			# make sure any boundary (with single or double ==) contained at the end of chunk does not get
-			# truncated by this processing round => save it to the buffer for next round
-			endlen = len(self._multipart_boundary) + 4
-			data, self._buffer = data[0:-endlen], data[-endlen:]
-
-		# stream data to part handler
-		if data and self._current_part:
-				self._on_part_data(self._current_part, data)
-
-		if end_of_header >= 0:
-			self._on_part_header(self._buffer[delimiter_len+2:end_of_header])
-			self._buffer = self._buffer[end_of_header + 4:]
-
-		if delimiter_loc != -1 and self._buffer[delimiter_len:delimiter_len+2] == "--":
-			# we saw the last boundary and are at the end of our request
-			if self._current_part:
-				self._on_part_finish(self._current_part)
-				self._current_part = None
-			self._buffer = b""
-			self._on_request_body_finish()
+
+		buffer = self._buffer
+		buffer.extend(data)
+		view = memoryview(buffer)
+
+		position = 0
+		while position < len(buffer):
+			if self._state == UploadStorageFallbackHandler.STATE_DATA:
+				delimiter_loc = buffer.find(delimiter, position)
+				if delimiter_loc == -1:
+					# stream everything to the part handler that can't be the beginning of a boundary
+					end = max(position, len(buffer) - delimiter_len + 1)
+					if end > position and self._current_part:
+						self._on_part_data(self._current_part, view[position:end])
+					position = end
+					break
+
+				if delimiter_loc > position and self._current_part:
+					self._on_part_data(self._current_part, view[position:delimiter_loc])
+				if self._current_part:
+					self._on_part_finish(self._current_part)
+					self._current_part = None
+				position = delimiter_loc + delimiter_len
+				self._state = UploadStorageFallbackHandler.STATE_BOUNDARY
+
+			elif self._state == UploadStorageFallbackHandler.STATE_BOUNDARY:
+				# the boundary is followed by either "--" for the last one or optional whitespace and a line break
+				if len(buffer) - position < 2:
+					break
+
+				if buffer[position:position + 2] == b"--":
+					position = len(buffer)
+					self._state = UploadStorageFallbackHandler.STATE_EPILOGUE
+					self._on_request_body_finish()
+					break
+
+				end_of_line = buffer.find(b"\r\n", position)
+				if end_of_line == -1:
+					if len(buffer) - position > UploadStorageFallbackHandler.MAX_HEADER_SIZE:
+						raise tornado.web.HTTPError(400, reason="Invalid multipart boundary")
+					break
+				# keep the line break, an empty header directly follows it
+				position = end_of_line
+				self._state = UploadStorageFallbackHandler.STATE_HEADER
+
+			elif self._state == UploadStorageFallbackHandler.STATE_HEADER:
+				# the header starts after the line break of the boundary line and ends with an empty line
+				end_of_header = buffer.find(b"\r\n\r\n", position)
+				if end_of_header == -1:
+					if len(buffer) - position > UploadStorageFallbackHandler.MAX_HEADER_SIZE:
+						raise tornado.web.HTTPError(400, reason="Multipart header too large")
+					break
+
+				header = bytes(buffer[position + 2:end_of_header])
+				position = end_of_header + 4
+				self._state = UploadStorageFallbackHandler.STATE_DATA
+				self._on_part_header(header)
+
+			else:
+				# ignore anything after the last boundary
+				position = len(buffer)
+
+		# the view needs to be released before the buffer can be resized
+		del view
+		del buffer[:position]
 
 	def _on_part_header(self, header):
 		"""
@@ -232,11 +334,6 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 			self._on_part_finish(self._current_part)
 			self._current_part = None
 
-		header_check = header.find(self._multipart_boundary)
-		if header_check != -1:
-			self._logger.warn("Header still contained multipart boundary, stripping it...")
-			header = header[header_check:]
-
 		# convert to dict
 		header = tornado.httputil.HTTPHeaders.parse(header.decode("utf-8"))
 		disp_header = header.get("Content-Disposition", "")
@@ -264,12 +361,14 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		* `path`: path to the temporary file storing the file's data
 		* `content_type`: content type of the part
 		* `file`: file handle for the temporary file (mode "wb", not deleted on close!)
+		* `hasher`: SHA1 hash object the file's data is fed into
+		* `size`: number of bytes of the file's data received so far
 
 		Structure of `data` parts:
 
 		* `name`: name of the part
 		* `content_type`: content type of the part
-		* `data`: bytes of the part (initialized to "")
+		* `data`: list of the chunks of the part's bytes (initialized to [])
 
 		:param name: name of the part
 		:param content_type: content type of the part
@@ -284,27 +383,32 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 						filename=tornado.escape.utf8(filename),
 						path=tornado.escape.utf8(handle.name),
 						content_type=tornado.escape.utf8(content_type),
-						file=handle)
+						file=handle,
+						hasher=hashlib.sha1(),
+						size=0)
 
 		else:
-			return dict(name=tornado.escape.utf8(name), content_type=content_type, data=b"")
+			return dict(name=tornado.escape.utf8(name), content_type=content_type, data=[])
 
 	def _on_part_data(self, part, data):
 		"""
 		Called when new bytes are received for the given `part`, takes care of writing them to their storage.
 
 		:param part: part for which data was received
-		:param data: data chunk which was received
+		:param data: view on the data chunk which was received, only valid during the call
 		"""
 		if "file" in part:
 			part["file"].write(data)
+			part["hasher"].update(data)
+			part["size"] += len(data)
 		else:
-			part["data"] += data
+			part["data"].append(data.tobytes())
 
 	def _on_part_finish(self, part):
 		"""
 		Called when a part gets closed, takes care of storing the finished part in the internal parts storage and for
-		`file` parts closing the temporary file and storing the part in the internal files storage.
+		`file` parts closing the temporary file, determining the hash and storing the part in the internal files
+		storage.
 
 		:param part: part which was closed
 		"""
@@ -314,34 +418,45 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 			self._files.append(part["path"])
 			part["file"].close()
 			del part["file"]
+			with _upload_hashes_mutex:
+				_upload_hashes[part["path"]] = part["hasher"].hexdigest()
+			del part["hasher"]
+		else:
+			part["data"] = b"".join(part["data"])
 
 	def _on_request_body_finish(self):
 		"""
 		Called when the request body has been read completely. Takes care of creating the replacement body out of the
-		logged parts, turning `file` parts into new
-		:return:
+		logged parts, turning `file` parts into new form fields for their name, path, content type and size.
 		"""
 
-		self._new_body = b""
+		# form fields supplied by the client must not be mistaken for the ones describing the files
+		file_fields = set(name + "." + suffix for name, part in self._parts.iteritems() if "filename" in part for suffix in self._suffixes.values())
+
+		body = []
 		for name, part in self._parts.iteritems():
 			if "filename" in part:
 				# add form fields for filename, path, size and content_type for all files contained in the request
-				fields = dict((self._suffixes[key], value) for (key, value) in dict(name=part["filename"], path=part["path"], size=str(os.stat(part["path"]).st_size), content_type=part["content_type"]).iteritems())
+				fields = dict((self._suffixes[key], value) for (key, value) in dict(name=part["filename"], path=part["path"], size=str(part["size"]), content_type=part["content_type"]).iteritems())
 				for n, p in fields.iteritems():
 					key = name + "." + n
-					self._new_body += b"--%s\r\n" % self._multipart_boundary
-					self._new_body += b"Content-Disposition: form-data; name=\"%s\"\r\n" % key
-					self._new_body += b"\r\n"
-					self._new_body += p + b"\r\n"
+					body.append(b"--%s\r\n" % self._multipart_boundary)
+					body.append(b"Content-Disposition: form-data; name=\"%s\"\r\n" % key)
+					body.append(b"\r\n")
+					body.append(p + b"\r\n")
 			elif "data" in part:
-				self._new_body += b"--%s\r\n" % self._multipart_boundary
+				if name in file_fields:
+					self._logger.warn("Ignoring form field {name} which would override the description of an uploaded file".format(**locals()))
+					continue
+				body.append(b"--%s\r\n" % self._multipart_boundary)
 				value = part["data"]
-				self._new_body += b"Content-Disposition: form-data; name=\"%s\"\r\n" % name
+				body.append(b"Content-Disposition: form-data; name=\"%s\"\r\n" % name)
 				if "content_type" in part and part["content_type"] is not None:
-					self._new_body += b"Content-Type: %s\r\n" % part["content_type"]
-				self._new_body += b"\r\n"
-				self._new_body += value + b"\r\n"
-		self._new_body += b"--%s--\r\n" % self._multipart_boundary
+					body.append(b"Content-Type: %s\r\n" % part["content_type"])
+				body.append(b"\r\n")
+				body.append(value + b"\r\n")
+		body.append(b"--%s--\r\n" % self._multipart_boundary)
+		self._new_body = b"".join(body)
 
 	def _handle_method(self, *args, **kwargs):
 		"""
@@ -349,31 +464,31 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		the current request and changed body to the `fallback`.
 		"""
 
-		# determine which body to supply
-		body = b""
-		if self.is_multipart():
-			# make sure we really processed all data in the buffer
-			while len(self._buffer):
-				self._process_multipart_data(self._buffer)
+		try:
+			# determine which body to supply
+			body = b""
+			if self.is_multipart():
+				if self._state != UploadStorageFallbackHandler.STATE_EPILOGUE:
+					# we never saw the last boundary
+					self.on_connection_close()
+					raise tornado.web.HTTPError(400, reason="Incomplete multipart body")
 
-			# use rewritten body
-			body = self._new_body
+				# use rewritten body
+				body = self._new_body
 
-		elif self.request.method in UploadStorageFallbackHandler.BODY_METHODS:
-			# directly use data from buffer
-			body = self._buffer
+			elif self.request.method in UploadStorageFallbackHandler.BODY_METHODS:
+				# directly use the received data
+				body = b"".join(self._body)
 
-		# rewrite content length
-		self.request.headers["Content-Length"] = len(body)
+			# rewrite content length
+			self.request.headers["Content-Length"] = len(body)
 
-		try:
 			# call the configured fallback with request and body to use
 			self._fallback(self.request, body)
 			self._headers_written = True
 		finally:
 			# make sure the temporary files are removed again
-			for f in self._files:
-				octoprint.util.silentRemove(f)
+			self._remove_files()
 
 	# make all http methods trigger _handle_method
 	get = _handle_method
@@ -83,3 +83,36 @@ class GcodeWatchdogHandler(watchdog.events.PatternMatchingEventHandler):
 
 	def on_created(self, event):
 		self._upload(event.src_path)
+
+
+class StorageWatchdogHandler(watchdog.events.FileSystemEventHandler):
+	"""
+	Keeps the file index of a :class:`~octoprint.filemanager.storage.LocalFileStorage` current with changes made to its
+	base folder outside of OctoPrint.
+	"""
+
+	def __init__(self, storage):
+		watchdog.events.FileSystemEventHandler.__init__(self)
+
+		self._logger = logging.getLogger(__name__)
+
+		self._storage = storage
+
+	def _refresh(self, path):
+		try:
+			self._storage.refresh(path)
+		except:
+			self._logger.exception("Error while refreshing the file index for {path}".format(**locals()))
+
+	def on_created(self, event):
+		self._refresh(event.src_path)
+
+	def on_deleted(self, event):
+		self._refresh(event.src_path)
+
+	def on_modified(self, event):
+		self._refresh(event.src_path)
+
+	def on_moved(self, event):
+		self._refresh(event.src_path)
+		self._refresh(event.dest_path)
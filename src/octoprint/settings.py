@@ -28,6 +28,7 @@ default_settings = {
 		"baudrate": None,
 		"autoconnect": False,
 		"log": False,
+		"record": False,
 		"timeout": {
 			"detection": 0.5,
 			"connection": 10,
@@ -35,7 +36,24 @@ default_settings = {
 			"temperature": 5,
 			"sdStatus": 1
 		},
-		"additionalPorts": []
+		"additionalPorts": [],
+		"lastBaudrates": {},
+		"resendHistory": 2000,
+		"logBuffer": 1000,
+		"workerProcess": False,
+		"polling": {
+			"maxInterval": 30,
+			"saturation": 0.8
+		},
+		"sendWindow": {
+			"enabled": False,
+			"lines": 4,
+			"bytes": 127
+		},
+		"readAhead": {
+			"enabled": True,
+			"lines": 250
+		}
 	},
 	"server": {
 		"host": "0.0.0.0",
@@ -77,7 +95,25 @@ default_settings = {
 		"sizeThreshold": 20 * 1024 * 1024, # 20MB
 	},
 	"gcodeAnalysis": {
-		"maxExtruders": 10
+		"maxExtruders": 10,
+		"backend": "auto",
+		"estimator": "planner",
+
+		# number of worker processes to analyse files in parallel, 0 to analyse in a thread of the server. The workers
+		# are forked while the server starts up, before its other threads exist. A worker that died is forked again
+		# from a running server and closes the sockets and files it inherited first
+		"processes": 0
+	},
+	"jobCache": {
+		"enabled": True,
+		"maxEntries": 20
+	},
+	"analysisCache": {
+		"enabled": True,
+		"maxEntries": 1000
+	},
+	"fileMetadata": {
+		"backend": "yaml"
 	},
 	"feature": {
 		"temperatureGraph": True,
@@ -98,7 +134,9 @@ default_settings = {
 		"watched": None,
 		"plugins": None,
 		"slicingProfiles": None,
-		"printerProfiles": None
+		"printerProfiles": None,
+		"jobCache": None,
+		"analysisCache": None
 	},
 	"temperature": {
 		"profiles": [
@@ -146,6 +184,7 @@ default_settings = {
 		"allowCrossOrigin": False,
 		"apps": {}
 	},
+	"printers": [],
 	"terminalFilters": [
 		{ "name": "Suppress M105 requests/responses", "regex": "(Send: M105)|(Recv: ok T\d*:)" },
 		{ "name": "Suppress M27 requests/responses", "regex": "(Send: M27)|(Recv: SD printing byte)" }
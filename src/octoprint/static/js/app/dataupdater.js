@@ -30,6 +30,14 @@ function DataUpdater(allViewModels) {
         self._autoReconnectTrial = 0;
     };
 
+    self.sendMessage = function(message) {
+        if (self._socket === undefined || self._socket.readyState != SockJS.OPEN) {
+            return false;
+        }
+        self._socket.send(JSON.stringify(message));
+        return true;
+    };
+
     self._onclose = function() {
         var handled = false;
         _.each(self.allViewModels, function(viewModel) {
@@ -110,6 +118,12 @@ function DataUpdater(allViewModels) {
                     DISPLAY_VERSION = data["display_version"];
                     $("span.version").text(DISPLAY_VERSION);
 
+                    _.each(self.allViewModels, function(viewModel) {
+                        if (viewModel.hasOwnProperty("onDataUpdaterConnect")) {
+                            viewModel.onDataUpdaterConnect(self);
+                        }
+                    });
+
                     if ($("#offline_overlay").is(":visible")) {
                         hideOfflineOverlay();
                         _.each(self.allViewModels, function(viewModel) {
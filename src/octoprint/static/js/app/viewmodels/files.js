@@ -114,14 +114,23 @@ function GcodeFilesViewModel(printerStateViewModel, loginStateViewModel, slicing
     };
 
     self._otherRequestInProgress = false;
+    // revision of the file list we currently have, used to only fetch the files that changed since
+    self._filesRevision = undefined;
+
     self.requestData = function(filenameToFocus, locationToFocus) {
         if (self._otherRequestInProgress) return;
 
+        var data = {};
+        if (self._filesRevision) {
+            data.since = self._filesRevision;
+        }
+
         self._otherRequestInProgress = true;
         $.ajax({
             url: API_BASEURL + "files",
             method: "GET",
             dataType: "json",
+            data: data,
             success: function(response) {
                 self.fromResponse(response, filenameToFocus, locationToFocus);
                 self._otherRequestInProgress = false;
@@ -134,6 +143,20 @@ function GcodeFilesViewModel(printerStateViewModel, loginStateViewModel, slicing
 
     self.fromResponse = function(response, filenameToFocus, locationToFocus) {
         var files = response.files;
+        if (response.removed !== undefined) {
+            // we only got the local files that changed since our last request (and all files on the SD card), merge
+            // them with the ones we already have
+            var isUpdated = function(file) {
+                if (file.origin != "local") return true;
+                if (_.contains(response.removed, file.name)) return true;
+                return _.some(response.files, function(other) {
+                    return other.origin == file.origin && other.name == file.name;
+                });
+            };
+            files = _.reject(self.listHelper.allItems, isUpdated).concat(files);
+        }
+        self._filesRevision = response.revision;
+
         _.each(files, function(element, index, list) {
             if (!element.hasOwnProperty("size")) element.size = undefined;
             if (!element.hasOwnProperty("date")) element.date = undefined;
@@ -20,6 +20,12 @@ function PrinterProfilesViewModel() {
                 z: {speed: 200, inverted: false},
                 e: {speed: 300, inverted: false}
             },
+            planner: {
+                acceleration: 3000,
+                travelAcceleration: 3000,
+                retractAcceleration: 3000,
+                jerk: {x: 10, y: 10, z: 0.3, e: 5}
+            },
             extruder: {
                 count: 1,
                 offsets: [
@@ -79,6 +85,14 @@ function PrinterProfilesViewModel() {
     self.editorAxisZInverted = ko.observable(false);
     self.editorAxisEInverted = ko.observable(false);
 
+    self.editorPlannerAcceleration = ko.observable();
+    self.editorPlannerTravelAcceleration = ko.observable();
+    self.editorPlannerRetractAcceleration = ko.observable();
+    self.editorPlannerJerkX = ko.observable();
+    self.editorPlannerJerkY = ko.observable();
+    self.editorPlannerJerkZ = ko.observable();
+    self.editorPlannerJerkE = ko.observable();
+
     self.availableColors = ko.observable([
         {key: "default", name: gettext("default")},
         {key: "red", name: gettext("red")},
@@ -237,6 +251,14 @@ function PrinterProfilesViewModel() {
         self.editorAxisESpeed(data.axes.e.speed);
         self.editorAxisEInverted(data.axes.e.inverted);
 
+        self.editorPlannerAcceleration(data.planner.acceleration);
+        self.editorPlannerTravelAcceleration(data.planner.travelAcceleration);
+        self.editorPlannerRetractAcceleration(data.planner.retractAcceleration);
+        self.editorPlannerJerkX(data.planner.jerk.x);
+        self.editorPlannerJerkY(data.planner.jerk.y);
+        self.editorPlannerJerkZ(data.planner.jerk.z);
+        self.editorPlannerJerkE(data.planner.jerk.e);
+
         var editDialog = $("#settings_printerProfiles_editDialog");
         var confirmButton = $("button.btn-confirm", editDialog);
         var dialogTitle = $("h3.modal-title", editDialog);
@@ -294,6 +316,17 @@ function PrinterProfilesViewModel() {
                     speed: parseInt(self.editorAxisZSpeed()),
                     inverted: self.editorAxisZInverted()
                 }
+            },
+            planner: {
+                acceleration: parseFloat(self.editorPlannerAcceleration()),
+                travelAcceleration: parseFloat(self.editorPlannerTravelAcceleration()),
+                retractAcceleration: parseFloat(self.editorPlannerRetractAcceleration()),
+                jerk: {
+                    x: parseFloat(self.editorPlannerJerkX()),
+                    y: parseFloat(self.editorPlannerJerkY()),
+                    z: parseFloat(self.editorPlannerJerkZ()),
+                    e: parseFloat(self.editorPlannerJerkE())
+                }
             }
         };
 
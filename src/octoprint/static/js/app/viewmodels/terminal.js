@@ -20,6 +20,7 @@ function TerminalViewModel(loginStateViewModel, settingsViewModel) {
 
     self.filters = self.settings.terminalFilters;
     self.filterRegex = undefined;
+    self.dataUpdater = undefined;
 
     self.cmdHistory = [];
     self.cmdHistoryIdx = -1;
@@ -28,11 +29,19 @@ function TerminalViewModel(loginStateViewModel, settingsViewModel) {
     self.activeFilters.subscribe(function(e) {
         self.updateFilterRegex();
         self.updateOutput();
+        self.sendFilters();
     });
 
     self.fromCurrentData = function(data) {
         self._processStateData(data.state);
-        self._processCurrentLogData(data.logs);
+        self._processCurrentLogData(self._withDroppedMarker(data.logs, data.logsDropped));
+    };
+
+    self._withDroppedMarker = function(logs, dropped) {
+        if (!dropped) {
+            return logs;
+        }
+        return [_.sprintf(gettext("[... %(dropped)d lines skipped ...]"), {dropped: dropped})].concat(logs);
     };
 
     self.fromHistoryData = function(data) {
@@ -73,6 +82,19 @@ function TerminalViewModel(loginStateViewModel, settingsViewModel) {
         console.log("Terminal filter regex: " + filterRegexStr);
     };
 
+    self.sendFilters = function() {
+        // let the server drop filtered lines before they are even pushed to us
+        if (self.dataUpdater === undefined) {
+            return;
+        }
+        self.dataUpdater.sendMessage({"logFilters": self.activeFilters()});
+    };
+
+    self.onDataUpdaterConnect = function(dataUpdater) {
+        self.dataUpdater = dataUpdater;
+        self.sendFilters();
+    };
+
     self.updateOutput = function() {
         if (!self.log)
             return;
@@ -10,6 +10,7 @@ import re
 import tempfile
 import logging
 import shutil
+import threading
 from flask import make_response
 
 from octoprint.settings import settings, default_settings
@@ -199,6 +200,48 @@ def silentRemove(file):
 		pass
 
 
+def cleanUpAfterFork(keep=None):
+	"""
+	Cleans up the state a worker process inherits when it is forked from the multi threaded server, to be called first
+	thing in the worker.
+
+	All file descriptors apart from stdin, stdout, stderr and those in ``keep`` (the server's sockets and files, the
+	pipes of other workers) are pointed to ``/dev/null``, which releases them without their numbers being reused while
+	inherited objects might still close them. The lock of the logging module, which another thread of the server might
+	have held at the time of the fork, is created anew.
+
+	@param keep the file descriptors the worker still needs, e.g. the one of its pipe to the server
+	"""
+
+	keep = set(keep or [])
+
+	if os.path.isdir("/proc/self/fd"):
+		fds = [int(fd) for fd in os.listdir("/proc/self/fd")]
+	else:
+		try:
+			maxfd = min(os.sysconf("SC_OPEN_MAX"), 4096)
+		except (AttributeError, ValueError, OSError):
+			maxfd = 256
+		fds = range(maxfd)
+
+	devnull = os.open(os.devnull, os.O_RDWR)
+	try:
+		for fd in fds:
+			if fd <= 2 or fd == devnull or fd in keep:
+				continue
+			try:
+				os.fstat(fd)
+				os.dup2(devnull, fd)
+			except OSError:
+				# not open (anymore)
+				pass
+	finally:
+		os.close(devnull)
+
+	if getattr(logging, "_lock", None) is not None:
+		logging._lock = threading.RLock()
+
+
 def sanitizeAscii(line):
 	return unicode(line, 'ascii', 'replace').encode('ascii', 'replace').rstrip()
 
@@ -10,6 +10,10 @@ import glob
 import time
 import re
 import threading
+import itertools
+import functools
+import array
+import operator
 import Queue as queue
 import logging
 import serial
@@ -17,15 +21,13 @@ import octoprint.plugin
 
 from collections import deque
 
-from octoprint.util.avr_isp import stk500v2
-from octoprint.util.avr_isp import ispBase
-
 from octoprint.settings import settings
 from octoprint.events import eventManager, Events
 from octoprint.filemanager import valid_file_type
 from octoprint.filemanager.destinations import FileDestinations
-from octoprint.util import getExceptionString, getNewTimeout, sanitizeAscii, filterNonAscii
+from octoprint.util import getExceptionString, sanitizeAscii, filterNonAscii
 from octoprint.util.virtual import VirtualPrinter
+from octoprint.util.recording import SerialRecorder
 
 try:
 	import _winreg
@@ -72,6 +74,147 @@ def baudrateList():
 		ret.insert(0, prev)
 	return ret
 
+_serialDiscovery = None
+def serialDiscovery():
+	global _serialDiscovery
+	if _serialDiscovery is None:
+		_serialDiscovery = SerialDiscovery()
+	return _serialDiscovery
+
+class SerialDiscovery(object):
+	"""
+	Finds out on which port and at which baudrate a printer is answering.
+
+	The list of available ports is cached for ``PORT_CACHE_TTL`` seconds. The baudrate a printer last successfully
+	answered at is remembered per port in ``serial.lastBaudrates``, so that it can be tried first the next time,
+	followed by the preferred baudrate and the ones most commonly used by firmwares.
+
+	:meth:`probe` opens all given ports at once and probes each of them in its own thread, trying the baudrates in
+	that order. A baudrate is considered working as soon as the printer answers an ``M105``, so with the remembered
+	baudrate the probe usually takes a single round trip.
+
+	``opener`` is called with port, baudrate and read timeout to open a port, it defaults to opening a serial port.
+	"""
+
+	PORT_CACHE_TTL = 10.0
+	LIKELY_BAUDRATES = [250000, 115200]
+	RETRIES = 5
+
+	def __init__(self, opener=None):
+		if opener is None:
+			opener = lambda port, baudrate, timeout: serial.Serial(str(port), baudrate, timeout=timeout, writeTimeout=10000)
+		self._opener = opener
+
+		self._mutex = threading.Lock()
+		self._ports = None
+		self._portsTimestamp = None
+
+	def getPorts(self, force=False):
+		"""
+		Returns the available ports as determined by :func:`serialList`, from the cache unless it's outdated or
+		``force`` is set.
+		"""
+		with self._mutex:
+			if force or self._ports is None or time.time() > self._portsTimestamp + self.PORT_CACHE_TTL:
+				self._ports = serialList()
+				self._portsTimestamp = time.time()
+			return list(self._ports)
+
+	def getBaudrates(self, port):
+		"""
+		Returns the baudrates to try for ``port``, most likely one first.
+		"""
+		lastBaudrates = settings().get(["serial", "lastBaudrates"]) or dict()
+		candidates = [lastBaudrates.get(port), settings().getInt(["serial", "baudrate"])] + self.LIKELY_BAUDRATES + baudrateList()
+
+		result = []
+		for baudrate in candidates:
+			if baudrate and baudrate not in result:
+				result.append(baudrate)
+		return result
+
+	def remember(self, port, baudrate):
+		lastBaudrates = dict(settings().get(["serial", "lastBaudrates"]) or dict())
+		if lastBaudrates.get(port) == baudrate:
+			return
+
+		lastBaudrates[port] = baudrate
+		settings().set(["serial", "lastBaudrates"], lastBaudrates)
+		settings().save()
+
+	def probe(self, ports, timeout, baudrate=None, log=None):
+		"""
+		Probes ``ports`` in parallel, at ``baudrate`` if given or at all baudrates determined by
+		:meth:`getBaudrates` otherwise, waiting up to ``timeout`` seconds for an answer per attempt.
+
+		Returns a tuple ``(port, baudrate, connection)`` with the still open connection to the first port that
+		answered, or None if none did.
+		"""
+		if log is None:
+			log = lambda message: None
+
+		found = threading.Event()
+		result = []
+		resultMutex = threading.Lock()
+
+		def probePort(port):
+			baudrates = [baudrate] if baudrate else self.getBaudrates(port)
+			try:
+				connection = self._opener(port, baudrates[0], timeout)
+			except:
+				log("Unexpected error while connecting to serial port: %s %s" % (port, getExceptionString()))
+				return
+
+			try:
+				for candidate in baudrates:
+					if found.is_set():
+						break
+
+					log("Trying port %s at baudrate %d" % (port, candidate))
+					connection.baudrate = candidate
+					if self._probeConnection(connection, timeout, found, log):
+						with resultMutex:
+							if not found.is_set():
+								result.append((port, candidate, connection))
+								found.set()
+								return
+			except:
+				log("Unexpected error while probing serial port: %s %s" % (port, getExceptionString()))
+
+			connection.close()
+
+		threads = []
+		for port in ports:
+			thread = threading.Thread(target=probePort, args=(port,))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			thread.join()
+
+		if not result:
+			return None
+
+		port, baudrate, connection = result[0]
+		self.remember(port, baudrate)
+		return port, baudrate, connection
+
+	def _probeConnection(self, connection, timeout, found, log):
+		for _ in range(self.RETRIES):
+			if found.is_set():
+				return False
+
+			connection.write("\nM105\n")
+			deadline = time.time() + timeout
+			while time.time() < deadline:
+				line = connection.readline()
+				if not line:
+					break
+				log("Recv: %s" % sanitizeAscii(line))
+				if "ok" in line and "T:" in line:
+					return True
+		return False
+
 gcodeToEvent = {
 	# pause for user input
 	"M226": Events.WAITING,
@@ -116,8 +259,14 @@ class MachineCom(object):
 	STATE_ERROR = 9
 	STATE_CLOSED_WITH_ERROR = 10
 	STATE_TRANSFERING_FILE = 11
+
+	SEND_PRIORITY_STOP = 0
+	SEND_PRIORITY_RESEND = 1
+	SEND_PRIORITY_COMMAND = 2
+
+	SEND_QUEUE_SIZE = 50
 	
-	def __init__(self, port = None, baudrate = None, callbackObject = None):
+	def __init__(self, port = None, baudrate = None, callbackObject = None, transport = None, logBuffer = None, excludedPorts = None):
 		self._logger = logging.getLogger(__name__)
 		self._serialLogger = logging.getLogger("SERIAL")
 
@@ -137,8 +286,13 @@ class MachineCom(object):
 		self._callback = callbackObject
 		self._state = self.STATE_NONE
 		self._serial = None
-		self._baudrateDetectList = baudrateList()
-		self._baudrateDetectRetry = 0
+		self._transport = transport
+		self._logBuffer = logBuffer
+		self._recorder = None
+		self._probed = False
+
+		# ports used by other printers, which must neither be probed nor opened
+		self._excludedPorts = excludedPorts if excludedPorts is not None else []
 		self._temp = {}
 		self._tempOffset = {}
 		self._bedTemp = None
@@ -152,11 +306,36 @@ class MachineCom(object):
 		self._currentExtruder = 0
 
 		self._timeout = None
+		self._timeouts = dict((name, settings().getFloat(["serial", "timeout", name])) for name in ("detection", "connection", "communication", "temperature", "sdStatus"))
+
+		# measures the link and decides when to poll for temperatures and SD status
+		self._pollScheduler = PollScheduler(
+			{"temperature": self._timeouts["temperature"], "sdStatus": self._timeouts["sdStatus"]},
+			settings().getFloat(["serial", "polling", "maxInterval"]),
+			saturation=settings().getFloat(["serial", "polling", "saturation"])
+		)
 
 		self._alwaysSendChecksum = settings().getBoolean(["feature", "alwaysSendChecksum"])
+		self._swallowOkAfterResend = settings().getBoolean(["feature", "swallowOkAfterResend"])
 		self._currentLine = 1
 		self._resendDelta = None
-		self._lastLines = deque([], 50)
+		self._lineHistory = LineHistory(settings().getInt(["serial", "resendHistory"]))
+		self._resendStatistics = {
+			"count": 0,
+			"lines": 0,
+			"lastDepth": 0,
+			"maxDepth": 0,
+			"bursts": 0,
+			"maxBurst": 0
+		}
+		self._resendBurst = 0
+
+		# send window, allows keeping more than one line in flight while printing
+		self._sendWindow = None
+		if settings().getBoolean(["serial", "sendWindow", "enabled"]):
+			self._sendWindow = SendWindow(settings().getInt(["serial", "sendWindow", "lines"]), settings().getInt(["serial", "sendWindow", "bytes"]))
+		self._heldLine = None
+		self._printFileExhausted = False
 
 		# hooks
 		self._pluginManager = octoprint.plugin.plugin_manager()
@@ -199,6 +378,16 @@ class MachineCom(object):
 		self._sendNextLock = threading.Lock()
 		self._sendingLock = threading.Lock()
 
+		# outbound command pipeline, filled by _sendCommand and drained by the sending thread
+		self._sendQueue = queue.PriorityQueue(maxsize=self.SEND_QUEUE_SIZE)
+		self._sendQueueCounter = itertools.count()
+		self._pendingResends = 0
+		self._deferredSends = deque()
+
+		# sending thread, started by the monitor as soon as the serial port is open
+		self._sendingThread = threading.Thread(target=self._sender)
+		self._sendingThread.daemon = True
+
 		# monitoring thread
 		self.thread = threading.Thread(target=self._monitor)
 		self.thread.daemon = True
@@ -225,12 +414,12 @@ class MachineCom(object):
 		self._callback.mcStateChange(newState)
 
 	def _log(self, message):
-		self._callback.mcLog(message)
-		self._serialLogger.debug(message)
-
-	def _addToLastLines(self, cmd):
-		self._lastLines.append(cmd)
-		self._logger.debug("Got %d lines of history in memory" % len(self._lastLines))
+		if self._logBuffer is not None:
+			# consumers including serial.log read the buffer asynchronously
+			self._logBuffer.append(message)
+		else:
+			self._callback.mcLog(message)
+			self._serialLogger.debug(message)
 
 	##~~ getters
 
@@ -312,6 +501,31 @@ class MachineCom(object):
 			return None
 		return self._currentFile.getFilepos()
 
+	def getPrintReadAhead(self):
+		if self._currentFile is None or not isinstance(self._currentFile, PrintingGcodeFileInformation):
+			return None
+		return self._currentFile.getReadAheadStats()
+
+	def getResendStatistics(self):
+		"""
+		Returns statistics on the resends requested by the printer since connecting: number of requests (``count``),
+		lines resent in total (``lines``), lines resent for the last and the largest request (``lastDepth``,
+		``maxDepth``), number of bursts of requests following each other before the previous one has been worked off
+		(``bursts``) and the most requests in such a burst (``maxBurst``), as well as the number of lines kept for
+		resending (``history``).
+		"""
+		with self._sendingLock:
+			stats = dict(self._resendStatistics)
+		stats["history"] = self._lineHistory.getSize()
+		return stats
+
+	def getRoundTripTime(self):
+		"""
+		Returns the smoothed time in seconds between sending a line and the printer acknowledging it, ``None`` if not
+		measured yet.
+		"""
+		return self._pollScheduler.getRoundTripTime()
+
 	def getPrintTime(self):
 		if self._currentFile is None or self._currentFile.getStartTime() is None:
 			return None
@@ -352,6 +566,13 @@ class MachineCom(object):
 			self._serial.close()
 		self._serial = None
 
+		if self._recorder is not None:
+			self._recorder.close()
+			self._recorder = None
+
+		if self._currentFile is not None:
+			self._currentFile.close()
+
 		if settings().get(["feature", "sdSupport"]):
 			self._sdFileList = []
 
@@ -392,6 +613,11 @@ class MachineCom(object):
 		self._pauseWaitStartTime = 0
 		self._pauseWaitTimeLost = 0.0
 
+		self._heldLine = None
+		self._printFileExhausted = False
+		if self._sendWindow is not None:
+			self._sendWindow.reset()
+
 		try:
 			self._currentFile.start()
 
@@ -410,6 +636,7 @@ class MachineCom(object):
 				self.sendCommand("M24")
 			else:
 				self._sendNext()
+				self._fillSendWindow()
 		except:
 			self._logger.exception("Error while trying to start printing")
 			self._errorValue = getExceptionString()
@@ -428,7 +655,7 @@ class MachineCom(object):
 		eventManager().fire(Events.TRANSFER_STARTED, {"local": localFilename, "remote": remoteFilename})
 		self._callback.mcFileTransferStarted(remoteFilename, self._currentFile.getFilesize())
 
-	def selectFile(self, filename, sd):
+	def selectFile(self, filename, sd, cachedJob=None):
 		if self.isBusy():
 			return
 
@@ -438,7 +665,13 @@ class MachineCom(object):
 				return
 			self.sendCommand("M23 %s" % filename)
 		else:
-			self._currentFile = PrintingGcodeFileInformation(filename, self.getOffsets)
+			readAhead = 0
+			if settings().getBoolean(["serial", "readAhead", "enabled"]):
+				readAhead = settings().getInt(["serial", "readAhead", "lines"])
+
+			if self._currentFile is not None:
+				self._currentFile.close()
+			self._currentFile = PrintingGcodeFileInformation(filename, self.getOffsets, cachedJob=cachedJob, readAhead=readAhead)
 			eventManager().fire(Events.FILE_SELECTED, {
 				"file": self._currentFile.getFilename(),
 				"origin": self._currentFile.getFileLocation()
@@ -449,6 +682,8 @@ class MachineCom(object):
 		if self.isBusy():
 			return
 
+		if self._currentFile is not None:
+			self._currentFile.close()
 		self._currentFile = None
 		eventManager().fire(Events.FILE_DESELECTED)
 		self._callback.mcFileSelected(None, None, False)
@@ -458,6 +693,7 @@ class MachineCom(object):
 			return
 
 		self._changeState(self.STATE_OPERATIONAL)
+		self._heldLine = None
 
 		if self.isSdFileSelected():
 			self.sendCommand("M25")    # pause print
@@ -482,7 +718,11 @@ class MachineCom(object):
 			if self.isSdFileSelected():
 				self.sendCommand("M24")
 			else:
+				# everything sent before pausing has been acknowledged by now
+				if self._sendWindow is not None:
+					self._sendWindow.reset()
 				self._sendNext()
+				self._fillSendWindow()
 
 			eventManager().fire(Events.PRINT_RESUMED, {
 				"file": self._currentFile.getFilename(),
@@ -633,6 +873,7 @@ class MachineCom(object):
 
 	def _monitor(self):
 		feedbackControls = settings().getFeedbackControls()
+		feedbackMatcher = ResponseClassifier.combine(map(lambda x: x[1].pattern, feedbackControls))
 		pauseTriggers = settings().getPauseTriggers()
 		feedbackErrors = []
 
@@ -640,23 +881,25 @@ class MachineCom(object):
 		if not self._openSerial():
 			return
 
+		self._sendingThread.start()
+
 		self._log("Connected to: %s, starting monitor" % self._serial)
-		if self._baudrate == 0:
-			self._log("Starting baud rate detection")
-			self._changeState(self.STATE_DETECT_BAUDRATE)
-		else:
-			self._changeState(self.STATE_CONNECTING)
+		self._changeState(self.STATE_CONNECTING)
 
 		#Start monitoring the serial port.
-		self._timeout = getNewTimeout("communication")
-
-		tempRequestTimeout = getNewTimeout("temperature")
-		sdStatusRequestTimeout = getNewTimeout("sdStatus")
+		self._timeout = self._getNewTimeout("communication")
+		self._pollScheduler.setCapacity(self._getLinkCapacity())
+		self._pollScheduler.reset()
 
 		startSeen = not settings().getBoolean(["feature", "waitForStartOnConnect"])
+		if self._probed:
+			# the printer already answered while probing, no need to wait for it to start, but it might have
+			# stopped due to what it received at the wrong baudrates
+			startSeen = True
+			self._sendCommand("M999")
 		heatingUp = False
 		swallowOk = False
-		supportRepetierTargetTemp = settings().getBoolean(["feature", "repetierTargetTemp"])
+		responseClassifier = self._createResponseClassifier(settings().getBoolean(["feature", "repetierTargetTemp"]))
 
 		while True:
 			try:
@@ -664,7 +907,9 @@ class MachineCom(object):
 				if line is None:
 					break
 				if line.strip() is not "":
-					self._timeout = getNewTimeout("communication")
+					self._timeout = self._getNewTimeout("communication")
+				if line.startswith("ok"):
+					self._pollScheduler.acknowledged()
 
 				##~~ debugging output handling
 				if line.startswith("//"):
@@ -716,109 +961,13 @@ class MachineCom(object):
 							self._sdFiles.append((filename, size))
 						continue
 
-				##~~ Temperature processing
-				if ' T:' in line or line.startswith('T:') or ' T0:' in line or line.startswith('T0:'):
-					self._processTemperatures(line)
-					self._callback.mcTempUpdate(self._temp, self._bedTemp)
-
-					#If we are waiting for an M109 or M190 then measure the time we lost during heatup, so we can remove that time from our printing time estimate.
-					if 'ok' in line and self._heatupWaitStartTime:
-						self._heatupWaitTimeLost = self._heatupWaitTimeLost + (time.time() - self._heatupWaitStartTime)
-						self._heatupWaitStartTime = None
-				elif supportRepetierTargetTemp and ('TargetExtr' in line or 'TargetBed' in line):
-					matchExtr = self._regex_repetierTempExtr.match(line)
-					matchBed = self._regex_repetierTempBed.match(line)
-
-					if matchExtr is not None:
-						toolNum = int(matchExtr.group(1))
-						try:
-							target = float(matchExtr.group(2))
-							if toolNum in self._temp.keys() and self._temp[toolNum] is not None and isinstance(self._temp[toolNum], tuple):
-								(actual, oldTarget) = self._temp[toolNum]
-								self._temp[toolNum] = (actual, target)
-							else:
-								self._temp[toolNum] = (None, target)
-							self._callback.mcTempUpdate(self._temp, self._bedTemp)
-						except ValueError:
-							pass
-					elif matchBed is not None:
-						try:
-							target = float(matchBed.group(1))
-							if self._bedTemp is not None and isinstance(self._bedTemp, tuple):
-								(actual, oldTarget) = self._bedTemp
-								self._bedTemp = (actual, target)
-							else:
-								self._bedTemp = (None, target)
-							self._callback.mcTempUpdate(self._temp, self._bedTemp)
-						except ValueError:
-							pass
-
-				##~~ SD Card handling
-				elif 'SD init fail' in line or 'volume.init failed' in line or 'openRoot failed' in line:
-					self._sdAvailable = False
-					self._sdFiles = []
-					self._callback.mcSdStateChange(self._sdAvailable)
-				elif 'Not SD printing' in line:
-					if self.isSdFileSelected() and self.isPrinting():
-						# something went wrong, printer is reporting that we actually are not printing right now...
-						self._sdFilePos = 0
-						self._changeState(self.STATE_OPERATIONAL)
-				elif 'SD card ok' in line and not self._sdAvailable:
-					self._sdAvailable = True
-					self.refreshSdFiles()
-					self._callback.mcSdStateChange(self._sdAvailable)
-				elif 'Begin file list' in line:
-					self._sdFiles = []
-					self._sdFileList = True
-				elif 'End file list' in line:
-					self._sdFileList = False
-					self._callback.mcSdFiles(self._sdFiles)
-				elif 'SD printing byte' in line:
-					# answer to M27, at least on Marlin, Repetier and Sprinter: "SD printing byte %d/%d"
-					match = self._regex_sdPrintingByte.search(line)
-					self._currentFile.setFilepos(int(match.group(1)))
-					self._callback.mcProgress()
-				elif 'File opened' in line:
-					# answer to M23, at least on Marlin, Repetier and Sprinter: "File opened:%s Size:%d"
-					match = self._regex_sdFileOpened.search(line)
-					self._currentFile = PrintingSdFileInformation(match.group(1), int(match.group(2)))
-				elif 'File selected' in line:
-					# final answer to M23, at least on Marlin, Repetier and Sprinter: "File selected"
-					if self._currentFile is not None:
-						self._callback.mcFileSelected(self._currentFile.getFilename(), self._currentFile.getFilesize(), True)
-						eventManager().fire(Events.FILE_SELECTED, {
-							"file": self._currentFile.getFilename(),
-							"origin": self._currentFile.getFileLocation()
-						})
-				elif 'Writing to file' in line:
-					# anwer to M28, at least on Marlin, Repetier and Sprinter: "Writing to file: %s"
-					self._printSection = "CUSTOM"
-					self._changeState(self.STATE_PRINTING)
-					line = "ok"
-				elif 'Done printing file' in line:
-					# printer is reporting file finished printing
-					self._sdFilePos = 0
-					self._callback.mcPrintjobDone()
-					self._changeState(self.STATE_OPERATIONAL)
-					eventManager().fire(Events.PRINT_DONE, {
-						"file": self._currentFile.getFilename(),
-						"filename": os.path.basename(self._currentFile.getFilename()),
-						"origin": self._currentFile.getFileLocation(),
-						"time": self.getPrintTime()
-					})
-				elif 'Done saving file' in line:
-					self.refreshSdFiles()
-
-				##~~ Message handling
-				elif line.strip() != '' \
-						and line.strip() != 'ok' and not line.startswith("wait") \
-						and not line.startswith('Resend:') \
-						and line != 'echo:Unknown command:""\n' \
-						and self.isOperational():
-					self._callback.mcMessage(line)
+				##~~ Response handling
+				handler = responseClassifier.classify(line)
+				if handler is not None:
+					line = handler(line)
 
 				##~~ Parsing for feedback commands
-				if feedbackControls:
+				if feedbackControls and (feedbackMatcher is None or feedbackMatcher.search(line) is not None):
 					for name, matcher, template in feedbackControls:
 						if name in feedbackErrors:
 							# we previously had an error with that one, so we'll skip it now
@@ -852,59 +1001,16 @@ class MachineCom(object):
 				if "ok" in line and heatingUp:
 					heatingUp = False
 
-				### Baudrate detection
-				if self._state == self.STATE_DETECT_BAUDRATE:
-					if line == '' or time.time() > self._timeout:
-						if len(self._baudrateDetectList) < 1:
-							self.close()
-							self._errorValue = "No more baudrates to test, and no suitable baudrate found."
-							self._changeState(self.STATE_ERROR)
-							eventManager().fire(Events.ERROR, {"error": self.getErrorString()})
-						elif self._baudrateDetectRetry > 0:
-							self._baudrateDetectRetry -= 1
-							self._serial.write('\n')
-							self._log("Baudrate test retry: %d" % (self._baudrateDetectRetry))
-							self._sendCommand("M105")
-							self._testingBaudrate = True
-						else:
-							baudrate = self._baudrateDetectList.pop(0)
-							try:
-								self._serial.baudrate = baudrate
-								self._serial.timeout = settings().getFloat(["serial", "timeout", "detection"])
-								self._log("Trying baudrate: %d" % (baudrate))
-								self._baudrateDetectRetry = 5
-								self._baudrateDetectTestOk = 0
-								self._timeout = getNewTimeout("communication")
-								self._serial.write('\n')
-								self._sendCommand("M105")
-								self._testingBaudrate = True
-							except:
-								self._log("Unexpected error while setting baudrate: %d %s" % (baudrate, getExceptionString()))
-					elif 'ok' in line and 'T:' in line:
-						self._baudrateDetectTestOk += 1
-						if self._baudrateDetectTestOk < 10:
-							self._log("Baudrate test ok: %d" % (self._baudrateDetectTestOk))
-							self._sendCommand("M105")
-						else:
-							self._sendCommand("M999")
-							self._serial.timeout = settings().getFloat(["serial", "timeout", "connection"])
-							self._changeState(self.STATE_OPERATIONAL)
-							if self._sdAvailable:
-								self.refreshSdFiles()
-							else:
-								self.initSdCard()
-							eventManager().fire(Events.CONNECTED, {"port": self._port, "baudrate": self._baudrate})
-					else:
-						self._testingBaudrate = False
-
 				### Connection attempt
-				elif self._state == self.STATE_CONNECTING:
+				if self._state == self.STATE_CONNECTING:
 					if (line == "" or "wait" in line) and startSeen:
 						self._sendCommand("M105")
 					elif "start" in line:
 						startSeen = True
 					elif "ok" in line and startSeen:
 						self._changeState(self.STATE_OPERATIONAL)
+						if self._transport is None and self._port != "VIRTUAL":
+							serialDiscovery().remember(self._port, self._baudrate)
 						if self._sdAvailable:
 							self.refreshSdFiles()
 						else:
@@ -923,10 +1029,10 @@ class MachineCom(object):
 							self._sendCommand(self._commandQueue.get())
 						else:
 							self._sendCommand("M105")
-						tempRequestTimeout = getNewTimeout("temperature")
+						self._pollScheduler.polled("temperature")
 					# resend -> start resend procedure from requested line
 					elif line.lower().startswith("resend") or line.lower().startswith("rs"):
-						if settings().get(["feature", "swallowOkAfterResend"]):
+						if self._swallowOkAfterResend:
 							swallowOk = True
 						self._handleResendRequest(line)
 
@@ -936,31 +1042,38 @@ class MachineCom(object):
 						self._log("Communication timeout during printing, forcing a line")
 						line = 'ok'
 
+					now = time.time()
 					if self.isSdPrinting():
-						if time.time() > tempRequestTimeout and not heatingUp:
+						if self._pollScheduler.isDue("temperature", now) and not heatingUp:
 							self._sendCommand("M105")
-							tempRequestTimeout = getNewTimeout("temperature")
+							self._pollScheduler.polled("temperature", now)
 
-						if time.time() > sdStatusRequestTimeout and not heatingUp:
+						if self._pollScheduler.isDue("sdStatus", now) and not heatingUp:
 							self._sendCommand("M27")
-							sdStatusRequestTimeout = getNewTimeout("sdStatus")
+							self._pollScheduler.polled("sdStatus", now)
 					else:
-						# Even when printing request the temperature every 5 seconds.
-						if time.time() > tempRequestTimeout and not self.isStreaming():
+						# Even when printing request the temperature regularly, less often while the link is saturated
+						if self._pollScheduler.isDue("temperature", now) and not self.isStreaming():
 							self._commandQueue.put("M105")
-							tempRequestTimeout = getNewTimeout("temperature")
+							self._pollScheduler.polled("temperature", now)
 
 						if "ok" in line and swallowOk:
 							swallowOk = False
 						elif "ok" in line:
+							if self._sendWindow is not None:
+								self._sendWindow.acknowledge()
+
 							if self._resendDelta is not None:
 								self._resendNextCommand()
 							elif not self._commandQueue.empty() and not self.isStreaming():
 								self._sendCommand(self._commandQueue.get(), True)
-							else:
-								self._sendNext()
+							elif not self._sendNext() and self._canPollEarly(now):
+								# nothing to send right now, use the idle link to poll the temperatures early
+								self._sendCommand("M105", True)
+								self._pollScheduler.polled("temperature", now)
+							self._fillSendWindow()
 						elif line.lower().startswith("resend") or line.lower().startswith("rs"):
-							if settings().get(["feature", "swallowOkAfterResend"]):
+							if self._swallowOkAfterResend:
 								swallowOk = True
 							self._handleResendRequest(line)
 			except:
@@ -971,48 +1084,232 @@ class MachineCom(object):
 				self._errorValue = errorMsg
 				self._changeState(self.STATE_ERROR)
 				eventManager().fire(Events.ERROR, {"error": self.getErrorString()})
+		self._sendQueue.put((self.SEND_PRIORITY_STOP, next(self._sendQueueCounter), None))
 		self._log("Connection closed, closing down monitor")
 
+	def _getNewTimeout(self, type):
+		return time.time() + self._timeouts[type]
+
+	def _getLinkCapacity(self):
+		# bytes per second, 8 data bits plus start and stop bit per byte
+		baudrate = getattr(self._serial, "baudrate", None)
+		if not baudrate:
+			return None
+		return baudrate / 10.0
+
+	def _canPollEarly(self, now):
+		if not self.isPrinting() or self.isStreaming() or self._heldLine is not None or self._resendDelta is not None:
+			return False
+		return self._pollScheduler.isIdleDue("temperature", now)
+
+	def _createResponseClassifier(self, supportRepetierTargetTemp):
+		rules = [
+			([" T:", "^T:", " T0:", "^T0:"], self._handleTemperatureReport)
+		]
+		if supportRepetierTargetTemp:
+			rules.append((["TargetExtr", "TargetBed"], self._handleRepetierTargetTemperature))
+		rules += [
+			(["SD init fail", "volume.init failed", "openRoot failed"], self._handleSdInitFailed),
+			(["Not SD printing"], self._handleNotSdPrinting),
+			(["SD card ok"], self._handleSdCardOk),
+			(["Begin file list"], self._handleSdFileListBegin),
+			(["End file list"], self._handleSdFileListEnd),
+			(["SD printing byte"], self._handleSdPrintingByte),
+			(["File opened"], self._handleSdFileOpened),
+			(["File selected"], self._handleSdFileSelected),
+			(["Writing to file"], self._handleSdWritingToFile),
+			(["Done printing file"], self._handleSdDonePrinting),
+			(["Done saving file"], self._handleSdDoneSaving)
+		]
+		return ResponseClassifier(rules, ignored=["", "ok", "wait"], fallback=self._handleMessage)
+
+	def _handleTemperatureReport(self, line):
+		self._processTemperatures(line)
+		self._callback.mcTempUpdate(self._temp, self._bedTemp)
+
+		#If we are waiting for an M109 or M190 then measure the time we lost during heatup, so we can remove that time from our printing time estimate.
+		if 'ok' in line and self._heatupWaitStartTime:
+			self._heatupWaitTimeLost = self._heatupWaitTimeLost + (time.time() - self._heatupWaitStartTime)
+			self._heatupWaitStartTime = None
+		return line
+
+	def _handleRepetierTargetTemperature(self, line):
+		matchExtr = self._regex_repetierTempExtr.match(line)
+		matchBed = self._regex_repetierTempBed.match(line)
+
+		if matchExtr is not None:
+			toolNum = int(matchExtr.group(1))
+			try:
+				target = float(matchExtr.group(2))
+				if toolNum in self._temp.keys() and self._temp[toolNum] is not None and isinstance(self._temp[toolNum], tuple):
+					(actual, oldTarget) = self._temp[toolNum]
+					self._temp[toolNum] = (actual, target)
+				else:
+					self._temp[toolNum] = (None, target)
+				self._callback.mcTempUpdate(self._temp, self._bedTemp)
+			except ValueError:
+				pass
+		elif matchBed is not None:
+			try:
+				target = float(matchBed.group(1))
+				if self._bedTemp is not None and isinstance(self._bedTemp, tuple):
+					(actual, oldTarget) = self._bedTemp
+					self._bedTemp = (actual, target)
+				else:
+					self._bedTemp = (None, target)
+				self._callback.mcTempUpdate(self._temp, self._bedTemp)
+			except ValueError:
+				pass
+		return line
+
+	def _handleSdInitFailed(self, line):
+		self._sdAvailable = False
+		self._sdFiles = []
+		self._callback.mcSdStateChange(self._sdAvailable)
+		return line
+
+	def _handleNotSdPrinting(self, line):
+		if self.isSdFileSelected() and self.isPrinting():
+			# something went wrong, printer is reporting that we actually are not printing right now...
+			self._sdFilePos = 0
+			self._changeState(self.STATE_OPERATIONAL)
+		return line
+
+	def _handleSdCardOk(self, line):
+		if self._sdAvailable:
+			return self._handleMessage(line)
+
+		self._sdAvailable = True
+		self.refreshSdFiles()
+		self._callback.mcSdStateChange(self._sdAvailable)
+		return line
+
+	def _handleSdFileListBegin(self, line):
+		self._sdFiles = []
+		self._sdFileList = True
+		return line
+
+	def _handleSdFileListEnd(self, line):
+		self._sdFileList = False
+		self._callback.mcSdFiles(self._sdFiles)
+		return line
+
+	def _handleSdPrintingByte(self, line):
+		# answer to M27, at least on Marlin, Repetier and Sprinter: "SD printing byte %d/%d"
+		match = self._regex_sdPrintingByte.search(line)
+		self._currentFile.setFilepos(int(match.group(1)))
+		self._callback.mcProgress()
+		return line
+
+	def _handleSdFileOpened(self, line):
+		# answer to M23, at least on Marlin, Repetier and Sprinter: "File opened:%s Size:%d"
+		match = self._regex_sdFileOpened.search(line)
+		self._currentFile = PrintingSdFileInformation(match.group(1), int(match.group(2)))
+		return line
+
+	def _handleSdFileSelected(self, line):
+		# final answer to M23, at least on Marlin, Repetier and Sprinter: "File selected"
+		if self._currentFile is not None:
+			self._callback.mcFileSelected(self._currentFile.getFilename(), self._currentFile.getFilesize(), True)
+			eventManager().fire(Events.FILE_SELECTED, {
+				"file": self._currentFile.getFilename(),
+				"origin": self._currentFile.getFileLocation()
+			})
+		return line
+
+	def _handleSdWritingToFile(self, line):
+		# anwer to M28, at least on Marlin, Repetier and Sprinter: "Writing to file: %s"
+		self._printSection = "CUSTOM"
+		self._changeState(self.STATE_PRINTING)
+		return "ok"
+
+	def _handleSdDonePrinting(self, line):
+		# printer is reporting file finished printing
+		self._sdFilePos = 0
+		self._callback.mcPrintjobDone()
+		self._changeState(self.STATE_OPERATIONAL)
+		eventManager().fire(Events.PRINT_DONE, {
+			"file": self._currentFile.getFilename(),
+			"filename": os.path.basename(self._currentFile.getFilename()),
+			"origin": self._currentFile.getFileLocation(),
+			"time": self.getPrintTime()
+		})
+		return line
+
+	def _handleSdDoneSaving(self, line):
+		self.refreshSdFiles()
+		return line
+
+	def _handleMessage(self, line):
+		if line.strip() != '' \
+				and line.strip() != 'ok' and not line.startswith("wait") \
+				and not line.startswith('Resend:') \
+				and line != 'echo:Unknown command:""\n' \
+				and self.isOperational():
+			self._callback.mcMessage(line)
+		return line
+
 	def _openSerial(self):
-		if self._port == 'AUTO':
-			self._changeState(self.STATE_DETECT_SERIAL)
-			programmer = stk500v2.Stk500v2()
-			self._log("Serial port list: %s" % (str(serialList())))
-			for p in serialList():
-				try:
-					self._log("Connecting to: %s" % (p))
-					programmer.connect(p)
-					self._serial = programmer.leaveISP()
-					break
-				except ispBase.IspError as (e):
-					self._log("Error while connecting to %s: %s" % (p, str(e)))
-					pass
-				except:
-					self._log("Unexpected error while connecting to serial port: %s %s" % (p, getExceptionString()))
-				programmer.close()
-			if self._serial is None:
-				self._log("Failed to autodetect serial port")
-				self._errorValue = 'Failed to autodetect serial port.'
-				self._changeState(self.STATE_ERROR)
-				eventManager().fire(Events.ERROR, {"error": self.getErrorString()})
-				return False
+		if self._transport is not None:
+			# something providing the serial port's interface was handed to us, e.g. to replay a recording
+			self._changeState(self.STATE_OPEN_SERIAL)
+			self._serial = self._transport
 		elif self._port == 'VIRTUAL':
 			self._changeState(self.STATE_OPEN_SERIAL)
 			self._serial = VirtualPrinter()
+		elif self._port in self._excludedPorts:
+			self._log("Serial port %s is used by another printer" % self._port)
+			self._errorValue = "Serial port %s is used by another printer." % self._port
+			self._changeState(self.STATE_ERROR)
+			eventManager().fire(Events.ERROR, {"error": self.getErrorString()})
+			return False
+		elif self._port == 'AUTO' or self._baudrate == 0:
+			discovery = serialDiscovery()
+			if self._port == 'AUTO':
+				self._changeState(self.STATE_DETECT_SERIAL)
+				ports = filter(lambda x: x != "VIRTUAL" and not x in self._excludedPorts, discovery.getPorts(force=True))
+				self._log("Serial port list: %s" % (str(ports)))
+			else:
+				self._changeState(self.STATE_DETECT_BAUDRATE)
+				ports = [self._port]
+
+			result = discovery.probe(ports, self._timeouts["detection"], baudrate=self._baudrate, log=self._log)
+			if result is None:
+				if self._port == 'AUTO':
+					self._log("Failed to autodetect serial port")
+					self._errorValue = 'Failed to autodetect serial port.'
+				else:
+					self._errorValue = "No more baudrates to test, and no suitable baudrate found."
+				self._changeState(self.STATE_ERROR)
+				eventManager().fire(Events.ERROR, {"error": self.getErrorString()})
+				return False
+
+			self._port, self._baudrate, self._serial = result
+			self._serial.timeout = self._timeouts["connection"]
+			self._probed = True
+			self._log("Printer answered on %s at baudrate %d" % (self._port, self._baudrate))
 		else:
 			self._changeState(self.STATE_OPEN_SERIAL)
 			try:
 				self._log("Connecting to: %s" % self._port)
 				if self._baudrate == 0:
-					self._serial = serial.Serial(str(self._port), 115200, timeout=settings().getFloat(["serial", "timeout", "connection"]), writeTimeout=10000)
+					self._serial = serial.Serial(str(self._port), 115200, timeout=self._timeouts["connection"], writeTimeout=10000)
 				else:
-					self._serial = serial.Serial(str(self._port), self._baudrate, timeout=settings().getFloat(["serial", "timeout", "connection"]), writeTimeout=10000)
+					self._serial = serial.Serial(str(self._port), self._baudrate, timeout=self._timeouts["connection"], writeTimeout=10000)
 			except:
 				self._log("Unexpected error while connecting to serial port: %s %s" % (self._port, getExceptionString()))
 				self._errorValue = "Failed to open serial port, permissions correct?"
 				self._changeState(self.STATE_ERROR)
 				eventManager().fire(Events.ERROR, {"error": self.getErrorString()})
 				return False
+
+		if settings().getBoolean(["serial", "record"]):
+			path = os.path.join(settings().getBaseFolder("logs"), time.strftime("serial-%Y%m%d-%H%M%S.rec"))
+			try:
+				self._recorder = SerialRecorder(path)
+				self._log("Recording serial traffic to %s" % path)
+			except:
+				self._logger.exception("Could not start recording serial traffic to %s" % path)
 		return True
 
 	def _handleErrors(self, line):
@@ -1049,6 +1346,9 @@ class MachineCom(object):
 			self._errorValue = getExceptionString()
 			self.close(True)
 			return None
+		recorder = self._recorder
+		if recorder is not None:
+			recorder.received(ret)
 		if ret == '':
 			#self._log("Recv: TIMEOUT")
 			return ''
@@ -1056,9 +1356,27 @@ class MachineCom(object):
 		return ret
 
 	def _sendNext(self):
+		"""
+		Sends the next line of the current file. Returns True if a line was sent, False if the line didn't fit into
+		the send window and was held back or if the file is done.
+		"""
 		with self._sendNextLock:
-			line = self._currentFile.getNext()
+			checksum = None
+			if self._heldLine is not None:
+				line, checksum = self._heldLine
+				self._heldLine = None
+			elif self._printFileExhausted:
+				line = None
+			else:
+				line = self._currentFile.getNext()
+				checksum = self._currentFile.getChecksum()
+
 			if line is None:
+				self._printFileExhausted = True
+				if self._sendWindow is not None and len(self._sendWindow) > 0 and not self.isStreaming():
+					# we are still waiting for the printer to acknowledge the last lines of the file
+					return False
+
 				if self.isStreaming():
 					self._sendCommand("M29")
 
@@ -1084,10 +1402,37 @@ class MachineCom(object):
 					self._callback.mcPrintjobDone()
 					self._changeState(self.STATE_OPERATIONAL)
 					eventManager().fire(Events.PRINT_DONE, payload)
-				return
+				return False
+
+			if self._sendWindow is not None and not self.isStreaming() and not self._sendWindow.fits(self._framedLength(line)):
+				# the printer's receive buffer can't take this line right now, keep it for the next ok
+				self._heldLine = (line, checksum)
+				return False
 
-			self._sendCommand(line, True)
+			self._sendCommand(line, True, checksum=checksum)
 			self._callback.mcProgress()
+			return True
+
+	def _fillSendWindow(self):
+		"""
+		Keeps sending lines while printing until the send window is full. Does nothing if no send window is
+		configured, in which case exactly one line is sent per received ok.
+		"""
+		if self._sendWindow is None or self.isStreaming() or self.isSdFileSelected():
+			return
+
+		while self.isPrinting() and self._resendDelta is None and self._sendWindow.hasRoom():
+			if not self._commandQueue.empty():
+				self._sendCommand(self._commandQueue.get(), True)
+			elif not self._sendNext():
+				break
+
+	def _framedLength(self, cmd, lineNumber=None):
+		# upper bound for the length of "N<lineNumber> <cmd>*<checksum>\n", the line number of commands still
+		# waiting in the send queue is not yet known, so leave some headroom for it
+		if lineNumber is None:
+			lineNumber = self._currentLine + self._sendQueue.qsize()
+		return len(cmd) + len(str(lineNumber)) + 7
 
 	def _handleResendRequest(self, line):
 		lineToResend = None
@@ -1098,8 +1443,17 @@ class MachineCom(object):
 				lineToResend = int(line.split()[1])
 
 		if lineToResend is not None:
-			self._resendDelta = self._currentLine - lineToResend
-			if self._resendDelta > len(self._lastLines) or len(self._lastLines) == 0 or self._resendDelta <= 0:
+			if self._sendWindow is not None:
+				# everything from the requested line on got discarded by the printer and will be sent again
+				self._sendWindow.resend(lineToResend)
+
+			with self._sendingLock:
+				stillResending = self._resendDelta is not None or self._pendingResends > 0
+				self._resendDelta = self._currentLine - lineToResend
+				historyAvailable = 0 < self._resendDelta <= len(self._lineHistory) and lineToResend in self._lineHistory
+				self._updateResendStatistics(self._resendDelta, stillResending)
+
+			if not historyAvailable:
 				self._errorValue = "Printer requested line %d but no sufficient history is available, can't resend" % lineToResend
 				self._logger.warn(self._errorValue)
 				if self.isPrinting():
@@ -1112,69 +1466,167 @@ class MachineCom(object):
 			else:
 				self._resendNextCommand()
 
+	def _updateResendStatistics(self, depth, stillResending):
+		stats = self._resendStatistics
+		stats["count"] += 1
+		if depth > 0:
+			stats["lines"] += depth
+			stats["lastDepth"] = depth
+			stats["maxDepth"] = max(stats["maxDepth"], depth)
+
+		# a resend request arriving before the previous one has been worked off continues a burst
+		if stillResending:
+			self._resendBurst += 1
+			if self._resendBurst == 2:
+				stats["bursts"] += 1
+		else:
+			self._resendBurst = 1
+		stats["maxBurst"] = max(stats["maxBurst"], self._resendBurst)
+
 	def _resendNextCommand(self):
-		# Make sure we are only handling one sending job at a time
+		# line number and history are owned by the sending thread, so only look at them while it's not sending
 		with self._sendingLock:
-			self._logger.debug("Resending line %d, delta is %d, history log is %s items strong" % (self._currentLine - self._resendDelta, self._resendDelta, len(self._lastLines)))
-			cmd = self._lastLines[-self._resendDelta]
-			lineNumber = self._currentLine - self._resendDelta
+			if self._resendDelta is None:
+				return
 
-			self._doSendWithChecksum(cmd, lineNumber)
+			lineNumber = self._currentLine - self._resendDelta
+			self._logger.debug("Resending line %d, delta is %d, history log is %s items strong" % (lineNumber, self._resendDelta, len(self._lineHistory)))
+			cmd, checksum = self._lineHistory.get(lineNumber)
 
+			# the sending thread holds back new lines until this resend has been written
+			self._pendingResends += 1
 			self._resendDelta -= 1
 			if self._resendDelta <= 0:
 				self._resendDelta = None
 
-	def _sendCommand(self, cmd, sendChecksum=False):
+		self._sendQueue.put((self.SEND_PRIORITY_RESEND, next(self._sendQueueCounter), (cmd, True, lineNumber, None, checksum)))
+
+	def _sendCommand(self, cmd, sendChecksum=False, checksum=None):
+		"""
+		Hands the command over to the sending thread. Plugin hooks, gcode handlers, line numbering and the actual
+		write all happen there, so that reading the printer's responses never has to wait on any of that.
+
+		``checksum`` may be given as calculated by :meth:`LineFramer.checksum` for ``cmd`` ahead of time.
+		"""
+		if self._serial is None:
+			return
+
+		if threading.current_thread() is self._sendingThread:
+			# called from within a hook or gcode handler, the queue might be full and we are the only one draining it
+			self._processCommand(cmd, sendChecksum, checksum=checksum)
+			return
+
+		windowEntry = None
+		if sendChecksum and self._sendWindow is not None and self.isPrinting() and not self.isStreaming():
+			windowEntry = self._sendWindow.reserve(self._framedLength(cmd))
+
+		self._sendQueue.put((self.SEND_PRIORITY_COMMAND, next(self._sendQueueCounter), (cmd, sendChecksum, None, windowEntry, checksum)))
+
+	def _sender(self):
+		"""
+		Main loop of the sending thread. Resent lines take precedence over everything else. Lines dequeued while a
+		resend is still in progress are deferred, since the printer expects the resent lines first.
+		"""
+		while True:
+			priority, _, entry = self._sendQueue.get()
+			if priority == self.SEND_PRIORITY_STOP:
+				break
+
+			try:
+				if priority == self.SEND_PRIORITY_RESEND:
+					cmd, _, lineNumber, _, checksum = entry
+					with self._sendingLock:
+						self._doSendWithChecksum(cmd, lineNumber, checksum)
+						self._pendingResends -= 1
+					if self._sendWindow is not None and self.isPrinting() and not self.isStreaming():
+						self._sendWindow.add(lineNumber, self._framedLength(cmd, lineNumber))
+				else:
+					with self._sendingLock:
+						resending = self._resendDelta is not None or self._pendingResends > 0
+					if resending:
+						self._deferredSends.append(entry)
+						continue
+
+					while self._deferredSends:
+						self._processCommand(*self._deferredSends.popleft())
+					self._processCommand(*entry)
+
+				if self._deferredSends:
+					with self._sendingLock:
+						resending = self._resendDelta is not None or self._pendingResends > 0
+					while self._deferredSends and not resending:
+						self._processCommand(*self._deferredSends.popleft())
+			except:
+				self._logger.exception("Something crashed inside the sending loop, please report this in OctoPrint's bug tracker:")
+
+		self._deferredSends.clear()
+		self._logger.debug("Connection closed, closing down sender")
+
+	def _processCommand(self, cmd, sendChecksum=False, lineNumber=None, windowEntry=None, checksum=None):
+		if self._serial is None:
+			return
+
+		originalCmd = cmd
+
+		if not self.isStreaming():
+			for hook in self._gcode_hooks:
+				hook_cmd = self._gcode_hooks[hook](self, cmd)
+				if hook_cmd and isinstance(hook_cmd, basestring):
+					cmd = hook_cmd
+			gcode = self._regex_command.search(cmd)
+			if gcode:
+				gcode = gcode.group(1)
+
+				if gcode in gcodeToEvent:
+					eventManager().fire(gcodeToEvent[gcode])
+
+				gcodeHandler = "_gcode_" + gcode
+				if hasattr(self, gcodeHandler):
+					cmd = getattr(self, gcodeHandler)(cmd)
+
+		if cmd is not originalCmd:
+			# changed by a hook or handler, a precalculated checksum doesn't apply anymore
+			checksum = None
+
+		if cmd is not None:
+			self._doSend(cmd, sendChecksum, windowEntry, checksum)
+		elif windowEntry is not None:
+			self._sendWindow.release(windowEntry)
+
+	def _doSend(self, cmd, sendChecksum=False, windowEntry=None, checksum=None):
 		# Make sure we are only handling one sending job at a time
 		with self._sendingLock:
-			if self._serial is None:
-				return
-
-			if not self.isStreaming():
-				for hook in self._gcode_hooks:
-					hook_cmd = self._gcode_hooks[hook](self, cmd)
-					if hook_cmd and isinstance(hook_cmd, basestring):
-						cmd = hook_cmd
-				gcode = self._regex_command.search(cmd)
-				if gcode:
-					gcode = gcode.group(1)
-
-					if gcode in gcodeToEvent:
-						eventManager().fire(gcodeToEvent[gcode])
-
-					gcodeHandler = "_gcode_" + gcode
-					if hasattr(self, gcodeHandler):
-						cmd = getattr(self, gcodeHandler)(cmd)
-
-			if cmd is not None:
-				self._doSend(cmd, sendChecksum)
-
-	def _doSend(self, cmd, sendChecksum=False):
-		if sendChecksum or self._alwaysSendChecksum:
-			lineNumber = self._currentLine
-			self._addToLastLines(cmd)
-			self._currentLine += 1
-			self._doSendWithChecksum(cmd, lineNumber)
-		else:
-			self._doSendWithoutChecksum(cmd)
+			if sendChecksum or self._alwaysSendChecksum:
+				lineNumber = self._currentLine
+				self._lineHistory.add(lineNumber, cmd, checksum)
+				self._currentLine += 1
+				if windowEntry is not None:
+					self._sendWindow.assign(windowEntry, lineNumber)
+				self._doSendWithChecksum(cmd, lineNumber, checksum)
+			else:
+				if windowEntry is not None:
+					self._sendWindow.release(windowEntry)
+				self._doSendWithoutChecksum(cmd)
 
-	def _doSendWithChecksum(self, cmd, lineNumber):
+	def _doSendWithChecksum(self, cmd, lineNumber, checksum=None):
 		self._logger.debug("Sending cmd '%s' with lineNumber %r" % (cmd, lineNumber))
-
-		commandToSend = "N%d %s" % (lineNumber, cmd)
-		checksum = reduce(lambda x,y:x^y, map(ord, commandToSend))
-		commandToSend = "%s*%d" % (commandToSend, checksum)
-		self._doSendWithoutChecksum(commandToSend)
+		self._doWrite(LineFramer.frame(lineNumber, cmd, checksum))
 
 	def _doSendWithoutChecksum(self, cmd):
-		self._log("Send: %s" % cmd)
+		self._doWrite(cmd + "\n")
+
+	def _doWrite(self, line):
+		self._log("Send: %s" % line[:-1])
+		self._pollScheduler.sent(len(line))
+		recorder = self._recorder
+		if recorder is not None:
+			recorder.sent(line)
 		try:
-			self._serial.write(cmd + '\n')
+			self._serial.write(line)
 		except serial.SerialTimeoutException:
 			self._log("Serial timeout while writing to serial port, trying again.")
 			try:
-				self._serial.write(cmd + '\n')
+				self._serial.write(line)
 			except:
 				self._log("Unexpected error while writing serial port: %s" % (getExceptionString()))
 				self._errorValue = getExceptionString()
@@ -1260,13 +1712,14 @@ class MachineCom(object):
 		else:
 			newLineNumber = 0
 
-		# send M110 command with new line number
-		self._doSendWithChecksum(cmd, newLineNumber)
-		self._currentLine = newLineNumber + 1
+		with self._sendingLock:
+			# send M110 command with new line number
+			self._doSendWithChecksum(cmd, newLineNumber)
+			self._currentLine = newLineNumber + 1
 
-		# after a reset of the line number we have no way to determine what line exactly the printer now wants
-		self._lastLines.clear()
-		self._resendDelta = None
+			# after a reset of the line number we have no way to determine what line exactly the printer now wants
+			self._lineHistory.clear()
+			self._resendDelta = None
 
 		return None
 
@@ -1286,7 +1739,7 @@ class MachineCom(object):
 		elif s_idx != -1:
 			# dwell time is specified in seconds
 			_timeout = int(cmd[s_idx+1:])
-		self._timeout = getNewTimeout("communication") + _timeout
+		self._timeout = self._getNewTimeout("communication") + _timeout
 		return cmd
 
 ### MachineCom callback ################################################################################################
@@ -1331,6 +1784,427 @@ class MachineComPrintCallback(object):
 	def mcForceDisconnect(self):
 		pass
 
+### Response classification ############################################################################################
+
+class ResponseClassifier(object):
+	"""
+	Routes lines received from the printer to their handlers.
+
+	Built once per connection from an ordered list of ``(keywords, handler)`` rules. ``keywords`` are plain strings
+	to be searched for anywhere in the line, unless prefixed with ``^``, in which case the line has to start with them.
+	All keywords are compiled into one regular expression, so each line is scanned only once. A line is routed to the
+	handler of the first rule with a keyword contained in it, just like an ``if/elif`` chain of substring tests would.
+	If no rule matches, the line goes to ``fallback``. Lines that equal one of ``ignored`` after stripping are not
+	scanned and get no handler.
+
+	Keywords must not overlap each other in a way that would hide a higher ranked rule behind a lower ranked one
+	within the same part of a line, since matches are searched non-overlapping from left to right.
+	"""
+
+	_regex_backreference = re.compile(r"\\[1-9]|\(\?P=")
+
+	def __init__(self, rules, ignored=None, fallback=None):
+		self._handlers = []
+		patterns = []
+		firstChars = set()
+		for keywords, handler in rules:
+			alternatives = []
+			for keyword in keywords:
+				if keyword.startswith("^"):
+					keyword = keyword[1:]
+					alternatives.append("^" + re.escape(keyword))
+				else:
+					alternatives.append(re.escape(keyword))
+				firstChars.add(keyword[0])
+			patterns.append("(?P<r%d>%s)" % (len(self._handlers), "|".join(alternatives)))
+			self._handlers.append(handler)
+		self._groups = dict(("r%d" % index, index) for index in range(len(self._handlers)))
+
+		self._regex = None
+		if patterns:
+			# the lookahead lets the scan skip over positions that can't start any keyword without trying every one
+			self._regex = re.compile("(?=[%s])(?:%s)" % (re.escape("".join(sorted(firstChars))), "|".join(patterns)))
+		self._ignored = frozenset(ignored) if ignored else frozenset()
+		self._fallback = fallback
+
+	def classify(self, line):
+		"""
+		Returns the handler for ``line``, or None if the line is to be ignored.
+		"""
+		if line.strip() in self._ignored:
+			return None
+
+		if self._regex is None:
+			return self._fallback
+
+		match = self._regex.search(line)
+		if match is None:
+			return self._fallback
+
+		best = self._groups[match.lastgroup]
+		if best > 0:
+			# a higher ranked keyword might still follow further down the line
+			for match in self._regex.finditer(line, match.end()):
+				index = self._groups[match.lastgroup]
+				if index < best:
+					best = index
+					if best == 0:
+						break
+		return self._handlers[best]
+
+	@staticmethod
+	def combine(patterns):
+		"""
+		Combines ``patterns`` into a single compiled regular expression matching whenever any of them matches, to be
+		used as a quick check before searching for the individual patterns. Returns None if there's nothing to combine
+		or the patterns can't be combined safely, e.g. because they contain backreferences, whose group numbers would
+		change in the combined expression.
+		"""
+		patterns = list(patterns)
+		if len(patterns) < 2:
+			return None
+
+		for pattern in patterns:
+			if ResponseClassifier._regex_backreference.search(pattern):
+				return None
+
+		try:
+			return re.compile("|".join(map(lambda x: "(?:%s)" % x, patterns)))
+		except:
+			return None
+
+### Polling ############################################################################################################
+
+class PollScheduler(object):
+	"""
+	Decides when to poll the printer for status information like temperatures or SD progress. Every kind of poll has a
+	base interval, given through ``intervals`` as a dict mapping names to seconds.
+
+	Everything written to the printer is reported through :meth:`sent` and every received ``ok`` through
+	:meth:`acknowledged`. From that the scheduler tracks the smoothed round trip time of lines and how much of the
+	link's capacity (in bytes per second, see :meth:`setCapacity`) has been used since a poll was last done. If more
+	than ``saturation`` of the capacity was used, the link is considered saturated and the interval of that poll is
+	doubled, up to ``maxInterval``, so that polling doesn't take bandwidth away from the lines being printed. Once the
+	link is no longer saturated, the base interval is used again.
+
+	A poll is never due again before ``ROUND_TRIPS`` round trip times have passed, up to ``maxInterval`` as well. While
+	the printer takes long to acknowledge lines, e.g. because its planner is full, polls would otherwise queue up
+	behind each other in the printer before the previous one was even answered.
+
+	:meth:`isIdleDue` allows to poll early, to make use of a moment in which nothing else is waiting to be sent.
+	"""
+
+	SMOOTHING = 0.2
+	MAX_IN_FLIGHT = 64
+	ROUND_TRIPS = 2
+
+	def __init__(self, intervals, maxInterval, saturation=0.8, capacity=None):
+		self._baseIntervals = dict(intervals)
+		self._maxInterval = maxInterval
+		self._saturation = saturation
+		self._capacity = capacity
+
+		self._mutex = threading.Lock()
+		self._inFlight = deque()
+		self._roundTripTime = None
+		self._bytes = 0
+
+		self._intervals = dict()
+		self._lastPolls = dict()
+		self._utilization = dict()
+		self.reset()
+
+	def setCapacity(self, capacity):
+		self._capacity = capacity
+
+	def reset(self, now=None):
+		"""
+		Forgets about lines still in flight and schedules all polls one base interval from ``now``.
+		"""
+		if now is None:
+			now = time.time()
+
+		with self._mutex:
+			self._inFlight.clear()
+			for name, interval in self._baseIntervals.items():
+				self._intervals[name] = interval
+				self._lastPolls[name] = (now, self._bytes)
+				self._utilization[name] = 0.0
+
+	def sent(self, size, now=None):
+		if now is None:
+			now = time.time()
+
+		with self._mutex:
+			self._bytes += size
+			if len(self._inFlight) >= self.MAX_IN_FLIGHT:
+				# we lost track of what's been acknowledged
+				self._inFlight.clear()
+			self._inFlight.append(now)
+
+	def acknowledged(self, now=None):
+		if now is None:
+			now = time.time()
+
+		with self._mutex:
+			if not self._inFlight:
+				return
+			roundTripTime = now - self._inFlight.popleft()
+			if self._roundTripTime is None:
+				self._roundTripTime = roundTripTime
+			else:
+				self._roundTripTime += self.SMOOTHING * (roundTripTime - self._roundTripTime)
+
+	def isDue(self, name, now=None):
+		if now is None:
+			now = time.time()
+		return now >= self._lastPolls[name][0] + self._intervals[name]
+
+	def isIdleDue(self, name, now=None):
+		"""
+		Whether at least half of the base interval of the poll ``name`` has passed, making it worth to poll early
+		while the link is idle.
+		"""
+		if now is None:
+			now = time.time()
+		return now >= self._lastPolls[name][0] + self._baseIntervals[name] / 2.0
+
+	def polled(self, name, now=None):
+		"""
+		Marks the poll ``name`` as done at ``now`` and determines the interval until it's due next.
+		"""
+		if now is None:
+			now = time.time()
+
+		with self._mutex:
+			lastPoll, lastBytes = self._lastPolls[name]
+			utilization = 0.0
+			if self._capacity and now > lastPoll:
+				utilization = (self._bytes - lastBytes) / ((now - lastPoll) * self._capacity)
+
+			maxInterval = max(self._maxInterval, self._baseIntervals[name])
+			if utilization > self._saturation:
+				interval = min(self._intervals[name] * 2, maxInterval)
+			else:
+				interval = self._baseIntervals[name]
+			if self._roundTripTime is not None:
+				interval = max(interval, min(self.ROUND_TRIPS * self._roundTripTime, maxInterval))
+
+			self._intervals[name] = interval
+
+			self._lastPolls[name] = (now, self._bytes)
+			self._utilization[name] = utilization
+
+	def getInterval(self, name):
+		return self._intervals[name]
+
+	def getUtilization(self, name):
+		"""
+		The fraction of the link's capacity used between the last two polls ``name``.
+		"""
+		return self._utilization[name]
+
+	def getRoundTripTime(self):
+		"""
+		The smoothed round trip time of a line in seconds, ``None`` if not measured yet.
+		"""
+		return self._roundTripTime
+
+### Line framing #######################################################################################################
+
+class LineFramer(object):
+	"""
+	Frames commands for sending with a line number and checksum as ``N<lineNumber> <command>*<checksum>\n``.
+
+	The checksum is the XOR over all bytes of ``N<lineNumber> <command>``. Since XOR is associative, the part covering
+	the command doesn't depend on the line number and can be determined via :meth:`checksum` as soon as the command
+	is known, e.g. while reading ahead in the file to print. :meth:`frame` then only has to cover the short line
+	number prefix when the line actually gets written.
+	"""
+
+	@staticmethod
+	def checksum(data):
+		"""
+		Returns the XOR over all bytes of ``data``.
+		"""
+		return reduce(operator.xor, bytearray(data), 0)
+
+	@staticmethod
+	def frame(lineNumber, command, checksum=None):
+		"""
+		Returns ``command`` framed with ``lineNumber`` and checksum, ready to be written to the printer. ``checksum``
+		may be the result of :meth:`checksum` for ``command`` calculated earlier.
+		"""
+		prefix = "N" + str(lineNumber) + " "
+		if checksum is None:
+			checksum = reduce(operator.xor, bytearray(command), 0)
+		checksum ^= reduce(operator.xor, bytearray(prefix))
+		return prefix + command + "*" + str(checksum) + "\n"
+
+### Line history #######################################################################################################
+
+class LineHistory(object):
+	"""
+	Remembers the last ``size`` lines sent with a line number, so that they can be sent again when the printer requests
+	a resend. Lines are kept in a preallocated ring buffer indexed by their line number together with their checksum
+	as calculated by :meth:`LineFramer.checksum` (if known), so looking up a line takes the same time no matter how
+	far back it was sent.
+
+	Line numbers are expected to increase by one with every added line, :meth:`clear` has to be called when the line
+	number gets reset.
+	"""
+
+	def __init__(self, size):
+		self._size = max(1, size)
+		self._lines = [None] * self._size
+		self._lineNumbers = array.array("l", [-1]) * self._size
+		self._checksums = array.array("h", [-1]) * self._size
+		self._count = 0
+
+	def add(self, lineNumber, line, checksum=None):
+		index = lineNumber % self._size
+		self._lines[index] = line
+		self._lineNumbers[index] = lineNumber
+		self._checksums[index] = checksum if checksum is not None else -1
+		if self._count < self._size:
+			self._count += 1
+
+	def get(self, lineNumber):
+		"""
+		Returns a tuple ``(line, checksum)`` for the line sent as ``lineNumber``, or None if it's not part of the
+		history (anymore).
+		"""
+		index = lineNumber % self._size
+		if self._lineNumbers[index] != lineNumber:
+			return None
+
+		checksum = self._checksums[index]
+		return self._lines[index], checksum if checksum >= 0 else None
+
+	def clear(self):
+		for index in range(self._size):
+			self._lines[index] = None
+			self._lineNumbers[index] = -1
+		self._count = 0
+
+	def getSize(self):
+		return self._size
+
+	def __contains__(self, lineNumber):
+		return self._lineNumbers[lineNumber % self._size] == lineNumber
+
+	def __len__(self):
+		return self._count
+
+### Send window ########################################################################################################
+
+class SendWindow(object):
+	"""
+	Keeps track of the lines currently in flight to the printer, that is lines that have been sent but have not yet
+	been acknowledged with an ``ok``. Models the printer's receive buffer by limiting both the number of unacknowledged
+	lines and their combined size in bytes, similar to how :class:`octoprint.util.virtual.CharCountingQueue` models
+	the buffer of the virtual printer.
+
+	Lines are tracked by their line number, so that everything from a line requested to be resent onwards can be
+	dropped from the window. Since line numbers are only assigned by the sending thread, room for a line is reserved
+	through :meth:`reserve` when it is queued and the reservation is then assigned its line number once the line
+	actually gets written.
+	"""
+
+	def __init__(self, maxLines, maxBytes):
+		self._maxLines = max(1, maxLines)
+		self._maxBytes = maxBytes
+		self._lines = deque()
+		self._bytes = 0
+		self._mutex = threading.Lock()
+
+	def add(self, lineNumber, size):
+		"""
+		Marks the line ``lineNumber`` of ``size`` bytes as sent.
+		"""
+		with self._mutex:
+			self._lines.append([lineNumber, size])
+			self._bytes += size
+
+	def reserve(self, size):
+		"""
+		Reserves room for a line of ``size`` bytes whose line number is not yet known and returns the reservation,
+		to be passed to :meth:`assign` or :meth:`release` later.
+		"""
+		entry = [None, size]
+		with self._mutex:
+			self._lines.append(entry)
+			self._bytes += size
+		return entry
+
+	def assign(self, entry, lineNumber):
+		"""
+		Assigns the line number ``lineNumber`` to the reservation ``entry``.
+		"""
+		with self._mutex:
+			entry[0] = lineNumber
+
+	def release(self, entry):
+		"""
+		Drops the reservation ``entry`` without it ever having been sent.
+		"""
+		with self._mutex:
+			for i, line in enumerate(self._lines):
+				if line is entry:
+					del self._lines[i]
+					self._bytes -= entry[1]
+					break
+
+	def acknowledge(self):
+		"""
+		Marks the oldest line in flight as acknowledged and returns its line number, or None if no line was in flight.
+		"""
+		with self._mutex:
+			if not self._lines:
+				return None
+			lineNumber, size = self._lines.popleft()
+			self._bytes -= size
+			return lineNumber
+
+	def resend(self, lineNumber):
+		"""
+		Removes the line ``lineNumber`` and all lines sent after it from the window. Reservations that haven't been
+		sent yet are kept.
+		"""
+		with self._mutex:
+			kept = deque()
+			for line in self._lines:
+				if line[0] is not None and line[0] >= lineNumber:
+					self._bytes -= line[1]
+				else:
+					kept.append(line)
+			self._lines = kept
+
+	def reset(self):
+		with self._mutex:
+			self._lines.clear()
+			self._bytes = 0
+
+	def hasRoom(self):
+		with self._mutex:
+			return len(self._lines) < self._maxLines and self._bytes < self._maxBytes
+
+	def fits(self, size):
+		"""
+		Returns True if a line of ``size`` bytes can be sent without overflowing the window. A line always fits
+		into an empty window.
+		"""
+		with self._mutex:
+			if not self._lines:
+				return True
+			return len(self._lines) < self._maxLines and self._bytes + size <= self._maxBytes
+
+	def getBytes(self):
+		return self._bytes
+
+	def __len__(self):
+		return len(self._lines)
+
 ### Printing file information classes ##################################################################################
 
 class PrintingFileInformation(object):
@@ -1359,6 +2233,13 @@ class PrintingFileInformation(object):
 	def getFilepos(self):
 		return self._filepos
 
+	def getChecksum(self):
+		"""
+		The checksum of the line last retrieved for printing as calculated by :meth:`LineFramer.checksum`, or None if
+		it's not known in advance.
+		"""
+		return None
+
 	def getFileLocation(self):
 		return FileDestinations.LOCAL
 
@@ -1383,6 +2264,12 @@ class PrintingFileInformation(object):
 		"""
 		self._startTime = time.time()
 
+	def close(self):
+		"""
+		Releases any resources held for reading the file.
+		"""
+		pass
+
 class PrintingSdFileInformation(PrintingFileInformation):
 	"""
 	Encapsulates information regarding an ongoing print from SD.
@@ -1405,9 +2292,25 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 	"""
 	Encapsulates information regarding an ongoing direct print. Takes care of the needed file handle and ensures
 	that the file is closed in case of an error.
+
+	If a ``cachedJob`` (see :class:`octoprint.printer.jobcache.CachedPrintJob`) is provided and available when the
+	print is started, the commands are read from that instead of being parsed from the file line by line.
+
+	The checksum of each line is calculated while reading it, which happens in the background if ``readAhead`` is
+	set, so that it doesn't have to be done anymore when the line gets sent.
 	"""
 
-	def __init__(self, filename, offsetCallback):
+	LINE_COMMAND = 0
+	LINE_TOOL_CHANGE = 1
+	LINE_HOTEND_TEMPERATURE = 2
+	LINE_BED_TEMPERATURE = 3
+
+	_regex_tempCommand = re.compile("M(104|109|140|190)")
+	_regex_tempCommandTemperature = re.compile("S([-+]?\d*\.?\d*)")
+	_regex_tempCommandTool = re.compile("T(\d+)")
+	_regex_toolCommand = re.compile("^T(\d+)")
+
+	def __init__(self, filename, offsetCallback, cachedJob=None, readAhead=0):
 		PrintingFileInformation.__init__(self, filename)
 
 		self._filehandle = None
@@ -1416,12 +2319,16 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 		self._lineCount = None
 		self._firstLine = None
 		self._currentTool = 0
+		self._checksum = None
 
 		self._offsetCallback = offsetCallback
-		self._regex_tempCommand = re.compile("M(104|109|140|190)")
-		self._regex_tempCommandTemperature = re.compile("S([-+]?\d*\.?\d*)")
-		self._regex_tempCommandTool = re.compile("T(\d+)")
-		self._regex_toolCommand = re.compile("^T(\d+)")
+
+		self._cachedJob = cachedJob
+		self._cachedIndex = None
+		self._cachedCount = 0
+
+		self._readAhead = readAhead
+		self._lineBuffer = None
 
 		if not os.path.exists(self._filename) or not os.path.isfile(self._filename):
 			raise IOError("File %s does not exist" % self._filename)
@@ -1431,24 +2338,111 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 		"""
 		Opens the file for reading and determines the file size. Start time won't be recorded until 100 lines in
 		"""
+		self.close()
+
 		PrintingFileInformation.start(self)
-		self._filehandle = open(self._filename, "r")
 		self._lineCount = None
 
+		if self._cachedJob is not None:
+			try:
+				if self._cachedJob.open(self._filename):
+					self._cachedIndex = 0
+					self._cachedCount = len(self._cachedJob)
+			except:
+				logging.getLogger(__name__).exception("Could not open cached print job for %s, reading the file instead" % self._filename)
+
+		if self._cachedIndex is None:
+			self._filehandle = open(self._filename, "r")
+
+		if self._readAhead > 0:
+			# the thread reading ahead owns the file from now on and closes it once it's done
+			cleanup = functools.partial(self._closeSource, self._filehandle, self._cachedJob if self._cachedIndex is not None else None)
+			self._lineBuffer = ReadAheadBuffer(self._readLine, self._readAhead, cleanup=cleanup)
+
+	def close(self):
+		"""
+		Stops reading ahead and closes the file. While reading ahead, the file is closed by the thread reading it.
+		"""
+		if self._lineBuffer is not None:
+			self._lineBuffer.stop()
+			self._lineBuffer = None
+		else:
+			self._closeSource(self._filehandle, self._cachedJob if self._cachedIndex is not None else None)
+
+		self._filehandle = None
+		self._cachedIndex = None
+
+	def _closeSource(self, filehandle, cachedJob):
+		if filehandle is not None:
+			filehandle.close()
+		if cachedJob is not None:
+			cachedJob.close()
+
 	def getNext(self):
 		"""
 		Retrieves the next line for printing.
 		"""
-		if self._filehandle is None:
-			raise ValueError("File %s is not open for reading" % self._filename)
-
 		if self._lineCount is None:
+			if self._filehandle is None and self._cachedIndex is None and self._lineBuffer is None:
+				# while reading ahead, the file might already have been read completely and closed by now
+				raise ValueError("File %s is not open for reading" % self._filename)
 			self._lineCount = 0
+			self._checksum = None
 			return "M110 N0"
 
+		if self._lineBuffer is not None:
+			entry = self._lineBuffer.get()
+		else:
+			entry = self._readLine()
+
+		if entry is None:
+			self._checksum = None
+			return None
+
+		line, lineType, tool, filepos, checksum = entry
+		self._lineCount += 1
+		self._filepos = filepos
+
+		if lineType == self.LINE_COMMAND:
+			self._checksum = checksum
+			return line
+
+		appliedLine = self._applyLine(line, lineType, tool)
+		self._checksum = checksum if appliedLine is line else None
+		return appliedLine
+
+	def getChecksum(self):
+		return self._checksum
+
+	def getReadAheadStats(self):
+		"""
+		Returns size, current fill level and number of underruns of the read ahead buffer, or None if no read ahead
+		is taking place.
+		"""
+		lineBuffer = self._lineBuffer
+		if lineBuffer is None:
+			return None
+		return lineBuffer.getStats()
+
+	def _readLine(self):
+		"""
+		Reads the next line to print, either from the cached job or the file. Returns a tuple ``(line, lineType, tool,
+		filepos, checksum)``, see :meth:`parseLine` and :meth:`LineFramer.checksum`, or None once everything has been
+		read.
+		"""
+		if self._cachedIndex is not None:
+			if self._cachedIndex >= self._cachedCount:
+				self._cachedJob.close()
+				self._cachedIndex = None
+				return None
+
+			line, filepos, lineType, tool, checksum = self._cachedJob.get(self._cachedIndex)
+			self._cachedIndex += 1
+			return line, lineType, tool, filepos, checksum
+
 		try:
-			processedLine = None
-			while processedLine is None:
+			parsed = None
+			while parsed is None:
 				if self._filehandle is None:
 					# file got closed just now
 					return None
@@ -1456,67 +2450,81 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 				if not line:
 					self._filehandle.close()
 					self._filehandle = None
-				processedLine = self._processLine(line)
-			self._lineCount += 1
-			self._filepos = self._filehandle.tell()
+				parsed = self.parseLine(line)
 
-			return processedLine
+			line, lineType, tool = parsed
+			return line, lineType, tool, self._filehandle.tell(), LineFramer.checksum(line)
 		except Exception as (e):
 			if self._filehandle is not None:
 				self._filehandle.close()
 				self._filehandle = None
 			raise e
 
-	def _processLine(self, line):
+	def _applyLine(self, line, lineType, tool):
+		if lineType == self.LINE_TOOL_CHANGE:
+			# track tool changes
+			self._currentTool = tool
+		elif lineType != self.LINE_COMMAND and self._offsetCallback is not None:
+			## apply offsets
+			# if we have a temperature command, retrieve current offsets
+			tempOffset, bedTempOffset = self._offsetCallback()
+			if lineType == self.LINE_HOTEND_TEMPERATURE:
+				# extruder temperature, determine which one and retrieve corresponding offset
+				toolNum = tool if tool is not None else self._currentTool
+				offset = tempOffset[toolNum] if toolNum in tempOffset.keys() and tempOffset[toolNum] is not None else 0
+			else:
+				# bed temperature
+				offset = bedTempOffset
+
+			if not offset == 0:
+				# if we have an offset != 0, we need to get the temperature to be set and apply the offset to it
+				tempValueMatch = self._regex_tempCommandTemperature.search(line)
+				if tempValueMatch is not None:
+					try:
+						temp = float(tempValueMatch.group(1))
+						if temp > 0:
+							newTemp = temp + offset
+							line = line.replace("S" + tempValueMatch.group(1), "S%f" % newTemp)
+					except ValueError:
+						pass
+		return line
+
+	@classmethod
+	def parseLine(cls, line):
+		"""
+		Strips comments and surrounding whitespace from ``line`` and determines whether it's a tool change or sets a
+		temperature, so that the current tool can be tracked and temperature offsets can be applied when sending it.
+
+		Returns None if nothing is left to send after stripping, otherwise a tuple ``(command, lineType, tool)`` with
+		``lineType`` being one of the ``LINE_*`` constants and ``tool`` the tool selected by a tool change, the tool
+		explicitly addressed by a hotend temperature command or None.
+		"""
 		if ";" in line:
 			line = line[0:line.find(";")]
 		line = line.strip()
-		if len(line) > 0:
-			toolMatch = self._regex_toolCommand.match(line)
-			if toolMatch is not None:
-				# track tool changes
-				self._currentTool = int(toolMatch.group(1))
-			else:
-				## apply offsets
-				if self._offsetCallback is not None:
-					tempMatch = self._regex_tempCommand.match(line)
-					if tempMatch is not None:
-						# if we have a temperature command, retrieve current offsets
-						tempOffset, bedTempOffset = self._offsetCallback()
-						if tempMatch.group(1) == "104" or tempMatch.group(1) == "109":
-							# extruder temperature, determine which one and retrieve corresponding offset
-							toolNum = self._currentTool
-
-							toolNumMatch = self._regex_tempCommandTool.search(line)
-							if toolNumMatch is not None:
-								try:
-									toolNum = int(toolNumMatch.group(1))
-								except ValueError:
-									pass
-
-							offset = tempOffset[toolNum] if toolNum in tempOffset.keys() and tempOffset[toolNum] is not None else 0
-						elif tempMatch.group(1) == "140" or tempMatch.group(1) == "190":
-							# bed temperature
-							offset = bedTempOffset
-						else:
-							# unknown, should never happen
-							offset = 0
-
-						if not offset == 0:
-							# if we have an offset != 0, we need to get the temperature to be set and apply the offset to it
-							tempValueMatch = self._regex_tempCommandTemperature.search(line)
-							if tempValueMatch is not None:
-								try:
-									temp = float(tempValueMatch.group(1))
-									if temp > 0:
-										newTemp = temp + offset
-										line = line.replace("S" + tempValueMatch.group(1), "S%f" % newTemp)
-								except ValueError:
-									pass
-			return line
-		else:
+		if len(line) == 0:
 			return None
 
+		toolMatch = cls._regex_toolCommand.match(line)
+		if toolMatch is not None:
+			return line, cls.LINE_TOOL_CHANGE, int(toolMatch.group(1))
+
+		tempMatch = cls._regex_tempCommand.match(line)
+		if tempMatch is not None:
+			if tempMatch.group(1) == "104" or tempMatch.group(1) == "109":
+				tool = None
+				toolNumMatch = cls._regex_tempCommandTool.search(line)
+				if toolNumMatch is not None:
+					try:
+						tool = int(toolNumMatch.group(1))
+					except ValueError:
+						pass
+				return line, cls.LINE_HOTEND_TEMPERATURE, tool
+			else:
+				return line, cls.LINE_BED_TEMPERATURE, None
+
+		return line, cls.LINE_COMMAND, None
+
 class StreamingGcodeFileInformation(PrintingGcodeFileInformation):
 	def __init__(self, path, localFilename, remoteFilename):
 		PrintingGcodeFileInformation.__init__(self, path, None)
@@ -1532,3 +2540,102 @@ class StreamingGcodeFileInformation(PrintingGcodeFileInformation):
 
 	def getRemoteFilename(self):
 		return self._remoteFilename
+
+class ReadAheadBuffer(object):
+	"""
+	Calls ``source`` in a background thread and keeps up to ``size`` of its results ready to be retrieved via
+	:meth:`get`, so that a slow read doesn't have to be waited for when the next line is needed. ``source`` is called
+	until it returns None. Exceptions raised by ``source`` are raised again by :meth:`get`.
+
+	Whenever :meth:`get` finds the buffer empty while ``source`` hasn't been exhausted yet, that is counted as an
+	underrun.
+
+	If given, ``cleanup`` is called by the background thread once it stopped calling ``source``, so that whatever
+	``source`` reads from is only ever closed by the thread reading from it.
+	"""
+
+	def __init__(self, source, size, cleanup=None):
+		self._source = source
+		self._size = size
+		self._cleanup = cleanup
+		self._queue = queue.Queue(maxsize=size)
+
+		self._underruns = 0
+		self._started = False
+		self._done = False
+
+		self._stopped = threading.Event()
+		self._thread = threading.Thread(target=self._produce)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def get(self):
+		"""
+		Returns the next result of ``source``, waiting for it if necessary.
+		"""
+		if self._done:
+			return None
+
+		try:
+			entry = self._queue.get_nowait()
+		except queue.Empty:
+			if self._started:
+				# the very first line is expected to need a wait
+				self._underruns += 1
+
+			while True:
+				try:
+					entry = self._queue.get(timeout=0.5)
+					break
+				except queue.Empty:
+					if self._stopped.is_set():
+						return None
+		self._started = True
+
+		if entry is None:
+			self._done = True
+		elif isinstance(entry, Exception):
+			self._done = True
+			raise entry
+		return entry
+
+	def stop(self):
+		"""
+		Signals the background thread to stop and waits for it to finish, including ``cleanup``. If ``source`` takes
+		longer than that, the thread still stops and cleans up once it returns.
+		"""
+		self._stopped.set()
+		self._thread.join(2.0)
+		if self._thread.is_alive():
+			logging.getLogger(__name__).warn("Reading ahead didn't stop in time, it will stop once the current read returns")
+
+	def getStats(self):
+		return {
+			"size": self._size,
+			"fill": self._queue.qsize(),
+			"underruns": self._underruns
+		}
+
+	def _produce(self):
+		try:
+			while not self._stopped.is_set():
+				try:
+					entry = self._source()
+				except Exception as e:
+					entry = e
+
+				while not self._stopped.is_set():
+					try:
+						self._queue.put(entry, timeout=0.5)
+						break
+					except queue.Full:
+						pass
+
+				if entry is None or isinstance(entry, Exception):
+					break
+		finally:
+			if self._cleanup is not None:
+				try:
+					self._cleanup()
+				except:
+					logging.getLogger(__name__).exception("Error while cleaning up after reading ahead")
@@ -0,0 +1,502 @@
+# coding=utf-8
+from __future__ import absolute_import
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import logging
+import multiprocessing
+import Queue as queue
+import threading
+import time
+
+from octoprint.settings import settings
+from octoprint.events import eventManager
+from octoprint.util.comm import MachineCom, serialDiscovery
+from octoprint.util.logbuffer import LogBuffer
+from octoprint.util import cleanUpAfterFork
+
+
+# messages from the server to the worker
+CALL = "call"
+CLOSE = "close"
+
+# messages from the worker to the server
+CALLBACK = "callback"
+SNAPSHOT = "snapshot"
+LOG = "log"
+RECORD = "record"
+EVENT = "event"
+REMEMBER = "remember"
+EXIT = "exit"
+
+
+class RemoteMachineCom(object):
+	"""
+	Stands in for :class:`~octoprint.util.comm.MachineCom`, running the actual communication in a worker process so
+	that the serial timing of a printer is neither affected by the server's request handling nor by other printers.
+
+	Commands are passed on to the worker without waiting for it, the getters answer from the latest snapshot of the
+	worker's state. The worker sends such a snapshot right before every callback and whenever the state changed, so
+	callbacks see the state that triggered them. Log lines are read in batches from a log buffer in the worker and
+	appended to ``logBuffer``. Events fired and baudrates remembered by the worker are passed on to the server's
+	event manager and serial discovery, log records of the worker to the server's loggers.
+	"""
+
+	def __init__(self, port = None, baudrate = None, callbackObject = None, logBuffer = None, excludedPorts = None):
+		self._logger = logging.getLogger(__name__)
+
+		self._callback = callbackObject
+		self._logBuffer = logBuffer
+		self._snapshot = _initialSnapshot(port, baudrate)
+
+		self._channel, workerChannel = multiprocessing.Pipe()
+		self._sendMutex = threading.Lock()
+
+		self._process = multiprocessing.Process(target=_work, args=(workerChannel, port, baudrate, excludedPorts), name="CommWorker")
+		self._process.daemon = True
+		self._process.start()
+		workerChannel.close()
+
+		# the receiver only queues the messages, so the worker is never held up by a callback still busy
+		self._messages = queue.Queue()
+		self._receiver = threading.Thread(target=self._receive, name="CommWorkerReceiver")
+		self._receiver.daemon = True
+		self._receiver.start()
+
+		self._dispatcher = threading.Thread(target=self._dispatch, name="CommWorkerDispatcher")
+		self._dispatcher.daemon = True
+		self._dispatcher.start()
+
+	##~~ commands
+
+	def sendCommand(self, cmd):
+		self._call("sendCommand", cmd)
+
+	def startPrint(self):
+		self._call("startPrint")
+
+	def selectFile(self, filename, sd, cachedJob=None):
+		self._call("selectFile", filename, sd, cachedJob=cachedJob)
+
+	def unselectFile(self):
+		self._call("unselectFile")
+
+	def cancelPrint(self):
+		self._call("cancelPrint")
+
+	def setPause(self, pause):
+		self._call("setPause", pause)
+
+	def setTemperatureOffset(self, tool=None, bed=None):
+		self._call("setTemperatureOffset", tool=tool, bed=bed)
+
+	def startFileTransfer(self, filename, localFilename, remoteFilename):
+		self._call("startFileTransfer", filename, localFilename, remoteFilename)
+
+	def deleteSdFile(self, filename):
+		self._call("deleteSdFile", filename)
+
+	def initSdCard(self):
+		self._call("initSdCard")
+
+	def releaseSdCard(self):
+		self._call("releaseSdCard")
+
+	def refreshSdFiles(self):
+		self._call("refreshSdFiles")
+
+	def close(self, isError = False):
+		self._send((CLOSE, isError))
+		self._process.join(10)
+		if self._process.is_alive():
+			self._logger.warn("Comm worker didn't shut down in time, terminating it")
+			self._process.terminate()
+
+	##~~ getters
+
+	def getState(self):
+		return self._snapshot["state"]
+
+	def getStateString(self):
+		return self._snapshot["stateString"]
+
+	def getConnection(self):
+		return self._snapshot["connection"]
+
+	def getOffsets(self):
+		return self._snapshot["offsets"]
+
+	def getPrintTime(self):
+		return self._snapshot["printTime"]
+
+	def getCleanedPrintTime(self):
+		return self._snapshot["cleanedPrintTime"]
+
+	def getPrintProgress(self):
+		return self._snapshot["printProgress"]
+
+	def getPrintFilepos(self):
+		return self._snapshot["printFilepos"]
+
+	def getPrintReadAhead(self):
+		return self._snapshot["printReadAhead"]
+
+	def getResendStatistics(self):
+		return self._snapshot["resendStatistics"]
+
+	def getRoundTripTime(self):
+		return self._snapshot["roundTripTime"]
+
+	def getSdFiles(self):
+		return self._snapshot["sdFiles"]
+
+	def isOperational(self):
+		return self._snapshot["operational"]
+
+	def isPrinting(self):
+		return self._snapshot["printing"]
+
+	def isPaused(self):
+		return self._snapshot["paused"]
+
+	def isBusy(self):
+		return self._snapshot["busy"]
+
+	def isStreaming(self):
+		return self._snapshot["streaming"]
+
+	def isSdReady(self):
+		return self._snapshot["sdReady"]
+
+	def isError(self):
+		return self._snapshot["error"]
+
+	def isClosedOrError(self):
+		return self._snapshot["closedOrError"]
+
+	##~~ channel handling
+
+	def _call(self, name, *args, **kwargs):
+		self._send((CALL, name, args, kwargs))
+
+	def _send(self, message):
+		with self._sendMutex:
+			try:
+				self._channel.send(message)
+			except (IOError, EOFError, ValueError):
+				self._logger.warn("Comm worker is gone, can't send {message!r}".format(message=message[:2]))
+
+	def _receive(self):
+		while True:
+			try:
+				message = self._channel.recv()
+			except (IOError, EOFError):
+				self._messages.put(None)
+				return
+
+			self._messages.put(message)
+			if message[0] == EXIT:
+				return
+
+	def _dispatch(self):
+		while True:
+			message = self._messages.get()
+			if message is None:
+				self._workerDied()
+				return
+
+			try:
+				self._handle(message)
+			except:
+				self._logger.exception("Error while handling message {type} from comm worker".format(type=message[0]))
+
+			if message[0] == EXIT:
+				return
+
+	def _handle(self, message):
+		type = message[0]
+		if type == CALLBACK:
+			_, name, args, snapshot = message
+			if snapshot is not None:
+				self._snapshot = snapshot
+			getattr(self._callback, name)(*args)
+		elif type == SNAPSHOT:
+			self._snapshot = message[1]
+		elif type == LOG:
+			_, lines, dropped = message
+			if self._logBuffer is None:
+				return
+			if dropped:
+				self._logBuffer.append("[%d lines dropped by comm worker]" % dropped)
+			for line in lines:
+				self._logBuffer.append(line)
+		elif type == RECORD:
+			_, name, level, text = message
+			logging.getLogger(name).log(level, text)
+		elif type == EVENT:
+			_, event, payload = message
+			eventManager().fire(event, payload)
+		elif type == REMEMBER:
+			_, port, baudrate = message
+			serialDiscovery().remember(port, baudrate)
+
+	def _workerDied(self):
+		if self._snapshot["closedOrError"]:
+			return
+
+		self._logger.error("Comm worker died unexpectedly")
+		snapshot = dict(self._snapshot)
+		snapshot.update(state=MachineCom.STATE_CLOSED_WITH_ERROR, stateString="Error: Communication worker died",
+		                operational=False, printing=False, paused=False, busy=False, streaming=False,
+		                error=True, closedOrError=True)
+		self._snapshot = snapshot
+		self._callback.mcStateChange(MachineCom.STATE_CLOSED_WITH_ERROR)
+
+for _name in dir(MachineCom):
+	if _name.startswith("STATE_"):
+		setattr(RemoteMachineCom, _name, getattr(MachineCom, _name))
+
+
+def _initialSnapshot(port, baudrate):
+	return {
+		"state": MachineCom.STATE_NONE,
+		"stateString": "Offline",
+		"connection": (port, baudrate),
+		"offsets": ({}, 0),
+		"printTime": None,
+		"cleanedPrintTime": None,
+		"printProgress": None,
+		"printFilepos": None,
+		"printReadAhead": None,
+		"resendStatistics": None,
+		"roundTripTime": None,
+		"sdFiles": [],
+		"operational": False,
+		"printing": False,
+		"paused": False,
+		"busy": False,
+		"streaming": False,
+		"sdReady": False,
+		"error": False,
+		"closedOrError": False
+	}
+
+
+def _takeSnapshot(comm):
+	return {
+		"state": comm.getState(),
+		"stateString": comm.getStateString(),
+		"connection": comm.getConnection(),
+		"offsets": comm.getOffsets(),
+		"printTime": comm.getPrintTime(),
+		"cleanedPrintTime": comm.getCleanedPrintTime(),
+		"printProgress": comm.getPrintProgress(),
+		"printFilepos": comm.getPrintFilepos(),
+		"printReadAhead": comm.getPrintReadAhead(),
+		"resendStatistics": comm.getResendStatistics(),
+		"roundTripTime": comm.getRoundTripTime(),
+		"sdFiles": list(comm.getSdFiles()),
+		"operational": comm.isOperational(),
+		"printing": comm.isPrinting(),
+		"paused": comm.isPaused(),
+		"busy": comm.isBusy(),
+		"streaming": comm.isStreaming(),
+		"sdReady": comm.isSdReady(),
+		"error": comm.isError(),
+		"closedOrError": comm.isClosedOrError()
+	}
+
+
+##~~ worker process
+
+
+class _WorkerChannel(object):
+	"""
+	The worker's end of the channel, shared by the comm threads, the log reader and the command loop.
+	"""
+
+	def __init__(self, connection):
+		self._connection = connection
+		self._mutex = threading.RLock()
+		self._comm = None
+		self._lastSnapshot = None
+
+	def attach(self, comm):
+		self._comm = comm
+
+	def send(self, message):
+		with self._mutex:
+			try:
+				self._connection.send(message)
+			except (IOError, EOFError, ValueError):
+				# the server is gone, nothing left to report to
+				pass
+
+	def sendSnapshot(self, force=False):
+		"""
+		Sends a snapshot of the comm's state if it changed since the last one sent.
+		"""
+		with self._mutex:
+			snapshot = self._snapshot(force=force)
+			if snapshot is not None:
+				self.send((SNAPSHOT, snapshot))
+
+	def sendCallback(self, name, args):
+		# taking the snapshot and sending it happen atomically, so snapshots never arrive out of order
+		with self._mutex:
+			self.send((CALLBACK, name, args, self._snapshot(force=True)))
+
+	def _snapshot(self, force=False):
+		if self._comm is None:
+			return None
+
+		snapshot = _takeSnapshot(self._comm)
+		if not force and snapshot == self._lastSnapshot:
+			return None
+		self._lastSnapshot = snapshot
+		return snapshot
+
+
+class _CallbackForwarder(object):
+	"""
+	Callback object of the worker's comm, passing all callbacks on to the server. Progress callbacks are coalesced,
+	the server only needs the latest progress.
+	"""
+
+	PROGRESS_INTERVAL = 0.25
+
+	def __init__(self, channel):
+		self._channel = channel
+		self._lastProgress = 0
+		self._progressPending = False
+
+	def mcProgress(self):
+		now = time.time()
+		if now - self._lastProgress < self.PROGRESS_INTERVAL:
+			self._progressPending = True
+			return
+		self._lastProgress = now
+		self._progressPending = False
+		self._forward("mcProgress")
+
+	def flushProgress(self):
+		if self._progressPending:
+			self._lastProgress = 0
+			self.mcProgress()
+
+	def __getattr__(self, name):
+		if not name.startswith("mc"):
+			raise AttributeError(name)
+		return lambda *args: self._forward(name, *args)
+
+	def _forward(self, name, *args):
+		self._channel.sendCallback(name, args)
+
+
+class _ForwardingEventManager(object):
+	def __init__(self, channel):
+		self._channel = channel
+
+	def fire(self, event, payload=None):
+		self._channel.send((EVENT, event, payload))
+
+	def subscribe(self, event, callback):
+		pass
+
+	def unsubscribe(self, event, callback):
+		pass
+
+
+class _ForwardingLogHandler(logging.Handler):
+	def __init__(self, channel):
+		logging.Handler.__init__(self)
+		self._channel = channel
+
+	def emit(self, record):
+		try:
+			self._channel.send((RECORD, record.name, record.levelno, self.format(record)))
+		except:
+			self.handleError(record)
+
+
+def _prepareWorker(channel):
+	"""
+	Redirects everything the worker would otherwise do to the state it inherited from the server to the server
+	instead: logging, events and remembering baudrates (which would save the settings).
+	"""
+	import octoprint.events
+	import octoprint.util.comm
+
+	handler = _ForwardingLogHandler(channel)
+	handler.setFormatter(logging.Formatter("%(message)s"))
+	for logger in [logging.getLogger()] + [l for l in logging.Logger.manager.loggerDict.values() if isinstance(l, logging.Logger)]:
+		for h in list(logger.handlers):
+			logger.removeHandler(h)
+		logger.propagate = True
+	logging.getLogger().addHandler(handler)
+
+	octoprint.events._instance = _ForwardingEventManager(channel)
+
+	class WorkerSerialDiscovery(octoprint.util.comm.SerialDiscovery):
+		def remember(self, port, baudrate):
+			channel.send((REMEMBER, port, baudrate))
+	octoprint.util.comm._serialDiscovery = WorkerSerialDiscovery()
+
+
+def _work(connection, port, baudrate, excludedPorts):
+	# the worker is forked from the thread handling the connect request, while the server's other threads are running
+	cleanUpAfterFork(keep=[connection.fileno()])
+
+	channel = _WorkerChannel(connection)
+	_prepareWorker(channel)
+
+	callback = _CallbackForwarder(channel)
+	logBuffer = LogBuffer(settings().getInt(["serial", "logBuffer"]))
+	logCursor = logBuffer.cursor()
+
+	stopped = threading.Event()
+	def forwardLog():
+		while not stopped.wait(0.05):
+			lines, dropped = logCursor.read()
+			if lines or dropped:
+				channel.send((LOG, lines, dropped))
+			callback.flushProgress()
+			channel.sendSnapshot()
+	logForwarder = threading.Thread(target=forwardLog, name="CommWorkerLog")
+	logForwarder.daemon = True
+
+	comm = MachineCom(port, baudrate, callbackObject=callback, logBuffer=logBuffer, excludedPorts=excludedPorts)
+	channel.attach(comm)
+	logForwarder.start()
+
+	try:
+		while True:
+			try:
+				message = connection.recv()
+			except (IOError, EOFError):
+				# the server is gone
+				comm.close()
+				break
+
+			if message[0] == CLOSE:
+				comm.close(isError=message[1])
+				break
+			elif message[0] == CALL:
+				_, name, args, kwargs = message
+				try:
+					getattr(comm, name)(*args, **kwargs)
+				except:
+					logging.getLogger(__name__).exception("Error while calling {name} on the comm".format(name=name))
+				channel.sendSnapshot()
+	finally:
+		comm.thread.join(5)
+		stopped.set()
+		logForwarder.join(1)
+
+		lines, dropped = logCursor.read()
+		channel.send((LOG, lines, dropped))
+		channel.sendSnapshot(force=True)
+		channel.send((EXIT,))
+		connection.close()
@@ -5,24 +5,43 @@ __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2013 David Braam, Gina Häußge - Released under terms of the AGPLv3 License"
 
 
+import copy
+import itertools
 import math
 import os
+import re
 import base64
 import zlib
 import logging
 
 from octoprint.settings import settings
+from octoprint.util.planner import TrapezoidalPlanner, NumpyTrapezoidalPlanner
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 
 class AnalysisAborted(Exception):
-	pass
+	"""
+	Raised when an analysis got aborted. ``checkpoint`` allows to resume the analysis later on via
+	:meth:`gcode.load`, if available.
+	"""
+
+	def __init__(self, checkpoint=None):
+		Exception.__init__(self)
+		self.checkpoint = checkpoint
 
 
 class gcode(object):
-	def __init__(self):
+	def __init__(self, backend=None, estimator=None):
 		self._logger = logging.getLogger(__name__)
+		self._backend = backend
+		self._estimator = estimator
 
 		self.layerList = None
+		self.layers = None
 		self.extrusionAmount = [0]
 		self.extrusionVolume = [0]
 		self.totalMoveTimeMinute = 0
@@ -30,222 +49,643 @@ class gcode(object):
 		self.progressCallback = None
 		self._abort = False
 		self._filamentDiameter = 0
-	
-	def load(self, filename, printer_profile):
+		self._fileSize = None
+		self._fileModification = None
+
+	def load(self, filename, printer_profile, checkpoint=None):
+		"""
+		Analyses ``filename``. If a ``checkpoint`` from a previously aborted analysis of the same unchanged file is
+		provided, the analysis continues from there.
+		"""
 		if os.path.isfile(filename):
 			self.filename = filename
-			self._fileSize = os.stat(filename).st_size
-			with open(filename, "r") as f:
-				self._load(f, printer_profile)
+			stat = os.stat(filename)
+			self._fileSize = stat.st_size
+			self._fileModification = stat.st_mtime
+			# binary mode, so that the processed length of the lines matches the offset to seek to when resuming
+			with open(filename, "rb") as f:
+				self._load(f, printer_profile, checkpoint=checkpoint)
 
 	def abort(self):
 		self._abort = True
 
-	def _load(self, gcodeFile, printer_profile):
-		filePos = 0
-		readBytes = 0
-		pos = [0.0, 0.0, 0.0]
-		posOffset = [0.0, 0.0, 0.0]
-		currentE = [0.0]
-		totalExtrusion = [0.0]
-		maxExtrusion = [0.0]
-		currentExtruder = 0
-		totalMoveTimeMinute = 0.0
-		absoluteE = True
-		scale = 1.0
-		posAbs = True
-		feedRateXY = min(printer_profile["axes"]["x"]["speed"], printer_profile["axes"]["y"]["speed"])
-		offsets = printer_profile["extruder"]["offsets"]
+	def _load(self, gcodeFile, printer_profile, checkpoint=None):
+		analyzer = createAnalyzer(printer_profile, backend=self._backend, estimator=self._estimator)
+
+		if isinstance(gcodeFile, (list)):
+			total = len(gcodeFile)
+		else:
+			total = self._fileSize
 
-		for line in gcodeFile:
+		processed = 0
+		if checkpoint is not None:
+			if self._matchesCheckpoint(checkpoint, analyzer):
+				self._logger.debug("Resuming analysis of {filename} at {position}".format(filename=self.filename, position=checkpoint["position"]))
+				analyzer.setState(checkpoint["state"])
+				processed = checkpoint["position"]
+			else:
+				self._logger.debug("Checkpoint doesn't match {filename}, starting analysis from scratch".format(filename=self.filename))
+
+		if isinstance(gcodeFile, (list)):
+			lines = iter(gcodeFile[processed:])
+		else:
+			gcodeFile.seek(processed)
+			lines = iter(gcodeFile)
+
+		while True:
 			if self._abort:
-				raise AnalysisAborted()
-			filePos += 1
-			readBytes += len(line)
-
-			if isinstance(gcodeFile, (file)):
-				percentage = float(readBytes) / float(self._fileSize)
-			elif isinstance(gcodeFile, (list)):
-				percentage = float(filePos) / float(len(gcodeFile))
+				# aborting only happens between chunks, where the state of the analyzer is consistent
+				raise AnalysisAborted(checkpoint=self._createCheckpoint(analyzer, processed))
+
+			chunk = list(itertools.islice(lines, analyzer.chunkSize))
+			if not chunk:
+				break
+			analyzer.feed(chunk)
+
+			if isinstance(gcodeFile, (list)):
+				processed += len(chunk)
 			else:
-				percentage = None
+				processed += sum(map(len, chunk))
 
 			try:
-				if self.progressCallback is not None and (filePos % 1000 == 0) and percentage is not None:
-					self.progressCallback(percentage)
+				if self.progressCallback is not None and total and len(chunk) == analyzer.chunkSize:
+					self.progressCallback(float(processed) / float(total))
 			except:
 				pass
 
-			if ';' in line:
-				comment = line[line.find(';')+1:].strip()
-				if comment.startswith("filament_diameter"):
-					filamentValue = comment.split("=", 1)[1].strip()
-					try:
-						self._filamentDiameter = float(filamentValue)
-					except ValueError:
-						try:
-							self._filamentDiameter = float(filamentValue.split(",")[0].strip())
-						except ValueError:
-							self._filamentDiameter = 0.0
-				elif comment.startswith("CURA_PROFILE_STRING") or comment.startswith("CURA_OCTO_PROFILE_STRING"):
-					if comment.startswith("CURA_PROFILE_STRING"):
-						prefix = "CURA_PROFILE_STRING:"
-					else:
-						prefix = "CURA_OCTO_PROFILE_STRING:"
+		if self.progressCallback is not None:
+			self.progressCallback(100.0)
+
+		self._filamentDiameter = analyzer.filamentDiameter
+		self.extrusionAmount = analyzer.maxExtrusion[:]
+		self.extrusionVolume = [0] * len(self.extrusionAmount)
+		for i in range(len(self.extrusionAmount)):
+			radius = self._filamentDiameter / 2
+			self.extrusionVolume[i] = (self.extrusionAmount[i] * (math.pi * radius * radius)) / 1000
+		self.totalMoveTimeMinute = analyzer.totalMoveTimeMinute
+		self.layers = analyzer.layers
+
+	def _createCheckpoint(self, analyzer, position):
+		return dict(
+			analyzer=analyzer.__class__.__name__,
+			estimator=analyzer.estimator,
+			size=self._fileSize,
+			modification=self._fileModification,
+			position=position,
+			state=analyzer.getState()
+		)
+
+	def _matchesCheckpoint(self, checkpoint, analyzer):
+		return checkpoint.get("analyzer") == analyzer.__class__.__name__ \
+		       and checkpoint.get("estimator") == analyzer.estimator \
+		       and checkpoint.get("size") == self._fileSize \
+		       and checkpoint.get("modification") == self._fileModification
+
+
+ANALYSIS_VERSION = 3
+"""Version of the analysis results, to be increased whenever changes to the analysis change its results."""
+
+
+def analyzerBackend(backend=None):
+	"""
+	Returns the backend actually used for the requested ``backend``, which may be ``python`` for
+	:class:`GcodeAnalyzer`, ``numpy`` for :class:`NumpyGcodeAnalyzer` or ``auto`` (the default) for the latter if
+	NumPy is available. Falls back to ``python`` if NumPy is requested but not installed.
+	"""
+
+	if backend is None:
+		backend = "auto"
+
+	if backend in ("auto", "numpy"):
+		if numpy is not None:
+			return "numpy"
+		elif backend == "numpy":
+			logging.getLogger(__name__).warn("NumPy is not available, falling back to the pure Python GCODE analysis")
+	elif backend != "python":
+		logging.getLogger(__name__).warn("Unknown GCODE analysis backend {backend}, using the pure Python one".format(backend=backend))
+
+	return "python"
+
+
+def createAnalyzer(printer_profile, backend=None, estimator=None):
+	"""
+	Creates the analyzer for ``backend``, see :func:`analyzerBackend`, using the print time ``estimator``, see
+	:class:`GcodeAnalyzer`.
+	"""
+
+	if analyzerBackend(backend) == "numpy":
+		return NumpyGcodeAnalyzer(printer_profile, estimator=estimator)
+	return GcodeAnalyzer(printer_profile, estimator=estimator)
+
+
+_parameterPattern = re.compile("([A-Z])([-+]?(?:[0-9]+\\.?[0-9]*|\\.[0-9]+))")
+"""Scanner splitting a GCODE line into (letter, value) pairs, e.g. ``G1 X10.5 E-1`` into ``G/1``, ``X/10.5`` and ``E/-1``."""
 
-					curaOptions = self._parseCuraProfileString(comment, prefix)
-					if "filament_diameter" in curaOptions:
-						try:
-							self._filamentDiameter = float(curaOptions["filament_diameter"])
-						except:
-							self._filamentDiameter = 0.0
-				line = line[0:line.find(';')]
 
-			G = getCodeInt(line, 'G')
-			M = getCodeInt(line, 'M')
-			T = getCodeInt(line, 'T')
+class GcodeAnalyzer(object):
+	"""
+	Incremental analysis of GCODE for print time and filament usage.
+
+	Lines are passed in chunks to :meth:`feed`, the analysis state (position, extrusion per tool, modes, feedrate) is
+	kept between calls so that a file can be streamed through the analyzer. Each line is tokenized exactly once into
+	its parameters by a precompiled scanner. Unlike the former lookup of each parameter via :func:`getCodeInt` and
+	``getCodeFloat``, this reads
+
+	* parameters without separating spaces (``G1X10Y10E1F1200``), which were ignored before,
+	* lines with a line number and checksum (``N12 G1 X20 Y5 E2*45``), the last parameter of which was ignored before,
+	* and of parameters given several times on a line (``G1 X1 Y1 E4.5 X50``) the last one, where it was the first
+	  before. Slicers don't produce such lines.
+
+	The results are available as ``totalMoveTimeMinute``, ``maxExtrusion`` (per tool, in mm) and ``filamentDiameter``
+	(if the slicer put it in a comment).
+
+	In addition to the totals, ``layers`` contains a breakdown per layer as dicts of ``z``, ``moveTimeMinute`` and
+	``extrusion`` (filament per tool, in mm), together with the ``line`` (counted from 0) and byte ``offset`` at which
+	the layer starts. A new layer starts with the first extruding move at a different Z than the preceding
+	extruding move, travel moves and retractions count towards the layer in which they happen. Lines are expected
+	to be terminated by a newline, as read from a file.
+
+	The ``estimator`` (``gcodeAnalysis.estimator`` if not set) decides how the time of moves is estimated: ``planner``
+	simulates the acceleration of the printer's firmware via :class:`~octoprint.util.planner.TrapezoidalPlanner`,
+	``simple`` assumes every move happens at its feedrate.
+	"""
+
+	chunkSize = 1000
+
+	plannerClass = TrapezoidalPlanner
+
+	_stateAttributes = ("position", "positionOffset", "currentE", "totalExtrusion", "maxExtrusion", "currentExtruder",
+	                    "totalMoveTimeMinute", "absoluteE", "absolutePosition", "scale", "feedRateXY", "filamentDiameter",
+	                    "lineCount", "byteCount", "layers", "planner")
+
+	def __init__(self, printer_profile, maxExtruders=None, estimator=None):
+		self._logger = logging.getLogger(__name__)
+
+		if maxExtruders is None:
+			maxExtruders = settings().getInt(["gcodeAnalysis", "maxExtruders"])
+		self.maxExtruders = maxExtruders
+		self.offsets = printer_profile["extruder"]["offsets"]
+
+		if estimator is None:
+			estimator = settings().get(["gcodeAnalysis", "estimator"])
+		self.estimator = estimator
+		if estimator == "planner":
+			self.planner = self.plannerClass(printer_profile)
+		else:
+			self.planner = None
+
+		self.position = [0.0, 0.0, 0.0]
+		self.positionOffset = [0.0, 0.0, 0.0]
+		self.currentE = [0.0]
+		self.totalExtrusion = [0.0]
+		self.maxExtrusion = [0.0]
+		self.currentExtruder = 0
+		self.totalMoveTimeMinute = 0.0
+		self.absoluteE = True
+		self.absolutePosition = True
+		self.scale = 1.0
+		self.feedRateXY = min(printer_profile["axes"]["x"]["speed"], printer_profile["axes"]["y"]["speed"])
+		self.filamentDiameter = 0.0
+		self.lineCount = 0
+		self.byteCount = 0
+		self.layers = [self._newLayer(None, 0, 0)]
+
+	def feed(self, lines):
+		"""
+		Analyzes ``lines`` and updates the analysis state accordingly.
+		"""
+
+		findall = _parameterPattern.findall
+		sqrt = math.sqrt
+
+		# hot state lives in local variables while processing the chunk and is written back afterwards
+		posX, posY, posZ = self.position
+		offsetX, offsetY, offsetZ = self.positionOffset
+		currentE = self.currentE
+		totalExtrusion = self.totalExtrusion
+		maxExtrusion = self.maxExtrusion
+		currentExtruder = self.currentExtruder
+		totalMoveTimeMinute = self.totalMoveTimeMinute
+		absoluteE = self.absoluteE
+		absolutePosition = self.absolutePosition
+		scale = self.scale
+		feedRateXY = self.feedRateXY
+
+		layers = self.layers
+		layer = layers[-1]
+		lineNumber = self.lineCount - 1
+		nextOffset = self.byteCount
+
+		# moves are collected for the planner (if any) together with their layer and planned together at the end of
+		# the chunk or when the printer comes to a halt
+		planner = self.planner
+		segments = [] if planner is not None else None
+		segmentLayers = [] if planner is not None else None
+
+		for line in lines:
+			lineNumber += 1
+			offset = nextOffset
+			nextOffset += len(line)
+
+			if ";" in line:
+				line = self._processComment(line)
+
+			params = dict(findall(line))
+			if not params:
+				continue
+
+			G = params.get("G")
+			if G is not None:
+				try:
+					G = int(G)
+				except ValueError:
+					G = None
 
 			if G is not None:
 				if G == 0 or G == 1:	#Move
-					x = getCodeFloat(line, 'X')
-					y = getCodeFloat(line, 'Y')
-					z = getCodeFloat(line, 'Z')
-					e = getCodeFloat(line, 'E')
-					f = getCodeFloat(line, 'F')
-					oldPos = pos
-					pos = pos[:]
-					if posAbs:
+					x = params.get("X")
+					y = params.get("Y")
+					z = params.get("Z")
+					e = params.get("E")
+					f = params.get("F")
+
+					oldX = posX
+					oldY = posY
+					oldZ = posZ
+					if absolutePosition:
 						if x is not None:
-							pos[0] = x * scale + posOffset[0]
+							posX = float(x) * scale + offsetX
 						if y is not None:
-							pos[1] = y * scale + posOffset[1]
+							posY = float(y) * scale + offsetY
 						if z is not None:
-							pos[2] = z * scale + posOffset[2]
+							posZ = float(z) * scale + offsetZ
 					else:
 						if x is not None:
-							pos[0] += x * scale
+							posX += float(x) * scale
 						if y is not None:
-							pos[1] += y * scale
+							posY += float(y) * scale
 						if z is not None:
-							pos[2] += z * scale
+							posZ += float(z) * scale
 					if f is not None:
-						feedRateXY = f
+						feedRateXY = float(f)
 
-					moveType = 'move'
 					if e is not None:
+						e = float(e)
 						if absoluteE:
 							e -= currentE[currentExtruder]
+
 						if e > 0.0:
-							moveType = 'extrude'
-						if e < 0.0:
-							moveType = 'retract'
+							if layer["z"] is None:
+								layer["z"] = posZ
+							elif layer["z"] != posZ:
+								layer = self._newLayer(posZ, lineNumber, offset)
+								layers.append(layer)
+
 						totalExtrusion[currentExtruder] += e
 						currentE[currentExtruder] += e
 						if totalExtrusion[currentExtruder] > maxExtrusion[currentExtruder]:
+							# filament counts towards a layer as far as it increases the maximum extrusion
+							extrusion = layer["extrusion"]
+							extrusion[currentExtruder] = extrusion.get(currentExtruder, 0.0) + totalExtrusion[currentExtruder] - maxExtrusion[currentExtruder]
 							maxExtrusion[currentExtruder] = totalExtrusion[currentExtruder]
-					else:
-						e = 0.0
-
-					if x is not None or y is not None or z is not None:
-						diffX = oldPos[0] - pos[0]
-						diffY = oldPos[1] - pos[1]
-						totalMoveTimeMinute += math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
-					elif moveType == "extrude":
-						diffX = oldPos[0] - pos[0]
-						diffY = oldPos[1] - pos[1]
-						time1 = math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
-						time2 = abs(e / feedRateXY)
-						totalMoveTimeMinute += max(time1, time2)
-					elif moveType == "retract":
-						totalMoveTimeMinute += abs(e / feedRateXY)
-
-					if moveType == 'move' and oldPos[2] != pos[2]:
-						if oldPos[2] > pos[2] and abs(oldPos[2] - pos[2]) > 5.0 and pos[2] < 1.0:
-							oldPos[2] = 0.0
+
+					if segments is not None:
+						if x is not None or y is not None or z is not None or e:
+							segments.append((posX - oldX, posY - oldY, posZ - oldZ, e or 0.0, feedRateXY))
+							segmentLayers.append(layer)
+					elif x is not None or y is not None or z is not None:
+						diffX = oldX - posX
+						diffY = oldY - posY
+						moveTimeMinute = sqrt(diffX * diffX + diffY * diffY) / feedRateXY
+						totalMoveTimeMinute += moveTimeMinute
+						layer["moveTimeMinute"] += moveTimeMinute
+					elif e:
+						# pure extrusion or retraction, the XY distance is zero
+						moveTimeMinute = abs(e / feedRateXY)
+						totalMoveTimeMinute += moveTimeMinute
+						layer["moveTimeMinute"] += moveTimeMinute
+
 				elif G == 4:	#Delay
-					S = getCodeFloat(line, 'S')
+					if planner is not None:
+						totalMoveTimeMinute += self._plan(segments, segmentLayers, stop=True)
+						segments = []
+						segmentLayers = []
+					S = params.get("S")
 					if S is not None:
-						totalMoveTimeMinute += S / 60.0
-					P = getCodeFloat(line, 'P')
+						totalMoveTimeMinute += float(S) / 60.0
+						layer["moveTimeMinute"] += float(S) / 60.0
+					P = params.get("P")
 					if P is not None:
-						totalMoveTimeMinute += P / 60.0 / 1000.0
+						totalMoveTimeMinute += float(P) / 60.0 / 1000.0
+						layer["moveTimeMinute"] += float(P) / 60.0 / 1000.0
 				elif G == 20:	#Units are inches
 					scale = 25.4
 				elif G == 21:	#Units are mm
 					scale = 1.0
 				elif G == 28:	#Home
-					x = getCodeFloat(line, 'X')
-					y = getCodeFloat(line, 'Y')
-					z = getCodeFloat(line, 'Z')
-					center = [0.0,0.0,0.0]
+					if planner is not None:
+						totalMoveTimeMinute += self._plan(segments, segmentLayers, stop=True)
+						segments = []
+						segmentLayers = []
+					x = params.get("X")
+					y = params.get("Y")
+					z = params.get("Z")
 					if x is None and y is None and z is None:
-						pos = center
+						posX = posY = posZ = 0.0
 					else:
-						pos = pos[:]
 						if x is not None:
-							pos[0] = center[0]
+							posX = 0.0
 						if y is not None:
-							pos[1] = center[1]
+							posY = 0.0
 						if z is not None:
-							pos[2] = center[2]
+							posZ = 0.0
 				elif G == 90:	#Absolute position
-					posAbs = True
+					absolutePosition = True
 				elif G == 91:	#Relative position
-					posAbs = False
+					absolutePosition = False
 				elif G == 92:
-					x = getCodeFloat(line, 'X')
-					y = getCodeFloat(line, 'Y')
-					z = getCodeFloat(line, 'Z')
-					e = getCodeFloat(line, 'E')
+					x = params.get("X")
+					y = params.get("Y")
+					z = params.get("Z")
+					e = params.get("E")
 					if e is not None:
-						currentE[currentExtruder] = e
+						currentE[currentExtruder] = float(e)
 					if x is not None:
-						posOffset[0] = pos[0] - x
+						offsetX = posX - float(x)
 					if y is not None:
-						posOffset[1] = pos[1] - y
+						offsetY = posY - float(y)
 					if z is not None:
-						posOffset[2] = pos[2] - z
+						offsetZ = posZ - float(z)
+				continue
+
+			M = params.get("M")
+			if M is not None:
+				try:
+					M = int(M)
+				except ValueError:
+					M = None
 
-			elif M is not None:
+			if M is not None:
 				if M == 82:   #Absolute E
 					absoluteE = True
 				elif M == 83:   #Relative E
 					absoluteE = False
+				continue
 
-			elif T is not None:
-				if T > settings().getInt(["gcodeAnalysis", "maxExtruders"]):
+			T = params.get("T")
+			if T is not None:
+				try:
+					T = int(T)
+				except ValueError:
+					continue
+
+				if T > self.maxExtruders:
 					self._logger.warn("GCODE tried to select tool %d, that looks wrong, ignoring for GCODE analysis" % T)
-				else:
-					posOffset[0] -= offsets[currentExtruder][0] if currentExtruder < len(offsets) else 0
-					posOffset[1] -= offsets[currentExtruder][1] if currentExtruder < len(offsets) else 0
+					continue
 
-					currentExtruder = T
+				offsets = self.offsets
+				offsetX -= offsets[currentExtruder][0] if currentExtruder < len(offsets) else 0
+				offsetY -= offsets[currentExtruder][1] if currentExtruder < len(offsets) else 0
 
-					posOffset[0] += offsets[currentExtruder][0] if currentExtruder < len(offsets) else 0
-					posOffset[1] += offsets[currentExtruder][1] if currentExtruder < len(offsets) else 0
+				currentExtruder = T
 
-					if len(currentE) <= currentExtruder:
-						for i in range(len(currentE), currentExtruder + 1):
-							currentE.append(0.0)
-					if len(maxExtrusion) <= currentExtruder:
-						for i in range(len(maxExtrusion), currentExtruder + 1):
-							maxExtrusion.append(0.0)
-					if len(totalExtrusion) <= currentExtruder:
-						for i in range(len(totalExtrusion), currentExtruder + 1):
-							totalExtrusion.append(0.0)
+				offsetX += offsets[currentExtruder][0] if currentExtruder < len(offsets) else 0
+				offsetY += offsets[currentExtruder][1] if currentExtruder < len(offsets) else 0
 
-		if self.progressCallback is not None:
-			self.progressCallback(100.0)
+				for l in (currentE, maxExtrusion, totalExtrusion):
+					if len(l) <= currentExtruder:
+						l.extend([0.0] * (currentExtruder + 1 - len(l)))
 
-		self.extrusionAmount = maxExtrusion
-		self.extrusionVolume = [0] * len(maxExtrusion)
-		for i in range(len(maxExtrusion)):
-			radius = self._filamentDiameter / 2
-			self.extrusionVolume[i] = (self.extrusionAmount[i] * (math.pi * radius * radius)) / 1000
-		self.totalMoveTimeMinute = totalMoveTimeMinute
+		if planner is not None:
+			totalMoveTimeMinute += self._plan(segments, segmentLayers)
 
-	def _parseCuraProfileString(self, comment, prefix):
-		return {key: value for (key, value) in map(lambda x: x.split("=", 1), zlib.decompress(base64.b64decode(comment[len(prefix):])).split("\b"))}
+		self.position = [posX, posY, posZ]
+		self.positionOffset = [offsetX, offsetY, offsetZ]
+		self.currentExtruder = currentExtruder
+		self.totalMoveTimeMinute = totalMoveTimeMinute
+		self.absoluteE = absoluteE
+		self.absolutePosition = absolutePosition
+		self.scale = scale
+		self.feedRateXY = feedRateXY
+		self.lineCount = lineNumber + 1
+		self.byteCount = nextOffset
+
+	def getState(self):
+		"""
+		Returns a copy of the analysis state, to be restored via :meth:`setState`.
+		"""
+		return dict((key, copy.deepcopy(getattr(self, key))) for key in self._stateAttributes)
+
+	def setState(self, state):
+		for key in self._stateAttributes:
+			setattr(self, key, copy.deepcopy(state[key]))
+
+	def _plan(self, segments, segmentLayers, stop=False):
+		"""
+		Plans ``segments``, adds the time of each to its layer in ``segmentLayers`` and returns the total time in
+		minutes.
+		"""
+		totalMoveTimeMinute = 0.0
+		for moveTime, layer in zip(self.planner.plan(segments, stop=stop), segmentLayers):
+			layer["moveTimeMinute"] += moveTime / 60.0
+			totalMoveTimeMinute += moveTime / 60.0
+		return totalMoveTimeMinute
+
+	def _newLayer(self, z, line, offset):
+		return dict(z=z, line=line, offset=offset, moveTimeMinute=0.0, extrusion=dict())
+
+	def _processComment(self, line):
+		comment = line[line.find(";")+1:].strip()
+		if comment.startswith("filament_diameter"):
+			filamentValue = comment.split("=", 1)[1].strip()
+			try:
+				self.filamentDiameter = float(filamentValue)
+			except ValueError:
+				try:
+					self.filamentDiameter = float(filamentValue.split(",")[0].strip())
+				except ValueError:
+					self.filamentDiameter = 0.0
+		elif comment.startswith("CURA_PROFILE_STRING") or comment.startswith("CURA_OCTO_PROFILE_STRING"):
+			if comment.startswith("CURA_PROFILE_STRING"):
+				prefix = "CURA_PROFILE_STRING:"
+			else:
+				prefix = "CURA_OCTO_PROFILE_STRING:"
+
+			curaOptions = _parseCuraProfileString(comment, prefix)
+			if "filament_diameter" in curaOptions:
+				try:
+					self.filamentDiameter = float(curaOptions["filament_diameter"])
+				except:
+					self.filamentDiameter = 0.0
+		return line[0:line.find(";")]
+
+
+_rowNumber = "([-+]?(?:[0-9]+\\.?[0-9]*|\\.[0-9]+))"
+_rowPattern = re.compile("^(?:[ \\t]*(?:G{num}|M{num}|T{num}|X{num}|Y{num}|Z{num}|E{num}|F{num}|S{num}|P{num}|[^ \\t\\n]+))*[ \\t]*$".format(num=_rowNumber), re.MULTILINE)
+"""Scanner splitting each line of a chunk into the columns G, M, T, X, Y, Z, E, F, S and P in one pass."""
+
+_commentPattern = re.compile(";[^\\n]*")
+_filamentCommentPattern = re.compile(";[ \\t]*(?:filament_diameter|CURA_PROFILE_STRING|CURA_OCTO_PROFILE_STRING)[^\\n]*")
+
+_G, _M, _T, _X, _Y, _Z, _E, _F = range(8)
+_stateCodes = (4, 20, 21, 28, 90, 91, 92)
+
+
+class NumpyGcodeAnalyzer(GcodeAnalyzer):
+	"""
+	Batch variant of :class:`GcodeAnalyzer` for large files, requires NumPy.
+
+	Each chunk of lines is parsed in one pass into columns of a NumPy array. Consecutive moves are then evaluated
+	vectorized. Lines changing the analysis state otherwise (dwells, homing, positioning and extrusion modes, G92 and
+	tool changes) are rare and are handed to :meth:`GcodeAnalyzer.feed` one by one.
+	"""
+
+	chunkSize = 50000
+
+	plannerClass = NumpyTrapezoidalPlanner
+
+	def feed(self, lines):
+		lines = list(lines)
+		lineCount = self.lineCount
+		byteCount = self.byteCount
+
+		# start line and byte offset of each line in the chunk, for the layer starts
+		lineNumbers = numpy.arange(lineCount, lineCount + len(lines))
+		lineLengths = numpy.fromiter(map(len, lines), dtype=numpy.int64, count=len(lines))
+		lineOffsets = _accumulate(lineLengths, self.byteCount) - lineLengths
+
+		text = "".join(lines)
+		for match in _filamentCommentPattern.finditer(text):
+			self._processComment(match.group(0))
+		if not text.endswith("\n"):
+			text += "\n"
+
+		rows = _rowPattern.findall(_commentPattern.sub("", text))[:len(lines)]
+		columns = numpy.fromstring(" ".join(value or "nan" for row in rows for value in row), sep=" ").reshape(-1, 10)
+
+		G = columns[:, _G]
+		hasG = ~numpy.isnan(G)
+		moves = (G == 0) | (G == 1)
+		stateChanges = (hasG & numpy.in1d(G, _stateCodes)) \
+		               | (~hasG & numpy.in1d(columns[:, _M], (82, 83))) \
+		               | (~hasG & numpy.isnan(columns[:, _M]) & ~numpy.isnan(columns[:, _T]))
+
+		start = 0
+		for index in numpy.flatnonzero(stateChanges):
+			self._feedMoves(columns[start:index][moves[start:index]],
+			                lineNumbers[start:index][moves[start:index]],
+			                lineOffsets[start:index][moves[start:index]],
+			                stop=G[index] in (4, 28))
+
+			GcodeAnalyzer.feed(self, [lines[index]])
+
+			start = index + 1
+		self._feedMoves(columns[start:][moves[start:]], lineNumbers[start:][moves[start:]], lineOffsets[start:][moves[start:]])
+
+		self.lineCount = lineCount + len(lines)
+		self.byteCount = byteCount + int(lineLengths.sum())
+
+	def _feedMoves(self, moves, lineNumbers, lineOffsets, stop=False):
+		if not len(moves):
+			if stop and self.planner is not None:
+				self.planner.stop()
+			return
+
+		x = moves[:, _X]
+		y = moves[:, _Y]
+		z = moves[:, _Z]
+		e = moves[:, _E]
+
+		scale = self.scale
+		posX, posY, posZ = self.position
+		if self.absolutePosition:
+			offsetX, offsetY, offsetZ = self.positionOffset
+			newX = _forwardFill(x * scale + offsetX, posX)
+			newY = _forwardFill(y * scale + offsetY, posY)
+			newZ = _forwardFill(z * scale + offsetZ, posZ)
+		else:
+			newX = _accumulate(numpy.nan_to_num(x) * scale, posX)
+			newY = _accumulate(numpy.nan_to_num(y) * scale, posY)
+			newZ = _accumulate(numpy.nan_to_num(z) * scale, posZ)
+		feedRate = _forwardFill(moves[:, _F], self.feedRateXY)
+
+		tool = self.currentExtruder
+		if self.absoluteE:
+			currentE = _forwardFill(e, self.currentE[tool])
+			extrusion = numpy.diff(numpy.concatenate(([self.currentE[tool]], currentE)))
+		else:
+			extrusion = numpy.nan_to_num(e)
+			currentE = _accumulate(extrusion, self.currentE[tool])
+		totalExtrusion = _accumulate(extrusion, self.totalExtrusion[tool])
+
+		diffX = numpy.concatenate(([posX], newX[:-1])) - newX
+		diffY = numpy.concatenate(([posY], newY[:-1])) - newY
+		if self.planner is not None:
+			diffZ = numpy.concatenate(([posZ], newZ[:-1])) - newZ
+			moveTime = self.planner.planArrays(-diffX, -diffY, -diffZ, extrusion, feedRate, stop=stop) / 60.0
+		else:
+			xyzGiven = ~(numpy.isnan(x) & numpy.isnan(y) & numpy.isnan(z))
+			moveTime = numpy.where(xyzGiven,
+			                       numpy.sqrt(diffX * diffX + diffY * diffY) / feedRate,
+			                       numpy.abs(extrusion / feedRate))
+
+		# filament counts towards a layer as far as it increases the maximum extrusion, like for the totals
+		maxExtrusion = numpy.maximum.accumulate(numpy.concatenate(([self.maxExtrusion[tool]], totalExtrusion)))
+		self._addToLayers(newZ, moveTime, extrusion, numpy.diff(maxExtrusion), lineNumbers, lineOffsets)
+
+		self.position = [float(newX[-1]), float(newY[-1]), float(newZ[-1])]
+		self.feedRateXY = float(feedRate[-1])
+		self.currentE[tool] = float(currentE[-1])
+		self.totalExtrusion[tool] = float(totalExtrusion[-1])
+		self.maxExtrusion[tool] = float(maxExtrusion[-1])
+		self.totalMoveTimeMinute = float(_accumulate(moveTime, self.totalMoveTimeMinute)[-1])
+
+	def _addToLayers(self, z, moveTime, extrusion, filament, lineNumbers, lineOffsets):
+		extruding = numpy.flatnonzero(extrusion > 0.0)
+		if len(extruding) and self.layers[-1]["z"] is None:
+			self.layers[-1]["z"] = float(z[extruding[0]])
+
+		extrudingZ = z[extruding]
+		previousZ = numpy.concatenate(([self.layers[-1]["z"]], extrudingZ[:-1]))
+		layerStarts = extruding[extrudingZ != previousZ]
+
+		starts = numpy.zeros(len(z), dtype=int)
+		starts[layerStarts] = 1
+		layerIndex = numpy.cumsum(starts)
+		count = len(layerStarts) + 1
+
+		moveTimes = numpy.bincount(layerIndex, weights=moveTime, minlength=count)
+		filaments = numpy.bincount(layerIndex, weights=filament, minlength=count)
+
+		tool = self.currentExtruder
+		for i in range(count):
+			if i > 0:
+				start = layerStarts[i - 1]
+				self.layers.append(self._newLayer(float(z[start]), int(lineNumbers[start]), int(lineOffsets[start])))
+			layer = self.layers[-1]
+			layer["moveTimeMinute"] += float(moveTimes[i])
+			layer["extrusion"][tool] = layer["extrusion"].get(tool, 0.0) + float(filaments[i])
+
+
+def _forwardFill(values, initial):
+	"""
+	Replaces NaNs in ``values`` by the preceding value, or by ``initial`` if there is none.
+	"""
+	values = numpy.concatenate(([initial], values))
+	index = numpy.where(numpy.isnan(values), 0, numpy.arange(len(values)))
+	numpy.maximum.accumulate(index, out=index)
+	return values[index][1:]
+
+
+def _accumulate(values, initial):
+	"""
+	Running sum over ``values`` starting at ``initial``, summed up in order like a loop would.
+	"""
+	return numpy.cumsum(numpy.concatenate(([initial], values)))[1:]
+
+
+def _parseCuraProfileString(comment, prefix):
+	return {key: value for (key, value) in map(lambda x: x.split("=", 1), zlib.decompress(base64.b64decode(comment[len(prefix):])).split("\b"))}
 
 
 def getCodeInt(line, code):
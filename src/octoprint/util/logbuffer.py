@@ -0,0 +1,181 @@
+# coding=utf-8
+from __future__ import absolute_import
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import itertools
+import logging
+import re
+import threading
+
+
+class LogBuffer(object):
+	"""
+	Ring buffer holding the last ``size`` lines of the communication log.
+
+	Appending a line is O(1) and doesn't take any locks, so the communication thread is never held up by the
+	consumers of the log. Every appended line gets a sequence number, consumers read the buffer at their own pace
+	through a :class:`LogCursor` remembering the sequence number up to which they have read. A consumer that falls
+	further than ``size`` lines behind loses the overwritten lines, which is reported by its cursor.
+
+	Lock free here means relying on the interpreter lock for the atomicity of drawing the next sequence number and of
+	storing or fetching a single list item. Every slot holds its line together with the line's sequence number, so
+	readers can tell whether the line they expect has already been written or has been overwritten meanwhile.
+	"""
+
+	def __init__(self, size):
+		if size <= 0:
+			raise ValueError("size must be positive")
+		self._size = size
+		self._entries = [(-1, None)] * size
+		self._counter = itertools.count()
+
+		# only a hint for the readers, concurrent appends may publish their sequence numbers out of order
+		self._next = 0
+
+	def append(self, line):
+		sequence = next(self._counter)
+		self._entries[sequence % self._size] = (sequence, line)
+		self._next = sequence + 1
+
+	def getSize(self):
+		return self._size
+
+	def getSequence(self):
+		"""
+		Returns the sequence number the next appended line will get, changes whenever lines are appended.
+		"""
+		return self._next
+
+	def tail(self, count):
+		"""
+		Returns the last ``count`` lines still held by the buffer.
+		"""
+		end = self._next
+		lines, _, _ = self._read(max(0, end - count), end)
+		return lines
+
+	def cursor(self, backlog=0):
+		"""
+		Creates a new :class:`LogCursor` on the buffer, positioned such that its first read returns the last
+		``backlog`` lines followed by anything appended later.
+		"""
+		return LogCursor(self, max(0, self._next - backlog))
+
+	def _read(self, position, end, limit=None, filter=None):
+		dropped = 0
+		if end - position > self._size:
+			dropped += end - self._size - position
+			position = end - self._size
+
+		lines = []
+		while position < end and (limit is None or len(lines) < limit):
+			sequence, line = self._entries[position % self._size]
+			if sequence < position:
+				# not written yet, will be picked up by the next read
+				break
+			elif sequence > position:
+				# overwritten while reading, continue with the oldest line still available
+				oldest = max(position + 1, sequence - self._size + 1)
+				dropped += oldest - position
+				position = oldest
+				continue
+
+			position += 1
+			if filter is not None and filter.search(line):
+				continue
+			lines.append(line)
+
+		return lines, position, dropped
+
+
+class LogCursor(object):
+	"""
+	Read position of a single consumer in a :class:`LogBuffer`.
+
+	Lines matching the cursor's filter (see :meth:`setFilter`) are skipped while reading. Lines the consumer missed
+	because they were overwritten before it got to read them are counted instead.
+	"""
+
+	def __init__(self, buffer, position):
+		self._buffer = buffer
+		self._position = position
+		self._filter = None
+		self._dropped = 0
+		self._mutex = threading.Lock()
+
+	def read(self, limit=None):
+		"""
+		Returns a tuple of the lines appended since the last read (at most ``limit`` if given) and the number of lines
+		dropped meanwhile.
+		"""
+		with self._mutex:
+			lines, self._position, dropped = self._buffer._read(self._position, self._buffer.getSequence(), limit=limit, filter=self._filter)
+			self._dropped += dropped
+			return lines, dropped
+
+	def setFilter(self, filter):
+		"""
+		Sets the compiled regular expression for lines to skip, ``None`` to not skip any lines.
+		"""
+		self._filter = filter
+
+	def getDropped(self):
+		"""
+		Returns the total number of lines dropped since the cursor was created.
+		"""
+		return self._dropped
+
+	def getLag(self):
+		"""
+		Returns how many lines have been appended that the cursor hasn't read yet.
+		"""
+		return max(0, self._buffer.getSequence() - self._position)
+
+
+def compileFilters(regexes):
+	"""
+	Compiles the given regular expressions into one matching any of them, returns ``None`` for no expressions.
+	"""
+	regexes = [regex for regex in regexes if regex]
+	if not regexes:
+		return None
+	return re.compile("|".join("(?:%s)" % regex for regex in regexes))
+
+
+class LogForwarder(object):
+	"""
+	Forwards the lines of a :class:`LogBuffer` to ``logger`` on a background thread, checking for new lines every
+	``interval`` seconds. Lines are only forwarded while the logger is enabled for ``DEBUG``, otherwise they are
+	skipped.
+	"""
+
+	def __init__(self, buffer, logger, interval=0.1):
+		self._cursor = buffer.cursor()
+		self._logger = logger
+		self._interval = interval
+		self._stopped = threading.Event()
+
+		self._worker = threading.Thread(target=self._work, name="LogForwarder")
+		self._worker.daemon = True
+		self._worker.start()
+
+	def stop(self):
+		self._stopped.set()
+
+	def flush(self):
+		lines, dropped = self._cursor.read()
+		if not self._logger.isEnabledFor(logging.DEBUG):
+			return
+
+		if dropped:
+			self._logger.debug("[%d lines dropped]" % dropped)
+		for line in lines:
+			self._logger.debug(line)
+
+	def _work(self):
+		while not self._stopped.wait(self._interval):
+			self.flush()
+		self.flush()
@@ -0,0 +1,235 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import math
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+_infinity = float("inf")
+
+
+class TrapezoidalPlanner(object):
+	"""
+	Model of the motion planner of a Marlin like firmware, to estimate the time moves take including acceleration.
+
+	Moves are handed to :meth:`plan` in batches of segments ``(dx, dy, dz, de, feedrate)`` (in mm and mm/min). Each
+	segment gets a trapezoidal velocity profile: accelerating from its entry speed, cruising at its feedrate and
+	decelerating to its exit speed, limited by the acceleration for printing, travel and retraction moves from the
+	printer profile's ``planner`` settings. The speed at each junction between two segments is limited by the jerk per
+	axis, i.e. the change in speed each axis may undergo instantly. Like the firmware's lookahead, each batch is
+	planned backwards and forwards so that every segment can decelerate in time for the following ones.
+
+	Between batches only the speed and direction at the end of the previous batch are kept, after :meth:`stop` (e.g.
+	on a dwell or homing) the next move starts from standstill.
+	"""
+
+	def __init__(self, printer_profile):
+		planner = printer_profile["planner"]
+		self.acceleration = float(planner["acceleration"])
+		self.travelAcceleration = float(planner["travelAcceleration"])
+		self.retractAcceleration = float(planner["retractAcceleration"])
+		self.jerk = tuple(float(planner["jerk"][axis]) for axis in ("x", "y", "z", "e"))
+
+		# direction and nominal speed of the last segment and its exit speed (squared), standstill initially
+		self.direction = (0.0, 0.0, 0.0, 0.0)
+		self.speed = _infinity
+		self.exitSquared = _infinity
+
+	def plan(self, segments, stop=False):
+		"""
+		Plans ``segments`` following the previously planned ones and returns the time each one takes, in seconds.
+		If ``stop`` is set, the printer comes to a standstill after the last segment.
+		"""
+
+		sqrt = math.sqrt
+		jerk = self.jerk
+
+		lengths = []
+		speeds = []
+		accelerations = []
+		directions = []
+		times = [0.0] * len(segments)
+		indices = []
+		for index, (dx, dy, dz, de, feedrate) in enumerate(segments):
+			length = sqrt(dx * dx + dy * dy + dz * dz)
+			if length:
+				acceleration = self.acceleration if de else self.travelAcceleration
+			else:
+				length = abs(de)
+				acceleration = self.retractAcceleration
+				if not length:
+					continue
+
+			lengths.append(length)
+			speeds.append(feedrate / 60.0)
+			accelerations.append(acceleration)
+			directions.append((dx / length, dy / length, dz / length, de / length))
+			indices.append(index)
+
+		if not lengths:
+			if stop:
+				self.stop()
+			return times
+
+		# limits of the squared speed at the junctions before each segment and after the last one
+		limits = []
+		previousDirection = self.direction
+		previousSpeed = self.speed
+		for direction, speed in zip(directions, speeds):
+			limit = min(_junctionLimit(previousDirection, direction, jerk), previousSpeed, speed)
+			limits.append(limit * limit)
+			previousDirection = direction
+			previousSpeed = speed
+		limits[0] = min(limits[0], self.exitSquared)
+		if stop:
+			limit = min(_junctionLimit(previousDirection, (0.0, 0.0, 0.0, 0.0), jerk), previousSpeed)
+		else:
+			limit = previousSpeed
+		limits.append(limit * limit)
+
+		# backward pass: every segment has to be able to decelerate to the entry speed of the following one
+		count = len(lengths)
+		squared = limits
+		for i in range(count - 1, -1, -1):
+			reachable = squared[i + 1] + 2.0 * accelerations[i] * lengths[i]
+			if reachable < squared[i]:
+				squared[i] = reachable
+
+		# forward pass: every segment has to be able to accelerate to its exit speed
+		for i in range(count):
+			reachable = squared[i] + 2.0 * accelerations[i] * lengths[i]
+			if reachable < squared[i + 1]:
+				squared[i + 1] = reachable
+
+		for i in range(count):
+			times[indices[i]] = _trapezoidTime(lengths[i], speeds[i], accelerations[i], squared[i], squared[i + 1])
+
+		if stop:
+			self.stop()
+		else:
+			self.direction = directions[-1]
+			self.speed = speeds[-1]
+			self.exitSquared = squared[-1]
+		return times
+
+	def stop(self):
+		self.direction = (0.0, 0.0, 0.0, 0.0)
+		self.speed = _infinity
+		self.exitSquared = _infinity
+
+
+def _junctionLimit(previousDirection, direction, jerk):
+	"""
+	Maximum speed at which the direction may change from ``previousDirection`` to ``direction`` without exceeding the
+	``jerk`` on any axis.
+	"""
+	limit = _infinity
+	for previous, current, axisJerk in zip(previousDirection, direction, jerk):
+		change = abs(current - previous)
+		if change * limit > axisJerk:
+			limit = axisJerk / change
+	return limit
+
+
+def _trapezoidTime(length, speed, acceleration, entrySquared, exitSquared):
+	speedSquared = speed * speed
+	entry = math.sqrt(entrySquared)
+	exit = math.sqrt(exitSquared)
+
+	cruise = length - (2.0 * speedSquared - entrySquared - exitSquared) / (2.0 * acceleration)
+	if cruise >= 0.0:
+		return (2.0 * speed - entry - exit) / acceleration + cruise / speed
+
+	# speed is never reached, accelerate up to the peak speed and decelerate from there right away
+	peak = math.sqrt(max((2.0 * acceleration * length + entrySquared + exitSquared) / 2.0, entrySquared, exitSquared))
+	return (2.0 * peak - entry - exit) / acceleration
+
+
+class NumpyTrapezoidalPlanner(TrapezoidalPlanner):
+	"""
+	Vectorized variant of :class:`TrapezoidalPlanner`, requires NumPy.
+
+	:meth:`planArrays` takes the segments as arrays. The backward and forward passes are evaluated as running minima
+	over the cumulative sum of ``2 * acceleration * length`` instead of a loop over the segments.
+	"""
+
+	def plan(self, segments, stop=False):
+		if not len(segments):
+			if stop:
+				self.stop()
+			return []
+
+		columns = numpy.array(segments, dtype=float)
+		return list(self.planArrays(columns[:, 0], columns[:, 1], columns[:, 2], columns[:, 3], columns[:, 4], stop=stop))
+
+	def planArrays(self, dx, dy, dz, de, feedrate, stop=False):
+		"""
+		Like :meth:`plan`, but with the segments given as arrays of ``dx``, ``dy``, ``dz``, ``de`` and ``feedrate``.
+		"""
+
+		times = numpy.zeros(len(dx))
+
+		xyzLength = numpy.sqrt(dx * dx + dy * dy + dz * dz)
+		lengths = numpy.where(xyzLength > 0.0, xyzLength, numpy.abs(de))
+		valid = numpy.flatnonzero(lengths > 0.0)
+		if not len(valid):
+			if stop:
+				self.stop()
+			return times
+
+		lengths = lengths[valid]
+		speeds = feedrate[valid] / 60.0
+		accelerations = numpy.where(xyzLength[valid] > 0.0,
+		                            numpy.where(de[valid] != 0.0, self.acceleration, self.travelAcceleration),
+		                            self.retractAcceleration)
+		directions = numpy.column_stack((dx[valid], dy[valid], dz[valid], de[valid])) / lengths[:, None]
+
+		# limits of the squared speed at the junctions before each segment and after the last one
+		if stop:
+			following = numpy.zeros((1, 4))
+		else:
+			following = directions[-1:]
+		changes = numpy.abs(numpy.diff(numpy.vstack(([self.direction], directions, following)), axis=0))
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			junctionLimits = numpy.min(numpy.where(changes > 0.0, numpy.array(self.jerk) / changes, _infinity), axis=1)
+		limits = numpy.minimum(junctionLimits,
+		                       numpy.minimum(numpy.concatenate(([self.speed], speeds)), numpy.concatenate((speeds, [speeds[-1]]))))
+		limits = limits * limits
+		limits[0] = min(limits[0], self.exitSquared)
+
+		# backward pass w[i] = min(limit[i], w[i+1] + d[i]) and forward pass w[i+1] = min(w[i+1], w[i] + d[i]), with
+		# d = 2 * acceleration * length, as running minima over the cumulative sum of d
+		distances = numpy.concatenate(([0.0], numpy.cumsum(2.0 * accelerations * lengths)))
+		squared = numpy.minimum.accumulate((limits + distances)[::-1])[::-1] - distances
+		squared = numpy.minimum.accumulate(squared - distances) + distances
+		squared = numpy.maximum(squared, 0.0)
+
+		entrySquared = squared[:-1]
+		exitSquared = squared[1:]
+		entry = numpy.sqrt(entrySquared)
+		exit = numpy.sqrt(exitSquared)
+
+		speedsSquared = speeds * speeds
+		cruise = lengths - (2.0 * speedsSquared - entrySquared - exitSquared) / (2.0 * accelerations)
+		peak = numpy.sqrt(numpy.maximum((2.0 * accelerations * lengths + entrySquared + exitSquared) / 2.0,
+		                                numpy.maximum(entrySquared, exitSquared)))
+		times[valid] = numpy.where(cruise >= 0.0,
+		                           (2.0 * speeds - entry - exit) / accelerations + numpy.maximum(cruise, 0.0) / speeds,
+		                           (2.0 * peak - entry - exit) / accelerations)
+
+		if stop:
+			self.stop()
+		else:
+			self.direction = tuple(float(value) for value in directions[-1])
+			self.speed = float(speeds[-1])
+			self.exitSquared = float(squared[-1])
+		return times
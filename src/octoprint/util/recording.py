@@ -0,0 +1,187 @@
+# coding=utf-8
+from __future__ import absolute_import
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import threading
+import time
+
+
+RECEIVED = "<"
+SENT = ">"
+
+HEADER = "# OctoPrint serial recording, version 1\n"
+
+
+class SerialRecorder(object):
+	"""
+	Records the traffic on the serial port to ``path``, one line per event::
+
+	    <seconds since start>\\t<direction>\\t<data>
+
+	with direction being ``<`` for received and ``>`` for sent data and the data escaped via ``string_escape``. Read
+	timeouts are recorded as received empty lines, so that a replay through :class:`ReplaySerial` encounters them at
+	the same point.
+	"""
+
+	def __init__(self, path):
+		self._path = path
+		self._file = open(path, "wb")
+		self._file.write(HEADER)
+		self._start = time.time()
+		self._mutex = threading.Lock()
+
+	def getPath(self):
+		return self._path
+
+	def received(self, data):
+		self._record(RECEIVED, data)
+
+	def sent(self, data):
+		self._record(SENT, data)
+
+	def close(self):
+		with self._mutex:
+			if self._file is not None:
+				self._file.close()
+				self._file = None
+
+	def _record(self, direction, data):
+		with self._mutex:
+			if self._file is None:
+				return
+			self._file.write("%.6f\t%s\t%s\n" % (time.time() - self._start, direction, data.encode("string_escape")))
+
+
+def loadRecording(path):
+	"""
+	Reads a recording made by :class:`SerialRecorder` and returns its events as a list of tuples ``(time, direction,
+	data)``.
+	"""
+	events = []
+	with open(path, "rb") as f:
+		for line in f:
+			if line.startswith("#"):
+				continue
+			line = line.rstrip("\n")
+			if not line:
+				continue
+			timestamp, direction, data = line.split("\t", 2)
+			events.append((float(timestamp), direction, data.decode("string_escape")))
+	return events
+
+
+class ReplaySerial(object):
+	"""
+	Stands in for the serial port, playing back the received lines of a recording as returned by
+	:func:`loadRecording`.
+
+	Every received line is only handed out once as many lines have been written as had been sent before it was
+	received during recording, so the replay stays in step with the communication layer reading from it. With
+	``realtime`` set, lines are furthermore not handed out before the time at which they were originally received,
+	otherwise the recording is played back as fast as the reader can keep up with it.
+
+	If the expected writes don't happen within ``stallTimeout`` seconds, the replay has diverged from the recording
+	and the line is handed out anyway. Once the recording is exhausted, :meth:`readline` behaves like a serial port
+	without anything to read, or with ``closeAtEnd`` set raises an :class:`IOError` like a disconnected one, which
+	ends the communication. Written lines differing from the recorded ones are counted, see :meth:`getStats`.
+	"""
+
+	def __init__(self, events, realtime=False, stallTimeout=5.0, closeAtEnd=False):
+		self._received = []
+		self._sent = []
+		for timestamp, direction, data in events:
+			if direction == RECEIVED:
+				self._received.append((timestamp, len(self._sent), data))
+			elif direction == SENT:
+				self._sent.append(data)
+
+		self._realtime = realtime
+		self._stallTimeout = stallTimeout
+		self._closeAtEnd = closeAtEnd
+
+		self._condition = threading.Condition()
+		self._position = 0
+		self._written = 0
+		self._mismatches = 0
+		self._stalls = 0
+		self._closed = False
+		self._start = None
+
+		self.timeout = 1.0
+		self.baudrate = None
+
+	def readline(self):
+		with self._condition:
+			if self._start is None:
+				self._start = time.time()
+
+			if self._position >= len(self._received):
+				if self._closeAtEnd:
+					raise IOError("End of replay")
+				self._wait(self.timeout)
+				return ""
+
+			timestamp, writes, data = self._received[self._position]
+
+			if self._written < writes:
+				deadline = time.time() + self._stallTimeout
+				while self._written < writes and not self._closed:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						self._stalls += 1
+						break
+					self._condition.wait(remaining)
+
+			if self._realtime:
+				delay = self._start + timestamp - time.time()
+				if delay > 0:
+					self._wait(delay)
+
+			if self._closed:
+				raise IOError("Replay closed")
+
+			self._position += 1
+			return data
+
+	def write(self, data):
+		with self._condition:
+			if self._closed:
+				raise IOError("Replay closed")
+
+			if self._written >= len(self._sent) or self._sent[self._written] != data:
+				self._mismatches += 1
+			self._written += 1
+			self._condition.notify_all()
+
+	def close(self):
+		with self._condition:
+			self._closed = True
+			self._condition.notify_all()
+
+	def isDone(self):
+		return self._position >= len(self._received)
+
+	def getStats(self):
+		"""
+		Returns how many of the recorded lines have been received and written, how many written lines differed from
+		the recording and how often the replay had to give up waiting for writes.
+		"""
+		with self._condition:
+			return {
+				"received": self._position,
+				"written": self._written,
+				"mismatches": self._mismatches,
+				"stalls": self._stalls
+			}
+
+	def _wait(self, duration):
+		# to be called while holding the condition
+		deadline = time.time() + duration
+		while not self._closed:
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				break
+			self._condition.wait(remaining)
@@ -0,0 +1,160 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import Queue as queue
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+
+from octoprint.filemanager.analysis import AnalysisQueue, AbstractAnalysisQueue, AnalysisProcess, QueueEntry
+from octoprint.util.gcodeInterpreter import AnalysisAborted
+
+
+class AnalysisQueueTest(unittest.TestCase):
+
+	def setUp(self):
+		self.queue = AnalysisQueue()
+		self.gcode_queue = mock.MagicMock()
+		self.queue._queues = dict(gcode=self.gcode_queue)
+
+	def test_pause_resume(self):
+		self.queue.pause()
+		self.assertTrue(self.queue.is_paused())
+		self.gcode_queue.pause.assert_called_once_with()
+
+		self.queue.resume()
+		self.assertFalse(self.queue.is_paused())
+		self.gcode_queue.resume.assert_called_once_with()
+
+	def test_pause_nested(self):
+		# two printers printing at the same time
+		self.queue.pause()
+		self.queue.pause()
+		self.assertEquals(1, self.gcode_queue.pause.call_count)
+
+		self.queue.resume()
+		self.assertTrue(self.queue.is_paused())
+		self.assertFalse(self.gcode_queue.resume.called)
+
+		self.queue.resume()
+		self.assertFalse(self.queue.is_paused())
+		self.assertEquals(1, self.gcode_queue.resume.call_count)
+
+	def test_resume_unpaused(self):
+		self.queue.resume()
+		self.assertFalse(self.queue.is_paused())
+		self.assertFalse(self.gcode_queue.resume.called)
+
+
+class BlockingAnalysisQueue(AbstractAnalysisQueue):
+	"""
+	Analysis returning the pid of the analysing process, the analysis of "blocking" only finishes if aborted the first
+	time, providing a checkpoint to resume from.
+	"""
+
+	def __init__(self, finished_callback, processes=0):
+		self._attempts = 0
+		self._aborted = threading.Event()
+		AbstractAnalysisQueue.__init__(self, finished_callback, processes=processes)
+
+	def _do_analysis(self, entry, checkpoint=None):
+		self._attempts += 1
+		if entry.path == "blocking" and self._attempts == 1:
+			self._aborted.wait(10)
+			raise AnalysisAborted(checkpoint=dict(position=42))
+		return dict(pid=os.getpid(), attempts=self._attempts, checkpoint=checkpoint)
+
+	def _do_abort(self):
+		self._aborted.set()
+
+
+class AnalysisProcessesTest(unittest.TestCase):
+
+	processes = 2
+
+	def setUp(self):
+		self.event_manager_patcher = mock.patch("octoprint.filemanager.analysis.eventManager")
+		self.event_manager_patcher.start()
+
+		handle, self.path = tempfile.mkstemp()
+		os.close(handle)
+
+		self.results = queue.Queue()
+		self.queue = BlockingAnalysisQueue(lambda entry, result: self.results.put((entry.path, result)), processes=self.processes)
+
+	def tearDown(self):
+		self.event_manager_patcher.stop()
+		os.remove(self.path)
+
+	def entry(self, path):
+		return QueueEntry(path, "gcode", "local", self.path, None)
+
+	def test_parallel(self):
+		self.queue.enqueue(self.entry("blocking"))
+		self.queue.enqueue(self.entry("other"))
+
+		# "other" gets analysed while "blocking" still blocks the first process
+		path, result = self.results.get(timeout=5)
+		self.assertEquals("other", path)
+		self.assertNotEquals(os.getpid(), result["pid"])
+
+	def test_pause_resume(self):
+		self.queue.enqueue(self.entry("blocking"))
+		self.queue.enqueue(self.entry("other"))
+		self.results.get(timeout=5)
+
+		self.queue.pause()
+		self.assertRaises(queue.Empty, self.results.get, timeout=0.5)
+
+		self.queue.resume()
+		path, result = self.results.get(timeout=5)
+		self.assertEquals("blocking", path)
+		self.assertEquals(2, result["attempts"])
+		self.assertEquals(dict(position=42), result["checkpoint"])
+
+
+@unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc")
+class AnalysisProcessTest(unittest.TestCase):
+
+	def test_inherited_files_released(self):
+		handle, path = tempfile.mkstemp()
+		try:
+			# the "analysis" tells where the inherited file descriptor points to in the worker
+			process = AnalysisProcess(lambda entry, checkpoint=None: os.readlink("/proc/self/fd/%d" % entry), None)
+			process.start()
+			self.assertEquals(os.devnull, process.analyze(handle))
+		finally:
+			os.close(handle)
+			os.remove(path)
+
+
+class AnalysisThreadTest(AnalysisProcessesTest):
+
+	processes = 0
+
+	def test_parallel(self):
+		# only one analysis at a time without processes
+		pass
+
+	def test_pause_resume(self):
+		self.queue.enqueue(self.entry("blocking"))
+		while not self.queue._current:
+			time.sleep(0.01)
+
+		self.queue.pause()
+		self.assertRaises(queue.Empty, self.results.get, timeout=0.5)
+
+		self.queue.resume()
+		path, result = self.results.get(timeout=5)
+		self.assertEquals("blocking", path)
+		self.assertEquals(os.getpid(), result["pid"])
+		self.assertEquals(dict(position=42), result["checkpoint"])
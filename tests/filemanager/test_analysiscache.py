@@ -0,0 +1,66 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint.filemanager.analysiscache import AnalysisCache
+
+
+KEY_DATA = dict(type="gcode", version=1, speed=[6000, 6000], offsets=[[0.0, 0.0]])
+RESULT = dict(estimatedPrintTime=3803.9, filament=dict(tool0=dict(length=1407.4, volume=8.9)))
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.cache = AnalysisCache(self.folder, max_entries=2)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_get_set(self):
+		self.assertIsNone(self.cache.get("abc", KEY_DATA))
+
+		self.cache.set("abc", KEY_DATA, RESULT)
+		self.assertEquals(RESULT, self.cache.get("abc", KEY_DATA))
+
+		# same content analysed against another printer profile
+		other_key_data = dict(KEY_DATA)
+		other_key_data["speed"] = [3000, 3000]
+		self.assertIsNone(self.cache.get("abc", other_key_data))
+		self.assertIsNone(self.cache.get("def", KEY_DATA))
+
+	def test_key_data_order(self):
+		self.cache.set("abc", KEY_DATA, RESULT)
+		self.assertEquals(RESULT, self.cache.get("abc", dict(reversed(list(KEY_DATA.items())))))
+
+	def test_eviction(self):
+		for i, file_hash in enumerate(("first", "second", "third")):
+			self.cache.set(file_hash, KEY_DATA, RESULT)
+			# make sure modification times differ
+			for entry in os.listdir(self.folder):
+				if entry.startswith(file_hash):
+					os.utime(os.path.join(self.folder, entry), (1000 + i, 1000 + i))
+
+		self.assertIsNone(self.cache.get("first", KEY_DATA))
+		self.assertEquals(RESULT, self.cache.get("second", KEY_DATA))
+		self.assertEquals(RESULT, self.cache.get("third", KEY_DATA))
+		self.assertEquals(2, len(os.listdir(self.folder)))
+
+	def test_unreadable(self):
+		self.cache.set("abc", KEY_DATA, RESULT)
+		path = os.path.join(self.folder, os.listdir(self.folder)[0])
+		with open(path, "w") as f:
+			f.write("{not json")
+
+		self.assertIsNone(self.cache.get("abc", KEY_DATA))
+		self.assertFalse(os.path.exists(path))
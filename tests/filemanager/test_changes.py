@@ -0,0 +1,64 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import unittest
+
+from octoprint.filemanager.changes import ChangeJournal
+
+
+class ChangeJournalTest(unittest.TestCase):
+
+	def setUp(self):
+		self.journal = ChangeJournal(max_removed=2)
+
+	def test_since(self):
+		self.journal.changed("a.gcode")
+		revision = self.journal.revision
+
+		self.journal.changed("b.gcode")
+		self.journal.changed("folder/c.gcode")
+		self.journal.removed("a.gcode")
+
+		changed, removed = self.journal.since(revision)
+		self.assertEquals(["b.gcode", "folder/c.gcode"], sorted(changed))
+		self.assertEquals(["a.gcode"], removed)
+
+		self.assertEquals(([], []), self.journal.since(self.journal.revision))
+
+	def test_readded(self):
+		self.journal.removed("a.gcode")
+		revision = self.journal.revision
+
+		self.journal.changed("a.gcode")
+		self.assertEquals((["a.gcode"], []), self.journal.since(revision))
+
+	def test_removed_folder(self):
+		revision = self.journal.revision
+		self.journal.changed("folder/a.gcode")
+		self.journal.removed("folder")
+
+		self.assertEquals(([], ["folder"]), self.journal.since(revision))
+
+	def test_invalid_tokens(self):
+		self.assertIsNone(self.journal.since(None))
+		self.assertIsNone(self.journal.since("garbage"))
+		self.assertIsNone(self.journal.since(ChangeJournal().revision))
+
+		# future revisions are unknown as well
+		epoch = self.journal.revision.rsplit("-", 1)[0]
+		self.assertIsNone(self.journal.since(epoch + "-10"))
+
+	def test_forgotten_removals(self):
+		revision = self.journal.revision
+		self.journal.removed("a.gcode")
+		self.journal.removed("b.gcode")
+		self.assertEquals(([], ["a.gcode", "b.gcode"]), self.journal.since(revision))
+
+		# a third removal pushes the first one out, changes since before it are unknown now
+		self.journal.removed("c.gcode")
+		self.assertIsNone(self.journal.since(revision))
@@ -0,0 +1,84 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint.filemanager.fileindex import FileIndex
+
+
+class FileIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = tempfile.mkdtemp()
+		self._write("test.gcode", "G28\n")
+		self._write("unsupported.txt", "text")
+		self._write(".hidden.gcode", "G28\n")
+		os.mkdir(os.path.join(self.basefolder, "sub"))
+		self._write(os.path.join("sub", "test.stl"), "solid")
+
+		self.index = FileIndex(self.basefolder)
+
+	def tearDown(self):
+		shutil.rmtree(self.basefolder)
+
+	def test_build(self):
+		self.assertEquals(sorted([self._path("test.gcode"), self._path(os.path.join("sub", "test.stl"))]),
+		                  sorted(self.index.build()))
+
+		entries = dict(self.index.entries(self.basefolder))
+		self.assertEquals(["sub", "test.gcode"], sorted(entries.keys()))
+		self.assertEquals("folder", entries["sub"].type)
+		self.assertEquals("machinecode", entries["test.gcode"].type)
+		self.assertEquals(4, entries["test.gcode"].size)
+
+		self.assertEquals(["test.stl"], [name for name, _ in self.index.entries(self._path("sub"))])
+
+	def test_update_file(self):
+		self.index.build()
+
+		# unchanged
+		self.assertEquals([], self.index.update(self._path("test.gcode")))
+
+		# changed
+		self._write("test.gcode", "G28\nG1 X10\n")
+		self.assertEquals([self._path("test.gcode")], self.index.update(self._path("test.gcode")))
+		self.assertEquals(11, dict(self.index.entries(self.basefolder))["test.gcode"].size)
+
+		# removed
+		os.remove(self._path("test.gcode"))
+		self.assertEquals([], self.index.update(self._path("test.gcode")))
+		self.assertFalse("test.gcode" in dict(self.index.entries(self.basefolder)))
+
+	def test_update_new_folder(self):
+		self.index.build()
+
+		os.makedirs(self._path(os.path.join("new", "nested")))
+		self._write(os.path.join("new", "nested", "test.gcode"), "G28\n")
+
+		# an update for the file also indexes the folders containing it
+		self.assertEquals([self._path(os.path.join("new", "nested", "test.gcode"))],
+		                  self.index.update(self._path(os.path.join("new", "nested", "test.gcode"))))
+		self.assertTrue("new" in dict(self.index.entries(self.basefolder)))
+		self.assertEquals(["test.gcode"], [name for name, _ in self.index.entries(self._path(os.path.join("new", "nested")))])
+
+	def test_remove_folder(self):
+		self.index.build()
+
+		self.index.remove(self._path("sub"))
+		self.assertFalse("sub" in dict(self.index.entries(self.basefolder)))
+		self.assertFalse(self._path("sub") in self.index.folders())
+
+	def _path(self, name):
+		return os.path.join(self.basefolder, name)
+
+	def _write(self, name, contents):
+		with open(self._path(name), "w") as f:
+			f.write(contents)
@@ -10,6 +10,7 @@ import unittest
 import mock
 
 import octoprint.filemanager
+from octoprint.filemanager.hashing import completed_future
 
 class FileManagerTest(unittest.TestCase):
 
@@ -55,9 +56,67 @@ class FileManagerTest(unittest.TestCase):
 		file_path = self.file_manager.add_file(octoprint.filemanager.FileDestinations.LOCAL, "test.file", wrapper)
 
 		self.assertEquals(("", "test.file"), file_path)
-		self.local_storage.add_file.assert_called_once_with("test.file", wrapper, printer_profile=test_profile, allow_overwrite=False, links=None)
+		self.local_storage.add_file.assert_called_once_with("test.file", wrapper, printer_profile=test_profile, allow_overwrite=False, links=None, file_hash=None)
 		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
 
+	def test_add_file_cached_analysis(self):
+		self.file_manager._analysis_cache = mock.MagicMock()
+		self.file_manager._analysis_cache.get.return_value = dict(estimatedPrintTime=10)
+
+		self.local_storage.add_file.return_value = "test.gcode"
+		self.local_storage.get_absolute_path.return_value = "prefix/test.gcode"
+		self.local_storage.get_metadata.return_value = dict(hash="abc")
+		self.local_storage.get_hash.return_value = completed_future("abc")
+		self.analysis_queue.get_cache_key_data.return_value = dict(version=1)
+
+		self.file_manager.add_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", object())
+
+		self.file_manager._analysis_cache.get.assert_called_once_with("abc", dict(version=1))
+		self.assertFalse(self.analysis_queue.enqueue.called)
+		self.local_storage.set_additional_metadata.assert_called_once_with("test.gcode", "analysis", dict(estimatedPrintTime=10))
+		self.fire_event.assert_any_call(octoprint.filemanager.Events.METADATA_ANALYSIS_FINISHED, dict(file="test.gcode", result=dict(estimatedPrintTime=10)))
+
+	def test_add_file_uncached_analysis(self):
+		self.file_manager._analysis_cache = mock.MagicMock()
+		self.file_manager._analysis_cache.get.return_value = None
+
+		self.local_storage.add_file.return_value = "test.gcode"
+		self.local_storage.get_absolute_path.return_value = "prefix/test.gcode"
+		self.local_storage.get_metadata.return_value = dict(hash="abc")
+		self.local_storage.get_hash.return_value = completed_future("abc")
+		self.analysis_queue.get_cache_key_data.return_value = dict(version=1)
+
+		self.file_manager.add_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", object())
+		self.assertEquals(1, self.analysis_queue.enqueue.call_count)
+		entry = self.analysis_queue.enqueue.call_args[0][0]
+
+		self.file_manager._on_analysis_finished(entry, dict(estimatedPrintTime=10))
+		self.local_storage.set_additional_metadata.assert_called_once_with("test.gcode", "analysis", dict(estimatedPrintTime=10))
+		self.file_manager._analysis_cache.set.assert_called_once_with("abc", dict(version=1), result=dict(estimatedPrintTime=10))
+
+	def test_analysis_layer_index(self):
+		layers = [dict(z=0.3, line=0, offset=0, estimatedPrintTime=20.0, filament=dict(tool0=dict(length=5.0)))]
+		entry = octoprint.filemanager.QueueEntry("test.gcode", "gcode", octoprint.filemanager.FileDestinations.LOCAL, "prefix/test.gcode", None)
+
+		self.file_manager._on_analysis_finished(entry, dict(estimatedPrintTime=20.0, layers=layers))
+
+		# the layers only go into the layer index
+		self.local_storage.set_additional_metadata.assert_called_once_with("test.gcode", "analysis", dict(estimatedPrintTime=20.0))
+		self.assertEquals(1, self.local_storage.set_layer_index.call_count)
+		path, layer_index = self.local_storage.set_layer_index.call_args[0]
+		self.assertEquals("test.gcode", path)
+		self.assertEquals(list(octoprint.filemanager.LayerIndex.from_analysis(layers)), list(layer_index))
+
+	def test_job_built_once_hashed(self):
+		self.file_manager._job_cache = mock.MagicMock()
+		self.local_storage.get_absolute_path.return_value = "prefix/test.gcode"
+
+		hashed_callback = self.local_storage.register_hashed_callback.call_args[0][0]
+		hashed_callback("test.gcode", "abc")
+		hashed_callback("test.stl", "def")
+
+		self.file_manager._job_cache.schedule.assert_called_once_with("abc", "prefix/test.gcode")
+
 	def test_remove_file(self):
 		self.file_manager.remove_file(octoprint.filemanager.FileDestinations.LOCAL, "test.file")
 
@@ -116,9 +175,8 @@ class FileManagerTest(unittest.TestCase):
 		temp_file.name = "tmp.file"
 		mocked_tempfile.return_value = temp_file
 
-		# mock metadata on local storage
-		metadata = dict(hash="aabbccddeeff")
-		self.local_storage.get_metadata.return_value = metadata
+		# mock hash on local storage
+		self.local_storage.get_hash.return_value = completed_future("aabbccddeeff")
 
 		# mock printer profile
 		expected_printer_profile = dict(id="_default", name="My Default Profile")
@@ -174,7 +232,7 @@ class FileManagerTest(unittest.TestCase):
 
 		# assert that model links were added
 		expected_links = [("model", dict(name="source.file"))]
-		self.local_storage.add_file.assert_called_once_with("dest.file", mock.ANY, printer_profile=expected_printer_profile, allow_overwrite=True, links=expected_links)
+		self.local_storage.add_file.assert_called_once_with("dest.file", mock.ANY, printer_profile=expected_printer_profile, allow_overwrite=True, links=expected_links, file_hash=None)
 
 		# assert that the generated gcode was manipulated as required
 		expected_open_calls = [mock.call("prefix/dest.file", "w"), mock.call("tmp.file", "r")]
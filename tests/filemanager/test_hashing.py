@@ -0,0 +1,64 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from octoprint.filemanager.hashing import FileHasher
+
+
+class FileHasherTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.path = os.path.join(self.folder, "test.gcode")
+		self._write("G28\n")
+
+		self.hasher = FileHasher(workers=1)
+
+	def tearDown(self):
+		self.hasher.shutdown()
+		shutil.rmtree(self.folder)
+
+	def test_hash(self):
+		self.assertIsNone(self.hasher.cached(self.path))
+		self.assertEquals(hashlib.sha1("G28\n").hexdigest(), self.hasher.hash(self.path).result(timeout=10))
+		self.assertEquals(hashlib.sha1("G28\n").hexdigest(), self.hasher.cached(self.path))
+
+	def test_cached(self):
+		self.hasher.hash(self.path).result(timeout=10)
+
+		with mock.patch("octoprint.filemanager.hashing.create_hash") as create_hash:
+			future = self.hasher.hash(self.path)
+			self.assertTrue(future.done())
+			self.assertEquals(hashlib.sha1("G28\n").hexdigest(), future.result())
+			self.assertFalse(create_hash.called)
+
+	def test_changed(self):
+		self.hasher.hash(self.path).result(timeout=10)
+
+		self._write("G28 X Y\n")
+		os.utime(self.path, (0, 0))
+		self.assertIsNone(self.hasher.cached(self.path))
+		self.assertEquals(hashlib.sha1("G28 X Y\n").hexdigest(), self.hasher.hash(self.path).result(timeout=10))
+
+	def test_remember(self):
+		self.hasher.remember(self.path, "known")
+		self.assertEquals("known", self.hasher.hash(self.path).result(timeout=10))
+
+	def test_missing(self):
+		self.assertRaises(OSError, self.hasher.hash(os.path.join(self.folder, "missing.gcode")).result, timeout=10)
+
+	def _write(self, contents):
+		with open(self.path, "w") as f:
+			f.write(contents)
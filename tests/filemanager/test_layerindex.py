@@ -0,0 +1,74 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import unittest
+
+from ddt import ddt, data, unpack
+
+from octoprint.filemanager.layerindex import LayerIndex, Layer, InvalidLayerIndex
+
+
+ANALYSIS_LAYERS = [
+	dict(z=0.3, line=0, offset=0, estimatedPrintTime=20.0, filament=dict(tool0=dict(length=5.0))),
+	dict(z=0.5, line=120, offset=2400, estimatedPrintTime=30.0, filament=dict(tool0=dict(length=3.0), tool1=dict(length=1.0))),
+	dict(z=0.7, line=250, offset=5000, estimatedPrintTime=10.0, filament=dict())
+]
+
+
+@ddt
+class LayerIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.index = LayerIndex.from_analysis(ANALYSIS_LAYERS)
+
+	def test_from_analysis(self):
+		self.assertEquals(2, self.index.tools)
+		self.assertEquals(60.0, self.index.total_time)
+		self.assertEquals([Layer(0, 0, 0.3, 0.0, (0.0, 0.0)),
+		                   Layer(2400, 120, 0.5, 20.0, (5.0, 0.0)),
+		                   Layer(5000, 250, 0.7, 50.0, (8.0, 1.0))],
+		                  list(self.index))
+
+	def test_roundtrip(self):
+		index = LayerIndex.from_bytes(self.index.to_bytes())
+		self.assertEquals(list(self.index), list(index))
+		self.assertEquals(self.index.total_time, index.total_time)
+		self.assertEquals(self.index.tools, index.tools)
+
+	def test_roundtrip_unknown_z(self):
+		index = LayerIndex.from_bytes(LayerIndex([Layer(0, 0, None, 0.0, (0.0,))]).to_bytes())
+		self.assertIsNone(index[0].z)
+
+	@data((0, 0), (2399, 0), (2400, 1), (4999, 1), (5000, 2), (100000, 2))
+	@unpack
+	def test_layer_at_offset(self, offset, expected):
+		self.assertEquals(expected, self.index.layer_at_offset(offset))
+
+	@data((0, 0), (119, 0), (120, 1), (250, 2), (251, 2))
+	@unpack
+	def test_layer_at_line(self, line, expected):
+		self.assertEquals(expected, self.index.layer_at_line(line))
+
+	@data((0, None, 0.0), (1200, None, 10.0), (2400, None, 20.0), (3700, None, 35.0), (7500, None, 50.0),
+	      (7500, 10000, 55.0), (20000, 10000, 60.0))
+	@unpack
+	def test_time_at_offset(self, offset, end, expected):
+		self.assertAlmostEquals(expected, self.index.time_at_offset(offset, end=end))
+
+	def test_empty(self):
+		index = LayerIndex.from_bytes(LayerIndex().to_bytes())
+		self.assertEquals(0, len(index))
+		self.assertIsNone(index.layer_at_offset(100))
+		self.assertIsNone(index.time_at_offset(100))
+
+	@data("", "OPLX", "garbage that is long enough for a header")
+	def test_invalid(self, data):
+		self.assertRaises(InvalidLayerIndex, LayerIndex.from_bytes, data)
+
+	def test_truncated(self):
+		self.assertRaises(InvalidLayerIndex, LayerIndex.from_bytes, self.index.to_bytes()[:-1])
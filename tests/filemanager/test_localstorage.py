@@ -35,10 +35,13 @@ FILE_CRAZYRADIO_STL = FileWrapper("crazyradio.stl")
 
 class LocalStorageTest(unittest.TestCase):
 
+	metadata_backend = "yaml"
+	metadata_file = ".metadata.yaml"
+
 	def setUp(self):
 		import tempfile
 		self.basefolder = tempfile.mkdtemp()
-		self.storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder)
+		self.storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder, metadata_backend=self.metadata_backend)
 
 	def tearDown(self):
 		import shutil
@@ -99,6 +102,33 @@ class LocalStorageTest(unittest.TestCase):
 		self.assertTrue("hash" in link)
 		self.assertEquals(FILE_BP_CASE_GCODE.hash, link["hash"])
 
+	def test_add_file_with_association_while_hashing(self):
+		import mock
+		import threading
+		from octoprint.filemanager.hashing import create_hash
+
+		hashing = threading.Event()
+		def blocking_create_hash(*args, **kwargs):
+			hashing.wait(10)
+			return create_hash(*args, **kwargs)
+
+		with mock.patch("octoprint.filemanager.hashing.create_hash", side_effect=blocking_create_hash):
+			stl_name = self.storage.add_file("bp_case.stl", FILE_BP_CASE_STL)
+			gcode_name = self.storage.add_file("bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=stl_name))])
+
+			# neither file is hashed yet, adding them didn't wait for it
+			self.assertFalse("hash" in self.storage.get_metadata(stl_name))
+			self.assertFalse("hash" in self.storage.get_metadata(gcode_name))
+
+			hashing.set()
+			self.assertEquals(FILE_BP_CASE_STL.hash, self.storage.get_hash(stl_name).result(timeout=10))
+			self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_hash(gcode_name).result(timeout=10))
+
+		self.assertEquals([dict(rel="model", name=stl_name, hash=FILE_BP_CASE_STL.hash)],
+		                  self.storage.get_metadata(gcode_name)["links"])
+		self.assertEquals([dict(rel="machinecode", name=gcode_name, hash=FILE_BP_CASE_GCODE.hash)],
+		                  self.storage.get_metadata(stl_name)["links"])
+
 	def test_remove_file(self):
 		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
 		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=stl_name))])
@@ -192,6 +222,133 @@ class LocalStorageTest(unittest.TestCase):
 		self.assertEquals("folder", file_list["empty"]["type"])
 		self.assertEquals(0, len(file_list["empty"]["children"]))
 
+	def test_list_from_index(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_folder("content", "content")
+
+		import mock
+		with mock.patch("os.listdir", side_effect=AssertionError("listing touched the file system")), \
+		     mock.patch("os.stat", side_effect=AssertionError("listing touched the file system")):
+			file_list = self.storage.list_files()
+
+		self.assertEquals(["bp_case.gcode", "content"], sorted(file_list.keys()))
+		self.assertEquals(os.path.getsize(FILE_BP_CASE_GCODE.path), file_list["bp_case.gcode"]["size"])
+
+	def test_refresh(self):
+		# files copied into and changed in the base folder from outside
+		FILE_BP_CASE_STL.save(os.path.join(self.basefolder, "external.stl"))
+		self.storage.refresh(os.path.join(self.basefolder, "external.stl"))
+		self.storage.get_hash("external.stl").result(timeout=10)
+
+		file_list = self.storage.list_files()
+		self.assertTrue("external.stl" in file_list)
+		self.assertEquals(FILE_BP_CASE_STL.hash, file_list["external.stl"]["hash"])
+
+		FILE_CRAZYRADIO_STL.save(os.path.join(self.basefolder, "external.stl"))
+		self.storage.refresh(os.path.join(self.basefolder, "external.stl"))
+		self.assertEquals(FILE_CRAZYRADIO_STL.hash, self.storage.get_hash("external.stl").result(timeout=10))
+		self.assertEquals(FILE_CRAZYRADIO_STL.hash, self.storage.get_metadata("external.stl")["hash"])
+
+		os.remove(os.path.join(self.basefolder, "external.stl"))
+		self.storage.refresh(os.path.join(self.basefolder, "external.stl"))
+		self.assertFalse("external.stl" in self.storage.list_files())
+
+	def test_index_built_on_startup(self):
+		FILE_BP_CASE_GCODE.save(os.path.join(self.basefolder, "external.gcode"))
+
+		storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder, metadata_backend=self.metadata_backend)
+		storage.get_hash("external.gcode").result(timeout=10)
+		file_list = storage.list_files()
+		self.assertTrue("external.gcode" in file_list)
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, file_list["external.gcode"]["hash"])
+
+	def test_add_file_same_contents(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.add_history("bp_case.gcode", dict(timestamp=1411979916.422, printTime=3600.0, success=True, printerProfile="_default"))
+
+		# uploading the same contents again keeps the metadata
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, overwrite=True)
+		self.assertEquals(1, len(self.storage.get_metadata("bp_case.gcode")["history"]))
+
+		# other contents start over
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_STL, overwrite=True)
+		self.assertFalse("history" in self.storage.get_metadata("bp_case.gcode"))
+
+	def test_add_file_known_hash(self):
+		import mock
+		with mock.patch("octoprint.filemanager.hashing.create_hash") as create_hash:
+			self.storage.add_file("bp_case.gcode", FILE_BP_CASE_GCODE, file_hash=FILE_BP_CASE_GCODE.hash)
+			self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_hash("bp_case.gcode").result(timeout=10))
+			self.assertFalse(create_hash.called)
+
+	def test_hashed_callback(self):
+		import mock
+		callback = mock.MagicMock()
+		self.storage.register_hashed_callback(callback)
+
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		callback.assert_called_once_with("bp_case.gcode", FILE_BP_CASE_GCODE.hash)
+
+		# same contents, same hash
+		callback.reset_mock()
+		self.storage.refresh(os.path.join(self.basefolder, "bp_case.gcode"))
+		self.storage.get_hash("bp_case.gcode").result(timeout=10)
+		self.assertFalse(callback.called)
+
+	def test_changes(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+		self._add_folder("content", "content")
+
+		revision = self.storage.get_revision()
+		self.assertEquals(([], []), self.storage.get_changes(revision))
+
+		self.storage.add_history("bp_case.gcode", dict(timestamp=1411979916.422, printTime=3600.0, success=True, printerProfile="_default"))
+		self.storage.remove_file("bp_case.stl")
+		self.storage.remove_folder("content")
+
+		changed, removed = self.storage.get_changes(revision)
+		self.assertEquals(["bp_case.gcode"], changed)
+		self.assertEquals(["bp_case.stl", "content"], sorted(removed))
+		self.assertNotEquals(revision, self.storage.get_revision())
+
+		# tokens of another storage instance are unknown
+		self.assertIsNone(self.storage.get_changes("abcdef-1"))
+
+	def test_layer_index(self):
+		from octoprint.filemanager.layerindex import LayerIndex, Layer
+
+		content_folder = self._add_folder("content", "content")
+		gcode_name = self._add_file((content_folder, "bp_case.gcode"), content_folder + "/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.assertIsNone(self.storage.get_layer_index(gcode_name))
+
+		layer_index = LayerIndex([Layer(0, 0, 0.3, 0.0, (0.0,)), Layer(1024, 40, 0.5, 30.0, (12.5,))], total_time=60.0)
+		self.storage.set_layer_index(gcode_name, layer_index)
+
+		stored = self.storage.get_layer_index(gcode_name)
+		self.assertEquals(list(layer_index), list(stored))
+		self.assertEquals(60.0, stored.total_time)
+
+		# the index is neither listed nor does it keep the folder from being considered empty
+		self.assertEquals(["bp_case.gcode"], self.storage.list_files()[content_folder]["children"].keys())
+
+		self.storage.remove_file(gcode_name)
+		self.assertIsNone(self.storage.get_layer_index(gcode_name))
+		self.storage.remove_folder(content_folder, recursive=False)
+
+	def test_layer_index_removed_on_changed_file(self):
+		from octoprint.filemanager.layerindex import LayerIndex, Layer
+
+		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.set_layer_index(gcode_name, LayerIndex([Layer(0, 0, 0.3, 0.0, (0.0,))]))
+
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, overwrite=True)
+		self.assertIsNotNone(self.storage.get_layer_index(gcode_name))
+
+		self.storage.add_file("bp_case.gcode", FILE_BP_CASE_STL, allow_overwrite=True)
+		self.storage.get_hash(gcode_name).result(timeout=10)
+		self.assertIsNone(self.storage.get_layer_index(gcode_name))
+
 	def test_add_link_model(self):
 		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
 		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
@@ -288,6 +445,7 @@ class LocalStorageTest(unittest.TestCase):
 
 	def _add_file(self, path, expected_path, file_object, links=None, overwrite=False):
 		sanitized_path = self.storage.add_file(path, file_object, links=links, allow_overwrite=overwrite)
+		self.assertEquals(file_object.hash, self.storage.get_hash(sanitized_path).result(timeout=10))
 		split_path = sanitized_path.split("/")
 		if len(split_path) == 1:
 			file_path = os.path.join(self.basefolder, split_path[0])
@@ -298,7 +456,8 @@ class LocalStorageTest(unittest.TestCase):
 
 		self.assertEquals(expected_path, sanitized_path)
 		self.assertTrue(os.path.exists(file_path))
-		self.assertTrue(os.path.exists(os.path.join(folder_path, ".metadata.yaml")))
+		if self.metadata_file is not None:
+			self.assertTrue(os.path.exists(os.path.join(folder_path, self.metadata_file)))
 
 		metadata = self.storage.get_metadata(sanitized_path)
 		self.assertIsNotNone(metadata)
@@ -321,3 +480,43 @@ class LocalStorageTest(unittest.TestCase):
 
 		return sanitized_path
 
+
+class SqliteLocalStorageTest(LocalStorageTest):
+
+	metadata_backend = "sqlite"
+	metadata_file = None
+
+	def test_find_files_by_hash(self):
+		self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+		self._add_folder("content", "content")
+		self._add_file("content/copy.stl", "content/copy.stl", FILE_BP_CASE_STL)
+		self._add_file("crazyradio.stl", "crazyradio.stl", FILE_CRAZYRADIO_STL)
+
+		self.assertEquals(["bp_case.stl", "content/copy.stl"], sorted(self.storage.find_files_by_hash(FILE_BP_CASE_STL.hash)))
+
+		self.storage.remove_folder("content")
+		self.assertEquals(["bp_case.stl"], self.storage.find_files_by_hash(FILE_BP_CASE_STL.hash))
+
+	def test_metadata_survives_restart(self):
+		self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+		self.storage.add_link("bp_case.stl", "web", dict(href="http://www.example.com"))
+
+		storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder, metadata_backend="sqlite")
+		metadata = storage.get_metadata("bp_case.stl")
+		self.assertEquals(FILE_BP_CASE_STL.hash, metadata["hash"])
+		self.assertEquals("http://www.example.com", metadata["links"][0]["href"])
+
+	def test_metadata_follows_renamed_folder(self):
+		self._add_folder("content", "content")
+		self._add_file("content/bp_case.stl", "content/bp_case.stl", FILE_BP_CASE_STL)
+		self.storage.add_link("content/bp_case.stl", "web", dict(href="http://www.example.com"))
+
+		# renamed outside of OctoPrint
+		os.rename(os.path.join(self.basefolder, "content"), os.path.join(self.basefolder, "renamed"))
+
+		storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder, metadata_backend="sqlite")
+		storage.get_hash("renamed/bp_case.stl").result(timeout=10)
+		metadata = storage.get_metadata("renamed/bp_case.stl")
+		self.assertEquals(FILE_BP_CASE_STL.hash, metadata["hash"])
+		self.assertEquals("http://www.example.com", metadata["links"][0]["href"])
+		self.assertEquals(["renamed/bp_case.stl"], storage.find_files_by_hash(FILE_BP_CASE_STL.hash))
@@ -0,0 +1,122 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from octoprint.filemanager.metadata import create_metadata_store, YamlMetadataStore, SqliteMetadataStore
+
+
+METADATA = {
+	"bp_case.stl": dict(hash="abc", links=[dict(rel="machinecode", name="bp_case.gcode", hash="def")]),
+	"bp_case.gcode": dict(hash="def", links=[dict(rel="model", name="bp_case.stl", hash="abc")],
+	                      analysis=dict(estimatedPrintTime=3803.9))
+}
+
+
+class SqliteMetadataStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = tempfile.mkdtemp()
+		self.subfolder = os.path.join(self.basefolder, "sub")
+		os.mkdir(self.subfolder)
+
+	def tearDown(self):
+		shutil.rmtree(self.basefolder)
+
+	def test_import(self):
+		for folder in (self.basefolder, self.subfolder):
+			with open(os.path.join(folder, ".metadata.yaml"), "w") as f:
+				yaml.safe_dump(METADATA, f)
+
+		store = SqliteMetadataStore(self.basefolder)
+		self.assertEquals(METADATA, store.get_folder(self.basefolder))
+		self.assertEquals(METADATA["bp_case.stl"], store.get(self.subfolder, "bp_case.stl"))
+
+		# the yaml files stay in place
+		for folder in (self.basefolder, self.subfolder):
+			self.assertTrue(os.path.exists(os.path.join(folder, ".metadata.yaml")))
+
+		# the import is only done once
+		store.save(self.subfolder, dict(), names=["bp_case.stl"])
+		store = SqliteMetadataStore(self.basefolder)
+		self.assertIsNone(store.get(self.subfolder, "bp_case.stl"))
+
+	def test_save_changed(self):
+		store = SqliteMetadataStore(self.basefolder)
+		store.save(self.basefolder, METADATA)
+
+		metadata = dict(METADATA)
+		metadata["bp_case.gcode"] = dict(hash="ghi")
+		metadata["bp_case.stl"] = dict(hash="jkl")
+
+		# only the saved name is updated
+		store.save(self.basefolder, metadata, names=["bp_case.gcode"])
+		self.assertEquals(dict(hash="ghi"), store.get(self.basefolder, "bp_case.gcode"))
+		self.assertEquals(METADATA["bp_case.stl"], store.get(self.basefolder, "bp_case.stl"))
+
+		# saved names no longer contained are removed
+		del metadata["bp_case.gcode"]
+		store.save(self.basefolder, metadata, names=["bp_case.gcode"])
+		self.assertIsNone(store.get(self.basefolder, "bp_case.gcode"))
+
+	def test_find_by_hash(self):
+		store = SqliteMetadataStore(self.basefolder)
+		store.save(self.basefolder, METADATA)
+		store.save(self.subfolder, METADATA)
+
+		self.assertEquals(sorted([(self.basefolder, "bp_case.stl"), (self.subfolder, "bp_case.stl")]),
+		                  sorted(store.find_by_hash("abc")))
+		self.assertEquals([], store.find_by_hash("xyz"))
+
+	def test_remove_folder(self):
+		store = SqliteMetadataStore(self.basefolder)
+		store.save(self.basefolder, METADATA)
+		store.save(self.subfolder, METADATA)
+		store.save(os.path.join(self.subfolder, "nested"), METADATA)
+		store.save(self.subfolder + "_other", METADATA)
+
+		store.remove_folder(self.subfolder)
+		self.assertEquals(dict(), store.get_folder(self.subfolder))
+		self.assertEquals(dict(), store.get_folder(os.path.join(self.subfolder, "nested")))
+		self.assertEquals(METADATA, store.get_folder(self.subfolder + "_other"))
+		self.assertEquals(METADATA, store.get_folder(self.basefolder))
+
+
+class CreateMetadataStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.basefolder)
+
+	def test_backends(self):
+		self.assertIsInstance(create_metadata_store(self.basefolder), YamlMetadataStore)
+		self.assertIsInstance(create_metadata_store(self.basefolder, backend="sqlite"), SqliteMetadataStore)
+		self.assertIsInstance(create_metadata_store(self.basefolder, backend="unknown"), YamlMetadataStore)
+
+	def test_export(self):
+		subfolder = os.path.join(self.basefolder, "sub")
+		os.mkdir(subfolder)
+
+		store = create_metadata_store(self.basefolder, backend="sqlite")
+		store.save(self.basefolder, METADATA)
+		store.save(subfolder, METADATA)
+		store.close()
+
+		# switching back to yaml exports the database once
+		store = create_metadata_store(self.basefolder, backend="yaml")
+		self.assertEquals(METADATA, store.get_folder(self.basefolder))
+		self.assertEquals(METADATA, store.get_folder(subfolder))
+		self.assertFalse(os.path.exists(os.path.join(self.basefolder, ".metadata.db")))
+		self.assertTrue(os.path.exists(os.path.join(self.basefolder, ".metadata.db.exported")))
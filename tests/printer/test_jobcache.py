@@ -0,0 +1,139 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import unittest
+import mock
+import os
+import shutil
+import tempfile
+from ddt import ddt, data
+
+import octoprint.printer.jobcache
+from octoprint.util.comm import LineFramer, PrintingGcodeFileInformation
+
+GCODE = """; generated for testing
+M190 S60
+M104 T1 S200 ; second hotend
+M109 S210
+G28
+
+T1
+G1 X10 Y10 E1.0 ; move
+M104 S205
+T0
+M140 S65
+G1 X20 Y20 E2.0
+"""
+
+class SynchronousThread(object):
+	def __init__(self, target=None):
+		self._target = target
+		self.daemon = False
+
+	def start(self):
+		self._target()
+
+@ddt
+class PrintJobCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.cache = octoprint.printer.jobcache.PrintJobCache(os.path.join(self.folder), max_entries=2)
+
+		self.gcode = os.path.join(self.folder, "test.gcode")
+		with open(self.gcode, "wb") as f:
+			f.write(GCODE)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_build(self):
+		job = self.cache.get("abc")
+		self.assertFalse(job.available)
+
+		self.cache.build("abc", self.gcode)
+
+		self.assertTrue(job.available)
+		self.assertTrue(job.open(self.gcode))
+		self.assertEquals(10, len(job))
+		self.assertEquals(("M190 S60", 33, PrintingGcodeFileInformation.LINE_BED_TEMPERATURE, None, LineFramer.checksum("M190 S60")), job.get(0))
+		self.assertEquals(("M104 T1 S200", 62, PrintingGcodeFileInformation.LINE_HOTEND_TEMPERATURE, 1, LineFramer.checksum("M104 T1 S200")), job.get(1))
+		self.assertEquals(("T1", 80, PrintingGcodeFileInformation.LINE_TOOL_CHANGE, 1, LineFramer.checksum("T1")), job.get(4))
+		self.assertEquals(("G1 X20 Y20 E2.0", len(GCODE), PrintingGcodeFileInformation.LINE_COMMAND, None, LineFramer.checksum("G1 X20 Y20 E2.0")), job.get(9))
+		job.close()
+
+	@data(
+		({}, 0),
+		({0: 5, 1: -10}, 0),
+		({0: 5}, 3)
+	)
+	def test_same_as_file(self, data):
+		tool_offsets, bed_offset = data
+		offsets = lambda: (tool_offsets, bed_offset)
+
+		self.cache.build("abc", self.gcode)
+
+		expected = self._print(PrintingGcodeFileInformation(self.gcode, offsets))
+		self.assertEquals(expected, self._print(PrintingGcodeFileInformation(self.gcode, offsets, cachedJob=self.cache.get("abc"))))
+		self.assertEquals(expected, self._print(PrintingGcodeFileInformation(self.gcode, offsets, cachedJob=self.cache.get("abc"), readAhead=3)))
+		self.assertEquals(expected, self._print(PrintingGcodeFileInformation(self.gcode, offsets, readAhead=3)))
+
+	def test_outdated_version(self):
+		self.cache.build("abc", self.gcode)
+		with open(os.path.join(self.folder, "abc.index"), "r+b") as f:
+			f.seek(4)
+			f.write(b"\x01\x00")
+
+		self.assertFalse(self.cache.get("abc").available)
+
+	def test_source_changed(self):
+		self.cache.build("abc", self.gcode)
+		with open(self.gcode, "ab") as f:
+			f.write("G1 X30\n")
+
+		self.assertFalse(self.cache.get("abc").open(self.gcode))
+
+		# falls back to reading the file
+		lines = self._print(PrintingGcodeFileInformation(self.gcode, None, cachedJob=self.cache.get("abc")))
+		self.assertEquals(("G1 X30", len(GCODE) + 7, LineFramer.checksum("G1 X30")), lines[-1])
+
+	def test_evict(self):
+		for file_hash in ("a", "b", "c"):
+			self.cache.build(file_hash, self.gcode)
+			os.utime(os.path.join(self.folder, file_hash + ".index"), (0, {"a": 100, "b": 300, "c": 200}[file_hash]))
+		self.cache.build("d", self.gcode)
+
+		self.assertFalse(self.cache.get("a").available)
+		self.assertFalse(self.cache.get("c").available)
+		self.assertTrue(self.cache.get("b").available)
+		self.assertTrue(self.cache.get("d").available)
+
+	def test_schedule_paused(self):
+		with mock.patch("threading.Thread", SynchronousThread):
+			self.cache.pause()
+			self.cache.schedule("abc", self.gcode)
+			self.assertFalse(self.cache.get("abc").available)
+
+			self.cache.resume()
+			self.assertTrue(self.cache.get("abc").available)
+
+	def test_build_aborted_when_paused(self):
+		self.cache.pause()
+		self.assertFalse(self.cache.build("abc", self.gcode))
+		self.assertFalse(self.cache.get("abc").available)
+		self.assertEquals(["test.gcode"], os.listdir(self.folder))
+
+	def _print(self, file_information):
+		file_information.start()
+
+		result = []
+		line = file_information.getNext()
+		while line is not None:
+			result.append((line, file_information.getFilepos(), file_information.getChecksum()))
+			line = file_information.getNext()
+		return result
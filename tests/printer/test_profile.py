@@ -0,0 +1,66 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import yaml
+
+from octoprint.printer.profile import PrinterProfileManager
+
+
+class PrinterProfileManagerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+
+		settings_patcher = mock.patch("octoprint.printer.profile.settings")
+		settings = settings_patcher.start()
+		self.addCleanup(settings_patcher.stop)
+		settings.return_value.getBaseFolder.return_value = self.folder
+		settings.return_value.get.return_value = None
+
+		self.manager = PrinterProfileManager()
+
+	def _write_profile(self, identifier, profile):
+		with open(os.path.join(self.folder, identifier + ".profile"), "wb") as f:
+			yaml.safe_dump(profile, f)
+
+	def test_planner_defaults_for_old_profile(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["id"] = "old"
+		del profile["planner"]
+		self._write_profile("old", profile)
+
+		loaded = self.manager.get("old")
+		self.assertIsNotNone(loaded)
+		self.assertEquals(PrinterProfileManager.default["planner"], loaded["planner"])
+
+	def test_planner_values_converted(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["id"] = "custom"
+		profile["planner"] = dict(acceleration="1500", travelAcceleration=2000, retractAcceleration=1000,
+		                          jerk=dict(x=8, y=8, z="0.4", e=2.5))
+		self._write_profile("custom", profile)
+
+		loaded = self.manager.get("custom")
+		self.assertEquals(1500.0, loaded["planner"]["acceleration"])
+		self.assertEquals(0.4, loaded["planner"]["jerk"]["z"])
+
+	def test_invalid_acceleration(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["id"] = "invalid"
+		profile["planner"]["acceleration"] = 0
+		self._write_profile("invalid", profile)
+
+		self.assertIsNone(self.manager.get("invalid"))
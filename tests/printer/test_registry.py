@@ -0,0 +1,113 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import unittest
+import mock
+
+from octoprint.printer.registry import PrinterRegistry, InvalidPrinterError, DEFAULT_PRINTER
+
+
+class PrinterRegistryTest(unittest.TestCase):
+
+	def setUp(self):
+		self.settings_patcher = mock.patch("octoprint.printer.registry.settings")
+		self.settings = self.settings_patcher.start()
+
+		self.config = {
+			("appearance", "name"): "",
+			("serial", "autoconnect"): True,
+			("serial", "port"): "/dev/ttyACM0",
+			("printers",): [
+				dict(id="left", name="Left", port="/dev/ttyACM1", baudrate=115200, profile="mk2", autoconnect=True),
+				dict(id="right", name="Right", port="/dev/ttyACM2"),
+				dict(id="in valid"),
+				dict(name="No id")
+			]
+		}
+		self.settings.return_value.get.side_effect = lambda path: self.config[tuple(path)]
+		self.settings.return_value.getBoolean.side_effect = lambda path: self.config[tuple(path)]
+
+		self.busy_ports = dict()
+
+		def factory(identifier=None, name=None, connectionDefaults=None, busyPorts=None):
+			printer = mock.MagicMock()
+			printer.getIdentifier.return_value = identifier
+			printer.getName.return_value = name
+			printer.isDefault.return_value = identifier == DEFAULT_PRINTER
+			printer.getConnectionDefaults.return_value = connectionDefaults
+			printer.isClosedOrError.return_value = True
+			self.busy_ports[identifier] = busyPorts
+			return printer
+
+		self.registry = PrinterRegistry(factory)
+
+	def tearDown(self):
+		self.settings_patcher.stop()
+
+	def test_load(self):
+		self.registry.load()
+
+		self.assertEquals([DEFAULT_PRINTER, "left", "right"], self.registry.identifiers())
+		self.assertEquals(3, len(self.registry))
+		self.assertTrue("left" in self.registry)
+		self.assertFalse("in valid" in self.registry)
+
+		self.assertTrue(self.registry.get_default().isDefault())
+		self.assertEquals(dict(port="/dev/ttyACM1", baudrate=115200, profile="mk2"), self.registry.get("left").getConnectionDefaults())
+		self.assertIsNone(self.registry.get("unknown"))
+
+	def test_add_duplicate(self):
+		self.registry.add("left")
+		self.assertRaises(InvalidPrinterError, self.registry.add, "left")
+
+	def test_add_invalid(self):
+		self.assertRaises(InvalidPrinterError, self.registry.add, "../left")
+
+	def test_autoconnect(self):
+		self.registry.load()
+		self.registry.autoconnect(["/dev/ttyACM0", "/dev/ttyACM2"])
+
+		self.registry.get_default().connect.assert_called_once_with(port="/dev/ttyACM0")
+		self.assertFalse(self.registry.get("left").connect.called) # port not available
+		self.assertFalse(self.registry.get("right").connect.called) # autoconnect disabled
+
+	def test_add_same_port(self):
+		self.registry.load()
+
+		# the default printer's port from the serial settings counts as well
+		self.assertRaises(InvalidPrinterError, self.registry.add, "other", port="/dev/ttyACM0")
+		self.assertRaises(InvalidPrinterError, self.registry.add, "other", port="/dev/ttyACM2")
+
+		# autodetection and the virtual printer don't occupy a port
+		self.registry.add("auto", port="AUTO")
+		self.registry.add("virtual", port="VIRTUAL")
+
+	def test_busy_ports(self):
+		self.registry.load()
+
+		left = self.registry.get("left")
+		left.isClosedOrError.return_value = False
+		left.getCurrentConnection.return_value = ("Printing", "/dev/ttyACM1", 115200, None)
+
+		self.assertEquals(["/dev/ttyACM1"], self.busy_ports["right"]())
+		self.assertEquals(["/dev/ttyACM1"], self.busy_ports[DEFAULT_PRINTER]())
+		self.assertEquals([], self.busy_ports["left"]())
+
+	def test_save_connection_defaults(self):
+		self.registry.load()
+
+		self.registry.save_connection_defaults("right", port="/dev/ttyACM3", baudrate=250000, profile="mk2", autoconnect=True)
+
+		printers = self.settings.return_value.set.call_args[0][1]
+		self.assertEquals(dict(id="right", name="Right", port="/dev/ttyACM3", baudrate=250000, profile="mk2", autoconnect=True), printers[1])
+		self.assertEquals(self.config[("printers",)][0], printers[0])
+		self.registry.get("right").setConnectionDefaults.assert_called_once_with(dict(port="/dev/ttyACM3", baudrate=250000, profile="mk2"))
+
+		# neither another printer's port nor the default printer
+		self.assertRaises(InvalidPrinterError, self.registry.save_connection_defaults, "right", port="/dev/ttyACM1")
+		self.assertRaises(InvalidPrinterError, self.registry.save_connection_defaults, DEFAULT_PRINTER, port="/dev/ttyACM3")
@@ -0,0 +1,138 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import tornado.httputil
+import tornado.web
+
+from ddt import ddt, data
+
+from octoprint.server.util.tornado import UploadStorageFallbackHandler, get_upload_hash
+
+
+BOUNDARY = "----WebKitFormBoundarypYiSUx63abAmhT5C"
+CONTENTS = "".join("G1 X%d Y%d\r\n" % (i, i) for i in range(5000)) + "--" + BOUNDARY[:-1]
+
+
+def multipart_body(parts):
+	body = ""
+	for name, filename, value in parts:
+		body += "--%s\r\n" % BOUNDARY
+		if filename is not None:
+			body += "Content-Disposition: form-data; name=\"%s\"; filename=\"%s\"\r\n" % (name, filename)
+			body += "Content-Type: application/octet-stream\r\n"
+		else:
+			body += "Content-Disposition: form-data; name=\"%s\"\r\n" % name
+		body += "\r\n"
+		body += value + "\r\n"
+	body += "--%s--\r\n" % BOUNDARY
+	return body
+
+
+@ddt
+class UploadStorageFallbackHandlerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.fallback = mock.MagicMock()
+		self.fallback.side_effect = self._on_fallback
+		self.received = None
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	@data(1, 7, 64, 4096, 65536)
+	def test_upload(self, chunk_size):
+		body = multipart_body([("apikey", None, "my_funny_apikey"),
+		                       ("file", "test.gcode", CONTENTS),
+		                       ("select", None, "true")])
+
+		handler = self._handler(body)
+		for i in range(0, len(body), chunk_size):
+			handler.data_received(body[i:i + chunk_size])
+		handler.post()
+
+		self.assertEquals("my_funny_apikey", self.received["apikey"])
+		self.assertEquals("true", self.received["select"])
+		self.assertEquals("test.gcode", self.received["file.name"])
+		self.assertEquals(str(len(CONTENTS)), self.received["file.size"])
+		self.assertEquals(hashlib.sha1(CONTENTS).hexdigest(), self.received["file.path.hash"])
+		self.assertEquals(CONTENTS, self.received["file.path.contents"])
+
+		# the temporary file and its hash are gone again
+		self.assertEquals([], os.listdir(self.folder))
+		self.assertIsNone(get_upload_hash(self.received["file.path"]))
+
+	def test_forged_file_fields(self):
+		body = multipart_body([("file.name", None, "forged.gcode"),
+		                       ("file", "test.gcode", CONTENTS)])
+
+		handler = self._handler(body)
+		handler.data_received(body)
+		handler.post()
+
+		self.assertEquals("test.gcode", self.received["file.name"])
+
+	def test_forged_upload(self):
+		# form fields describing an upload that wasn't received, e.g. a file already on the server
+		path = os.path.join(self.folder, "existing.gcode")
+		with open(path, "wb") as f:
+			f.write(CONTENTS)
+		body = multipart_body([("file.name", None, "test.gcode"),
+		                       ("file.path", None, path),
+		                       ("file.hash", None, "forged")])
+
+		handler = self._handler(body)
+		handler.data_received(body)
+		handler.post()
+
+		self.assertEquals(path, self.received["file.path"])
+		self.assertIsNone(self.received["file.path.hash"])
+
+	def test_incomplete_body(self):
+		body = multipart_body([("file", "test.gcode", CONTENTS)])
+
+		handler = self._handler(body)
+		handler.data_received(body[:len(body) / 2])
+		self.assertRaises(tornado.web.HTTPError, handler.post)
+
+		self.assertFalse(self.fallback.called)
+		self.assertEquals([], os.listdir(self.folder))
+
+	def test_no_multipart(self):
+		handler = self._handler("some=data&more=data", content_type="application/x-www-form-urlencoded")
+		handler.data_received("some=data")
+		handler.data_received("&more=data")
+		handler.post()
+
+		self.assertEquals("some=data&more=data", self.fallback.call_args[0][1])
+
+	def _handler(self, body, content_type="multipart/form-data; boundary=" + BOUNDARY):
+		headers = tornado.httputil.HTTPHeaders({"Content-Type": content_type, "Content-Length": str(len(body))})
+		request = tornado.httputil.HTTPServerRequest(method="POST", uri="/api/files/local", headers=headers, connection=mock.MagicMock())
+		application = tornado.web.Application()
+
+		handler = UploadStorageFallbackHandler(application, request, fallback=self.fallback, path=self.folder)
+		handler.prepare()
+		return handler
+
+	def _on_fallback(self, request, body):
+		arguments = dict()
+		files = dict()
+		tornado.httputil.parse_body_arguments(request.headers["Content-Type"], body, arguments, files)
+		self.received = dict((key, value[0]) for key, value in arguments.items())
+		if "file.path" in self.received:
+			with open(self.received["file.path"], "rb") as f:
+				self.received["file.path.contents"] = f.read()
+			self.received["file.path.hash"] = get_upload_hash(self.received["file.path"])
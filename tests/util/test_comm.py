@@ -0,0 +1,444 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import time
+import unittest
+import mock
+from ddt import ddt, data, unpack
+
+import octoprint.util.comm
+
+@ddt
+class SendWindowTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.window = octoprint.util.comm.SendWindow(4, 64)
+
+	def test_empty(self):
+		self.assertEquals(0, len(self.window))
+		self.assertTrue(self.window.hasRoom())
+		self.assertTrue(self.window.fits(100))
+		self.assertIsNone(self.window.acknowledge())
+
+	@data(
+		((10, 10, 10), 34, True),
+		((10, 10, 10, 10), 1, False),  # line limit reached
+		((30, 30), 4, True),
+		((30, 30), 5, False)           # byte limit would be exceeded
+	)
+	@unpack
+	def test_fits(self, sizes, size, expected):
+		for lineNumber, s in enumerate(sizes):
+			self.window.add(lineNumber + 1, s)
+		self.assertEquals(expected, self.window.fits(size))
+
+	def test_acknowledge(self):
+		self.window.add(1, 10)
+		self.window.add(2, 20)
+
+		self.assertEquals(1, self.window.acknowledge())
+		self.assertEquals(20, self.window.getBytes())
+		self.assertEquals(2, self.window.acknowledge())
+		self.assertEquals(0, self.window.getBytes())
+		self.assertEquals(0, len(self.window))
+
+	def test_resend(self):
+		for lineNumber in range(1, 5):
+			self.window.add(lineNumber, 10)
+		self.assertFalse(self.window.hasRoom())
+
+		self.window.resend(3)
+
+		self.assertEquals(2, len(self.window))
+		self.assertEquals(20, self.window.getBytes())
+		self.assertTrue(self.window.hasRoom())
+		self.assertEquals(1, self.window.acknowledge())
+
+	def test_reserve_assign(self):
+		self.window.add(1, 10)
+		first = self.window.reserve(10)
+		second = self.window.reserve(10)
+		self.assertEquals(3, len(self.window))
+		self.assertEquals(30, self.window.getBytes())
+
+		self.window.assign(first, 2)
+		self.window.resend(2)
+
+		# the assigned line has to be resent, the reservation not yet written is kept
+		self.assertEquals(2, len(self.window))
+		self.assertEquals(20, self.window.getBytes())
+
+		self.window.release(second)
+		self.assertEquals(1, len(self.window))
+		self.assertEquals(1, self.window.acknowledge())
+		self.assertEquals(0, self.window.getBytes())
+
+
+@ddt
+class LineFramerTestCase(unittest.TestCase):
+
+	def _frame(self, lineNumber, command):
+		# the way lines used to be framed, character by character
+		line = "N%d %s" % (lineNumber, command)
+		return "%s*%d\n" % (line, reduce(lambda x,y:x^y, map(ord, line)))
+
+	@data(
+		(0, "M110 N0"),
+		(1, "G28"),
+		(12345, "G1 X10.000 Y20.000 E0.12345 F1800"),
+		(7, "M117 Ümlaut"),
+		(99, "")
+	)
+	@unpack
+	def test_frame(self, lineNumber, command):
+		expected = self._frame(lineNumber, command)
+		self.assertEquals(expected, octoprint.util.comm.LineFramer.frame(lineNumber, command))
+
+		checksum = octoprint.util.comm.LineFramer.checksum(command)
+		self.assertEquals(expected, octoprint.util.comm.LineFramer.frame(lineNumber, command, checksum))
+
+
+class PollSchedulerTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.scheduler = octoprint.util.comm.PollScheduler({"temperature": 5.0}, 20.0, saturation=0.8, capacity=1000.0)
+		self.scheduler.reset(now=100.0)
+
+	def test_due(self):
+		self.assertFalse(self.scheduler.isDue("temperature", now=104.0))
+		self.assertFalse(self.scheduler.isIdleDue("temperature", now=102.0))
+		self.assertTrue(self.scheduler.isIdleDue("temperature", now=103.0))
+		self.assertTrue(self.scheduler.isDue("temperature", now=105.0))
+
+		self.scheduler.polled("temperature", now=105.0)
+		self.assertFalse(self.scheduler.isDue("temperature", now=109.0))
+		self.assertTrue(self.scheduler.isDue("temperature", now=110.0))
+
+	def test_backoff(self):
+		now = 100.0
+		for expected in (10.0, 20.0, 20.0):
+			# 4500 bytes in 5 seconds at 1000 bytes per second
+			self.scheduler.sent(4500, now=now)
+			now += 5.0
+			self.scheduler.polled("temperature", now=now)
+			self.assertAlmostEquals(0.9, self.scheduler.getUtilization("temperature"))
+			self.assertEquals(expected, self.scheduler.getInterval("temperature"))
+
+		# link calms down again
+		self.scheduler.sent(100, now=now)
+		self.scheduler.polled("temperature", now=now + 20.0)
+		self.assertEquals(5.0, self.scheduler.getInterval("temperature"))
+
+	def test_unknown_capacity(self):
+		self.scheduler.setCapacity(None)
+		self.scheduler.sent(100000, now=101.0)
+		self.scheduler.polled("temperature", now=105.0)
+		self.assertEquals(5.0, self.scheduler.getInterval("temperature"))
+
+	def test_round_trip_time(self):
+		self.assertIsNone(self.scheduler.getRoundTripTime())
+
+		self.scheduler.sent(10, now=100.0)
+		self.scheduler.sent(10, now=100.5)
+		self.scheduler.acknowledged(now=101.0)
+		self.assertAlmostEquals(1.0, self.scheduler.getRoundTripTime())
+
+		self.scheduler.acknowledged(now=101.5)
+		self.assertAlmostEquals(1.0, self.scheduler.getRoundTripTime())
+
+		# nothing in flight, nothing to measure
+		self.scheduler.acknowledged(now=110.0)
+		self.assertAlmostEquals(1.0, self.scheduler.getRoundTripTime())
+
+	def test_slow_acknowledgements(self):
+		# the printer takes 4 seconds to acknowledge a line
+		self.scheduler.sent(10, now=100.0)
+		self.scheduler.acknowledged(now=104.0)
+		self.scheduler.polled("temperature", now=105.0)
+		self.assertEquals(8.0, self.scheduler.getInterval("temperature"))
+
+		# never beyond the maximum interval
+		self.scheduler.sent(10, now=105.0)
+		self.scheduler.acknowledged(now=205.0)
+		self.scheduler.polled("temperature", now=205.0)
+		self.assertEquals(20.0, self.scheduler.getInterval("temperature"))
+
+
+class LineHistoryTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.history = octoprint.util.comm.LineHistory(4)
+
+	def test_get(self):
+		self.history.add(1, "G28", 12)
+		self.history.add(2, "G1 X10")
+
+		self.assertEquals(("G28", 12), self.history.get(1))
+		self.assertEquals(("G1 X10", None), self.history.get(2))
+		self.assertIsNone(self.history.get(3))
+		self.assertEquals(2, len(self.history))
+
+	def test_wrap_around(self):
+		for lineNumber in range(1, 11):
+			self.history.add(lineNumber, "G1 X%d" % lineNumber)
+
+		self.assertEquals(4, len(self.history))
+		self.assertFalse(6 in self.history)
+		self.assertIsNone(self.history.get(6))
+		for lineNumber in range(7, 11):
+			self.assertTrue(lineNumber in self.history)
+			self.assertEquals(("G1 X%d" % lineNumber, None), self.history.get(lineNumber))
+
+	def test_clear(self):
+		self.history.add(1, "G28")
+		self.history.clear()
+
+		self.assertEquals(0, len(self.history))
+		self.assertFalse(1 in self.history)
+
+		self.history.add(0, "M110 N0")
+		self.assertEquals(("M110 N0", None), self.history.get(0))
+		self.assertIsNone(self.history.get(4))
+
+
+@ddt
+class ResponseClassifierTestCase(unittest.TestCase):
+
+	def setUp(self):
+		rules = [
+			([" T:", "^T:"], "temperature"),
+			(["SD card ok"], "sd_ok"),
+			(["File opened"], "file_opened")
+		]
+		self.classifier = octoprint.util.comm.ResponseClassifier(rules, ignored=["", "ok"], fallback="message")
+
+	@data(
+		("ok\n", None),
+		("\n", None),
+		("ok T:210.0 /210.0 B:60.0 /60.0\n", "temperature"),
+		("T:210.0 /210.0\n", "temperature"),
+		("XT:210.0\n", "message"),
+		("echo:SD card ok\n", "sd_ok"),
+		("File opened: foo.gco Size: 1234 SD card ok\n", "sd_ok"),  # rule order wins, not position in line
+		("File opened: foo.gco Size: 1234\n", "file_opened"),
+		("File opened: foo.gco Size: 1234 T:1\n", "temperature"),
+		("ok 1234\n", "message"),
+		("wait\n", "message")
+	)
+	@unpack
+	def test_classify(self, line, expected):
+		self.assertEquals(expected, self.classifier.classify(line))
+
+	def test_combine(self):
+		matcher = octoprint.util.comm.ResponseClassifier.combine(["X:([0-9.]+)", "FIRMWARE_NAME:(\\S+)"])
+		self.assertIsNotNone(matcher.search("X:10.0 Y:20.0"))
+		self.assertIsNotNone(matcher.search("FIRMWARE_NAME:Marlin"))
+		self.assertIsNone(matcher.search("ok"))
+
+	@data(
+		[],
+		["X:([0-9.]+)"],
+		["(a)\\1", "b"],
+		["(?P<x>a)(?P=x)", "b"],
+		["(", "b"]
+	)
+	def test_combine_unsupported(self, patterns):
+		self.assertIsNone(octoprint.util.comm.ResponseClassifier.combine(patterns))
+
+
+class ReadAheadBufferTestCase(unittest.TestCase):
+
+	def _source(self, entries):
+		iterator = iter(entries)
+		def source():
+			entry = next(iterator, None)
+			if callable(entry):
+				entry = entry()
+			return entry
+		return source
+
+	def test_get(self):
+		buffer = octoprint.util.comm.ReadAheadBuffer(self._source(["a", "b", "c"]), 2)
+
+		self.assertEquals(["a", "b", "c", None, None], [buffer.get() for _ in range(5)])
+		self.assertEquals(2, buffer.getStats()["size"])
+
+	def test_exception(self):
+		def fail():
+			raise IOError("read failed")
+		buffer = octoprint.util.comm.ReadAheadBuffer(self._source(["a", fail]), 2)
+
+		self.assertEquals("a", buffer.get())
+		self.assertRaises(IOError, buffer.get)
+		self.assertIsNone(buffer.get())
+
+	def test_underrun(self):
+		import threading
+		event = threading.Event()
+		def slow():
+			event.wait()
+			return "b"
+		buffer = octoprint.util.comm.ReadAheadBuffer(self._source(["a", slow]), 2)
+
+		self.assertEquals("a", buffer.get())
+		threading.Timer(0.1, event.set).start()
+		self.assertEquals("b", buffer.get())
+		self.assertEquals(1, buffer.getStats()["underruns"])
+
+	def test_stop(self):
+		buffer = octoprint.util.comm.ReadAheadBuffer(lambda: "a", 2)
+		self.assertEquals("a", buffer.get())
+
+		buffer.stop()
+		while buffer.get() is not None:
+			pass
+
+	def test_cleanup_by_reading_thread(self):
+		import threading
+		reading = threading.Event()
+		release = threading.Event()
+		cleanedUp = []
+		def slow():
+			reading.set()
+			release.wait(10)
+			return "b"
+		buffer = octoprint.util.comm.ReadAheadBuffer(self._source(["a", slow]), 1, cleanup=lambda: cleanedUp.append(threading.current_thread()))
+
+		self.assertEquals("a", buffer.get())
+		reading.wait(10)
+		threading.Timer(0.1, release.set).start()
+		buffer.stop()
+
+		# stopping waited for the read to return and the reading thread cleaned up
+		self.assertEquals(1, len(cleanedUp))
+		self.assertNotEquals(threading.current_thread(), cleanedUp[0])
+
+
+class PrintingGcodeFileInformationTestCase(unittest.TestCase):
+
+	def setUp(self):
+		import tempfile
+		handle, self.path = tempfile.mkstemp()
+		with os.fdopen(handle, "wb") as f:
+			f.write("G28 ; home\nG1 X10\n")
+
+	def tearDown(self):
+		os.remove(self.path)
+
+	def test_read_ahead_whole_file(self):
+		file_information = octoprint.util.comm.PrintingGcodeFileInformation(self.path, None, readAhead=10)
+		file_information.start()
+
+		# wait until everything has been read ahead and the file has been closed again
+		while file_information.getReadAheadStats()["fill"] < 3:
+			time.sleep(0.01)
+
+		self.assertEquals(["M110 N0", "G28", "G1 X10", None], [file_information.getNext() for _ in range(4)])
+
+	def test_read_ahead_close(self):
+		file_information = octoprint.util.comm.PrintingGcodeFileInformation(self.path, None, readAhead=1)
+		file_information.start()
+		self.assertEquals("M110 N0", file_information.getNext())
+		filehandle = file_information._filehandle
+
+		file_information.close()
+		self.assertTrue(filehandle.closed)
+		self.assertIsNone(file_information.getReadAheadStats())
+
+
+class FakePort(object):
+
+	def __init__(self, port, baudrate, answeringBaudrate=None):
+		self.port = port
+		self.baudrate = baudrate
+		self.answeringBaudrate = answeringBaudrate
+		self.closed = False
+		self.written = []
+		self._responses = []
+
+	def readline(self):
+		if self._responses:
+			return self._responses.pop(0)
+		return ""
+
+	def write(self, data):
+		self.written.append((self.baudrate, data))
+		if self.baudrate == self.answeringBaudrate:
+			self._responses.append("ok T:21.0 /0.0\n")
+		else:
+			self._responses.append("\x80\x12\n")
+
+	def close(self):
+		self.closed = True
+
+
+class SerialDiscoveryTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.settings_patcher = mock.patch("octoprint.util.comm.settings")
+		self.settings = self.settings_patcher.start().return_value
+
+		self.lastBaudrates = {"/dev/ttyACM0": 57600}
+		self.settings.get.side_effect = lambda path: self.lastBaudrates if path == ["serial", "lastBaudrates"] else None
+		self.settings.getInt.side_effect = lambda path: 230400 if path == ["serial", "baudrate"] else None
+
+		self.answering = dict()
+		self.opened = dict()
+		def opener(port, baudrate, timeout):
+			self.opened[port] = FakePort(port, baudrate, self.answering.get(port))
+			return self.opened[port]
+		self.discovery = octoprint.util.comm.SerialDiscovery(opener=opener)
+
+	def tearDown(self):
+		self.settings_patcher.stop()
+
+	def test_baudrates(self):
+		self.assertEquals([57600, 230400, 250000, 115200, 38400, 19200, 9600], self.discovery.getBaudrates("/dev/ttyACM0"))
+		self.assertEquals([230400, 250000, 115200, 57600, 38400, 19200, 9600], self.discovery.getBaudrates("/dev/ttyUSB0"))
+
+	def test_probe(self):
+		self.answering["/dev/ttyUSB0"] = 115200
+
+		port, baudrate, connection = self.discovery.probe(["/dev/ttyACM0", "/dev/ttyUSB0"], 0.01)
+
+		self.assertEquals(("/dev/ttyUSB0", 115200), (port, baudrate))
+		self.assertIs(self.opened["/dev/ttyUSB0"], connection)
+		self.assertFalse(connection.closed)
+		self.assertTrue(self.opened["/dev/ttyACM0"].closed)
+
+		# likely baudrates first, each retried until giving up, then a single round trip at the right one
+		self.assertEquals([230400] * 5 + [250000] * 5 + [115200], [written_baudrate for written_baudrate, _ in connection.written])
+		self.settings.set.assert_called_once_with(["serial", "lastBaudrates"], {"/dev/ttyACM0": 57600, "/dev/ttyUSB0": 115200})
+
+	def test_probe_remembered(self):
+		self.answering["/dev/ttyACM0"] = 57600
+
+		port, baudrate, connection = self.discovery.probe(["/dev/ttyACM0"], 0.01)
+
+		self.assertEquals(("/dev/ttyACM0", 57600), (port, baudrate))
+		self.assertEquals([(57600, "\nM105\n")], connection.written)
+		self.assertFalse(self.settings.set.called)
+
+	def test_probe_fixed_baudrate(self):
+		self.answering["/dev/ttyACM0"] = 57600
+
+		self.assertIsNone(self.discovery.probe(["/dev/ttyACM0"], 0.01, baudrate=115200))
+		self.assertTrue(self.opened["/dev/ttyACM0"].closed)
+		self.assertEquals(set([115200]), set(written_baudrate for written_baudrate, _ in self.opened["/dev/ttyACM0"].written))
+
+	def test_ports_cached(self):
+		with mock.patch("octoprint.util.comm.serialList") as serialList:
+			serialList.return_value = ["/dev/ttyACM0"]
+
+			self.assertEquals(["/dev/ttyACM0"], self.discovery.getPorts())
+			self.assertEquals(["/dev/ttyACM0"], self.discovery.getPorts())
+			self.assertEquals(1, serialList.call_count)
+
+			self.discovery.getPorts(force=True)
+			self.assertEquals(2, serialList.call_count)
@@ -0,0 +1,110 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import unittest
+import mock
+
+from octoprint.util.comm import MachineCom
+from octoprint.util.commworker import RemoteMachineCom, _WorkerChannel, _CallbackForwarder, _initialSnapshot, \
+	CALLBACK, SNAPSHOT, LOG, EVENT
+from octoprint.util.logbuffer import LogBuffer
+
+
+class WorkerChannelTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.connection = mock.MagicMock()
+		self.channel = _WorkerChannel(self.connection)
+
+		self.comm = mock.MagicMock()
+		self.comm.getState.return_value = MachineCom.STATE_OPERATIONAL
+		self.comm.getSdFiles.return_value = []
+		self.channel.attach(self.comm)
+
+	def sent(self):
+		return [call[0][0] for call in self.connection.send.call_args_list]
+
+	def test_snapshot_only_on_change(self):
+		self.channel.sendSnapshot()
+		self.channel.sendSnapshot()
+		self.assertEquals(1, len(self.sent()))
+
+		self.comm.getState.return_value = MachineCom.STATE_PRINTING
+		self.channel.sendSnapshot()
+
+		messages = self.sent()
+		self.assertEquals(2, len(messages))
+		self.assertEquals(SNAPSHOT, messages[1][0])
+		self.assertEquals(MachineCom.STATE_PRINTING, messages[1][1]["state"])
+
+	def test_callback_with_snapshot(self):
+		forwarder = _CallbackForwarder(self.channel)
+		forwarder.mcStateChange(MachineCom.STATE_OPERATIONAL)
+
+		type, name, args, snapshot = self.sent()[0]
+		self.assertEquals((CALLBACK, "mcStateChange", (MachineCom.STATE_OPERATIONAL,)), (type, name, args))
+		self.assertEquals(MachineCom.STATE_OPERATIONAL, snapshot["state"])
+
+	def test_progress_coalesced(self):
+		forwarder = _CallbackForwarder(self.channel)
+		for _ in range(10):
+			forwarder.mcProgress()
+		self.assertEquals(1, len(self.sent()))
+
+		forwarder.flushProgress()
+		forwarder.flushProgress()
+		self.assertEquals(2, len(self.sent()))
+
+	def test_no_private_callbacks(self):
+		forwarder = _CallbackForwarder(self.channel)
+		self.assertFalse(hasattr(forwarder, "_something"))
+
+
+class RemoteMachineComTestCase(unittest.TestCase):
+
+	def setUp(self):
+		# the message handling is tested without an actual worker process
+		self.callback = mock.MagicMock()
+		self.logBuffer = LogBuffer(10)
+		self.comm = RemoteMachineCom.__new__(RemoteMachineCom)
+		self.comm._logger = mock.MagicMock()
+		self.comm._callback = self.callback
+		self.comm._logBuffer = self.logBuffer
+		self.comm._snapshot = _initialSnapshot("/dev/ttyACM0", 115200)
+
+	def test_state_constants(self):
+		self.assertEquals(MachineCom.STATE_PRINTING, RemoteMachineCom.STATE_PRINTING)
+
+	def test_callback_sees_snapshot(self):
+		snapshot = _initialSnapshot("/dev/ttyACM0", 115200)
+		snapshot.update(state=MachineCom.STATE_PRINTING, printing=True)
+
+		def mcStateChange(state):
+			self.assertTrue(self.comm.isPrinting())
+		self.callback.mcStateChange.side_effect = mcStateChange
+
+		self.comm._handle((CALLBACK, "mcStateChange", (MachineCom.STATE_PRINTING,), snapshot))
+		self.callback.mcStateChange.assert_called_once_with(MachineCom.STATE_PRINTING)
+		self.assertEquals(MachineCom.STATE_PRINTING, self.comm.getState())
+
+	def test_log(self):
+		cursor = self.logBuffer.cursor()
+		self.comm._handle((LOG, ["Send: M105", "Recv: ok"], 0))
+		self.comm._handle((LOG, ["Recv: ok"], 2))
+		self.assertEquals(["Send: M105", "Recv: ok", "[2 lines dropped by comm worker]", "Recv: ok"], cursor.read()[0])
+
+	@mock.patch("octoprint.util.commworker.eventManager")
+	def test_event(self, eventManager):
+		self.comm._handle((EVENT, "Connected", dict(port="/dev/ttyACM0", baudrate=115200)))
+		eventManager.return_value.fire.assert_called_once_with("Connected", dict(port="/dev/ttyACM0", baudrate=115200))
+
+	def test_worker_died(self):
+		self.comm._workerDied()
+		self.assertTrue(self.comm.isClosedOrError())
+		self.assertTrue(self.comm.isError())
+		self.callback.mcStateChange.assert_called_once_with(MachineCom.STATE_CLOSED_WITH_ERROR)
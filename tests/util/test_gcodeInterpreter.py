@@ -0,0 +1,367 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import copy
+import os
+import unittest
+
+import mock
+from ddt import ddt, data, unpack
+
+from octoprint.printer.profile import PrinterProfileManager
+from octoprint.util.gcodeInterpreter import gcode, GcodeAnalyzer, NumpyGcodeAnalyzer, AnalysisAborted, createAnalyzer
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+BP_CASE_GCODE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "filemanager", "_files", "bp_case.gcode")
+
+SAMPLE_GCODE = """; filament_diameter = 1.75,1.75
+G21 ; mm
+G90
+M82
+G28
+G1 Z0.3 F1200
+G92 E0
+G1 X10 Y10 E1.5 F1800
+G1 X20 Y10 E3.0
+G1 E2.0 F2400
+G1 E3.0
+G4 P500
+G4 S2
+G91
+G1 X5 Y5 E0.5
+G1 Z1 F600
+G90
+M83
+G1 X30 Y30 E2
+G1 E-1
+G1 E1
+T1
+M82
+G92 E0
+G1 X40 Y40 E5 F3000
+G1 X50 Y40 E7
+T0
+G92 X0 Y0
+G1 X10 Y0 E10
+G28 X0
+G1 X12 Y3 E11
+G20
+G1 X1 Y1 E11.2
+G21
+T12
+G1 X0 Y0
+""".splitlines(True)
+
+
+def _profile():
+	profile = copy.deepcopy(PrinterProfileManager.default)
+	profile["extruder"]["count"] = 2
+	profile["extruder"]["offsets"] = [(0.0, 0.0), (15.0, -5.0)]
+	return profile
+
+
+@ddt
+@mock.patch("octoprint.util.gcodeInterpreter.settings")
+class GcodeTestCase(unittest.TestCase):
+
+	# reference values as calculated by the analysis prior to the tokenizing GcodeAnalyzer, both backends have to
+	# arrive at them with the simple estimator
+
+	@data("python", "numpy")
+	def test_bp_case(self, backend, settings):
+		settings.return_value.getInt.return_value = 10
+
+		interpreter = gcode(backend=backend, estimator="simple")
+		interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default)
+
+		self.assertAlmostEquals(63.3986785859499, interpreter.totalMoveTimeMinute)
+		self.assertEquals(1, len(interpreter.extrusionAmount))
+		self.assertAlmostEquals(1407.434510000002, interpreter.extrusionAmount[0])
+		self.assertAlmostEquals(8.978582902758397, interpreter.extrusionVolume[0])
+
+	@data("python", "numpy")
+	def test_sample(self, backend, settings):
+		settings.return_value.getInt.return_value = 10
+		progress = mock.MagicMock()
+
+		interpreter = gcode(backend=backend, estimator="simple")
+		interpreter.progressCallback = progress
+		interpreter._load(SAMPLE_GCODE, _profile())
+
+		self.assertAlmostEquals(0.15006977253978826, interpreter.totalMoveTimeMinute)
+		self.assertEquals(2, len(interpreter.extrusionAmount))
+		self.assertAlmostEquals(11.2, interpreter.extrusionAmount[0])
+		self.assertAlmostEquals(7.0, interpreter.extrusionAmount[1])
+		self.assertAlmostEquals(0.026939157004532473, interpreter.extrusionVolume[0])
+		self.assertAlmostEquals(0.016836973127832795, interpreter.extrusionVolume[1])
+		progress.assert_called_once_with(100.0)
+
+	def test_abort(self, settings):
+		settings.return_value.getInt.return_value = 10
+
+		interpreter = gcode(estimator="simple")
+		interpreter.abort()
+		self.assertRaises(AnalysisAborted, interpreter._load, SAMPLE_GCODE, _profile())
+
+	@data("python", "numpy")
+	def test_resume(self, backend, settings):
+		settings.return_value.getInt.return_value = 10
+
+		def abort(progress):
+			if progress < 100.0:
+				interpreter.abort()
+
+		interpreter = gcode(backend=backend, estimator="simple")
+		interpreter.progressCallback = abort
+		with mock.patch.object(GcodeAnalyzer, "chunkSize", 500), mock.patch.object(NumpyGcodeAnalyzer, "chunkSize", 500):
+			try:
+				interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default)
+				self.fail("Expected AnalysisAborted")
+			except AnalysisAborted as e:
+				checkpoint = e.checkpoint
+
+			self.assertEquals(os.path.getsize(BP_CASE_GCODE), checkpoint["size"])
+			self.assertTrue(0 < checkpoint["position"] < checkpoint["size"])
+
+			interpreter = gcode(backend=backend, estimator="simple")
+			interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default, checkpoint=checkpoint)
+
+		self.assertAlmostEquals(63.3986785859499, interpreter.totalMoveTimeMinute)
+		self.assertAlmostEquals(1407.434510000002, interpreter.extrusionAmount[0])
+
+	@data("python", "numpy")
+	def test_resume_planner(self, backend, settings):
+		settings.return_value.getInt.return_value = 10
+
+		def abort(progress):
+			if progress < 100.0:
+				interpreter.abort()
+
+		with mock.patch.object(GcodeAnalyzer, "chunkSize", 500), mock.patch.object(NumpyGcodeAnalyzer, "chunkSize", 500):
+			uninterrupted = gcode(backend=backend, estimator="planner")
+			uninterrupted.load(BP_CASE_GCODE, PrinterProfileManager.default)
+
+			interpreter = gcode(backend=backend, estimator="planner")
+			interpreter.progressCallback = abort
+			try:
+				interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default)
+				self.fail("Expected AnalysisAborted")
+			except AnalysisAborted as e:
+				checkpoint = e.checkpoint
+
+			# the planner continues where it left off
+			interpreter = gcode(backend=backend, estimator="planner")
+			interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default, checkpoint=checkpoint)
+
+		self.assertAlmostEquals(uninterrupted.totalMoveTimeMinute, interpreter.totalMoveTimeMinute)
+
+	def test_resume_changed_file(self, settings):
+		settings.return_value.getInt.return_value = 10
+
+		interpreter = gcode(estimator="simple")
+		interpreter.abort()
+		try:
+			interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default)
+			self.fail("Expected AnalysisAborted")
+		except AnalysisAborted as e:
+			checkpoint = e.checkpoint
+
+		# a checkpoint of a file that changed in the meantime is ignored
+		checkpoint.update(position=1000, modification=checkpoint["modification"] - 1)
+
+		interpreter = gcode(estimator="simple")
+		interpreter.load(BP_CASE_GCODE, PrinterProfileManager.default, checkpoint=checkpoint)
+
+		self.assertAlmostEquals(63.3986785859499, interpreter.totalMoveTimeMinute)
+		self.assertAlmostEquals(1407.434510000002, interpreter.extrusionAmount[0])
+
+
+LAYERS_GCODE = ["G28\n",
+                "G1 Z0.2 F600\n",
+                "G1 X10 E1 F1200\n",
+                "G1 E0 ; retract\n",
+                "G1 Z0.6\n",
+                "G1 X0\n",
+                "G1 Z0.2\n",
+                "G1 E1\n",
+                "G1 X10 E2\n",
+                "G1 Z0.4\n",
+                "G1 X0 E3\n",
+                "G4 S6\n"]
+
+
+@ddt
+class LayersTestCase(unittest.TestCase):
+
+	@data(GcodeAnalyzer, NumpyGcodeAnalyzer)
+	def test_layers(self, analyzerClass):
+		if analyzerClass is NumpyGcodeAnalyzer and numpy is None:
+			self.skipTest("NumPy is not installed")
+
+		analyzer = analyzerClass(PrinterProfileManager.default, maxExtruders=10, estimator="simple")
+		analyzer.feed(LAYERS_GCODE)
+
+		self.assertEquals([0.2, 0.4], [layer["z"] for layer in analyzer.layers])
+		self.assertEquals([0, 10], [layer["line"] for layer in analyzer.layers])
+		self.assertEquals([0, len("".join(LAYERS_GCODE[:10]))], [layer["offset"] for layer in analyzer.layers])
+		self.assertEquals(len("".join(LAYERS_GCODE)), analyzer.byteCount)
+		self.assertEquals([{0: 2.0}, {0: 1.0}], [layer["extrusion"] for layer in analyzer.layers])
+		self.assertAlmostEquals((10.0 + 1.0 + 10.0 + 1.0 + 10.0) / 1200, analyzer.layers[0]["moveTimeMinute"])
+		self.assertAlmostEquals(10.0 / 1200 + 0.1, analyzer.layers[1]["moveTimeMinute"])
+		self.assertAlmostEquals(analyzer.totalMoveTimeMinute, sum(layer["moveTimeMinute"] for layer in analyzer.layers))
+		self.assertEquals(12, analyzer.lineCount)
+
+	@data(GcodeAnalyzer, NumpyGcodeAnalyzer)
+	def test_layer_starts_across_chunks(self, analyzerClass):
+		if analyzerClass is NumpyGcodeAnalyzer and numpy is None:
+			self.skipTest("NumPy is not installed")
+
+		analyzer = analyzerClass(PrinterProfileManager.default, maxExtruders=10, estimator="simple")
+		analyzer.feed(LAYERS_GCODE[:9])
+		analyzer.feed(LAYERS_GCODE[9:])
+
+		self.assertEquals([0, 10], [layer["line"] for layer in analyzer.layers])
+		self.assertEquals([0, len("".join(LAYERS_GCODE[:10]))], [layer["offset"] for layer in analyzer.layers])
+
+	def test_layers_planner(self):
+		analyzer = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="planner")
+		analyzer.feed(SAMPLE_GCODE)
+		self.assertAlmostEquals(analyzer.totalMoveTimeMinute, sum(layer["moveTimeMinute"] for layer in analyzer.layers))
+
+
+@ddt
+class TokenizingTestCase(unittest.TestCase):
+
+	# lines the former analysis read differently or not at all
+
+	@data(
+		("G1X10Y10E1F1200\n", [10.0, 10.0, 0.0], [1.0], 1200.0),
+		("N12 G1 X20 Y5 E2*45\n", [20.0, 5.0, 0.0], [2.0], 6000.0),
+		("G1 X1 Y1 E4.5 X50\n", [50.0, 1.0, 0.0], [4.5], 6000.0)
+	)
+	@unpack
+	def test_line(self, line, position, extrusion, feedRate):
+		analyzerClasses = [GcodeAnalyzer]
+		if numpy is not None:
+			analyzerClasses.append(NumpyGcodeAnalyzer)
+
+		for analyzerClass in analyzerClasses:
+			analyzer = analyzerClass(PrinterProfileManager.default, maxExtruders=10, estimator="simple")
+			analyzer.feed([line])
+
+			self.assertEquals(position, analyzer.position)
+			self.assertEquals(extrusion, analyzer.maxExtrusion)
+			self.assertEquals(feedRate, analyzer.feedRateXY)
+
+
+class GcodeAnalyzerTestCase(unittest.TestCase):
+
+	def test_incremental(self):
+		complete = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+		complete.feed(SAMPLE_GCODE)
+
+		for chunkSize in (1, 7, 13):
+			analyzer = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+			for i in range(0, len(SAMPLE_GCODE), chunkSize):
+				analyzer.feed(SAMPLE_GCODE[i:i+chunkSize])
+
+			self.assertEquals(complete.totalMoveTimeMinute, analyzer.totalMoveTimeMinute)
+			self.assertEquals(complete.maxExtrusion, analyzer.maxExtrusion)
+			self.assertEquals(complete.position, analyzer.position)
+			self.assertEquals(len(SAMPLE_GCODE), analyzer.lineCount)
+
+	def test_tokenizing(self):
+		analyzer = GcodeAnalyzer(PrinterProfileManager.default, maxExtruders=10, estimator="simple")
+		analyzer.feed(["G01 X10 Y-2.5 E.5 F600 ; comment with G1 X100\n", "N12 G1 E1.0*37\n", "M107\n"])
+
+		self.assertEquals([10.0, -2.5, 0.0], analyzer.position)
+		self.assertEquals([1.0], analyzer.maxExtrusion)
+		self.assertEquals(600.0, analyzer.feedRateXY)
+
+	def test_planner(self):
+		simple = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+		simple.feed(SAMPLE_GCODE)
+
+		analyzer = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="planner")
+		analyzer.feed(SAMPLE_GCODE)
+
+		# accelerating takes time, but the dwells are the same
+		self.assertGreater(analyzer.totalMoveTimeMinute, simple.totalMoveTimeMinute)
+		self.assertEquals(simple.maxExtrusion, analyzer.maxExtrusion)
+
+	def test_planner_stops_on_dwell(self):
+		analyzer = GcodeAnalyzer(PrinterProfileManager.default, maxExtruders=10, estimator="planner")
+		analyzer.feed(["G1 X10 F6000\n"])
+		self.assertNotEquals((0.0, 0.0, 0.0, 0.0), analyzer.planner.direction)
+
+		analyzer.feed(["G4 P0\n"])
+		self.assertEquals((0.0, 0.0, 0.0, 0.0), analyzer.planner.direction)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class NumpyGcodeAnalyzerTestCase(unittest.TestCase):
+
+	def test_planner(self):
+		python = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="planner")
+		python.feed(SAMPLE_GCODE)
+
+		analyzer = NumpyGcodeAnalyzer(_profile(), maxExtruders=10, estimator="planner")
+		analyzer.feed(SAMPLE_GCODE)
+
+		# the batches between state changes are planned separately, so only close to each other
+		self.assertAlmostEquals(python.totalMoveTimeMinute, analyzer.totalMoveTimeMinute, delta=python.totalMoveTimeMinute * 0.01)
+		self.assertAlmostEquals(analyzer.totalMoveTimeMinute, sum(layer["moveTimeMinute"] for layer in analyzer.layers))
+
+	def test_layers_match(self):
+		python = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+		python.feed(SAMPLE_GCODE)
+
+		analyzer = NumpyGcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+		analyzer.feed(SAMPLE_GCODE)
+
+		self.assertEquals(len(python.layers), len(analyzer.layers))
+		for expected, actual in zip(python.layers, analyzer.layers):
+			self.assertEquals(expected["z"], actual["z"])
+			self.assertEquals(expected["line"], actual["line"])
+			self.assertEquals(expected["offset"], actual["offset"])
+			self.assertAlmostEquals(expected["moveTimeMinute"], actual["moveTimeMinute"])
+			for tool in set(expected["extrusion"].keys() + actual["extrusion"].keys()):
+				self.assertAlmostEquals(expected["extrusion"].get(tool, 0.0), actual["extrusion"].get(tool, 0.0))
+
+	def test_incremental(self):
+		python = GcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+		python.feed(SAMPLE_GCODE)
+
+		for chunkSize in (1, 7, len(SAMPLE_GCODE)):
+			analyzer = NumpyGcodeAnalyzer(_profile(), maxExtruders=10, estimator="simple")
+			for i in range(0, len(SAMPLE_GCODE), chunkSize):
+				analyzer.feed(SAMPLE_GCODE[i:i+chunkSize])
+
+			self.assertAlmostEquals(python.totalMoveTimeMinute, analyzer.totalMoveTimeMinute)
+			self.assertEquals(len(python.maxExtrusion), len(analyzer.maxExtrusion))
+			for expected, actual in zip(python.maxExtrusion, analyzer.maxExtrusion):
+				self.assertAlmostEquals(expected, actual)
+			self.assertEquals(python.position, analyzer.position)
+			self.assertEquals(python.filamentDiameter, analyzer.filamentDiameter)
+
+	@mock.patch("octoprint.util.gcodeInterpreter.settings")
+	def test_create_analyzer(self, settings):
+		self.assertIsInstance(createAnalyzer(PrinterProfileManager.default, backend="numpy"), NumpyGcodeAnalyzer)
+		self.assertNotIsInstance(createAnalyzer(PrinterProfileManager.default, backend="python"), NumpyGcodeAnalyzer)
+
+	@mock.patch("octoprint.util.gcodeInterpreter.settings")
+	@mock.patch("octoprint.util.gcodeInterpreter.numpy", None)
+	def test_create_analyzer_without_numpy(self, settings):
+		for backend in ("auto", "numpy"):
+			analyzer = createAnalyzer(PrinterProfileManager.default, backend=backend)
+			self.assertNotIsInstance(analyzer, NumpyGcodeAnalyzer)
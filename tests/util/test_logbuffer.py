@@ -0,0 +1,126 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import logging
+import threading
+import unittest
+
+import mock
+
+from octoprint.util.logbuffer import LogBuffer, LogForwarder, compileFilters
+
+
+class LogBufferTestCase(unittest.TestCase):
+
+	def test_tail(self):
+		buffer = LogBuffer(3)
+		self.assertEquals([], buffer.tail(3))
+
+		for i in range(5):
+			buffer.append("line %d" % i)
+
+		self.assertEquals(5, buffer.getSequence())
+		self.assertEquals(["line 3", "line 4"], buffer.tail(2))
+		self.assertEquals(["line 2", "line 3", "line 4"], buffer.tail(10))
+
+	def test_cursor(self):
+		buffer = LogBuffer(10)
+		buffer.append("before")
+		cursor = buffer.cursor()
+
+		buffer.append("first")
+		buffer.append("second")
+		self.assertEquals((["first", "second"], 0), cursor.read())
+		self.assertEquals(([], 0), cursor.read())
+
+		buffer.append("third")
+		self.assertEquals(1, cursor.getLag())
+		self.assertEquals((["third"], 0), cursor.read())
+
+	def test_cursor_backlog(self):
+		buffer = LogBuffer(10)
+		for i in range(5):
+			buffer.append("line %d" % i)
+
+		cursor = buffer.cursor(backlog=2)
+		self.assertEquals((["line 3", "line 4"], 0), cursor.read())
+
+	def test_cursor_limit(self):
+		buffer = LogBuffer(10)
+		cursor = buffer.cursor()
+		for i in range(5):
+			buffer.append("line %d" % i)
+
+		self.assertEquals((["line 0", "line 1"], 0), cursor.read(limit=2))
+		self.assertEquals((["line 2", "line 3", "line 4"], 0), cursor.read())
+
+	def test_cursor_dropped(self):
+		buffer = LogBuffer(3)
+		cursor = buffer.cursor()
+		for i in range(5):
+			buffer.append("line %d" % i)
+
+		self.assertEquals((["line 2", "line 3", "line 4"], 2), cursor.read())
+		self.assertEquals(2, cursor.getDropped())
+
+	def test_cursor_filter(self):
+		buffer = LogBuffer(10)
+		cursor = buffer.cursor()
+		cursor.setFilter(compileFilters(["(Send: M105)|(Recv: ok T\d*:)", "Send: M27"]))
+
+		for line in ("Send: M105", "Recv: ok T:21.0 /0.0", "Send: G1 X10", "Send: M27", "Recv: ok"):
+			buffer.append(line)
+		self.assertEquals((["Send: G1 X10", "Recv: ok"], 0), cursor.read())
+
+		cursor.setFilter(compileFilters([]))
+		buffer.append("Send: M105")
+		self.assertEquals((["Send: M105"], 0), cursor.read())
+
+	def test_concurrent_writers(self):
+		buffer = LogBuffer(100000)
+		cursor = buffer.cursor()
+
+		def write(name):
+			for i in range(1000):
+				buffer.append("%s %d" % (name, i))
+
+		threads = [threading.Thread(target=write, args=(name,)) for name in ("a", "b", "c")]
+		for thread in threads:
+			thread.start()
+
+		lines = []
+		while any(thread.is_alive() for thread in threads):
+			lines += cursor.read()[0]
+		for thread in threads:
+			thread.join()
+		lines += cursor.read()[0]
+
+		self.assertEquals(3000, len(lines))
+		self.assertEquals(3000, len(set(lines)))
+		for name in ("a", "b", "c"):
+			self.assertEquals(["%s %d" % (name, i) for i in range(1000)], [line for line in lines if line.startswith(name + " ")])
+
+	def test_forwarder(self):
+		buffer = LogBuffer(10)
+		logger = mock.MagicMock()
+		logger.isEnabledFor.return_value = True
+
+		forwarder = LogForwarder(buffer, logger, interval=60)
+		try:
+			buffer.append("first")
+			buffer.append("second")
+			forwarder.flush()
+			self.assertEquals([mock.call("first"), mock.call("second")], logger.debug.call_args_list)
+
+			logger.isEnabledFor.return_value = False
+			buffer.append("third")
+			forwarder.flush()
+			self.assertEquals(2, logger.debug.call_count)
+			logger.isEnabledFor.assert_called_with(logging.DEBUG)
+		finally:
+			forwarder.stop()
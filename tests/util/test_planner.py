@@ -0,0 +1,104 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import unittest
+
+from ddt import ddt, data
+
+from octoprint.util.planner import TrapezoidalPlanner, NumpyTrapezoidalPlanner
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+PROFILE = dict(planner=dict(acceleration=1000, travelAcceleration=2000, retractAcceleration=500,
+                            jerk=dict(x=10, y=10, z=0.4, e=5)))
+
+SEGMENTS = [(10.0, 0.0, 0.0, 0.5, 1800.0),
+            (0.0, 10.0, 0.0, 0.5, 1800.0),
+            (0.0, 0.0, 0.0, -1.0, 2400.0),
+            (0.0, 0.0, 0.2, 0.0, 600.0),
+            (50.0, 50.0, 0.0, 0.0, 9000.0),
+            (0.0, 0.0, 0.0, 1.0, 2400.0),
+            (0.0, 0.0, 0.0, 0.0, 2400.0),
+            (-10.0, 0.1, 0.0, 0.4, 1800.0),
+            (-10.0, -0.1, 0.0, 0.4, 1800.0),
+            (0.3, 0.3, 0.0, 0.02, 1800.0)]
+
+
+def planner_classes():
+	if numpy is None:
+		return [TrapezoidalPlanner]
+	return [TrapezoidalPlanner, NumpyTrapezoidalPlanner]
+
+
+@ddt
+class PlannerTest(unittest.TestCase):
+
+	@data(*planner_classes())
+	def test_cruise(self, planner_class):
+		planner = planner_class(PROFILE)
+
+		# starts and ends at the jerk speed of X, accelerates to and decelerates from 100mm/s in 90mm each
+		times = planner.plan([(100.0, 0.0, 0.0, 1.0, 6000.0)], stop=True)
+		self.assertAlmostEquals(2 * 0.09 + (100.0 - 2 * 4.95) / 100.0, times[0])
+
+	@data(*planner_classes())
+	def test_triangle(self, planner_class):
+		planner = planner_class(PROFILE)
+
+		times = planner.plan([(1.0, 0.0, 0.0, 0.1, 6000.0)], stop=True)
+		peak = (1100.0) ** 0.5
+		self.assertAlmostEquals(2 * (peak - 10.0) / 1000.0, times[0])
+
+	@data(*planner_classes())
+	def test_collinear(self, planner_class):
+		single = sum(planner_class(PROFILE).plan([(100.0, 0.0, 0.0, 0.0, 6000.0)], stop=True))
+		split = sum(planner_class(PROFILE).plan([(50.0, 0.0, 0.0, 0.0, 6000.0), (50.0, 0.0, 0.0, 0.0, 6000.0)], stop=True))
+		self.assertAlmostEquals(single, split)
+
+	@data(*planner_classes())
+	def test_corner(self, planner_class):
+		straight = sum(planner_class(PROFILE).plan([(50.0, 0.0, 0.0, 0.0, 6000.0), (50.0, 0.0, 0.0, 0.0, 6000.0)], stop=True))
+		corner = sum(planner_class(PROFILE).plan([(50.0, 0.0, 0.0, 0.0, 6000.0), (0.0, 50.0, 0.0, 0.0, 6000.0)], stop=True))
+		self.assertGreater(corner, straight)
+
+	@data(*planner_classes())
+	def test_retraction(self, planner_class):
+		planner = planner_class(PROFILE)
+
+		# never reaches 40mm/s with 500mm/s^2 over 1mm, starting and ending at the jerk speed of E
+		times = planner.plan([(0.0, 0.0, 0.0, -1.0, 2400.0)], stop=True)
+		peak = (500.0 + 25.0) ** 0.5
+		self.assertAlmostEquals(2 * (peak - 5.0) / 500.0, times[0])
+
+	@data(*planner_classes())
+	def test_zero_length(self, planner_class):
+		times = planner_class(PROFILE).plan([(0.0, 0.0, 0.0, 0.0, 6000.0)])
+		self.assertEquals([0.0], list(times))
+
+	@data(*planner_classes())
+	def test_batches(self, planner_class):
+		complete = sum(planner_class(PROFILE).plan(SEGMENTS, stop=True))
+
+		planner = planner_class(PROFILE)
+		batched = sum(planner.plan(SEGMENTS[:4])) + sum(planner.plan(SEGMENTS[4:], stop=True))
+
+		# only the lookahead across the batch boundary is lost
+		self.assertAlmostEquals(complete, batched, delta=complete * 0.01)
+
+	@unittest.skipIf(numpy is None, "NumPy is not installed")
+	def test_numpy(self):
+		expected = TrapezoidalPlanner(PROFILE).plan(SEGMENTS, stop=True)
+		actual = NumpyTrapezoidalPlanner(PROFILE).plan(SEGMENTS, stop=True)
+
+		self.assertEquals(len(expected), len(actual))
+		for e, a in zip(expected, actual):
+			self.assertAlmostEquals(e, a)
@@ -0,0 +1,84 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from octoprint.util.recording import SerialRecorder, ReplaySerial, loadRecording, RECEIVED, SENT
+
+
+class RecordingTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_record_and_load(self):
+		path = os.path.join(self.folder, "test.rec")
+		recorder = SerialRecorder(path)
+		recorder.received("start\n")
+		recorder.sent("N0 M110 N0*125\n")
+		recorder.received("")
+		recorder.received("ok T:21.0\t/0.0 \x80\n")
+		recorder.close()
+
+		events = loadRecording(path)
+		self.assertEquals([(RECEIVED, "start\n"), (SENT, "N0 M110 N0*125\n"), (RECEIVED, ""), (RECEIVED, "ok T:21.0\t/0.0 \x80\n")],
+		                  [(direction, data) for _, direction, data in events])
+		self.assertEquals(sorted(timestamp for timestamp, _, _ in events), [timestamp for timestamp, _, _ in events])
+
+
+class ReplaySerialTestCase(unittest.TestCase):
+
+	EVENTS = [
+		(0.0, RECEIVED, "start\n"),
+		(0.1, SENT, "M105\n"),
+		(0.2, RECEIVED, "ok T:21.0\n"),
+		(0.3, SENT, "M20\n"),
+		(0.4, RECEIVED, "ok\n")
+	]
+
+	def test_in_step(self):
+		replay = ReplaySerial(self.EVENTS)
+		self.assertEquals("start\n", replay.readline())
+
+		# the response is only handed out once the command it answers has been written
+		threading.Timer(0.1, replay.write, args=["M105\n"]).start()
+		self.assertEquals("ok T:21.0\n", replay.readline())
+
+		replay.write("M21\n")
+		self.assertEquals("ok\n", replay.readline())
+		self.assertTrue(replay.isDone())
+
+		replay.timeout = 0.01
+		self.assertEquals("", replay.readline())
+		self.assertEquals(dict(received=3, written=2, mismatches=1, stalls=0), replay.getStats())
+
+	def test_stall(self):
+		replay = ReplaySerial(self.EVENTS, stallTimeout=0.05)
+		self.assertEquals("start\n", replay.readline())
+		self.assertEquals("ok T:21.0\n", replay.readline())
+		self.assertEquals(1, replay.getStats()["stalls"])
+
+	def test_close(self):
+		replay = ReplaySerial(self.EVENTS)
+		replay.readline()
+
+		threading.Timer(0.1, replay.close).start()
+		self.assertRaises(IOError, replay.readline)
+		self.assertRaises(IOError, replay.write, "M105\n")
+
+	def test_close_at_end(self):
+		replay = ReplaySerial([(0.0, RECEIVED, "start\n")], closeAtEnd=True)
+		self.assertEquals("start\n", replay.readline())
+		self.assertRaises(IOError, replay.readline)